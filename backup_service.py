@@ -0,0 +1,341 @@
+# Respaldos en Línea e Instantáneas - Julia Confecciones
+#
+# Copia la base viva con la API de backup de SQLite (Connection.backup) por
+# pasos de PAGINAS páginas, con una pausa entre pasos: nunca se copia el
+# archivo a mano mientras Flask escribe. Con WAL la copia es un lector más y
+# no hace esperar al escritor. Si otra conexión escribe entre dos pasos,
+# SQLite reinicia la copia; tras MAX_REINICIOS se copia en un solo paso (una
+# sola transacción de lectura, que en WAL tampoco bloquea escrituras).
+#
+# Cada respaldo:
+#   1. copia a <directorio>/<base>_instantanea.db.tmp, quick_check y
+#      reemplazo atómico de la instantánea
+#   2. gzip de la instantánea a <base>_AAAAMMDD_HHMMSS.db.gz y su .sha256
+#      (formato de sha256sum)
+#   3. rotación: quedan los CONSERVAR respaldos más recientes
+#
+# La instantánea se abre en solo lectura (mode=ro, immutable=1): los reportes
+# pesados corren ahí sin tomar ningún bloqueo de la base viva.
+#
+# Uso:
+#   python backup_service.py --db julia_confecciones.db [--instantanea] [--listar]
+#   python backup_service.py --verificar respaldos/julia_confecciones_20250101_020000.db.gz
+#   python backup_service.py --restaurar respaldos/...db.gz restaurada.db
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+from database import conectar, es_postgres
+from metrics import registro
+
+logger = logging.getLogger("julia.respaldos")
+
+CONSERVAR = int(os.getenv("JULIA_RESPALDOS_CONSERVAR", "14"))
+PAGINAS = int(os.getenv("JULIA_RESPALDO_PAGINAS", "256"))
+PAUSA_S = float(os.getenv("JULIA_RESPALDO_PAUSA_MS", "5")) / 1000
+MAX_REINICIOS = int(os.getenv("JULIA_RESPALDO_MAX_REINICIOS", "20"))
+INSTANTANEA_MAX_ANTIGUEDAD_S = float(os.getenv("JULIA_INSTANTANEA_MAX_ANTIGUEDAD", "86400"))
+
+_duracion = registro.histograma(
+    "julia_respaldo_duracion_segundos", "Duración de la copia en línea de la base", ("tipo",))
+_fallos = registro.contador("julia_respaldo_fallos_total", "Respaldos o instantáneas que fallaron", ("tipo",))
+
+
+class ReinicioExcesivo(Exception):
+    """La copia por pasos se reinició demasiadas veces por escrituras concurrentes"""
+
+
+def directorio_respaldos(db_path):
+    """Directorio de respaldos de db_path (JULIA_RESPALDOS_DIR o respaldos/ junto a la base)"""
+    return os.getenv("JULIA_RESPALDOS_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(db_path)), "respaldos")
+
+
+def ruta_instantanea(db_path, directorio=None):
+    """Archivo de la instantánea de solo lectura de db_path"""
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(directorio or directorio_respaldos(db_path), f"{base}_instantanea.db")
+
+
+def conectar_instantanea(db_path, max_antiguedad=INSTANTANEA_MAX_ANTIGUEDAD_S):
+    """Conexión de solo lectura a la instantánea; la base viva si no hay una reciente"""
+    ruta = ruta_instantanea(db_path)
+    if not es_postgres(db_path) and os.path.exists(ruta):
+        if time.time() - os.path.getmtime(ruta) <= max_antiguedad:
+            # immutable: sin bloqueos ni lectura del WAL; el archivo solo se reemplaza, nunca se edita
+            return conectar(f"file:{quote(os.path.abspath(ruta))}?mode=ro&immutable=1", uri=True)
+        logger.warning("Instantánea %s con más de %.0f s: se usa la base viva", ruta, max_antiguedad)
+    return conectar(db_path)
+
+
+def _sha256(ruta):
+    digesto = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b""):
+            digesto.update(bloque)
+    return digesto.hexdigest()
+
+
+def _quick_check(ruta):
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(ruta))}?mode=ro", uri=True)
+    try:
+        resultado = [f[0] for f in conn.execute("PRAGMA quick_check").fetchall()]
+    finally:
+        conn.close()
+    if resultado != ["ok"]:
+        raise sqlite3.DatabaseError(f"quick_check de {ruta}: {'; '.join(resultado[:5])}")
+
+
+class ServicioRespaldos:
+    """Instantáneas y respaldos comprimidos con rotación de una base SQLite"""
+
+    def __init__(self, db_path, directorio=None, conservar=CONSERVAR, paginas=PAGINAS,
+                 pausa=PAUSA_S, max_reinicios=MAX_REINICIOS):
+        if es_postgres(db_path):
+            raise ValueError("Los respaldos en línea son de SQLite; en PostgreSQL use pg_dump")
+        self.db_path = db_path
+        self.directorio = directorio or directorio_respaldos(db_path)
+        self.base = os.path.splitext(os.path.basename(db_path))[0]
+        self.conservar = conservar
+        self.paginas = paginas
+        self.pausa = pausa
+        self.max_reinicios = max_reinicios
+        os.makedirs(self.directorio, exist_ok=True)
+
+        registro.registrar_colector(f"respaldos:{os.path.abspath(db_path)}", self._colector_metricas)
+
+    @property
+    def instantanea(self):
+        return ruta_instantanea(self.db_path, self.directorio)
+
+    def _copiar(self, destino):
+        """Copiar la base viva a `destino` por pasos; devuelve (páginas, reinicios)"""
+        progreso = {"restantes": None, "reinicios": 0, "total": 0}
+
+        def al_avanzar(estado, restantes, total):
+            # Si quedan más páginas que en el paso anterior, SQLite reinició la copia
+            if progreso["restantes"] is not None and restantes > progreso["restantes"]:
+                progreso["reinicios"] += 1
+                if progreso["reinicios"] > self.max_reinicios:
+                    raise ReinicioExcesivo(f"{progreso['reinicios']} reinicios")
+            progreso["restantes"] = restantes
+            progreso["total"] = total
+
+        origen = conectar(self.db_path)
+        copia = sqlite3.connect(destino)
+        try:
+            try:
+                origen.backup(copia, pages=self.paginas, progress=al_avanzar, sleep=self.pausa)
+            except ReinicioExcesivo as e:
+                logger.info("Respaldo de %s: %s, se copia en un solo paso", self.db_path, e)
+                origen.backup(copia)
+            # La copia hereda el modo WAL del origen; la instantánea es un solo archivo
+            copia.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            copia.close()
+            origen.close()
+        return progreso["total"], progreso["reinicios"]
+
+    def refrescar_instantanea(self):
+        """Copiar la base viva sobre la instantánea de solo lectura"""
+        temporal = self.instantanea + ".tmp"
+        inicio = time.perf_counter()
+        try:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            paginas, reinicios = self._copiar(temporal)
+            _quick_check(temporal)
+            # Los lectores con la instantánea anterior abierta siguen viendo la suya
+            os.replace(temporal, self.instantanea)
+            duracion = time.perf_counter() - inicio
+            _duracion.observar(duracion, tipo="instantanea")
+            return {
+                "success": True,
+                "instantanea": self.instantanea,
+                "paginas": paginas,
+                "reinicios": reinicios,
+                "duracion_segundos": round(duracion, 4)
+            }
+
+        except Exception as e:
+            _fallos.inc(tipo="instantanea")
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return {"success": False, "error": str(e)}
+
+    def crear_respaldo(self):
+        """Refrescar la instantánea y guardarla comprimida con su checksum"""
+        resultado = self.refrescar_instantanea()
+        if not resultado["success"]:
+            return resultado
+
+        nombre = f"{self.base}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db.gz"
+        ruta = os.path.join(self.directorio, nombre)
+        inicio = time.perf_counter()
+        try:
+            with open(self.instantanea, "rb") as entrada, gzip.open(ruta + ".tmp", "wb", compresslevel=6) as salida:
+                shutil.copyfileobj(entrada, salida, 1 << 20)
+            os.replace(ruta + ".tmp", ruta)
+            checksum = _sha256(ruta)
+            with open(ruta + ".sha256", "w") as archivo:
+                archivo.write(f"{checksum}  {nombre}\n")
+            _duracion.observar(time.perf_counter() - inicio, tipo="compresion")
+
+            resultado.update({
+                "respaldo": ruta,
+                "sha256": checksum,
+                "bytes": os.path.getsize(ruta),
+                "bytes_sin_comprimir": os.path.getsize(self.instantanea),
+                "eliminados": self.rotar()
+            })
+            logger.info("Respaldo %s (%d bytes, %d reinicios)", ruta, resultado["bytes"], resultado["reinicios"])
+            return resultado
+
+        except Exception as e:
+            _fallos.inc(tipo="respaldo")
+            for sobrante in (ruta + ".tmp", ruta):
+                if os.path.exists(sobrante):
+                    os.remove(sobrante)
+            return {"success": False, "error": str(e)}
+
+    def _respaldos(self):
+        # El sello AAAAMMDD_HHMMSS ordena por nombre igual que por fecha
+        return sorted(glob.glob(os.path.join(glob.escape(self.directorio), f"{glob.escape(self.base)}_*.db.gz")),
+                      reverse=True)
+
+    def rotar(self):
+        """Eliminar los respaldos más antiguos que los CONSERVAR recientes"""
+        eliminados = []
+        for ruta in self._respaldos()[self.conservar:]:
+            for archivo in (ruta, ruta + ".sha256"):
+                if os.path.exists(archivo):
+                    os.remove(archivo)
+            eliminados.append(os.path.basename(ruta))
+        return eliminados
+
+    def listar_respaldos(self):
+        """Respaldos disponibles, del más reciente al más antiguo"""
+        return [
+            {
+                "respaldo": ruta,
+                "bytes": os.path.getsize(ruta),
+                "fecha": datetime.fromtimestamp(os.path.getmtime(ruta)).isoformat(timespec="seconds"),
+                "tiene_checksum": os.path.exists(ruta + ".sha256")
+            } for ruta in self._respaldos()
+        ]
+
+    def obtener_estado(self):
+        """Respaldos guardados, último respaldo y antigüedad de la instantánea"""
+        respaldos = self.listar_respaldos()
+        existe = os.path.exists(self.instantanea)
+        return {
+            "directorio": self.directorio,
+            "respaldos": len(respaldos),
+            "ultimo_respaldo": respaldos[0] if respaldos else None,
+            "bytes_respaldos": sum(r["bytes"] for r in respaldos),
+            "instantanea": self.instantanea if existe else None,
+            "antiguedad_instantanea_segundos": (round(time.time() - os.path.getmtime(self.instantanea), 1)
+                                                if existe else None)
+        }
+
+    def _colector_metricas(self):
+        estado = self.obtener_estado()
+        etiquetas = {"base": self.base}
+        ultimo = estado["ultimo_respaldo"]
+        return [
+            ("julia_respaldos_guardados", "gauge", "Respaldos comprimidos conservados",
+             [(etiquetas, estado["respaldos"])]),
+            ("julia_respaldos_bytes", "gauge", "Espacio ocupado por los respaldos",
+             [(etiquetas, estado["bytes_respaldos"])]),
+            ("julia_respaldo_ultimo_timestamp", "gauge", "Fecha (epoch) del último respaldo",
+             [(etiquetas, os.path.getmtime(ultimo["respaldo"]) if ultimo else 0)]),
+            ("julia_instantanea_antiguedad_segundos", "gauge", "Antigüedad de la instantánea de reportes",
+             [(etiquetas, estado["antiguedad_instantanea_segundos"] or 0)]),
+        ]
+
+
+def verificar_respaldo(ruta):
+    """Comprobar el checksum del respaldo y la integridad de la base que contiene"""
+    try:
+        with open(ruta + ".sha256") as archivo:
+            esperado = archivo.read().split()[0]
+        if _sha256(ruta) != esperado:
+            return {"success": False, "error": "El checksum no coincide"}
+
+        temporal = ruta + ".verificacion.db"
+        try:
+            with gzip.open(ruta, "rb") as entrada, open(temporal, "wb") as salida:
+                shutil.copyfileobj(entrada, salida, 1 << 20)
+            _quick_check(temporal)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return {"success": True, "sha256": esperado}
+
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+def restaurar_respaldo(ruta, destino):
+    """Descomprimir un respaldo verificado en `destino` (que no debe existir)"""
+    if os.path.exists(destino):
+        return {"success": False, "error": f"{destino} ya existe"}
+    verificacion = verificar_respaldo(ruta)
+    if not verificacion["success"]:
+        return verificacion
+
+    with gzip.open(ruta, "rb") as entrada, open(destino + ".tmp", "wb") as salida:
+        shutil.copyfileobj(entrada, salida, 1 << 20)
+    os.replace(destino + ".tmp", destino)
+    return {"success": True, "destino": destino, "sha256": verificacion["sha256"]}
+
+
+def barrer_instantanea(db_path, marca):
+    """Barrido para sweep_scheduler: refrescar la instantánea de reportes"""
+    resultado = ServicioRespaldos(db_path).refrescar_instantanea()
+    if not resultado["success"]:
+        raise RuntimeError(resultado["error"])
+    return resultado["paginas"], marca
+
+
+def barrer_respaldo(db_path, marca):
+    """Barrido para sweep_scheduler: respaldo comprimido diario con rotación"""
+    resultado = ServicioRespaldos(db_path).crear_respaldo()
+    if not resultado["success"]:
+        raise RuntimeError(resultado["error"])
+    return resultado["paginas"], {"respaldo": os.path.basename(resultado["respaldo"]),
+                                  "sha256": resultado["sha256"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Respaldos en línea de la base SQLite")
+    parser.add_argument("--db", default=os.getenv("JULIA_DB", "julia_confecciones.db"))
+    parser.add_argument("--instantanea", action="store_true", help="Solo refrescar la instantánea")
+    parser.add_argument("--listar", action="store_true", help="Listar los respaldos guardados")
+    parser.add_argument("--verificar", metavar="RESPALDO", help="Verificar checksum e integridad")
+    parser.add_argument("--restaurar", nargs=2, metavar=("RESPALDO", "DESTINO"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.verificar:
+        print(json.dumps(verificar_respaldo(args.verificar), indent=2))
+    elif args.restaurar:
+        print(json.dumps(restaurar_respaldo(*args.restaurar), indent=2))
+    else:
+        servicio = ServicioRespaldos(args.db)
+        if args.listar:
+            print(json.dumps(servicio.listar_respaldos(), indent=2))
+        elif args.instantanea:
+            print(json.dumps(servicio.refrescar_instantanea(), indent=2))
+        else:
+            print(json.dumps(servicio.crear_respaldo(), indent=2))
@@ -0,0 +1,81 @@
+# Benchmark de peticiones condicionales al dashboard - Julia Confecciones
+#
+# Compara /api/dashboard respondido completo (200, las cuatro consultas)
+# con la vía rápida de If-None-Match (304, solo la versión del empleado),
+# usando el cliente de pruebas de Flask sobre el costurero con más tareas.
+#
+# Uso: python -m benchmarks.bench_etag --escala pequena --db /tmp/julia_bench.db
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.generador import ESCALAS, generar_base
+from database import conectar
+from sql_instrumentation import ambito_sql
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def medir(cliente, encabezados, peticiones, estado_esperado):
+    """Latencias de `peticiones` GET /api/dashboard, en milisegundos"""
+    latencias = []
+    sentencias = 0
+    for _ in range(peticiones):
+        with ambito_sql("bench_etag") as ambito:
+            inicio = time.perf_counter()
+            respuesta = cliente.get('/api/dashboard', headers=encabezados)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        if respuesta.status_code != estado_esperado:
+            raise RuntimeError(f"Se esperaba {estado_esperado} y llegó {respuesta.status_code}")
+        sentencias += ambito.sentencias
+    return {
+        "estado": estado_esperado,
+        "p50_ms": round(percentil(latencias, 0.5), 3),
+        "p99_ms": round(percentil(latencias, 0.99), 3),
+        "peticiones_por_segundo": round(peticiones / (sum(latencias) / 1000), 1),
+        "sentencias_por_peticion": round(sentencias / peticiones, 1),
+        "bytes": len(respuesta.data)
+    }
+
+
+def ejecutar(db_path, peticiones=500):
+    os.environ["JULIA_DB"] = db_path
+    import employee_tracking_portal as etp
+
+    conn = conectar(db_path)
+    codigo = conn.execute('''
+        SELECT e.codigo_acceso FROM produccion p JOIN empleados e ON e.id_empleado = p.id_costurero
+        GROUP BY p.id_costurero ORDER BY COUNT(*) DESC LIMIT 1
+    ''').fetchone()[0]
+    conn.close()
+
+    cliente = etp.app.test_client()
+    token = cliente.post('/api/login', json={'codigo_acceso': codigo}).get_json()['token_sesion']
+    encabezados = {'Authorization': f'Bearer {token}', 'Accept-Encoding': 'gzip'}
+    etag = cliente.get('/api/dashboard', headers=encabezados).headers.get('ETag')
+    if etag is None:
+        raise RuntimeError("El dashboard no devolvió ETag (¿base sin la migración 9?)")
+
+    resultados = {
+        "completa": medir(cliente, encabezados, peticiones, 200),
+        "no_modificada": medir(cliente, {**encabezados, 'If-None-Match': etag}, peticiones, 304),
+    }
+    resultados["mejora"] = round(resultados["completa"]["p50_ms"] / resultados["no_modificada"]["p50_ms"], 2)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de ETag / 304 del dashboard")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--db", default="julia_bench.db")
+    parser.add_argument("--peticiones", type=int, default=500)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        generar_base(args.db, args.escala)
+    print(json.dumps(ejecutar(args.db, args.peticiones), indent=2))
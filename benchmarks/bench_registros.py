@@ -0,0 +1,100 @@
+# Benchmark de registros tipados - Julia Confecciones
+#
+# Compara las lecturas armando un dict por fila (como antes) con los
+# registros de records.py: memoria retenida por el listado materializado
+# (tracemalloc), tiempo de lectura y tiempo de serializar a JSON, tanto en
+# el formato de objetos como en el de columnas + filas.
+#
+# Uso: python -m benchmarks.bench_registros --escala pequena --db /tmp/julia_bench.db
+
+import argparse
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+from benchmarks.generador import ESCALAS, generar_base
+from database import conectar
+from records import a_json, tipo_registro
+
+Orden = tipo_registro("Orden", "id_produccion id_orden tipo_orden fecha_asignacion fecha_entrega_corte "
+                               "fecha_entrega_costura estado_corte estado_costura pago_corte "
+                               "pago_costura estado_pago_corte estado_pago_costura")
+
+CONSULTA = f"SELECT {Orden.proyeccion()} FROM produccion"
+
+
+def leer_dicts(cursor):
+    """Lectura anterior: un dict armado a mano por fila"""
+    cursor.execute(CONSULTA)
+    return [
+        {
+            "id_produccion": t[0], "id_orden": t[1], "tipo_orden": t[2], "fecha_asignacion": t[3],
+            "fecha_entrega_corte": t[4], "fecha_entrega_costura": t[5], "estado_corte": t[6],
+            "estado_costura": t[7], "pago_corte": t[8], "pago_costura": t[9],
+            "estado_pago_corte": t[10], "estado_pago_costura": t[11]
+        } for t in cursor.fetchall()
+    ]
+
+
+def leer_registros(cursor):
+    cursor.execute(CONSULTA)
+    return Orden.de_filas(cursor.fetchall())
+
+
+def medir(db_path, lectura, serializar, repeticiones):
+    """Memoria retenida por el listado y mejores tiempos de lectura y de JSON"""
+    conn = conectar(db_path)
+    cursor = conn.cursor()
+
+    gc.collect()
+    tracemalloc.start()
+    filas = lectura(cursor)
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del filas
+
+    tiempos_lectura, tiempos_json = [], []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = lectura(cursor)
+        tiempos_lectura.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        texto = json.dumps(serializar(filas), default=str)
+        tiempos_json.append(time.perf_counter() - inicio)
+
+    conn.close()
+    return {
+        "filas": len(filas),
+        "memoria_kb": round(memoria / 1024, 1),
+        "lectura_ms": round(min(tiempos_lectura) * 1000, 2),
+        "json_ms": round(min(tiempos_json) * 1000, 2),
+        "json_kb": round(len(texto) / 1024, 1)
+    }
+
+
+def ejecutar(db_path, repeticiones=5):
+    resultados = {
+        "dicts": medir(db_path, leer_dicts, lambda filas: filas, repeticiones),
+        "registros": medir(db_path, leer_registros, a_json, repeticiones),
+        "registros_columnas": medir(db_path, leer_registros,
+                                    lambda filas: a_json(filas, columnas=True), repeticiones),
+    }
+    antes = resultados["dicts"]["memoria_kb"]
+    despues = resultados["registros"]["memoria_kb"]
+    resultados["ahorro_memoria"] = round(1 - despues / antes, 3) if antes else None
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de registros tipados frente a dicts")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--db", default="julia_bench.db")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        generar_base(args.db, args.escala)
+    print(json.dumps(ejecutar(args.db, args.repeticiones), indent=2))
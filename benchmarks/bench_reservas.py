@@ -0,0 +1,170 @@
+# Benchmark de creación de reservas - Julia Confecciones
+#
+# Compara el flujo anterior de crear_reserva (tres conexiones por reserva:
+# la propia, validar_cupon y obtener_cliente) con el flujo actual de una
+# sola conexión y una sola transacción BEGIN IMMEDIATE.
+#
+# Las dos variantes corren sobre una base en modo WAL, el que deja el
+# escritor único (sqlite_writer) al arrancar: así la diferencia medida es la
+# del flujo y no la del modo de journal. El modo usado sale en el reporte.
+#
+# Uso: python -m benchmarks.bench_reservas --reservas 2000 --hilos 4
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from reservation_system_implementation import ReservationSystem
+
+
+def crear_reserva_legado(sistema, id_cliente, id_producto, monto_total,
+                         porcentaje_reserva=50, codigo_cupon=None, notas=""):
+    """Reproducción del flujo anterior de crear_reserva (tres conexiones)"""
+    conn = sqlite3.connect(sistema.db_path)
+    cursor = conn.cursor()
+
+    descuento = 0
+    cupon_info = {"valid": False}
+
+    if codigo_cupon:
+        cupon_info = sistema.validar_cupon(codigo_cupon)
+        if cupon_info["valid"]:
+            if cupon_info["tipo"] == "porcentaje":
+                descuento = monto_total * (cupon_info["valor"] / 100)
+            else:
+                descuento = cupon_info["valor"]
+
+    cliente_info = sistema.obtener_cliente(id_cliente)
+    if cliente_info and cliente_info["descuento_frecuente"] > 0:
+        descuento += monto_total * (cliente_info["descuento_frecuente"] / 100)
+
+    monto_final = max(0, monto_total - descuento)
+    monto_reserva_final = monto_final * (porcentaje_reserva / 100)
+    monto_pendiente = monto_final - monto_reserva_final
+    fecha_vencimiento = datetime.now() + timedelta(days=7)
+
+    try:
+        cursor.execute('''
+            INSERT INTO reservas
+            (id_cliente, id_producto, fecha_vencimiento, monto_total,
+             monto_reserva, monto_pendiente, estado, codigo_cupon,
+             descuento_aplicado, notas)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (id_cliente, id_producto, fecha_vencimiento, monto_total,
+              monto_reserva_final, monto_pendiente, 'pendiente',
+              codigo_cupon, descuento, notas))
+
+        reserva_id = cursor.lastrowid
+
+        if codigo_cupon and cupon_info["valid"]:
+            cursor.execute('''
+                UPDATE cupones SET usos_actuales = usos_actuales + 1
+                WHERE codigo = ?
+            ''', (codigo_cupon,))
+
+        conn.commit()
+        conn.close()
+        return {"success": True, "reserva_id": reserva_id}
+
+    except Exception as e:
+        conn.close()
+        return {"success": False, "error": str(e)}
+
+
+def preparar_base(db_path, clientes=100):
+    """Crear esquema, clientes y un cupón con usos suficientes, en modo WAL"""
+    sistema = ReservationSystem(db_path)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    # Persistente en el archivo: también lo ven las conexiones del flujo anterior
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.executemany('''
+        INSERT INTO clientes (rut, nombre, email, celular, descuento_frecuente)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(f"{i:08d}-0", f"Cliente {i}", f"cliente{i}@email.com", "900000000",
+           (0.0, 5.0, 10.0)[i % 3]) for i in range(1, clientes + 1)])
+    cursor.execute('''
+        INSERT INTO cupones (codigo, tipo_descuento, valor_descuento, tipo_cupon,
+                             fecha_inicio, fecha_vencimiento, usos_maximos)
+        VALUES ('BENCH10', 'porcentaje', 10.0, 'reserva',
+                datetime('now', '-1 day'), datetime('now', '+30 days'), 100000000)
+    ''')
+    conn.commit()
+    conn.close()
+
+    return sistema
+
+
+def medir(funcion, sistema, reservas, hilos, clientes):
+    """Ejecutar `reservas` creaciones repartidas en `hilos` y medir throughput"""
+    por_hilo = reservas // hilos
+    errores = []
+
+    def trabajador(indice):
+        for i in range(por_hilo):
+            resultado = funcion(sistema, id_cliente=(indice * por_hilo + i) % clientes + 1,
+                                id_producto=1000 + i, monto_total=50000,
+                                codigo_cupon="BENCH10" if i % 2 == 0 else None)
+            if not resultado["success"]:
+                errores.append(resultado["error"])
+
+    threads = [threading.Thread(target=trabajador, args=(h,)) for h in range(hilos)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracion = time.perf_counter() - inicio
+
+    total = por_hilo * hilos
+    return {
+        "reservas": total,
+        "hilos": hilos,
+        "segundos": round(duracion, 4),
+        "reservas_por_segundo": round((total - len(errores)) / duracion, 1),
+        "errores": len(errores),
+        "journal_mode": modo_journal(sistema.db_path)
+    }
+
+
+def modo_journal(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("PRAGMA journal_mode").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def ejecutar(reservas=2000, hilos=1, clientes=100):
+    """Medir el flujo anterior y el actual sobre bases temporales separadas"""
+    resultados = {}
+    variantes = [
+        ("antes", crear_reserva_legado),
+        ("despues", lambda sistema, **kw: sistema.crear_reserva(**kw)),
+    ]
+
+    for nombre, funcion in variantes:
+        with tempfile.TemporaryDirectory() as directorio:
+            sistema = preparar_base(os.path.join(directorio, "bench.db"), clientes)
+            resultados[nombre] = medir(funcion, sistema, reservas, hilos, clientes)
+
+    antes = resultados["antes"]["reservas_por_segundo"]
+    despues = resultados["despues"]["reservas_por_segundo"]
+    resultados["mejora"] = round(despues / antes, 2) if antes else None
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de crear_reserva")
+    parser.add_argument("--reservas", type=int, default=2000)
+    parser.add_argument("--hilos", type=int, default=1)
+    parser.add_argument("--clientes", type=int, default=100)
+    args = parser.parse_args()
+
+    print(json.dumps(ejecutar(args.reservas, args.hilos, args.clientes), indent=2))
@@ -0,0 +1,97 @@
+# Benchmark de la capa de respuestas del portal - Julia Confecciones
+#
+# Compara, para el dashboard del empleado con más tareas y para la página
+# del portal, la forma anterior (json.dumps + default=str sin comprimir y
+# render_template_string en cada visita) con http_responses: tiempo por
+# respuesta y bytes enviados.
+#
+# Uso: python -m benchmarks.bench_respuestas --escala pequena --db /tmp/julia_bench.db
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.generador import ESCALAS, generar_base
+from database import conectar
+from http_responses import a_json_bytes, comprimir, orjson, brotli
+from records import a_json
+
+
+def medir(funcion, repeticiones):
+    """Mejor tiempo de `repeticiones` llamadas, en microsegundos"""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return round(mejor * 1_000_000, 1)
+
+
+def datos_dashboard(portal, db_path):
+    """El dashboard del costurero con más tareas, como lo arma /api/dashboard"""
+    conn = conectar(db_path)
+    id_empleado = conn.execute('''
+        SELECT id_costurero FROM produccion GROUP BY id_costurero ORDER BY COUNT(*) DESC LIMIT 1
+    ''').fetchone()[0]
+    conn.close()
+
+    pendientes = portal.obtener_tareas_pendientes(id_empleado, "costurero")
+    return {
+        "success": True,
+        "tareas_pendientes": pendientes,
+        "tareas_completadas": portal.obtener_tareas_completadas(id_empleado, "costurero"),
+        "resumen": portal.obtener_resumen_pagos(id_empleado, "costurero"),
+        "notificaciones": portal.obtener_notificaciones(id_empleado, no_leidas=True),
+        "tareas_pendientes_count": len(pendientes)
+    }
+
+
+def ejecutar(db_path, repeticiones=200, aceptadas="gzip, deflate, br"):
+    os.environ["JULIA_DB"] = db_path
+    import employee_tracking_portal as etp
+    from flask import render_template_string
+
+    datos = datos_dashboard(etp.portal, db_path)
+    anterior = json.dumps(a_json(datos), default=str).encode()
+    actual, codificacion = comprimir(a_json_bytes(datos), aceptadas)
+
+    with etp.app.app_context():
+        pagina_anterior = render_template_string(etp.HTML_TEMPLATE).encode()
+        tiempo_pagina_anterior = medir(lambda: render_template_string(etp.HTML_TEMPLATE).encode(),
+                                       repeticiones)
+
+    activos = etp.activos
+    visita = [a.variante(aceptadas)[0] for a in (activos.pagina, activos.css, activos.js)]
+
+    return {
+        "orjson": orjson is not None,
+        "brotli": brotli is not None,
+        "dashboard": {
+            "antes_us": medir(lambda: json.dumps(a_json(datos), default=str).encode(), repeticiones),
+            "despues_us": medir(lambda: comprimir(a_json_bytes(datos), aceptadas), repeticiones),
+            "solo_json_us": medir(lambda: a_json_bytes(datos), repeticiones),
+            "antes_bytes": len(anterior),
+            "despues_bytes": len(actual),
+            "codificacion": codificacion
+        },
+        "pagina": {
+            "antes_us": tiempo_pagina_anterior,
+            "despues_us": medir(lambda: activos.pagina.variante(aceptadas), repeticiones),
+            "antes_bytes": len(pagina_anterior),
+            "primera_visita_bytes": sum(len(v) for v in visita),
+            "visitas_siguientes_bytes": len(visita[0])
+        }
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de JSON, compresión y página del portal")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--db", default="julia_bench.db")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        generar_base(args.db, args.escala)
+    print(json.dumps(ejecutar(args.db, args.repeticiones), indent=2))
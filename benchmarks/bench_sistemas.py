@@ -0,0 +1,163 @@
+# Benchmark de Métodos Críticos de los Sistemas - Julia Confecciones
+#
+# Mide los métodos más usados de los cinco sistemas sobre una base sintética
+# (ver benchmarks.generador) y emite un reporte JSON comparable entre
+# ejecuciones.
+#
+# Uso:
+#   python -m benchmarks.bench_sistemas --escala pequena --salida base.json
+#   python -m benchmarks.bench_sistemas --escala pequena --comparar base.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.generador import ESCALAS, generar_base
+from frequent_customer_system import FrequentCustomerSystem
+from payment_system import PaymentSystem
+from reservation_system_implementation import ReservationSystem
+
+
+def medir(funcion, iteraciones):
+    """Ejecutar `funcion` varias veces y devolver estadísticas en milisegundos"""
+    tiempos = []
+    errores = 0
+
+    for i in range(iteraciones):
+        inicio = time.perf_counter()
+        try:
+            # Algunos métodos imprimen notificaciones simuladas
+            with contextlib.redirect_stdout(io.StringIO()):
+                resultado = funcion(i)
+        except Exception:
+            resultado = {"success": False}
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        if isinstance(resultado, dict) and resultado.get("success") is False:
+            errores += 1
+
+    tiempos.sort()
+    return {
+        "iteraciones": iteraciones,
+        "errores": errores,
+        "min_ms": round(tiempos[0], 3),
+        "media_ms": round(statistics.mean(tiempos), 3),
+        "p50_ms": round(tiempos[len(tiempos) // 2], 3),
+        "p95_ms": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+        "max_ms": round(tiempos[-1], 3),
+        "ops_por_segundo": round(1000 / statistics.mean(tiempos), 1)
+    }
+
+
+def casos(db_path, volumen, semilla=7):
+    """Construir los casos a medir: nombre -> función(i)"""
+    rnd = random.Random(semilla)
+    n_empleados = volumen["empleados"]
+    n_clientes = volumen["clientes"]
+
+    pagos = PaymentSystem(db_path)
+    clientes = FrequentCustomerSystem(db_path)
+    reservas = ReservationSystem(db_path)
+
+    fin = datetime.now()
+    inicio = fin - timedelta(days=30)
+
+    resultado = {
+        "PaymentSystem.calcular_sueldo_empleado": lambda i: pagos.calcular_sueldo_empleado(
+            rnd.randint(1, n_empleados), inicio, fin),
+        "PaymentSystem.generar_planilla_pagos": lambda i: pagos.generar_planilla_pagos(
+            fin.strftime("%Y-%m")),
+        "FrequentCustomerSystem.registrar_compra": lambda i: clientes.registrar_compra(
+            rnd.randint(1, n_clientes), rnd.randint(5, 50) * 1000),
+        "ReservationSystem.crear_reserva": lambda i: reservas.crear_reserva(
+            rnd.randint(1, n_clientes), 1500, 40000,
+            codigo_cupon="BENCH10" if i % 2 else None),
+        "PaymentSystem.verificar_pagos_pendientes": lambda i: pagos.verificar_pagos_pendientes(),
+    }
+
+    try:
+        from employee_tracking_portal import EmployeeTrackingPortal
+    except ImportError:
+        resultado["EmployeeTrackingPortal.obtener_tareas_pendientes"] = None
+    else:
+        portal = EmployeeTrackingPortal(db_path)
+        resultado["EmployeeTrackingPortal.obtener_tareas_pendientes"] = (
+            lambda i: portal.obtener_tareas_pendientes(
+                (i % n_empleados) + 1, 'cortador' if ((i % n_empleados) + 1) % 2 else 'costurero'))
+
+    return resultado
+
+
+def ejecutar(escala="pequena", db_path=None, iteraciones=50, regenerar=False):
+    """Generar (o reutilizar) la base y medir todos los casos"""
+    db_path = db_path or f"julia_bench_{escala}.db"
+    generacion = None
+
+    if regenerar or not os.path.exists(db_path):
+        generacion = generar_base(db_path, escala)
+
+    reporte = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "escala": escala,
+        "volumen": ESCALAS[escala],
+        "entorno": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform()
+        },
+        "generacion": generacion,
+        "resultados": {}
+    }
+
+    for nombre, funcion in casos(db_path, ESCALAS[escala]).items():
+        if funcion is None:
+            reporte["resultados"][nombre] = {"omitido": "dependencia no instalada (flask)"}
+            continue
+        reporte["resultados"][nombre] = medir(funcion, iteraciones)
+
+    return reporte
+
+
+def comparar(reporte, base):
+    """Comparar dos reportes: razón de la media actual / media base por método"""
+    comparacion = {}
+    for nombre, actual in reporte["resultados"].items():
+        anterior = base.get("resultados", {}).get(nombre)
+        if not anterior or "media_ms" not in actual or "media_ms" not in anterior:
+            continue
+        comparacion[nombre] = {
+            "media_base_ms": anterior["media_ms"],
+            "media_actual_ms": actual["media_ms"],
+            "razon": round(actual["media_ms"] / anterior["media_ms"], 3) if anterior["media_ms"] else None
+        }
+    return comparacion
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de los sistemas de Julia Confecciones")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--iteraciones", type=int, default=50)
+    parser.add_argument("--regenerar", action="store_true")
+    parser.add_argument("--salida", default=None, help="Archivo JSON donde guardar el reporte")
+    parser.add_argument("--comparar", default=None, help="Reporte JSON anterior para comparar")
+    args = parser.parse_args()
+
+    reporte = ejecutar(args.escala, args.db, args.iteraciones, args.regenerar)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            reporte["comparacion"] = comparar(reporte, json.load(f))
+
+    texto = json.dumps(reporte, indent=2, default=str)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    print(texto)
@@ -0,0 +1,257 @@
+# Prueba de Carga HTTP del Portal de Empleados - Julia Confecciones
+#
+# Simula N cortadores/costureros que inician sesión en /api/login y luego
+# consultan /api/dashboard en bucle, mientras una fracción de ellos actualiza
+# tareas en /api/tarea/actualizar. Reporta throughput, percentiles de latencia
+# y la tasa de errores "database is locked".
+#
+# Por defecto levanta la app Flask de employee_tracking_portal en un servidor
+# local con hilos sobre una base sintética; con --url se apunta a un servidor
+# ya levantado (por ejemplo detrás de gunicorn).
+#
+# Uso:
+#   python -m benchmarks.carga_portal --usuarios 40 --duracion 30 --fraccion-escritura 0.2
+
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.generador import ESCALAS, generar_base
+
+MENSAJE_BLOQUEO = "database is locked"
+
+
+class ContadorBloqueos(logging.Handler):
+    """Cuenta excepciones 'database is locked' registradas por la app Flask"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        texto = record.getMessage()
+        if record.exc_info and record.exc_info[1]:
+            texto += str(record.exc_info[1])
+        if MENSAJE_BLOQUEO in texto:
+            with self._lock:
+                self.total += 1
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    return round(valores[min(len(valores) - 1, int(len(valores) * p))], 2)
+
+
+def peticion(url, metodo="GET", cuerpo=None, token=None, timeout=30):
+    """Realizar una petición JSON; devuelve (status, dict|None, texto)"""
+    cabeceras = {"Content-Type": "application/json"}
+    if token:
+        cabeceras["Authorization"] = f"Bearer {token}"
+
+    datos = json.dumps(cuerpo).encode("utf-8") if cuerpo is not None else None
+    req = urllib.request.Request(url, data=datos, headers=cabeceras, method=metodo)
+
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as respuesta:
+            texto = respuesta.read().decode("utf-8", "replace")
+            status = respuesta.status
+    except urllib.error.HTTPError as e:
+        texto = e.read().decode("utf-8", "replace")
+        status = e.code
+
+    try:
+        return status, json.loads(texto), texto
+    except ValueError:
+        return status, None, texto
+
+
+class Usuario(threading.Thread):
+    """Empleado simulado: login y luego sondeo del dashboard"""
+
+    SIGUIENTE_ESTADO = {"pendiente": "en_proceso", "en_proceso": "completado"}
+
+    def __init__(self, base_url, codigo_acceso, fin, fraccion_escritura, intervalo,
+                 registrar, semilla):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.codigo_acceso = codigo_acceso
+        self.fin = fin
+        self.escritor = random.Random(semilla).random() < fraccion_escritura
+        self.intervalo = intervalo
+        self.registrar = registrar
+        self.rnd = random.Random(semilla)
+
+    def _llamar(self, endpoint, metodo="GET", cuerpo=None, token=None):
+        inicio = time.perf_counter()
+        try:
+            status, datos, texto = peticion(self.base_url + endpoint, metodo, cuerpo, token)
+        except Exception as e:
+            status, datos, texto = 0, None, str(e)
+        latencia = (time.perf_counter() - inicio) * 1000
+
+        ok = status == 200 and (datos is None or datos.get("success", True))
+        self.registrar(endpoint, latencia, ok, MENSAJE_BLOQUEO in texto)
+        return datos if status == 200 else None
+
+    def run(self):
+        datos = self._llamar("/api/login", "POST", {"codigo_acceso": self.codigo_acceso})
+        if not datos or not datos.get("success"):
+            return
+        token = datos["token_sesion"]
+
+        while time.monotonic() < self.fin:
+            dashboard = self._llamar("/api/dashboard", token=token)
+
+            if self.escritor and dashboard and dashboard.get("tareas_pendientes"):
+                tarea = self.rnd.choice(dashboard["tareas_pendientes"])
+                nuevo_estado = self.SIGUIENTE_ESTADO.get(tarea["estado"], "en_proceso")
+                self._llamar("/api/tarea/actualizar", "POST",
+                             {"id_produccion": tarea["id_produccion"], "nuevo_estado": nuevo_estado},
+                             token=token)
+
+            if self.intervalo:
+                time.sleep(self.intervalo)
+
+
+def iniciar_servidor_local(db_path):
+    """Levantar la app del portal en un servidor local con hilos"""
+    from werkzeug.serving import make_server
+
+    import employee_tracking_portal
+
+    employee_tracking_portal.portal.db_path = db_path
+    employee_tracking_portal.portal.init_database()
+
+    contador = ContadorBloqueos()
+    employee_tracking_portal.app.logger.addHandler(contador)
+    # Sin el log por petición de werkzeug
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    servidor = make_server("127.0.0.1", 0, employee_tracking_portal.app, threaded=True)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+
+    return servidor, contador, f"http://127.0.0.1:{servidor.server_port}"
+
+
+def codigos_empleados(db_path, cantidad):
+    """Códigos de acceso de empleados activos, repetidos si faltan"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT codigo_acceso FROM empleados
+        WHERE estado = 'activo' AND tipo_empleado IN ('cortador', 'costurero')
+        ORDER BY id_empleado
+    ''')
+    codigos = [c[0] for c in cursor.fetchall()]
+    conn.close()
+
+    # Más usuarios que empleados: varias sesiones por empleado (varias tablets)
+    return [codigos[i % len(codigos)] for i in range(cantidad)]
+
+
+def ejecutar(usuarios=20, duracion=20.0, fraccion_escritura=0.2, intervalo=0.0,
+             db_path=None, escala="pequena", url=None, regenerar=False):
+    """Ejecutar la prueba de carga y devolver el reporte"""
+    db_path = db_path or f"julia_bench_{escala}.db"
+    if regenerar or not os.path.exists(db_path):
+        generar_base(db_path, escala)
+
+    servidor = contador = None
+    if url:
+        base_url = url.rstrip("/")
+    else:
+        servidor, contador, base_url = iniciar_servidor_local(db_path)
+
+    muestras = defaultdict(list)
+    errores = defaultdict(int)
+    bloqueos = defaultdict(int)
+    lock = threading.Lock()
+
+    def registrar(endpoint, latencia, ok, bloqueo):
+        with lock:
+            muestras[endpoint].append(latencia)
+            if not ok:
+                errores[endpoint] += 1
+            if bloqueo:
+                bloqueos[endpoint] += 1
+
+    inicio = time.monotonic()
+    fin = inicio + duracion
+    hilos = [Usuario(base_url, codigo, fin, fraccion_escritura, intervalo, registrar, i)
+             for i, codigo in enumerate(codigos_empleados(db_path, usuarios))]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    transcurrido = time.monotonic() - inicio
+
+    if servidor:
+        servidor.shutdown()
+
+    total = sum(len(v) for v in muestras.values())
+    total_bloqueos = sum(bloqueos.values()) + (contador.total if contador else 0)
+
+    reporte = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "usuarios": usuarios,
+        "duracion_segundos": round(transcurrido, 2),
+        "fraccion_escritura": fraccion_escritura,
+        "intervalo_sondeo": intervalo,
+        "servidor": url or "local (werkzeug con hilos)",
+        "peticiones": total,
+        "peticiones_por_segundo": round(total / transcurrido, 1) if transcurrido else 0,
+        "errores": sum(errores.values()),
+        "bloqueos_database_locked": total_bloqueos,
+        "tasa_bloqueos": round(total_bloqueos / total, 4) if total else 0,
+        "endpoints": {}
+    }
+
+    for endpoint, latencias in sorted(muestras.items()):
+        latencias.sort()
+        reporte["endpoints"][endpoint] = {
+            "peticiones": len(latencias),
+            "errores": errores[endpoint],
+            "bloqueos_database_locked": bloqueos[endpoint],
+            "p50_ms": percentil(latencias, 0.50),
+            "p90_ms": percentil(latencias, 0.90),
+            "p99_ms": percentil(latencias, 0.99),
+            "max_ms": round(latencias[-1], 2)
+        }
+
+    return reporte
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga del portal de empleados")
+    parser.add_argument("--usuarios", type=int, default=20)
+    parser.add_argument("--duracion", type=float, default=20.0)
+    parser.add_argument("--fraccion-escritura", type=float, default=0.2)
+    parser.add_argument("--intervalo", type=float, default=0.0,
+                        help="Pausa entre consultas de cada usuario (0 = sin pausa)")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--url", default=None, help="URL de un portal ya levantado")
+    parser.add_argument("--regenerar", action="store_true")
+    parser.add_argument("--salida", default=None)
+    args = parser.parse_args()
+
+    reporte = ejecutar(args.usuarios, args.duracion, args.fraccion_escritura, args.intervalo,
+                       args.db, args.escala, args.url, args.regenerar)
+
+    texto = json.dumps(reporte, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    print(texto)
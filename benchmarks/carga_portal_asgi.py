@@ -0,0 +1,242 @@
+# Capacidad de Clientes Concurrentes: Portal Flask vs ASGI - Julia Confecciones
+#
+# Abre N conexiones en espera (clientes esperando notificaciones) y, mientras
+# siguen abiertas, M usuarios activos consultan /api/dashboard en bucle. Para
+# cada servidor reporta cuántos hilos consumen las conexiones en espera y la
+# latencia/throughput de los usuarios activos.
+#
+#   flask: app de employee_tracking_portal en werkzeug con hilos; cada
+#          conexión en espera ocupa un hilo del servidor.
+#   asgi:  portal_asgi en un servidor asyncio mínimo incluido aquí (para no
+#          depender de uvicorn en la prueba); las conexiones en espera son
+#          suscripciones SSE a /api/notificaciones/stream.
+#
+# Uso:
+#   python -m benchmarks.carga_portal_asgi --en-espera 500 --activos 20 --duracion 10
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.carga_portal import codigos_empleados, percentil, peticion
+from benchmarks.generador import ESCALAS, generar_base
+
+FRASES_HTTP = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class ServidorASGIMinimo:
+    """Servidor HTTP/1.1 asyncio mínimo (una petición por conexión) para apps ASGI"""
+
+    def __init__(self, app):
+        self.app = app
+        self.puerto = None
+        self._loop = asyncio.new_event_loop()
+        self._listo = threading.Event()
+        self._servidor = None
+        self._hilo = None
+
+    async def _atender(self, lector, escritor):
+        try:
+            cabecera = await lector.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            escritor.close()
+            return
+
+        lineas = cabecera.decode("latin-1").split("\r\n")
+        metodo, objetivo, _ = lineas[0].split(" ", 2)
+        encabezados = []
+        largo = 0
+        for linea in lineas[1:]:
+            if not linea:
+                continue
+            nombre, valor = linea.split(":", 1)
+            encabezados.append((nombre.strip().lower().encode(), valor.strip().encode()))
+            if nombre.strip().lower() == "content-length":
+                largo = int(valor)
+        cuerpo = await lector.readexactly(largo) if largo else b""
+        ruta, _, consulta = objetivo.partition("?")
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": metodo, "path": ruta, "query_string": consulta.encode(),
+            "headers": encabezados, "client": escritor.get_extra_info("peername"),
+        }
+        entregado = False
+
+        async def receive():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            # Después del cuerpo solo queda esperar a que el cliente cierre
+            await lector.read()
+            return {"type": "http.disconnect"}
+
+        async def send(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                salida = [f"HTTP/1.1 {estado} {FRASES_HTTP.get(estado, '')}".encode()]
+                salida += [n + b": " + v for n, v in mensaje.get("headers", [])]
+                salida.append(b"connection: close")
+                escritor.write(b"\r\n".join(salida) + b"\r\n\r\n")
+            else:
+                escritor.write(mensaje.get("body", b""))
+            await escritor.drain()
+
+        try:
+            await self.app(scope, receive, send)
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelada al detener el servidor: termina sin propagar la cancelación
+            pass
+        finally:
+            escritor.close()
+
+    def _ejecutar(self):
+        asyncio.set_event_loop(self._loop)
+        self._servidor = self._loop.run_until_complete(
+            asyncio.start_server(self._atender, "127.0.0.1", 0, backlog=4096))
+        self.puerto = self._servidor.sockets[0].getsockname()[1]
+        self._listo.set()
+        self._loop.run_forever()
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._ejecutar, daemon=True, name="servidor-asgi")
+        self._hilo.start()
+        self._listo.wait()
+        return f"http://127.0.0.1:{self.puerto}"
+
+    async def _cerrar(self):
+        self._servidor.close()
+        pendientes = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for tarea in pendientes:
+            tarea.cancel()
+        await asyncio.gather(*pendientes, return_exceptions=True)
+        self._loop.stop()
+
+    def detener(self):
+        asyncio.run_coroutine_threadsafe(self._cerrar(), self._loop)
+        self._hilo.join(5)
+
+
+def iniciar_servidor(modo, db_path):
+    """Levantar el portal Flask (werkzeug) o ASGI; devuelve (url, detener)"""
+    os.environ["JULIA_DB"] = db_path
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    if modo == "flask":
+        from werkzeug.serving import make_server
+
+        import employee_tracking_portal
+
+        employee_tracking_portal.portal.db_path = db_path
+        servidor = make_server("127.0.0.1", 0, employee_tracking_portal.app, threaded=True)
+        servidor.socket.listen(4096)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{servidor.server_port}", servidor.shutdown
+
+    import portal_asgi
+
+    portal_asgi.portal.portal.db_path = portal_asgi.portal.db_path = db_path
+    servidor = ServidorASGIMinimo(portal_asgi.app)
+    return servidor.iniciar(), servidor.detener
+
+
+def abrir_en_espera(modo, url, token, cantidad):
+    """Abrir conexiones que quedan esperando notificaciones"""
+    host, puerto = url.rsplit("/", 1)[-1].split(":")
+    sockets = []
+    for _ in range(cantidad):
+        s = socket.create_connection((host, int(puerto)))
+        if modo == "asgi":
+            s.sendall((f"GET /api/notificaciones/stream HTTP/1.1\r\nHost: {host}\r\n"
+                       f"Authorization: Bearer {token}\r\n\r\n").encode())
+        else:
+            # Mismo costo que un long-poll bloqueante: el hilo del servidor queda leyendo
+            s.sendall(f"GET /api/notificaciones HTTP/1.1\r\nHost: {host}\r\n".encode())
+        sockets.append(s)
+    return sockets
+
+
+def medir_activos(url, codigos, duracion):
+    """Usuarios activos: login y /api/dashboard en bucle durante `duracion` segundos"""
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+    fin = time.monotonic() + duracion
+
+    def usuario(codigo):
+        _, datos, _ = peticion(f"{url}/api/login", "POST", {"codigo_acceso": codigo})
+        token = (datos or {}).get("token_sesion")
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            estado, _, _ = peticion(f"{url}/api/dashboard", token=token)
+            latencia = (time.perf_counter() - inicio) * 1000
+            with lock:
+                latencias.append(latencia)
+                if estado != 200:
+                    errores[0] += 1
+
+    hilos = [threading.Thread(target=usuario, args=(c,)) for c in codigos]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    latencias.sort()
+    return latencias, errores[0]
+
+
+def ejecutar_modo(modo, db_path, en_espera, activos, duracion):
+    url, detener = iniciar_servidor(modo, db_path)
+    codigos = codigos_empleados(db_path, activos)
+    _, datos, _ = peticion(f"{url}/api/login", "POST", {"codigo_acceso": codigos[0]})
+
+    hilos_antes = threading.active_count()
+    sockets = abrir_en_espera(modo, url, datos["token_sesion"], en_espera)
+    time.sleep(1.0)
+    hilos_en_espera = threading.active_count() - hilos_antes
+
+    latencias, errores = medir_activos(url, codigos, duracion)
+
+    for s in sockets:
+        s.close()
+    detener()
+
+    return {
+        "conexiones_en_espera": en_espera,
+        "hilos_por_conexiones_en_espera": hilos_en_espera,
+        "usuarios_activos": activos,
+        "peticiones": len(latencias),
+        "peticiones_por_segundo": round(len(latencias) / duracion, 1),
+        "errores": errores,
+        "p50_ms": percentil(latencias, 0.50),
+        "p99_ms": percentil(latencias, 0.99)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capacidad de clientes concurrentes del portal")
+    parser.add_argument("--en-espera", type=int, default=500)
+    parser.add_argument("--activos", type=int, default=20)
+    parser.add_argument("--duracion", type=float, default=10.0)
+    parser.add_argument("--modo", choices=["flask", "asgi", "ambos"], default="ambos")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--db", default=None)
+    args = parser.parse_args()
+
+    db_path = args.db or f"julia_bench_{args.escala}.db"
+    if not os.path.exists(db_path):
+        generar_base(db_path, args.escala)
+
+    modos = ["flask", "asgi"] if args.modo == "ambos" else [args.modo]
+    reporte = {"fecha": datetime.now().isoformat(timespec="seconds"), "resultados": {}}
+    for modo in modos:
+        reporte["resultados"][modo] = ejecutar_modo(modo, db_path, args.en_espera,
+                                                    args.activos, args.duracion)
+    print(json.dumps(reporte, indent=2))
@@ -0,0 +1,213 @@
+# Prueba de Estrés de Escrituras Concurrentes - Julia Confecciones
+#
+# Varios procesos, cada uno con varios hilos, ejecutan una mezcla de
+# escrituras de los cinco sistemas sobre la misma base. Un fallo cuyo error es
+# un bloqueo de SQLite ("database is locked" / "busy") es un fallo espurio: la
+# prueba termina con código 1 si hay al menos uno.
+#
+# Uso:
+#   python -m benchmarks.estres_escrituras --procesos 4 --hilos 16 --operaciones 50
+#   python -m benchmarks.estres_escrituras --sin-politica   # sin timeouts ni reintentos
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+
+from benchmarks.generador import ESCALAS, generar_base
+
+# Sin política: sin busy timeout, sin reintentos y una transacción por llamada
+ENTORNO_SIN_POLITICA = {
+    "JULIA_SQLITE_TIMEOUT": "0",
+    "JULIA_SQLITE_REINTENTOS": "0",
+    "JULIA_ESCRITOR_UNICO": "0"
+}
+
+
+def es_espurio(error):
+    mensaje = str(error).lower()
+    return "locked" in mensaje or "busy" in mensaje
+
+
+def crear_sistemas(db_path):
+    """Instanciar los sistemas (cada constructor también escribe: init_database)"""
+    from frequent_customer_system import FrequentCustomerSystem
+    from payment_system import PaymentSystem
+    from production_tracking_system import ProductionTrackingSystem
+    from reservation_system_implementation import ReservationSystem
+
+    return (ProductionTrackingSystem(db_path), PaymentSystem(db_path),
+            FrequentCustomerSystem(db_path), ReservationSystem(db_path))
+
+
+def operaciones(sistemas, volumen, rnd):
+    """Mezcla de escrituras: lista de (nombre, función sin argumentos)"""
+    produccion, pagos, clientes, reservas = sistemas
+
+    def cliente():
+        return rnd.randint(1, volumen["clientes"])
+
+    def orden():
+        return rnd.randint(1, volumen["produccion"])
+
+    def empleado():
+        return rnd.randint(1, volumen["empleados"])
+
+    def material():
+        return rnd.randint(1, volumen["materiales"])
+
+    def proveedor():
+        return rnd.randint(1, volumen["proveedores"])
+
+    return [
+        ("crear_reserva", lambda: reservas.crear_reserva(
+            cliente(), 1500, 40000, codigo_cupon="BENCH10")),
+        ("registrar_pago_reserva", lambda: reservas.registrar_pago_reserva(
+            rnd.randint(1, volumen["reservas"]), 1000, "efectivo")),
+        ("expirar_reservas", lambda: reservas.expirar_reservas(
+            [rnd.randint(1, volumen["reservas"]) for _ in range(5)])),
+        ("registrar_compra", lambda: clientes.registrar_compra(cliente(), 5000)),
+        ("enviar_a_corte", lambda: produccion.enviar_a_corte(orden(), empleado())),
+        ("confirmar_recepcion_costura", lambda: produccion.confirmar_recepcion_costura(
+            orden(), empleado())),
+        ("crear_orden_produccion", lambda: produccion.crear_orden_produccion(
+            rnd.randint(1, 10**9), "reserva", [{"id_material": material(), "cantidad": 0.01}])),
+        ("registrar_compra_proveedor", lambda: pagos.registrar_compra_proveedor(
+            proveedor(), material(), 5, 1200, "credito", credito_dias=30)),
+        ("registrar_compras_proveedor_lote", lambda: pagos.registrar_compras_proveedor_lote([
+            {"id_proveedor": proveedor(), "id_material": material(), "cantidad": 2,
+             "precio_unitario": 900, "comprobante": "F-ESTRES", "credito_dias": 15}
+            for _ in range(3)])),
+        ("procesar_pago_empleado", lambda: pagos.procesar_pago_empleado(
+            empleado(), 1000, "fijo", "estres")),
+    ]
+
+
+def trabajador(db_path, escala, hilos, cantidad, semilla, cola):
+    """Proceso de la prueba: `hilos` hilos ejecutan `cantidad` operaciones cada uno"""
+    from metrics import registro
+
+    resultados = {"ok": 0, "negocio": 0, "espurios": 0, "ejemplos_espurios": [],
+                  "por_operacion": {}}
+    lock = threading.Lock()
+
+    try:
+        sistemas = crear_sistemas(db_path)
+    except Exception as e:
+        resultados["espurios" if es_espurio(e) else "negocio"] += 1
+        resultados["ejemplos_espurios"].append(f"inicialización: {e}")
+        resultados["reintentos"] = 0
+        cola.put(resultados)
+        return
+
+    def hilo(numero):
+        rnd = random.Random(semilla * 1000 + numero)
+        mezcla = operaciones(sistemas, ESCALAS[escala], rnd)
+        for _ in range(cantidad):
+            nombre, funcion = rnd.choice(mezcla)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    resultado = funcion()
+                error = None if not isinstance(resultado, dict) or resultado.get("success", True) \
+                    else resultado.get("error", "")
+            except Exception as e:
+                error = str(e)
+
+            with lock:
+                conteo = resultados["por_operacion"].setdefault(nombre, {"ok": 0, "fallos": 0})
+                if error is None:
+                    resultados["ok"] += 1
+                    conteo["ok"] += 1
+                    continue
+                conteo["fallos"] += 1
+                if es_espurio(error):
+                    resultados["espurios"] += 1
+                    if len(resultados["ejemplos_espurios"]) < 5:
+                        resultados["ejemplos_espurios"].append(f"{nombre}: {error}")
+                else:
+                    resultados["negocio"] += 1
+
+    hilos_activos = [threading.Thread(target=hilo, args=(n,)) for n in range(hilos)]
+    for h in hilos_activos:
+        h.start()
+    for h in hilos_activos:
+        h.join()
+
+    resultados["reintentos"] = registro.contador(
+        "julia_sqlite_reintentos_total", "", ("operacion",)).total()
+    cola.put(resultados)
+
+
+def ejecutar(escala="pequena", db_path=None, procesos=4, hilos=16, cantidad=50,
+             regenerar=False, sin_politica=False):
+    """Lanzar los procesos de la prueba y consolidar sus resultados"""
+    db_path = db_path or f"julia_bench_{escala}.db"
+    if regenerar or not os.path.exists(db_path):
+        generar_base(db_path, escala)
+
+    if sin_politica:
+        # Los procesos hijos (spawn) leen la configuración al importar database
+        os.environ.update(ENTORNO_SIN_POLITICA)
+
+    contexto = multiprocessing.get_context("spawn")
+    cola = contexto.Queue()
+    inicio = time.perf_counter()
+    lanzados = [
+        contexto.Process(target=trabajador,
+                         args=(db_path, escala, hilos, cantidad, p + 1, cola))
+        for p in range(procesos)
+    ]
+    for proceso in lanzados:
+        proceso.start()
+    parciales = [cola.get() for _ in lanzados]
+    for proceso in lanzados:
+        proceso.join()
+    duracion = time.perf_counter() - inicio
+
+    reporte = {
+        "escala": escala,
+        "politica": "sin timeouts ni reintentos" if sin_politica else "busy timeout + reintentos",
+        "procesos": procesos,
+        "hilos_por_proceso": hilos,
+        "operaciones": procesos * hilos * cantidad,
+        "segundos": round(duracion, 2),
+        "operaciones_por_segundo": round(procesos * hilos * cantidad / duracion, 1),
+        "ok": sum(p["ok"] for p in parciales),
+        "fallos_negocio": sum(p["negocio"] for p in parciales),
+        "fallos_espurios": sum(p["espurios"] for p in parciales),
+        "reintentos": sum(p["reintentos"] for p in parciales),
+        "ejemplos_espurios": [e for p in parciales for e in p["ejemplos_espurios"]][:5],
+        "por_operacion": {}
+    }
+    for parcial in parciales:
+        for nombre, conteo in parcial["por_operacion"].items():
+            total = reporte["por_operacion"].setdefault(nombre, {"ok": 0, "fallos": 0})
+            total["ok"] += conteo["ok"]
+            total["fallos"] += conteo["fallos"]
+    return reporte
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estrés de escrituras concurrentes sobre SQLite")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--operaciones", type=int, default=50, help="Operaciones por hilo")
+    parser.add_argument("--regenerar", action="store_true")
+    parser.add_argument("--sin-politica", action="store_true",
+                        help="Desactivar busy timeout, reintentos y escritor único (línea base)")
+    args = parser.parse_args()
+
+    reporte = ejecutar(args.escala, args.db, args.procesos, args.hilos, args.operaciones,
+                       args.regenerar, args.sin_politica)
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+
+    if reporte["fallos_espurios"]:
+        sys.exit(1)
@@ -0,0 +1,259 @@
+# Generador de Bases de Datos Sintéticas - Julia Confecciones
+#
+# Construye un julia_confecciones.db con datos ficticios a distintas escalas
+# para medir los sistemas con volúmenes realistas de temporada.
+#
+# Uso: python -m benchmarks.generador --escala mediana --db /tmp/julia_bench.db
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from payment_system import PaymentSystem
+from schema import asegurar_esquema, vincular_compras_cuentas
+
+ESCALAS = {
+    "pequena": {
+        "empleados": 10, "produccion": 5_000, "materiales": 50,
+        "clientes": 1_000, "compras_cliente": 20_000, "reservas": 2_000,
+        "proveedores": 10, "compras_proveedores": 1_000, "notificaciones": 5_000
+    },
+    "mediana": {
+        "empleados": 50, "produccion": 100_000, "materiales": 200,
+        "clientes": 20_000, "compras_cliente": 500_000, "reservas": 20_000,
+        "proveedores": 50, "compras_proveedores": 10_000, "notificaciones": 50_000
+    },
+    "grande": {
+        "empleados": 200, "produccion": 1_000_000, "materiales": 500,
+        "clientes": 100_000, "compras_cliente": 2_000_000, "reservas": 100_000,
+        "proveedores": 200, "compras_proveedores": 50_000, "notificaciones": 500_000
+    }
+}
+
+TAMANO_LOTE = 10_000
+
+
+def _insertar_en_lotes(cursor, sql, filas):
+    """Insertar un generador de filas en lotes de TAMANO_LOTE"""
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= TAMANO_LOTE:
+            cursor.executemany(sql, lote)
+            lote = []
+    if lote:
+        cursor.executemany(sql, lote)
+
+
+def _fecha(rnd, desde, dias):
+    return desde + timedelta(days=rnd.random() * dias)
+
+
+def crear_esquema(db_path):
+    """Crear el esquema de los cinco sistemas (incluido el portal, sin requerir Flask)"""
+    asegurar_esquema(db_path)
+
+
+def generar_base(db_path, escala="pequena", semilla=42):
+    """Generar una base sintética; devuelve un dict con los volúmenes creados"""
+    volumen = ESCALAS[escala]
+    rnd = random.Random(semilla)
+    ahora = datetime.now()
+    hace_dos_anos = ahora - timedelta(days=730)
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    inicio = time.perf_counter()
+    crear_esquema(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    cursor = conn.cursor()
+
+    # Empleados: mitad cortadores, mitad costureros
+    n_empleados = volumen["empleados"]
+    cursor.executemany('''
+        INSERT INTO empleados
+        (rut, nombre, email, celular, tipo_empleado, sueldo_fijo, precio_prenda,
+         fecha_contratacion, codigo_acceso)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(f"{10_000_000 + i}-{i % 10}", f"Empleado {i}", f"empleado{i}@email.com",
+           f"9{i:08d}", 'cortador' if i % 2 else 'costurero', rnd.choice((0, 250000)),
+           rnd.choice((3000, 5000, 8000)), hace_dos_anos.date(), f"EMP{i:05d}")
+          for i in range(1, n_empleados + 1)])
+
+    cortadores = [i for i in range(1, n_empleados + 1) if i % 2]
+    costureros = [i for i in range(1, n_empleados + 1) if not i % 2] or cortadores
+
+    cursor.executemany('''
+        INSERT INTO materiales
+        (nombre, tipo, unidad_medida, stock_actual, stock_minimo, costo_unitario)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(f"Material {i}", rnd.choice(('tela', 'hilo', 'boton', 'cierre')), 'unidades',
+           rnd.randint(0, 500), rnd.randint(10, 50), rnd.randint(100, 5000))
+          for i in range(1, volumen["materiales"] + 1)])
+
+    # Producción: la mayoría histórica (completada y pagada), el resto abierta
+    def filas_produccion():
+        for i in range(1, volumen["produccion"] + 1):
+            asignacion = _fecha(rnd, hace_dos_anos, 730)
+            abierta = rnd.random() < 0.05
+            estado_corte = rnd.choice(('pendiente', 'en_proceso')) if abierta else 'completado'
+            estado_costura = 'pendiente' if abierta else rnd.choice(('completado',) * 9 + ('en_proceso',))
+            entrega_corte = None if abierta else asignacion + timedelta(days=rnd.randint(1, 5))
+            entrega_costura = (entrega_corte + timedelta(days=rnd.randint(1, 7))
+                               if estado_costura == 'completado' else None)
+            pagado = not abierta and asignacion < ahora - timedelta(days=30)
+            yield (i, rnd.choice(('venta', 'reserva', 'stock')), rnd.choice(cortadores),
+                   rnd.choice(costureros), asignacion, entrega_corte, entrega_costura,
+                   estado_corte, estado_costura, rnd.choice((3000, 5000)), rnd.choice((6000, 8000)),
+                   'pagado' if pagado else 'pendiente', 'pagado' if pagado else 'pendiente')
+
+    _insertar_en_lotes(cursor, '''
+        INSERT INTO produccion
+        (id_orden, tipo_orden, id_cortador, id_costurero, fecha_asignacion,
+         fecha_entrega_corte, fecha_entrega_costura, estado_corte, estado_costura,
+         pago_corte, pago_costura, estado_pago_corte, estado_pago_costura)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', filas_produccion())
+
+    # Envíos para las órdenes abiertas (las consultas del portal los unen)
+    cursor.execute('''
+        INSERT INTO envios_proveedores (tipo_proveedor, id_proveedor, id_produccion, fecha_envio)
+        SELECT 'cortador', id_cortador, id_produccion, fecha_asignacion
+        FROM produccion WHERE estado_corte IN ('pendiente', 'en_proceso')
+    ''')
+
+    # Clientes y compras
+    n_clientes = volumen["clientes"]
+    cursor.executemany('''
+        INSERT INTO clientes (rut, nombre, email, celular, fecha_registro)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(f"{20_000_000 + i}-{i % 10}", f"Cliente {i}", f"cliente{i}@email.com",
+           f"9{i:08d}", _fecha(rnd, hace_dos_anos, 365)) for i in range(1, n_clientes + 1)])
+
+    _insertar_en_lotes(cursor, '''
+        INSERT INTO compras_cliente (id_cliente, monto_compra, fecha_compra, tipo_compra)
+        VALUES (?, ?, ?, ?)
+    ''', ((rnd.randint(1, n_clientes), rnd.randint(5, 80) * 1000,
+           _fecha(rnd, hace_dos_anos, 730), rnd.choice(('directa', 'reserva')))
+          for _ in range(volumen["compras_cliente"])))
+
+    # Totales y niveles de clientes consistentes con las compras
+    cursor.execute('''
+        UPDATE clientes SET
+            total_compras = COALESCE((SELECT SUM(monto_compra) FROM compras_cliente cc
+                                      WHERE cc.id_cliente = clientes.id_cliente), 0),
+            ultima_compra = (SELECT MAX(fecha_compra) FROM compras_cliente cc
+                             WHERE cc.id_cliente = clientes.id_cliente)
+    ''')
+    cursor.execute('''
+        UPDATE clientes SET
+            tipo_cliente = CASE WHEN total_compras >= 200000 THEN 'vip'
+                                WHEN total_compras >= 100000 THEN 'frecuente'
+                                ELSE 'regular' END,
+            descuento_frecuente = CASE WHEN total_compras >= 200000 THEN 15.0
+                                       WHEN total_compras >= 100000 THEN 10.0
+                                       WHEN total_compras >= 50000 THEN 5.0
+                                       ELSE 0.0 END
+    ''')
+
+    cursor.execute('''
+        INSERT INTO cupones (codigo, tipo_descuento, valor_descuento, tipo_cupon,
+                             fecha_inicio, fecha_vencimiento, usos_maximos)
+        VALUES ('BENCH10', 'porcentaje', 10.0, 'reserva',
+                datetime('now', '-1 day'), datetime('now', '+365 days'), 100000000)
+    ''')
+
+    def filas_reservas():
+        for _ in range(volumen["reservas"]):
+            fecha_reserva = _fecha(rnd, ahora - timedelta(days=365), 365)
+            monto = rnd.randint(10, 100) * 1000
+            yield (rnd.randint(1, n_clientes), rnd.randint(1000, 2000), fecha_reserva,
+                   fecha_reserva + timedelta(days=7), monto, monto / 2, monto / 2,
+                   rnd.choice(('pendiente', 'confirmada', 'completada', 'cancelada')))
+
+    _insertar_en_lotes(cursor, '''
+        INSERT INTO reservas
+        (id_cliente, id_producto, fecha_reserva, fecha_vencimiento, monto_total,
+         monto_reserva, monto_pendiente, estado)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', filas_reservas())
+
+    # Proveedores, compras a crédito y cuentas por pagar
+    n_proveedores = volumen["proveedores"]
+    cursor.executemany('''
+        INSERT INTO proveedores_materiales
+        (rut, nombre, email, celular, direccion, tipo_material, forma_pago, credito_dias)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(f"{30_000_000 + i}-{i % 10}", f"Proveedor {i}", f"proveedor{i}@email.com",
+           f"9{i:08d}", f"Calle {i}", 'tela', 'transferencia', 30)
+          for i in range(1, n_proveedores + 1)])
+
+    def filas_compras_proveedores():
+        for i in range(volumen["compras_proveedores"]):
+            compra = _fecha(rnd, ahora - timedelta(days=365), 365)
+            cantidad = rnd.randint(10, 200)
+            precio = rnd.randint(500, 5000)
+            pendiente = rnd.random() < 0.2
+            yield (rnd.randint(1, n_proveedores), rnd.randint(1, volumen["materiales"]),
+                   cantidad, precio, cantidad * precio, compra,
+                   None if pendiente else compra + timedelta(days=30),
+                   compra + timedelta(days=30), 'pendiente' if pendiente else 'pagado',
+                   'credito', f"F-{i}")
+
+    _insertar_en_lotes(cursor, '''
+        INSERT INTO compras_proveedores
+        (id_proveedor, id_material, cantidad, precio_unitario, total, fecha_compra,
+         fecha_pago, fecha_vencimiento, estado_pago, metodo_pago, comprobante)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', filas_compras_proveedores())
+
+    cursor.execute('''
+        INSERT INTO cuentas_por_pagar (tipo_cuenta, id_referencia, monto, fecha_vencimiento)
+        SELECT 'proveedor', id_proveedor, total, fecha_vencimiento
+        FROM compras_proveedores WHERE estado_pago = 'pendiente'
+    ''')
+    vincular_compras_cuentas(cursor)
+
+    # Notificaciones del portal (si sus tablas existen)
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'notificaciones_produccion'")
+    if cursor.fetchone():
+        _insertar_en_lotes(cursor, '''
+            INSERT INTO notificaciones_produccion
+            (id_empleado, id_produccion, tipo_notificacion, mensaje, fecha_envio, estado)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', ((rnd.randint(1, n_empleados), rnd.randint(1, volumen["produccion"]),
+               rnd.choice(('nueva_tarea', 'recordatorio', 'actualizacion')), "Mensaje de prueba",
+               _fecha(rnd, ahora - timedelta(days=180), 180),
+               rnd.choice(('leida', 'leida', 'leida', 'no_leida')))
+              for _ in range(volumen["notificaciones"])))
+
+    conn.commit()
+    conn.close()
+
+    # Reconstruir el estado de antigüedad a partir de las cuentas generadas
+    PaymentSystem(db_path).reconstruir_antiguedad_cxp()
+
+    return {
+        "escala": escala,
+        "semilla": semilla,
+        "volumen": volumen,
+        "segundos_generacion": round(time.perf_counter() - inicio, 2),
+        "tamano_bytes": os.path.getsize(db_path)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generar base sintética de Julia Confecciones")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--db", default="julia_bench.db")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    print(generar_base(args.db, args.escala, args.semilla))
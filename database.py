@@ -0,0 +1,85 @@
+# Conexiones a la Base de Datos - Julia Confecciones
+#
+# Política común de acceso: toda conexión espera hasta JULIA_SQLITE_TIMEOUT
+# segundos por un bloqueo antes de fallar (busy timeout), y las escrituras
+# transaccionales se reintentan con espera exponencial y jitter cuando SQLite
+# responde "database is locked" / "database is busy".
+#
+# db_path puede ser también una URL postgresql:// (ver postgres_backend): los
+# sistemas no cambian, solo la conexión que reciben.
+
+import logging
+import os
+import random
+import sqlite3
+import time
+
+from metrics import registro
+from sql_instrumentation import ConexionInstrumentada
+
+logger = logging.getLogger("julia.db")
+
+TIMEOUT_S = float(os.getenv("JULIA_SQLITE_TIMEOUT", "30"))
+REINTENTOS = int(os.getenv("JULIA_SQLITE_REINTENTOS", "5"))
+ESPERA_BASE_S = float(os.getenv("JULIA_SQLITE_ESPERA_BASE", "0.05"))
+ESPERA_MAXIMA_S = float(os.getenv("JULIA_SQLITE_ESPERA_MAXIMA", "2"))
+
+_reintentos = registro.contador(
+    "julia_sqlite_reintentos_total", "Reintentos por bloqueo transitorio de SQLite", ("operacion",))
+_agotados = registro.contador(
+    "julia_sqlite_reintentos_agotados_total", "Operaciones que fallaron tras agotar los reintentos",
+    ("operacion",))
+
+
+def es_postgres(db_path):
+    """True si db_path es una URL de PostgreSQL en vez de un archivo SQLite"""
+    return isinstance(db_path, str) and db_path.startswith(("postgresql://", "postgres://"))
+
+
+def conectar(db_path, **kwargs):
+    """Abrir una conexión SQLite instrumentada (ver sql_instrumentation)
+
+    Con una URL postgresql:// la conexión sale del pool de postgres_backend,
+    con la misma interfaz.
+    """
+    if es_postgres(db_path):
+        import postgres_backend
+        return postgres_backend.conectar(db_path, **kwargs)
+
+    kwargs.setdefault("timeout", TIMEOUT_S)
+    return sqlite3.connect(db_path, factory=ConexionInstrumentada, **kwargs)
+
+
+def es_bloqueo_transitorio(error):
+    """True si el error es SQLITE_BUSY / SQLITE_LOCKED y vale la pena reintentar"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    mensaje = str(error).lower()
+    return "locked" in mensaje or "busy" in mensaje
+
+
+def con_reintentos(funcion, nombre="", intentos=None, espera_base=None, espera_maxima=None):
+    """Ejecutar funcion() reintentando los bloqueos transitorios
+
+    Solo para operaciones idempotentes o transacciones que se deshacen por
+    completo al fallar. La espera es exponencial con jitter completo para que
+    los hilos que chocaron no vuelvan a chocar en el mismo instante.
+    """
+    intentos = REINTENTOS if intentos is None else intentos
+    espera_base = ESPERA_BASE_S if espera_base is None else espera_base
+    espera_maxima = ESPERA_MAXIMA_S if espera_maxima is None else espera_maxima
+
+    for intento in range(intentos + 1):
+        try:
+            return funcion()
+        except sqlite3.OperationalError as e:
+            if not es_bloqueo_transitorio(e):
+                raise
+            if intento == intentos:
+                _agotados.inc(operacion=nombre)
+                raise
+            _reintentos.inc(operacion=nombre)
+            espera = random.uniform(0, min(espera_maxima, espera_base * 2 ** intento))
+            logger.info("Bloqueo transitorio en %s (intento %d/%d), reintento en %.3f s: %s",
+                        nombre or "escritura", intento + 1, intentos, espera, e)
+            time.sleep(espera)
@@ -0,0 +1,312 @@
+# Mantención de la Base de Datos - Julia Confecciones
+#
+# Tareas periódicas sobre el archivo SQLite, pensadas para sweep_scheduler:
+#
+#   - estadísticas: ANALYZE acotado por PRAGMA analysis_limit y PRAGMA
+#     optimize, para que el planificador vea el tamaño real de las tablas
+#     tras el archivado y el particionado
+#   - vacío incremental: con auto_vacuum=INCREMENTAL, PRAGMA
+#     incremental_vacuum en pasos de PAGINAS_VACIO páginas (cada paso es
+#     una transacción corta) y solo en HORAS_TRANQUILAS. Una base creada sin
+#     auto_vacuum se convierte una vez con VACUUM, también en esas horas
+#   - integridad: PRAGMA quick_check en una conexión de solo lectura
+#   - mediciones: tamaño del archivo y del WAL, páginas y páginas libres,
+#     guardadas en mantencion_metricas para ver su evolución
+#
+# Uso:
+#   python db_maintenance.py --db julia_confecciones.db [--estadisticas] [--vaciar] [--integridad]
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+from database import conectar, con_reintentos, es_postgres
+from metrics import registro
+from schema import asegurar_esquema
+from sqlite_writer import escribir
+
+logger = logging.getLogger("julia.mantencion")
+
+PAGINAS_VACIO = int(os.getenv("JULIA_MANTENCION_PAGINAS_VACIO", "1000"))
+MAX_PASOS_VACIO = int(os.getenv("JULIA_MANTENCION_MAX_PASOS_VACIO", "50"))
+PAUSA_S = float(os.getenv("JULIA_MANTENCION_PAUSA_MS", "50")) / 1000
+LIMITE_ANALISIS = int(os.getenv("JULIA_MANTENCION_LIMITE_ANALISIS", "1000"))
+HORAS_TRANQUILAS = os.getenv("JULIA_MANTENCION_HORAS_TRANQUILAS", "1-6")
+
+# PRAGMA auto_vacuum
+AUTO_VACUUM = {0: "none", 1: "full", 2: "incremental"}
+
+_duracion = registro.histograma(
+    "julia_mantencion_duracion_segundos", "Duración de las tareas de mantención", ("operacion",))
+
+
+def _horas(rango):
+    """'1-6' -> {1, ..., 6}; '22-3' cruza la medianoche; '' -> todas"""
+    if not rango:
+        return set(range(24))
+    inicio, _, fin = rango.partition("-")
+    inicio, fin = int(inicio), int(fin or inicio)
+    if inicio <= fin:
+        return set(range(inicio, fin + 1))
+    return set(range(inicio, 24)) | set(range(0, fin + 1))
+
+
+class MantencionBase:
+    """Estadísticas, vacío incremental, integridad y mediciones de una base SQLite"""
+
+    def __init__(self, db_path, paginas_vacio=PAGINAS_VACIO, max_pasos=MAX_PASOS_VACIO,
+                 limite_analisis=LIMITE_ANALISIS, horas_tranquilas=HORAS_TRANQUILAS):
+        if es_postgres(db_path):
+            raise ValueError("En PostgreSQL la mantención la hace autovacuum")
+        asegurar_esquema(db_path)
+        self.db_path = db_path
+        self.paginas_vacio = paginas_vacio
+        self.max_pasos = max_pasos
+        self.limite_analisis = limite_analisis
+        self.horas_tranquilas = _horas(horas_tranquilas)
+
+        registro.registrar_colector(f"mantencion:{os.path.abspath(db_path)}", self._colector_metricas)
+
+    def _conectar(self):
+        return conectar(self.db_path, isolation_level=None)
+
+    def en_horas_tranquilas(self, momento=None):
+        """True si `momento` (ahora, hora local) cae en HORAS_TRANQUILAS"""
+        return (momento or datetime.now()).hour in self.horas_tranquilas
+
+    def _pragmas(self, conn):
+        cursor = conn.cursor()
+        valores = {}
+        for pragma in ("page_count", "freelist_count", "page_size", "auto_vacuum"):
+            cursor.execute(f"PRAGMA {pragma}")
+            valores[pragma] = cursor.fetchone()[0]
+        return valores
+
+    def medir(self, operacion="medicion", integridad=None, duracion=None):
+        """Tamaño y páginas libres de la base; se guarda en mantencion_metricas"""
+        conn = self._conectar()
+        try:
+            pragmas = self._pragmas(conn)
+        finally:
+            conn.close()
+
+        wal = self.db_path + "-wal"
+        medicion = {
+            "fecha": time.time(),
+            "operacion": operacion,
+            "tamano_bytes": os.path.getsize(self.db_path),
+            "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+            "paginas": pragmas["page_count"],
+            "paginas_libres": pragmas["freelist_count"],
+            "tamano_pagina": pragmas["page_size"],
+            "auto_vacuum": pragmas["auto_vacuum"],
+            "integridad": integridad,
+            "duracion_segundos": duracion
+        }
+
+        escribir(self.db_path, lambda cursor: cursor.execute(f'''
+            INSERT INTO mantencion_metricas ({", ".join(medicion)})
+            VALUES ({", ".join("?" for _ in medicion)})
+        ''', tuple(medicion.values())))
+        return medicion
+
+    def actualizar_estadisticas(self):
+        """ANALYZE acotado por analysis_limit y PRAGMA optimize"""
+        inicio = time.perf_counter()
+        conn = self._conectar()
+        try:
+            # analysis_limit: ANALYZE muestrea a lo más N filas por índice en vez de recorrerlo
+            conn.execute(f"PRAGMA analysis_limit = {int(self.limite_analisis)}")
+            con_reintentos(lambda: conn.execute("ANALYZE"), "mantencion.analyze")
+            con_reintentos(lambda: conn.execute("PRAGMA optimize"), "mantencion.optimize")
+            duracion = time.perf_counter() - inicio
+            _duracion.observar(duracion, operacion="estadisticas")
+            return {"success": True, "duracion_segundos": round(duracion, 4),
+                    "medicion": self.medir("estadisticas", duracion=duracion)}
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        finally:
+            conn.close()
+
+    def activar_vacio_incremental(self, conn):
+        """Convertir a auto_vacuum=INCREMENTAL con un VACUUM completo; False si ya lo estaba"""
+        if self._pragmas(conn)["auto_vacuum"] == 2:
+            return False
+        # VACUUM reescribe el archivo y bloquea a los escritores mientras dura: una sola vez
+        logger.info("Activando auto_vacuum=INCREMENTAL en %s (VACUUM)", self.db_path)
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        con_reintentos(lambda: conn.execute("VACUUM"), "mantencion.vacuum")
+        return True
+
+    def _paso_vacio(self, conn):
+        # executescript avanza el PRAGMA hasta el final; execute() liberaría una sola página
+        try:
+            conn.executescript(f"BEGIN IMMEDIATE; PRAGMA incremental_vacuum({int(self.paginas_vacio)}); COMMIT;")
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    def vaciar_incremental(self, forzar=False):
+        """Devolver páginas libres al sistema en pasos acotados (solo en horas tranquilas)"""
+        if not forzar and not self.en_horas_tranquilas():
+            return {"success": True, "omitido": "fuera de horas tranquilas", "paginas_liberadas": 0}
+
+        inicio = time.perf_counter()
+        conn = self._conectar()
+        try:
+            convertida = self.activar_vacio_incremental(conn)
+            libres_antes = self._pragmas(conn)["freelist_count"]
+            pasos = 0
+            while pasos < self.max_pasos and self._pragmas(conn)["freelist_count"]:
+                con_reintentos(lambda: self._paso_vacio(conn), "mantencion.vacio")
+                pasos += 1
+                time.sleep(PAUSA_S)
+            libres = self._pragmas(conn)["freelist_count"]
+            # Con WAL el archivo se achica al pasar las páginas del WAL a la base
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+
+            duracion = time.perf_counter() - inicio
+            _duracion.observar(duracion, operacion="vacio")
+            return {
+                "success": True,
+                "convertida": convertida,
+                "pasos": pasos,
+                "paginas_liberadas": libres_antes - libres,
+                "paginas_libres": libres,
+                "duracion_segundos": round(duracion, 4),
+                "medicion": self.medir("vacio", duracion=duracion)
+            }
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        finally:
+            conn.close()
+
+    def verificar_integridad(self, max_errores=20):
+        """PRAGMA quick_check en solo lectura; 'ok' o los primeros errores"""
+        inicio = time.perf_counter()
+        conn = conectar(f"file:{quote(os.path.abspath(self.db_path))}?mode=ro", uri=True)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"PRAGMA quick_check({int(max_errores)})")
+            errores = [f[0] for f in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        integridad = "ok" if errores == ["ok"] else "; ".join(errores)
+        duracion = time.perf_counter() - inicio
+        _duracion.observar(duracion, operacion="integridad")
+        if integridad != "ok":
+            logger.error("quick_check de %s con errores: %s", self.db_path, integridad)
+        return {
+            "success": integridad == "ok",
+            "integridad": integridad,
+            "duracion_segundos": round(duracion, 4),
+            "medicion": self.medir("integridad", integridad=integridad, duracion=duracion)
+        }
+
+    def obtener_historial(self, desde=None, limite=100):
+        """Mediciones guardadas, de la más reciente a la más antigua"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM mantencion_metricas
+            WHERE fecha >= ?
+            ORDER BY fecha DESC
+            LIMIT ?
+        ''', (desde or 0, limite))
+        columnas = [d[0] for d in cursor.description]
+        historial = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+        conn.close()
+        return historial
+
+    def obtener_estado(self):
+        """Última medición y último quick_check"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM mantencion_metricas ORDER BY id_medicion DESC LIMIT 1')
+        columnas = [d[0] for d in cursor.description]
+        fila = cursor.fetchone()
+        cursor.execute('''
+            SELECT fecha, integridad FROM mantencion_metricas
+            WHERE integridad IS NOT NULL
+            ORDER BY id_medicion DESC LIMIT 1
+        ''')
+        chequeo = cursor.fetchone()
+        conn.close()
+
+        ultima = dict(zip(columnas, fila)) if fila else None
+        return {
+            "ultima_medicion": ultima,
+            "auto_vacuum": AUTO_VACUUM.get(ultima["auto_vacuum"]) if ultima else None,
+            "ultimo_quick_check": {"fecha": chequeo[0], "integridad": chequeo[1]} if chequeo else None
+        }
+
+    def _colector_metricas(self):
+        estado = self.obtener_estado()
+        ultima = estado["ultima_medicion"]
+        if not ultima:
+            return []
+        etiquetas = {"base": os.path.basename(self.db_path)}
+        chequeo = estado["ultimo_quick_check"]
+        return [
+            ("julia_db_tamano_bytes", "gauge", "Tamaño del archivo de la base",
+             [(etiquetas, ultima["tamano_bytes"])]),
+            ("julia_db_wal_bytes", "gauge", "Tamaño del WAL", [(etiquetas, ultima["wal_bytes"])]),
+            ("julia_db_paginas_libres", "gauge", "Páginas en la lista libre (recuperables con vacío)",
+             [(etiquetas, ultima["paginas_libres"])]),
+            ("julia_db_paginas", "gauge", "Páginas de la base", [(etiquetas, ultima["paginas"])]),
+            ("julia_db_integridad_ok", "gauge", "1 si el último quick_check fue 'ok'",
+             [(etiquetas, 1 if chequeo and chequeo["integridad"] == "ok" else 0)]),
+        ]
+
+
+def barrer_mediciones(db_path, marca):
+    """Barrido para sweep_scheduler: guardar tamaño y páginas libres"""
+    medicion = MantencionBase(db_path).medir()
+    return 1, {"paginas_libres": medicion["paginas_libres"]}
+
+
+def barrer_estadisticas(db_path, marca):
+    """Barrido para sweep_scheduler: ANALYZE acotado y PRAGMA optimize"""
+    resultado = MantencionBase(db_path).actualizar_estadisticas()
+    if not resultado["success"]:
+        raise RuntimeError(resultado["error"])
+    return 0, marca
+
+
+def barrer_mantencion_nocturna(db_path, marca):
+    """Barrido para sweep_scheduler: vacío incremental y quick_check"""
+    mantencion = MantencionBase(db_path)
+    vacio = mantencion.vaciar_incremental()
+    if not vacio["success"]:
+        raise RuntimeError(vacio["error"])
+    chequeo = mantencion.verificar_integridad()
+    if not chequeo["success"]:
+        raise RuntimeError(f"quick_check: {chequeo['integridad']}")
+    return vacio["paginas_liberadas"], {"paginas_libres": chequeo["medicion"]["paginas_libres"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantención de la base SQLite")
+    parser.add_argument("--db", default=os.getenv("JULIA_DB", "julia_confecciones.db"))
+    parser.add_argument("--estadisticas", action="store_true", help="ANALYZE y PRAGMA optimize")
+    parser.add_argument("--vaciar", action="store_true", help="Vacío incremental aunque no sea hora tranquila")
+    parser.add_argument("--integridad", action="store_true", help="PRAGMA quick_check")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    mantencion = MantencionBase(args.db)
+    if args.estadisticas:
+        print(json.dumps(mantencion.actualizar_estadisticas(), indent=2))
+    if args.vaciar:
+        print(json.dumps(mantencion.vaciar_incremental(forzar=True), indent=2))
+    if args.integridad:
+        print(json.dumps(mantencion.verificar_integridad(), indent=2))
+    print(json.dumps(mantencion.obtener_estado(), indent=2))
@@ -1,75 +1,67 @@
 # Portal de Seguimiento para Cortadores y Costureros - Julia Confecciones
+#
+# Las notificaciones a empleados salen por la cola de trabajos; el portal
+# inicia sus propios trabajadores salvo con JULIA_COLA_EN_PROCESO=0 (entonces
+# hace falta `python job_queue.py`).
 
-from flask import Flask, request, jsonify, render_template_string, redirect, url_for, session
-import sqlite3
+from flask import Flask, Response, request, jsonify, redirect, url_for, session, g
+from flask.json.provider import DefaultJSONProvider
 from datetime import datetime, timedelta
 import json
+import os
 import secrets
+import time
+
+from pagination import consultar_pagina
+from database import conectar, es_postgres
+from schema import asegurar_esquema
+from sqlite_writer import escribir, escribir_sin_esperar
+from job_queue import encolar_trabajo, iniciar_en_proceso, tarea
+from sql_instrumentation import CABECERAS as CABECERAS_SQL, instrumentar_clase, iniciar_ambito, cerrar_ambito
+from metrics import registro
+from records import tipo_registro
+from http_responses import (ActivosPortal, CACHE_PRIVADO_REVALIDAR, a_json_bytes, comprimir,
+                            coincide_etag, es_comprimible, etag_empleado)
+from retention import SESION_INACTIVIDAD_HORAS, historial
+import tracing
+
+class ProveedorJSON(DefaultJSONProvider):
+    """jsonify con http_responses.a_json_bytes (orjson si está instalado)"""
+
+    def dumps(self, obj, **kwargs):
+        return a_json_bytes(obj).decode()
+
+    def response(self, *args, **kwargs):
+        datos = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(a_json_bytes(datos), mimetype=self.mimetype)
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)
-
+app.json = ProveedorJSON(app)
+
+TareaPendiente = tipo_registro("TareaPendiente", "id_produccion id_orden tipo_orden fecha_asignacion estado "
+                                                 "pago estado_pago notas estado_envio fecha_envio")
+TareaCompletada = tipo_registro("TareaCompletada", "id_produccion id_orden tipo_orden fecha_entrega pago estado_pago")
+DetalleTarea = tipo_registro("DetalleTarea", "id_produccion id_orden tipo_orden fecha_asignacion "
+                                             "fecha_entrega_corte fecha_entrega_costura estado_corte estado_costura "
+                                             "pago_corte pago_costura estado_pago_corte estado_pago_costura notas materiales")
+Notificacion = tipo_registro("Notificacion", "id_notificacion id_produccion tipo mensaje fecha_envio estado")
+NotificacionDifundida = tipo_registro("NotificacionDifundida",
+                                      "id_notificacion id_empleado id_produccion tipo mensaje fecha")
+ConteoTareas = tipo_registro("ConteoTareas", "tipo_empleado estado cantidad")
+
+@instrumentar_clase
 class EmployeeTrackingPortal:
     def __init__(self, db_path):
         self.db_path = db_path
 
     def init_database(self):
         """Inicializar tablas necesarias para el portal"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Tabla de Sesiones de Empleados
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sesiones_empleados (
-                id_sesion INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_empleado INTEGER,
-                token_sesion TEXT UNIQUE,
-                fecha_inicio DATETIME DEFAULT CURRENT_TIMESTAMP,
-                fecha_ultimo_acceso DATETIME,
-                estado TEXT DEFAULT 'activa',
-                ip_address TEXT,
-                user_agent TEXT,
-                FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado)
-            )
-        ''')
-
-        # Tabla de Notificaciones de Producción
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notificaciones_produccion (
-                id_notificacion INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_empleado INTEGER,
-                id_produccion INTEGER,
-                tipo_notificacion TEXT, -- 'nueva_tarea', 'recordatorio', 'actualizacion'
-                mensaje TEXT,
-                fecha_envio DATETIME DEFAULT CURRENT_TIMESTAMP,
-                fecha_leida DATETIME,
-                estado TEXT DEFAULT 'no_leida',
-                FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado),
-                FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion)
-            )
-        ''')
-
-        # Tabla de Registro de Actividad
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS registro_actividad (
-                id_registro INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_empleado INTEGER,
-                id_produccion INTEGER,
-                tipo_actividad TEXT,
-                descripcion TEXT,
-                fecha_actividad DATETIME DEFAULT CURRENT_TIMESTAMP,
-                ip_address TEXT,
-                FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado),
-                FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion)
-            )
-        ''')
-
-        conn.commit()
-        conn.close()
+        asegurar_esquema(self.db_path)
 
     def validar_acceso_empleado(self, codigo_acceso, password=None):
         """Validar acceso de empleado al portal"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -92,51 +84,46 @@ class EmployeeTrackingPortal:
 
     def crear_sesion(self, id_empleado, ip_address="", user_agent=""):
         """Crear nueva sesión para empleado"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         token_sesion = secrets.token_urlsafe(32)
 
-        try:
+        def operacion(cursor):
             cursor.execute('''
                 INSERT INTO sesiones_empleados
                 (id_empleado, token_sesion, ip_address, user_agent)
                 VALUES (?, ?, ?, ?)
             ''', (id_empleado, token_sesion, ip_address, user_agent))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "token_sesion": token_sesion}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def validar_sesion(self, token_sesion):
-        """Validar sesión activa"""
-        conn = sqlite3.connect(self.db_path)
+        """Validar sesión activa (expira tras SESION_INACTIVIDAD_HORAS sin uso)"""
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT se.id_empleado, e.nombre, e.tipo_empleado
             FROM sesiones_empleados se
             JOIN empleados e ON se.id_empleado = e.id_empleado
             WHERE se.token_sesion = ? AND se.estado = 'activa'
+            AND COALESCE(se.fecha_ultimo_acceso, se.fecha_inicio)
+                >= datetime('now', '-{int(SESION_INACTIVIDAD_HORAS)} hours')
         ''', (token_sesion,))
 
         sesion = cursor.fetchone()
+        conn.close()
 
         if sesion:
-            # Actualizar último acceso
-            cursor.execute('''
+            # Actualizar último acceso sin esperar: viaja en el próximo lote del escritor
+            escribir_sin_esperar(self.db_path, lambda cursor: cursor.execute('''
                 UPDATE sesiones_empleados
                 SET fecha_ultimo_acceso = datetime('now')
                 WHERE token_sesion = ?
-            ''', (token_sesion,))
-
-            conn.commit()
-            conn.close()
+            ''', (token_sesion,)))
 
             return {
                 "success": True,
@@ -145,148 +132,117 @@ class EmployeeTrackingPortal:
                 "tipo_empleado": sesion[2]
             }
 
-        conn.close()
         return {"success": False, "error": "Sesión inválida o expirada"}
 
+    def obtener_version_empleado(self, id_empleado):
+        """Versión de los datos del dashboard del empleado (None si no se lleva)
+
+        La suben los triggers de la migración 9 con cada escritura que toca sus
+        tareas, pagos o notificaciones. Se lee antes que los datos: una
+        escritura intermedia queda con una versión más nueva, nunca al revés.
+        """
+        if es_postgres(self.db_path):
+            return None
+
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT version FROM version_empleados WHERE id_empleado = ?', (id_empleado,))
+        fila = cursor.fetchone()
+        conn.close()
+        return fila[0] if fila else None
+
     def obtener_tareas_pendientes(self, id_empleado, tipo_empleado):
         """Obtener tareas pendientes para el empleado"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         if tipo_empleado == 'cortador':
-            cursor.execute('''
-                SELECT p.id_produccion, p.id_orden, p.tipo_orden,
-                       p.fecha_asignacion, p.estado_corte,
-                       p.pago_corte, p.estado_pago_corte,
-                       p.notas, ep.estado_envio, ep.fecha_envio
-                FROM produccion p
-                LEFT JOIN envios_proveedores ep ON p.id_produccion = ep.id_produccion
-                WHERE p.id_cortador = ?
-                AND p.estado_corte IN ('pendiente', 'en_proceso')
-                ORDER BY p.fecha_asignacion DESC
-            ''', (id_empleado,))
+            rol, estado, pago, estado_pago = 'cortador', 'estado_corte', 'pago_corte', 'estado_pago_corte'
         else:  # costurero
-            cursor.execute('''
-                SELECT p.id_produccion, p.id_orden, p.tipo_orden,
-                       p.fecha_asignacion, p.estado_costura,
-                       p.pago_costura, p.estado_pago_costura,
-                       p.notas, ep.estado_envio, ep.fecha_envio
-                FROM produccion p
-                LEFT JOIN envios_proveedores ep ON p.id_produccion = ep.id_produccion
-                WHERE p.id_costurero = ?
-                AND p.estado_costura IN ('pendiente', 'en_proceso')
-                ORDER BY p.fecha_asignacion DESC
-            ''', (id_empleado,))
+            rol, estado, pago, estado_pago = 'costurero', 'estado_costura', 'pago_costura', 'estado_pago_costura'
 
-        tareas = cursor.fetchall()
-        conn.close()
+        cursor.execute(f'''
+            SELECT {TareaPendiente.proyeccion(
+                "p", estado=f"p.{estado}", pago=f"p.{pago}", estado_pago=f"p.{estado_pago}",
+                estado_envio="ep.estado_envio", fecha_envio="ep.fecha_envio")}
+            FROM produccion p
+            LEFT JOIN envios_proveedores ep ON p.id_produccion = ep.id_produccion
+            WHERE p.id_{rol} = ?
+            AND p.{estado} IN ('pendiente', 'en_proceso')
+            ORDER BY p.fecha_asignacion DESC
+        ''', (id_empleado,))
 
-        return [
-            {
-                "id_produccion": t[0],
-                "id_orden": t[1],
-                "tipo_orden": t[2],
-                "fecha_asignacion": t[3],
-                "estado": t[4],
-                "pago": t[5],
-                "estado_pago": t[6],
-                "notas": t[7],
-                "estado_envio": t[8],
-                "fecha_envio": t[9]
-            } for t in tareas
-        ]
+        tareas = TareaPendiente.de_filas(cursor.fetchall())
+        conn.close()
+        return tareas
 
     def obtener_tareas_completadas(self, id_empleado, tipo_empleado, limite=10):
         """Obtener tareas completadas recientemente"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         if tipo_empleado == 'cortador':
-            cursor.execute('''
-                SELECT p.id_produccion, p.id_orden, p.tipo_orden,
-                       p.fecha_entrega_corte, p.pago_corte, p.estado_pago_corte
-                FROM produccion p
-                WHERE p.id_cortador = ? AND p.estado_corte = 'completado'
-                ORDER BY p.fecha_entrega_corte DESC
-                LIMIT ?
-            ''', (id_empleado, limite))
+            rol, fecha, pago, estado, estado_pago = ('cortador', 'fecha_entrega_corte', 'pago_corte',
+                                                     'estado_corte', 'estado_pago_corte')
         else:  # costurero
-            cursor.execute('''
-                SELECT p.id_produccion, p.id_orden, p.tipo_orden,
-                       p.fecha_entrega_costura, p.pago_costura, p.estado_pago_costura
-                FROM produccion p
-                WHERE p.id_costurero = ? AND p.estado_costura = 'completado'
-                ORDER BY p.fecha_entrega_costura DESC
-                LIMIT ?
-            ''', (id_empleado, limite))
-
-        tareas = cursor.fetchall()
-        conn.close()
+            rol, fecha, pago, estado, estado_pago = ('costurero', 'fecha_entrega_costura', 'pago_costura',
+                                                     'estado_costura', 'estado_pago_costura')
+
+        # Las más recientes de cada partición (cada una por su índice) y de ahí las `limite` primeras
+        columnas = TareaCompletada.proyeccion(fecha_entrega=fecha, pago=pago, estado_pago=estado_pago)
+        cursor.execute(f'''
+            SELECT * FROM (
+                SELECT {columnas}
+                FROM produccion
+                WHERE id_{rol} = ? AND {estado} = 'completado'
+                ORDER BY {fecha} DESC LIMIT ?
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT {columnas}
+                FROM produccion_historica
+                WHERE id_{rol} = ?
+                ORDER BY {fecha} DESC LIMIT ?
+            )
+            ORDER BY fecha_entrega DESC
+            LIMIT ?
+        ''', (id_empleado, limite, id_empleado, limite, limite))
 
-        return [
-            {
-                "id_produccion": t[0],
-                "id_orden": t[1],
-                "tipo_orden": t[2],
-                "fecha_entrega": t[3],
-                "pago": t[4],
-                "estado_pago": t[5]
-            } for t in tareas
-        ]
+        tareas = TareaCompletada.de_filas(cursor.fetchall())
+        conn.close()
+        return tareas
 
     def obtener_detalle_tarea(self, id_produccion, id_empleado, tipo_empleado):
         """Obtener detalles completos de una tarea"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         # Obtener información de la producción
-        cursor.execute('''
-            SELECT p.*,
-                   GROUP_CONCAT(m.nombre || ':' || dpm.cantidad_utilizada || ' ' || m.unidad_medida, ', ') as materiales
-            FROM produccion p
+        cursor.execute(f'''
+            SELECT {DetalleTarea.proyeccion("p", materiales=(
+                "COALESCE(GROUP_CONCAT(m.nombre || ':' || dpm.cantidad_utilizada || ' ' || m.unidad_medida, ', '), '')"))}
+            FROM produccion_completa p
             LEFT JOIN detalle_produccion_materiales dpm ON p.id_produccion = dpm.id_produccion
             LEFT JOIN materiales m ON dpm.id_material = m.id_material
             WHERE p.id_produccion = ?
             GROUP BY p.id_produccion
         ''', (id_produccion,))
 
-        produccion = cursor.fetchone()
+        detalle = DetalleTarea.de_fila(cursor.fetchone())
         conn.close()
-
-        if not produccion:
-            return None
-
-        return {
-            "id_produccion": produccion[0],
-            "id_orden": produccion[1],
-            "tipo_orden": produccion[2],
-            "fecha_asignacion": produccion[4],
-            "fecha_entrega_corte": produccion[6],
-            "fecha_entrega_costura": produccion[7],
-            "estado_corte": produccion[8],
-            "estado_costura": produccion[9],
-            "pago_corte": produccion[10],
-            "pago_costura": produccion[11],
-            "estado_pago_corte": produccion[12],
-            "estado_pago_costura": produccion[13],
-            "notas": produccion[14],
-            "materiales": produccion[15] or ""
-        }
+        return detalle
 
     def actualizar_estado_tarea(self, id_produccion, id_empleado, tipo_empleado,
                                nuevo_estado, notas=""):
         """Actualizar estado de una tarea"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
-            if tipo_empleado == 'cortador':
-                campo_estado = 'estado_corte'
-                campo_fecha = 'fecha_entrega_corte'
-            else:
-                campo_estado = 'estado_costura'
-                campo_fecha = 'fecha_entrega_costura'
+        if tipo_empleado == 'cortador':
+            campo_estado = 'estado_corte'
+            campo_fecha = 'fecha_entrega_corte'
+        else:
+            campo_estado = 'estado_costura'
+            campo_fecha = 'fecha_entrega_costura'
 
+        def operacion(cursor):
             if nuevo_estado == 'completado':
                 cursor.execute(f'''
                     UPDATE produccion
@@ -307,18 +263,26 @@ class EmployeeTrackingPortal:
                 VALUES (?, ?, 'cambio_estado', ?)
             ''', (id_empleado, id_produccion, f'Cambio estado a {nuevo_estado}: {notas}'))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Estado actualizado exitosamente"}
 
         except Exception as e:
-            conn.close()
+            return {"success": False, "error": str(e)}
+
+    def obtener_historial_actividad(self, id_empleado, desde=None, hasta=None, limite=100):
+        """Actividad del empleado, incluida la ya archivada por la retención"""
+        try:
+            actividad = historial(self.db_path, 'registro_actividad', {"id_empleado": id_empleado},
+                                  desde=desde, hasta=hasta, limite=limite)
+            return {"success": True, "actividad": actividad}
+
+        except Exception as e:
             return {"success": False, "error": str(e)}
 
     def obtener_resumen_pagos(self, id_empleado, tipo_empleado):
         """Obtener resumen de pagos del empleado"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         # Total de prendas completadas
@@ -340,84 +304,165 @@ class EmployeeTrackingPortal:
             ''', (id_empleado,))
 
         pagos = cursor.fetchone()
+
+        # Lo movido a produccion_historica está completado y pagado: basta su total acumulado
+        cursor.execute('''
+            SELECT prendas, monto FROM resumen_produccion_historica
+            WHERE id_empleado = ? AND rol = ?
+        ''', (id_empleado, 'cortador' if tipo_empleado == 'cortador' else 'costurero'))
+        historico = cursor.fetchone() or (0, 0)
         conn.close()
 
-        if pagos:
-            return {
-                "total_prendas": pagos[0] or 0,
-                "total_pendiente_pago": pagos[1] or 0,
-                "total_pagado": pagos[2] or 0,
-                "saldo_pendiente": (pagos[1] or 0) - (pagos[2] or 0)
-            }
-        return {"total_prendas": 0, "total_pendiente_pago": 0, "total_pagado": 0, "saldo_pendiente": 0}
+        total_prendas = (pagos[0] or 0) + historico[0]
+        total_pago = (pagos[1] or 0) + historico[1]
+        total_pagado = (pagos[2] or 0) + historico[1]
+        return {
+            "total_prendas": total_prendas,
+            "total_pendiente_pago": total_pago,
+            "total_pagado": total_pagado,
+            "saldo_pendiente": total_pago - total_pagado
+        }
 
     def obtener_notificaciones(self, id_empleado, no_leidas=True):
         """Obtener notificaciones para el empleado"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
+        columnas = Notificacion.proyeccion(tipo="tipo_notificacion")
 
         if no_leidas:
-            cursor.execute('''
-                SELECT id_notificacion, id_produccion, tipo_notificacion,
-                       mensaje, fecha_envio
+            cursor.execute(f'''
+                SELECT {columnas}
                 FROM notificaciones_produccion
                 WHERE id_empleado = ? AND estado = 'no_leida'
                 ORDER BY fecha_envio DESC
             ''', (id_empleado,))
         else:
-            cursor.execute('''
-                SELECT id_notificacion, id_produccion, tipo_notificacion,
-                       mensaje, fecha_envio, estado
+            cursor.execute(f'''
+                SELECT {columnas}
                 FROM notificaciones_produccion
                 WHERE id_empleado = ?
                 ORDER BY fecha_envio DESC
                 LIMIT 20
             ''', (id_empleado,))
 
-        notificaciones = cursor.fetchall()
+        notificaciones = Notificacion.de_filas(cursor.fetchall())
         conn.close()
+        return notificaciones
 
-        return [
-            {
-                "id_notificacion": n[0],
-                "id_produccion": n[1],
-                "tipo": n[2],
-                "mensaje": n[3],
-                "fecha_envio": n[4],
-                "estado": n[5] if len(n) > 5 else 'no_leida'
-            } for n in notificaciones
-        ]
+    def obtener_notificaciones_paginadas(self, id_empleado, no_leidas=False,
+                                         cursor_pagina=None, limite=20):
+        """Obtener notificaciones por páginas (keyset sobre fecha_envio, id_notificacion)"""
+        condiciones = ["id_empleado = ?"]
+        params = [id_empleado]
 
-    def marcar_notificacion_leida(self, id_notificacion, id_empleado):
-        """Marcar notificación como leída"""
-        conn = sqlite3.connect(self.db_path)
+        if no_leidas:
+            condiciones.append("estado = 'no_leida'")
+
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            pagina = consultar_pagina(
+                cursor,
+                f'''
+                SELECT {Notificacion.proyeccion(tipo="tipo_notificacion")}
+                FROM notificaciones_produccion
+                ''',
+                condiciones, params,
+                ("fecha_envio", "id_notificacion"), ("fecha_envio", "id_notificacion"),
+                cursor_pagina=cursor_pagina, limite=limite, tipo=Notificacion
+            )
+        except ValueError as e:
+            conn.close()
+            return {"success": False, "error": str(e)}
+
+        conn.close()
+        return {"success": True, **pagina}
+
+    def obtener_notificaciones_desde(self, id_desde, limite=500):
+        """Notificaciones de todos los empleados con id mayor a id_desde (para difusión)"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute(f'''
+            SELECT {NotificacionDifundida.proyeccion(tipo="tipo_notificacion", fecha="fecha_envio")}
+            FROM notificaciones_produccion
+            WHERE id_notificacion > ?
+            ORDER BY id_notificacion
+            LIMIT ?
+        ''', (id_desde, limite))
+
+        notificaciones = NotificacionDifundida.de_filas(cursor.fetchall())
+        conn.close()
+        return notificaciones
+
+    def ultimo_id_notificacion(self):
+        """Id de la notificación más reciente (0 si no hay)"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT COALESCE(MAX(id_notificacion), 0) FROM notificaciones_produccion')
+        ultimo = cursor.fetchone()[0]
+        conn.close()
+        return ultimo
+
+    def contar_tareas_pendientes_por_tipo(self):
+        """Contar tareas abiertas por tipo de empleado (para métricas)"""
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
+            SELECT 'cortador', estado_corte, COUNT(*) FROM produccion
+            WHERE estado_corte IN ('pendiente', 'en_proceso')
+            GROUP BY estado_corte
+            UNION ALL
+            SELECT 'costurero', estado_costura, COUNT(*) FROM produccion
+            WHERE estado_costura IN ('pendiente', 'en_proceso')
+            GROUP BY estado_costura
+        ''')
+
+        conteos = ConteoTareas.de_filas(cursor.fetchall())
+        conn.close()
+        return conteos
+
+    def marcar_notificacion_leida(self, id_notificacion, id_empleado):
+        """Marcar notificación como leída"""
+        escribir(self.db_path, lambda cursor: cursor.execute('''
             UPDATE notificaciones_produccion
             SET estado = 'leida', fecha_leida = datetime('now')
             WHERE id_notificacion = ? AND id_empleado = ?
-        ''', (id_notificacion, id_empleado))
-
-        conn.commit()
-        conn.close()
+        ''', (id_notificacion, id_empleado)))
 
     def enviar_notificacion(self, id_empleado, id_produccion, tipo_notificacion, mensaje):
         """Enviar notificación a empleado"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
+        escribir(self.db_path, lambda cursor: cursor.execute('''
             INSERT INTO notificaciones_produccion
             (id_empleado, id_produccion, tipo_notificacion, mensaje)
             VALUES (?, ?, ?, ?)
-        ''', (id_empleado, id_produccion, tipo_notificacion, mensaje))
+        ''', (id_empleado, id_produccion, tipo_notificacion, mensaje)))
 
-        conn.commit()
-        conn.close()
+    def encolar_notificacion(self, id_empleado, id_produccion, tipo_notificacion, mensaje,
+                             prioridad=0):
+        """Enviar la notificación en segundo plano (cola de trabajos)"""
+        try:
+            id_trabajo = encolar_trabajo(self.db_path, 'notificacion_empleado', {
+                "id_empleado": id_empleado,
+                "id_produccion": id_produccion,
+                "tipo_notificacion": tipo_notificacion,
+                "mensaje": mensaje
+            }, prioridad=prioridad)
+            return {"success": True, "id_trabajo": id_trabajo}
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+@tarea("notificacion_empleado")
+def _tarea_notificacion_empleado(db_path, id_empleado, id_produccion, tipo_notificacion, mensaje):
+    """Trabajo de la cola: registrar la notificación del empleado"""
+    EmployeeTrackingPortal(db_path).enviar_notificacion(id_empleado, id_produccion,
+                                                        tipo_notificacion, mensaje)
 
 # Instancia del portal
-portal = EmployeeTrackingPortal("julia_confecciones.db")
+portal = EmployeeTrackingPortal(os.getenv("JULIA_DB", "julia_confecciones.db"))
 
 # Template HTML para el portal
 HTML_TEMPLATE = """
@@ -695,10 +740,112 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# La página compilada una vez: HTML + CSS y JS versionados, precomprimidos
+activos = ActivosPortal(HTML_TEMPLATE)
+
+# Métricas HTTP
+duracion_peticiones = registro.histograma(
+    "julia_http_duracion_segundos", "Latencia de las peticiones al portal por ruta",
+    ("metodo", "ruta"))
+peticiones_total = registro.contador(
+    "julia_http_peticiones_total", "Peticiones al portal por ruta y código",
+    ("metodo", "ruta", "codigo"))
+
+def colector_tareas_pendientes():
+    """Tareas abiertas por tipo de empleado, calculadas al consultar /metrics"""
+    return [(
+        "julia_tareas_pendientes", "gauge", "Tareas de producción abiertas por tipo de empleado",
+        [({"tipo_empleado": c["tipo_empleado"], "estado": c["estado"]}, c["cantidad"])
+         for c in portal.contar_tareas_pendientes_por_tipo()]
+    )]
+
+registro.registrar_colector("tareas_pendientes", colector_tareas_pendientes)
+
+# Instrumentación SQL y métricas por petición
+@app.before_request
+def iniciar_conteo_sql():
+    ruta = request.url_rule.rule if request.url_rule else request.path
+    g.inicio_peticion = time.perf_counter()
+    g.ambito_sql = iniciar_ambito(f"{request.method} {ruta}")
+    span = tracing.iniciar_span(f"{request.method} {ruta}",
+                                {"http.method": request.method, "http.route": ruta},
+                                tracing.SERVIDOR)
+    if span is not None:
+        g.span_peticion = (span, tracing.activar(span))
+
+@app.after_request
+def cerrar_conteo_sql(response):
+    if 'ambito_sql' in g:
+        conteo = cerrar_ambito(*g.pop('ambito_sql'))
+        # Conteos por petición solo al depurar (JULIA_SQL_CABECERAS=1 o debug)
+        if CABECERAS_SQL or app.debug:
+            response.headers['X-SQL-Sentencias'] = str(conteo['sentencias'])
+            response.headers['X-SQL-Conexiones'] = str(conteo['conexiones'])
+
+    ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    if 'inicio_peticion' in g:
+        duracion_peticiones.observar(time.perf_counter() - g.inicio_peticion,
+                                     metodo=request.method, ruta=ruta)
+    peticiones_total.inc(metodo=request.method, ruta=ruta, codigo=str(response.status_code))
+    if 'span_peticion' in g:
+        g.span_peticion[0].atributos["http.status_code"] = response.status_code
+        if response.status_code >= 500:
+            g.span_peticion[0].marcar_error(f"HTTP {response.status_code}")
+    return response
+
+@app.after_request
+def comprimir_respuesta(response):
+    if (response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or not es_comprimible(response.mimetype or '')):
+        return response
+    response.vary.add('Accept-Encoding')
+    cuerpo, codificacion = comprimir(response.get_data(), request.headers.get('Accept-Encoding'),
+                                     response.mimetype)
+    if codificacion:
+        response.set_data(cuerpo)
+        response.headers['Content-Encoding'] = codificacion
+    return response
+
+@app.teardown_request
+def descartar_conteo_sql(error=None):
+    # Si la petición falló antes de after_request, cerrar igualmente el ámbito
+    if 'ambito_sql' in g:
+        cerrar_ambito(*g.pop('ambito_sql'))
+    if 'span_peticion' in g:
+        tracing.terminar_span(*g.pop('span_peticion'), error=error)
+
 # Routes
+def servir_activo(activo):
+    cuerpo, codificacion = activo.variante(request.headers.get('Accept-Encoding'))
+    return Response(cuerpo, content_type=activo.tipo, headers=activo.encabezados(codificacion))
+
+def respuesta_json(datos, columnas=False, etag=None):
+    respuesta = Response(a_json_bytes(datos, columnas), mimetype='application/json')
+    if etag:
+        respuesta.headers['ETag'] = etag
+        respuesta.headers['Cache-Control'] = CACHE_PRIVADO_REVALIDAR
+        respuesta.vary.add('Authorization')
+    return respuesta
+
+def etag_peticion(id_empleado):
+    """ETag de la petición actual del empleado; (etag, respuesta 304 o None)"""
+    etag = etag_empleado(id_empleado, portal.obtener_version_empleado(id_empleado),
+                         request.full_path)
+    if etag and coincide_etag(request.headers.get('If-None-Match'), etag):
+        return etag, Response(status=304, headers={'ETag': etag, 'Cache-Control': CACHE_PRIVADO_REVALIDAR,
+                                                   'Vary': 'Authorization'})
+    return etag, None
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return servir_activo(activos.pagina)
+
+@app.route('/activos/<nombre>')
+def activo_estatico(nombre):
+    activo = activos.activo(nombre)
+    if activo is None:
+        return jsonify({'success': False, 'error': 'No encontrado'}), 404
+    return servir_activo(activo)
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -735,20 +882,26 @@ def dashboard():
     id_empleado = sesion['id_empleado']
     tipo_empleado = sesion['tipo_empleado']
 
+    # Sin cambios desde la versión que tiene el cliente: 304 sin las cuatro consultas
+    etag, no_modificado = etag_peticion(id_empleado)
+    if no_modificado:
+        return no_modificado
+
     # Obtener datos del dashboard
     tareas_pendientes = portal.obtener_tareas_pendientes(id_empleado, tipo_empleado)
     tareas_completadas = portal.obtener_tareas_completadas(id_empleado, tipo_empleado)
     resumen = portal.obtener_resumen_pagos(id_empleado, tipo_empleado)
     notificaciones = portal.obtener_notificaciones(id_empleado, no_leidas=True)
 
-    return jsonify({
+    # formato=columnas: los listados como columnas + filas, sin un objeto por fila
+    return respuesta_json({
         'success': True,
         'tareas_pendientes': tareas_pendientes,
         'tareas_completadas': tareas_completadas,
         'resumen': resumen,
         'notificaciones': notificaciones,
         'tareas_pendientes_count': len(tareas_pendientes)
-    })
+    }, columnas=request.args.get('formato') == 'columnas', etag=etag)
 
 @app.route('/api/tarea/actualizar', methods=['POST'])
 def actualizar_tarea():
@@ -771,6 +924,29 @@ def actualizar_tarea():
 
     return jsonify(result)
 
+@app.route('/api/notificaciones')
+def listar_notificaciones():
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    sesion = portal.validar_sesion(token)
+
+    if not sesion['success']:
+        return jsonify({'success': False, 'error': 'Sesión inválida'}), 401
+
+    etag, no_modificado = etag_peticion(sesion['id_empleado'])
+    if no_modificado:
+        return no_modificado
+
+    result = portal.obtener_notificaciones_paginadas(
+        sesion['id_empleado'],
+        no_leidas=request.args.get('no_leidas') == '1',
+        cursor_pagina=request.args.get('cursor'),
+        limite=request.args.get('limite', 20)
+    )
+
+    if not result['success']:
+        return jsonify(result), 400
+    return respuesta_json(result, columnas=request.args.get('formato') == 'columnas', etag=etag)
+
 @app.route('/api/notificaciones/<int:id_notificacion>/leida', methods=['POST'])
 def marcar_notificacion_leida(id_notificacion):
     token = request.headers.get('Authorization', '').replace('Bearer ', '')
@@ -782,6 +958,11 @@ def marcar_notificacion_leida(id_notificacion):
     portal.marcar_notificacion_leida(id_notificacion, sesion['id_empleado'])
     return jsonify({'success': True})
 
+@app.route('/metrics')
+def metrics():
+    return Response(registro.exportar_texto(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     portal.init_database()
+    iniciar_en_proceso(portal.db_path)
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
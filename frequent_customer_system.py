@@ -1,9 +1,30 @@
 # Sistema de Gestión de Clientes Frecuentes - Julia Confecciones
+#
+# La notificación de subida de nivel se envía desde la cola de trabajos:
+# la ejecutan los trabajadores que inician el portal y el programador de
+# barridos, o `python job_queue.py` si se apagaron (JULIA_COLA_EN_PROCESO=0).
 
 import sqlite3
 from datetime import datetime, timedelta
 import json
 
+from database import conectar
+from job_queue import avisar, encolar, tarea
+from records import a_json, tipo_registro
+from schema import BENEFICIOS_PREDETERMINADOS, asegurar_esquema
+from sqlite_writer import escribir
+from sql_instrumentation import instrumentar_clase
+
+Beneficio = tipo_registro("Beneficio", "id_beneficio nivel tipo valor descripcion condiciones")
+ClienteFrecuente = tipo_registro("ClienteFrecuente", "id rut nombre email tipo_cliente total_compras "
+                                                     "descuento_frecuente")
+EstadisticasCompras = tipo_registro("EstadisticasCompras", "total_compras promedio_compra ultima_compra")
+CompraMensual = tipo_registro("CompraMensual", "mes total cantidad")
+NivelClientes = tipo_registro("NivelClientes", "nivel cantidad_clientes total_compras promedio_compras descuento")
+CandidatoUpgrade = tipo_registro("CandidatoUpgrade", "id_cliente nombre email total_compras nivel_actual "
+                                                     "monto_para_siguiente_nivel")
+
+@instrumentar_clase
 class FrequentCustomerSystem:
     def __init__(self, db_path):
         self.db_path = db_path
@@ -11,94 +32,19 @@ class FrequentCustomerSystem:
 
     def init_database(self):
         """Inicializar tablas de clientes frecuentes"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Tabla de Clientes (si no existe en el sistema principal)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clientes (
-                id_cliente INTEGER PRIMARY KEY AUTOINCREMENT,
-                rut TEXT UNIQUE,
-                nombre TEXT,
-                email TEXT,
-                celular TEXT,
-                direccion TEXT,
-                tipo_cliente TEXT DEFAULT 'regular',
-                fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP,
-                ultima_compra DATETIME,
-                total_compras REAL DEFAULT 0,
-                descuento_frecuente REAL DEFAULT 0,
-                estado TEXT DEFAULT 'activo'
-            )
-        ''')
-
-        # Tabla de Compras para seguimiento
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS compras_cliente (
-                id_compra INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_cliente INTEGER,
-                monto_compra REAL,
-                fecha_compra DATETIME DEFAULT CURRENT_TIMESTAMP,
-                tipo_compra TEXT, -- 'directa', 'reserva'
-                id_venta INTEGER, -- Referencia a venta original
-                FOREIGN KEY (id_cliente) REFERENCES clientes (id_cliente)
-            )
-        ''')
-
-        # Tabla de Beneficios de Clientes Frecuentes
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS beneficios_frecuentes (
-                id_beneficio INTEGER PRIMARY KEY AUTOINCREMENT,
-                nivel_cliente TEXT,
-                tipo_beneficio TEXT, -- 'descuento', 'cupon_exclusivo', 'prioridad'
-                valor_beneficio REAL,
-                descripcion TEXT,
-                condiciones TEXT
-            )
-        ''')
-
-        # Tabla de Canjeo de Beneficios
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS canjeo_beneficios (
-                id_canjeo INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_cliente INTEGER,
-                id_beneficio INTEGER,
-                fecha_canjeo DATETIME DEFAULT CURRENT_TIMESTAMP,
-                estado TEXT DEFAULT 'activo',
-                FOREIGN KEY (id_cliente) REFERENCES clientes (id_cliente),
-                FOREIGN KEY (id_beneficio) REFERENCES beneficios_frecuentes (id_beneficio)
-            )
-        ''')
-
-        # Insertar beneficios predeterminados
-        self.insertar_beneficios_predeterminados(cursor)
-
-        conn.commit()
-        conn.close()
+        asegurar_esquema(self.db_path)
 
     def insertar_beneficios_predeterminados(self, cursor):
         """Insertar beneficios predeterminados si no existen"""
-        beneficios = [
-            ('regular', 'descuento', 5.0, '5% de descuento en compras', 'Mínimo $50.000 en compras'),
-            ('frecuente', 'descuento', 10.0, '10% de descuento en compras', 'Mínimo $100.000 en compras'),
-            ('frecuente', 'prioridad', 0, 'Prioridad en producción', 'Mínimo $100.000 en compras'),
-            ('vip', 'descuento', 15.0, '15% de descuento en compras', 'Mínimo $200.000 en compras'),
-            ('vip', 'prioridad', 0, 'Entrega prioritaria', 'Mínimo $200.000 en compras'),
-            ('vip', 'cupon_exclusivo', 20.0, 'Cupón exclusivo 20%', 'Mínimo $200.000 en compras')
-        ]
-
         cursor.executemany('''
             INSERT OR IGNORE INTO beneficios_frecuentes
             (nivel_cliente, tipo_beneficio, valor_beneficio, descripcion, condiciones)
             VALUES (?, ?, ?, ?, ?)
-        ''', beneficios)
+        ''', BENEFICIOS_PREDETERMINADOS)
 
     def registrar_compra(self, id_cliente, monto_compra, tipo_compra='directa', id_venta=None):
         """Registrar una compra y actualizar estado de cliente"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             # Registrar la compra
             cursor.execute('''
                 INSERT INTO compras_cliente (id_cliente, monto_compra, tipo_compra, id_venta)
@@ -114,25 +60,25 @@ class FrequentCustomerSystem:
             ''', (monto_compra, id_cliente))
 
             # Actualizar nivel de cliente frecuente
-            self.actualizar_nivel_cliente(cursor, id_cliente)
-
-            conn.commit()
-            conn.close()
+            return self.actualizar_nivel_cliente(cursor, id_cliente)
 
+        try:
+            if escribir(self.db_path, operacion):
+                avisar(self.db_path)
             return {"success": True, "message": "Compra registrada exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def actualizar_nivel_cliente(self, cursor, id_cliente):
-        """Actualizar el nivel de cliente basado en compras"""
+        """Actualizar el nivel de cliente basado en compras; devuelve el id del aviso encolado"""
         # Obtener total de compras
-        cursor.execute('SELECT total_compras FROM clientes WHERE id_cliente = ?', (id_cliente,))
+        cursor.execute('SELECT total_compras, tipo_cliente FROM clientes WHERE id_cliente = ?',
+                       (id_cliente,))
         result = cursor.fetchone()
 
         if result:
-            total_compras = result[0]
+            total_compras, nivel_anterior = result
 
             # Determinar nivel y descuento
             if total_compras >= 200000:  # VIP
@@ -155,37 +101,44 @@ class FrequentCustomerSystem:
                 WHERE id_cliente = ?
             ''', (nivel, descuento, id_cliente))
 
-            # Enviar notificación de upgrade (simulado)
-            if nivel in ['frecuente', 'vip']:
-                self.enviar_notificacion_upgrade(id_cliente, nivel)
+            # La notificación sale en segundo plano y solo cuando el nivel sube;
+            # se encola en esta transacción, así no se avisa de una compra revertida
+            if nivel in ['frecuente', 'vip'] and nivel != nivel_anterior:
+                return encolar(cursor, 'notificacion_upgrade',
+                               {"id_cliente": id_cliente, "nuevo_nivel": nivel},
+                               clave_unica=f"upgrade:{id_cliente}:{nivel}")
+        return None
 
     def enviar_notificacion_upgrade(self, id_cliente, nuevo_nivel):
         """Simular envío de notificación de upgrade"""
         cursor = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = conectar(self.db_path)
             cursor = conn.cursor()
 
             cursor.execute('SELECT nombre, email FROM clientes WHERE id_cliente = ?', (id_cliente,))
             cliente = cursor.fetchone()
 
-            if cliente:
-                nombre, email = cliente
+            if not cliente:
+                return {"success": False, "error": "Cliente no encontrado"}
+
+            nombre, email = cliente
 
-                # Aquí se integraría con un sistema real de email/SMS
-                print(f"Notificación enviada a {nombre} ({email}):")
-                print(f"¡Felicidades! Has ascendido a cliente {nuevo_nivel}")
-                print(f"Ahora disfrutas de descuentos exclusivos y beneficios prioritarios")
+            # Aquí se integraría con un sistema real de email/SMS
+            print(f"Notificación enviada a {nombre} ({email}):")
+            print(f"¡Felicidades! Has ascendido a cliente {nuevo_nivel}")
+            print(f"Ahora disfrutas de descuentos exclusivos y beneficios prioritarios")
+            return {"success": True, "email": email, "nivel": nuevo_nivel}
 
         except Exception as e:
-            print(f"Error al enviar notificación: {e}")
+            return {"success": False, "error": str(e)}
         finally:
             if cursor:
                 conn.close()
 
     def obtener_beneficios_cliente(self, id_cliente):
         """Obtener beneficios disponibles para un cliente"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         # Obtener nivel del cliente
@@ -199,32 +152,21 @@ class FrequentCustomerSystem:
         nivel_cliente = result[0]
 
         # Obtener beneficios para ese nivel
-        cursor.execute('''
-            SELECT * FROM beneficios_frecuentes
+        cursor.execute(f'''
+            SELECT {Beneficio.proyeccion(nivel="nivel_cliente", tipo="tipo_beneficio",
+                                         valor="valor_beneficio")}
+            FROM beneficios_frecuentes
             WHERE nivel_cliente = ?
             ORDER BY tipo_beneficio, valor_beneficio DESC
         ''', (nivel_cliente,))
 
-        beneficios = cursor.fetchall()
+        beneficios = Beneficio.de_filas(cursor.fetchall())
         conn.close()
-
-        return [
-            {
-                "id_beneficio": b[0],
-                "nivel": b[1],
-                "tipo": b[2],
-                "valor": b[3],
-                "descripcion": b[4],
-                "condiciones": b[5]
-            } for b in beneficios
-        ]
+        return beneficios
 
     def canjear_beneficio(self, id_cliente, id_beneficio):
         """Canjear un beneficio para el cliente"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             # Verificar que el cliente puede acceder a este beneficio
             cursor.execute('''
                 SELECT b.*, c.tipo_cliente
@@ -235,7 +177,6 @@ class FrequentCustomerSystem:
 
             beneficio = cursor.fetchone()
             if not beneficio:
-                conn.close()
                 return {"success": False, "error": "Beneficio no disponible para este cliente"}
 
             # Registrar canjeo
@@ -244,46 +185,45 @@ class FrequentCustomerSystem:
                 VALUES (?, ?)
             ''', (id_cliente, id_beneficio))
 
-            conn.commit()
-            conn.close()
-
             return {
                 "success": True,
                 "message": f"Beneficio '{beneficio[4]}' canjeado exitosamente"
             }
 
+        try:
+            return escribir(self.db_path, operacion)
+
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def obtener_estadisticas_cliente(self, id_cliente):
         """Obtener estadísticas completas del cliente"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         # Información básica del cliente
-        cursor.execute('SELECT * FROM clientes WHERE id_cliente = ?', (id_cliente,))
-        cliente = cursor.fetchone()
+        cursor.execute(f'SELECT {ClienteFrecuente.proyeccion(id="id_cliente")} FROM clientes WHERE id_cliente = ?',
+                       (id_cliente,))
+        cliente = ClienteFrecuente.de_fila(cursor.fetchone())
 
         if not cliente:
             conn.close()
             return None
 
         # Estadísticas de compras
-        cursor.execute('''
-            SELECT COUNT(*) as total_compras, AVG(monto_compra) as promedio_compra,
-                   MAX(fecha_compra) as ultima_compra
+        cursor.execute(f'''
+            SELECT {EstadisticasCompras.proyeccion(total_compras="COUNT(*)", promedio_compra="AVG(monto_compra)",
+                                                   ultima_compra="MAX(fecha_compra)")}
             FROM compras_cliente
             WHERE id_cliente = ?
         ''', (id_cliente,))
 
-        stats = cursor.fetchone()
+        stats = EstadisticasCompras.de_fila(cursor.fetchone())
 
         # Compras por mes
-        cursor.execute('''
-            SELECT strftime('%Y-%m', fecha_compra) as mes,
-                   SUM(monto_compra) as total_mes,
-                   COUNT(*) as cantidad_compras
+        cursor.execute(f'''
+            SELECT {CompraMensual.proyeccion(mes="strftime('%Y-%m', fecha_compra)", total="SUM(monto_compra)",
+                                             cantidad="COUNT(*)")}
             FROM compras_cliente
             WHERE id_cliente = ?
             GROUP BY strftime('%Y-%m', fecha_compra)
@@ -291,37 +231,19 @@ class FrequentCustomerSystem:
             LIMIT 6
         ''', (id_cliente,))
 
-        compras_mensuales = cursor.fetchall()
+        compras_mensuales = CompraMensual.de_filas(cursor.fetchall())
 
         conn.close()
 
         return {
-            "cliente": {
-                "id": cliente[0],
-                "rut": cliente[1],
-                "nombre": cliente[2],
-                "email": cliente[3],
-                "tipo_cliente": cliente[5],
-                "total_compras": cliente[8],
-                "descuento_frecuente": cliente[9]
-            },
-            "estadisticas": {
-                "total_compras": stats[0],
-                "promedio_compra": stats[1],
-                "ultima_compra": stats[2]
-            },
-            "compras_mensuales": [
-                {
-                    "mes": cm[0],
-                    "total": cm[1],
-                    "cantidad": cm[2]
-                } for cm in compras_mensuales
-            ]
+            "cliente": cliente,
+            "estadisticas": stats,
+            "compras_mensuales": compras_mensuales
         }
 
     def generar_reporte_clientes_frecuentes(self, fecha_inicio=None, fecha_fin=None):
         """Generar reporte de clientes frecuentes"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         where_clause = ""
@@ -332,64 +254,63 @@ class FrequentCustomerSystem:
             params = [fecha_inicio, fecha_fin]
 
         cursor.execute(f'''
-            SELECT
-                c.tipo_cliente,
-                COUNT(*) as cantidad_clientes,
-                SUM(c.total_compras) as total_compras,
-                AVG(c.total_compras) as promedio_compras,
-                c.descuento_frecuente
+            SELECT {NivelClientes.proyeccion(nivel="c.tipo_cliente", cantidad_clientes="COUNT(*)",
+                                             total_compras="SUM(c.total_compras)",
+                                             promedio_compras="AVG(c.total_compras)",
+                                             descuento="c.descuento_frecuente")}
             FROM clientes c
             {where_clause}
             GROUP BY c.tipo_cliente
             ORDER BY c.descuento_frecuente DESC
         ''', params)
 
-        reporte = cursor.fetchall()
+        reporte = NivelClientes.de_filas(cursor.fetchall())
         conn.close()
+        return reporte
 
-        return [
-            {
-                "nivel": r[0],
-                "cantidad_clientes": r[1],
-                "total_compras": r[2],
-                "promedio_compras": r[3],
-                "descuento": r[4]
-            } for r in reporte
-        ]
-
-    def proximos_clientes_upgrade(self):
-        """Identificar clientes próximos a subir de nivel"""
-        conn = sqlite3.connect(self.db_path)
+    def proximos_clientes_upgrade(self, desde_compra=None, limite=10):
+        """Identificar clientes próximos a subir de nivel
+
+        Con desde_compra solo considera a los clientes con compras posteriores a
+        ese id_compra (total_compras solo cambia al registrar una compra).
+        """
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT
-                id_cliente, nombre, email, total_compras, tipo_cliente,
+        filtro = ""
+        params = []
+        if desde_compra is not None:
+            filtro = "AND id_cliente IN (SELECT id_cliente FROM compras_cliente WHERE id_compra > ?)"
+            params.append(desde_compra)
+
+        siguiente_nivel = '''
                 CASE
                     WHEN total_compras >= 50000 AND total_compras < 100000 THEN 100000 - total_compras
                     WHEN total_compras >= 100000 AND total_compras < 200000 THEN 200000 - total_compras
                     ELSE NULL
-                END as monto_para_siguiente_nivel
+                END'''
+        cursor.execute(f'''
+            SELECT {CandidatoUpgrade.proyeccion(nivel_actual="tipo_cliente",
+                                                monto_para_siguiente_nivel=siguiente_nivel)}
             FROM clientes
             WHERE total_compras < 200000
             AND estado = 'activo'
+            {filtro}
             ORDER BY total_compras DESC
-            LIMIT 10
-        ''')
+            LIMIT ?
+        ''', (*params, limite))
 
-        clientes = cursor.fetchall()
+        clientes = CandidatoUpgrade.de_filas(cursor.fetchall())
         conn.close()
+        return [c for c in clientes if c.monto_para_siguiente_nivel is not None]
 
-        return [
-            {
-                "id_cliente": c[0],
-                "nombre": c[1],
-                "email": c[2],
-                "total_compras": c[3],
-                "nivel_actual": c[4],
-                "monto_para_siguiente_nivel": c[5]
-            } for c in clientes if c[5] is not None
-        ]
+@tarea("notificacion_upgrade")
+def _tarea_notificacion_upgrade(db_path, id_cliente, nuevo_nivel):
+    """Trabajo de la cola: enviar la notificación de upgrade (un error se reintenta)"""
+    resultado = FrequentCustomerSystem(db_path).enviar_notificacion_upgrade(id_cliente, nuevo_nivel)
+    if not resultado["success"]:
+        raise RuntimeError(resultado["error"])
+    return resultado
 
 # Ejemplo de uso
 if __name__ == "__main__":
@@ -412,13 +333,17 @@ if __name__ == "__main__":
     sistema.registrar_compra(1, 45000)  # $45,000 (total: $105,000 - Frecuente)
     sistema.registrar_compra(1, 120000) # $120,000 (total: $225,000 - VIP)
 
+    # Las notificaciones de upgrade quedaron en la cola de trabajos
+    from job_queue import ColaTrabajos
+    print("Notificaciones enviadas:", ColaTrabajos("julia_confecciones.db").procesar_pendientes())
+
     # Obtener beneficios del cliente
     beneficios = sistema.obtener_beneficios_cliente(1)
     print("Beneficios disponibles:", beneficios)
 
     # Obtener estadísticas
     stats = sistema.obtener_estadisticas_cliente(1)
-    print("Estadísticas del cliente:", json.dumps(stats, indent=2, default=str))
+    print("Estadísticas del cliente:", json.dumps(a_json(stats), indent=2, default=str))
 
     # Generar reporte
     reporte = sistema.generar_reporte_clientes_frecuentes()
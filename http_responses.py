@@ -0,0 +1,207 @@
+# Capa de Respuestas HTTP del Portal - Julia Confecciones
+#
+# Usada por la app Flask (employee_tracking_portal) y la ASGI (portal_asgi):
+#
+# - JSON con orjson cuando está instalado (datetime y date nativos); sin
+#   orjson se usa json con separadores compactos. Los registros pasan antes
+#   por a_json: convertirlos en el hook default de orjson, fila por fila,
+#   resultó más lento que armar los dicts de una vez.
+# - Compresión br (si está el módulo brotli) o gzip según Accept-Encoding
+#   para los cuerpos de COMPRIMIR_DESDE bytes o más.
+# - La página del portal se compila una vez: el CSS y el JS del template
+#   salen a /activos/portal.<version>.css|js (versión = hash del contenido,
+#   cacheados un año como immutable) y el HTML queda como una página chica
+#   que se revalida. Las tres van precomprimidas al nivel máximo.
+# - ETag débil por empleado para el dashboard y las notificaciones, armado
+#   con la versión de version_empleados (ver schema, migración 9): con
+#   If-None-Match coincidente la respuesta es 304 sin consultar los datos.
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import zlib
+from datetime import date, datetime
+
+from records import a_json, es_registro
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRIMIR_DESDE = int(os.getenv("JULIA_COMPRIMIR_DESDE", "1024"))
+NIVEL_GZIP = int(os.getenv("JULIA_GZIP_NIVEL", "3"))
+NIVEL_BROTLI = int(os.getenv("JULIA_BROTLI_NIVEL", "5"))
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+CACHE_PRIVADO_REVALIDAR = "private, no-cache"
+
+PREFIJO_ACTIVOS = "/activos/"
+TIPOS_COMPRIMIBLES = ("application/json", "text/")
+
+
+# JSON
+
+def _fila(valor):
+    """default de orjson: tras a_json los únicos registros son filas de un listado en columnas"""
+    if es_registro(valor):
+        return list(valor)
+    return str(valor)
+
+
+def _por_defecto(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+if orjson is not None:
+    def a_json_bytes(datos, columnas=False):
+        """Serializar una respuesta (con registros, ver records) a JSON en bytes"""
+        return orjson.dumps(a_json(datos, columnas), default=_fila, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def a_json_bytes(datos, columnas=False):
+        """Serializar una respuesta (con registros, ver records) a JSON en bytes"""
+        return json.dumps(a_json(datos, columnas), default=_por_defecto, ensure_ascii=False,
+                          separators=(",", ":")).encode()
+
+
+# Compresión
+
+def elegir_codificacion(aceptadas):
+    """Codificación a usar según el encabezado Accept-Encoding (o None)"""
+    if not aceptadas:
+        return None
+    ofrecidas = {}
+    for parte in aceptadas.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                calidad = float(parametros.strip()[2:])
+            except ValueError:
+                calidad = 0.0
+        ofrecidas[nombre.strip()] = calidad
+    if brotli is not None and ofrecidas.get("br", 0) > 0:
+        return "br"
+    if ofrecidas.get("gzip", ofrecidas.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+def _comprimir_con(cuerpo, codificacion, maximo=False):
+    if codificacion == "br":
+        return brotli.compress(cuerpo, quality=11 if maximo else NIVEL_BROTLI)
+    # mtime=0: el mismo cuerpo comprime siempre a los mismos bytes
+    return gzip.compress(cuerpo, compresslevel=9 if maximo else NIVEL_GZIP, mtime=0)
+
+
+def es_comprimible(tipo):
+    return tipo.startswith(TIPOS_COMPRIMIBLES)
+
+
+def comprimir(cuerpo, aceptadas, tipo="application/json"):
+    """Devolver (cuerpo, codificación) comprimido si conviene, o (cuerpo, None)"""
+    if len(cuerpo) < COMPRIMIR_DESDE or not es_comprimible(tipo):
+        return cuerpo, None
+    codificacion = elegir_codificacion(aceptadas)
+    if codificacion is None:
+        return cuerpo, None
+    comprimido = _comprimir_con(cuerpo, codificacion)
+    if len(comprimido) >= len(cuerpo):
+        return cuerpo, None
+    return comprimido, codificacion
+
+
+# Peticiones condicionales
+
+def etag_empleado(id_empleado, version, variante=""):
+    """ETag de los datos del empleado en `version` (None si no hay versión)
+
+    `variante` (ruta y query string) distingue las distintas respuestas
+    armadas con los mismos datos: formato, página, filtros.
+    """
+    if version is None:
+        return None
+    return f'W/"{id_empleado}.{version}.{zlib.crc32(variante.encode()):08x}"'
+
+
+def coincide_etag(if_none_match, etag):
+    """True si el encabezado If-None-Match incluye `etag` (comparación débil)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    buscado = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == buscado
+               for candidato in if_none_match.split(","))
+
+
+# Página del portal
+
+class Activo:
+    """Contenido estático con sus variantes precomprimidas"""
+
+    __slots__ = ("ruta", "tipo", "cache", "version", "variantes")
+
+    def __init__(self, ruta, tipo, cuerpo, cache):
+        self.ruta = ruta
+        self.tipo = tipo
+        self.cache = cache
+        self.version = hashlib.sha256(cuerpo).hexdigest()[:12]
+        self.variantes = {None: cuerpo, "gzip": _comprimir_con(cuerpo, "gzip", maximo=True)}
+        if brotli is not None:
+            self.variantes["br"] = _comprimir_con(cuerpo, "br", maximo=True)
+
+    def variante(self, aceptadas):
+        """Devolver (cuerpo, codificación) para el Accept-Encoding del cliente"""
+        codificacion = elegir_codificacion(aceptadas)
+        if codificacion not in self.variantes:
+            codificacion = None
+        return self.variantes[codificacion], codificacion
+
+    def encabezados(self, codificacion):
+        """Encabezados de la respuesta (sin Content-Type, que va en self.tipo)"""
+        encabezados = {"Cache-Control": self.cache, "Vary": "Accept-Encoding"}
+        if codificacion:
+            encabezados["Content-Encoding"] = codificacion
+        return encabezados
+
+
+_ESTILO = re.compile(r"[ \t]*<style>(.*?)</style>\n?", re.DOTALL)
+_SCRIPT = re.compile(r"[ \t]*<script>(.*?)</script>\n?", re.DOTALL)
+
+
+class ActivosPortal:
+    """La página del portal compilada: HTML, CSS y JS versionados"""
+
+    def __init__(self, template):
+        estilo = _ESTILO.search(template)
+        script = _SCRIPT.search(template)
+        self.css = Activo(None, "text/css; charset=utf-8",
+                          estilo.group(1).encode() if estilo else b"", CACHE_INMUTABLE)
+        self.js = Activo(None, "application/javascript; charset=utf-8",
+                         script.group(1).encode() if script else b"", CACHE_INMUTABLE)
+        self.css.ruta = f"{PREFIJO_ACTIVOS}portal.{self.css.version}.css"
+        self.js.ruta = f"{PREFIJO_ACTIVOS}portal.{self.js.version}.js"
+
+        html = template.strip()
+        if estilo:
+            html = _ESTILO.sub(lambda _: f'    <link rel="stylesheet" href="{self.css.ruta}">\n', html, 1)
+        if script:
+            html = _SCRIPT.sub(lambda _: f'    <script src="{self.js.ruta}"></script>\n', html, 1)
+        self.pagina = Activo("/", "text/html; charset=utf-8", html.encode(), CACHE_REVALIDAR)
+
+        self.por_ruta = {self.css.ruta: self.css, self.js.ruta: self.js}
+
+    def activo(self, nombre):
+        """Activo servido en /activos/<nombre> (None si no existe o es de otra versión)"""
+        return self.por_ruta.get(PREFIJO_ACTIVOS + nombre)
@@ -0,0 +1,468 @@
+# Cola de Trabajos en Segundo Plano - Julia Confecciones
+#
+# Cola durable en la tabla cola_trabajos (migración 4 de schema.py). Los
+# sistemas encolan y responden de inmediato; un pool de trabajadores (hilos o
+# procesos) toma los trabajos y ejecuta la función registrada para su tipo.
+#
+#   - Prioridad: se toma primero el de mayor prioridad entre los visibles.
+#   - Reintentos: un error deja el trabajo invisible con espera exponencial;
+#     al agotar max_intentos queda 'fallido' con su último error.
+#   - Deduplicación: clave_unica admite una sola copia pendiente o en proceso.
+#   - Visibilidad: tomar un trabajo lo oculta por timeout_visibilidad
+#     segundos; si el trabajador muere, vuelve a la cola al vencer el plazo.
+#
+# `encolar(cursor, ...)` escribe dentro de la transacción del llamador, así el
+# trabajo existe si y solo si la escritura que lo origina se confirmó.
+# Las tareas son funcion(db_path, **datos) y se registran con @tarea(tipo).
+#
+# Despliegue: encolar no ejecuta nada. Los trabajos de los sistemas
+# (notificaciones de upgrade y de empleados, reportes de pagos, resumen
+# diario de cuentas por pagar) solo corren si hay trabajadores consumiendo la
+# misma base. Por omisión el portal (Flask o ASGI) y el programador de
+# barridos inician su propio pool de hilos; con trabajadores dedicados
+# (`python job_queue.py`) se puede apagar con JULIA_COLA_EN_PROCESO=0. Un
+# proceso sin pool lo avisa al arrancar, porque si nadie más consume la
+# cola los trabajos se acumulan como 'pendiente' (ver --estado).
+#
+# Uso:
+#   python job_queue.py --db julia_confecciones.db --trabajadores 4 [--procesos]
+
+import argparse
+import contextvars
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+from database import conectar, es_postgres
+from metrics import registro
+from records import a_json
+from sqlite_writer import escribir
+import tracing
+
+logger = logging.getLogger("julia.trabajos")
+
+TRABAJADORES = int(os.getenv("JULIA_COLA_TRABAJADORES", "2"))
+INTERVALO_S = float(os.getenv("JULIA_COLA_SONDEO", "1"))
+TIMEOUT_VISIBILIDAD_S = float(os.getenv("JULIA_COLA_VISIBILIDAD", "300"))
+MAX_INTENTOS = int(os.getenv("JULIA_COLA_MAX_INTENTOS", "5"))
+ESPERA_BASE_S = float(os.getenv("JULIA_COLA_ESPERA_BASE", "2"))
+ESPERA_MAXIMA_S = float(os.getenv("JULIA_COLA_ESPERA_MAXIMA", "600"))
+REINTENTOS_COMPLETAR = int(os.getenv("JULIA_COLA_REINTENTOS_COMPLETAR", "3"))
+EN_PROCESO = os.getenv("JULIA_COLA_EN_PROCESO", "1") != "0"
+
+# Módulos que registran tareas; los procesos trabajadores los importan al iniciar
+MODULOS_TAREAS = ("frequent_customer_system", "payment_system", "employee_tracking_portal",
+                  "outbox_replicator")
+
+TAREAS = {}
+
+_avisos = {}
+_lock_avisos = threading.Lock()
+
+_duracion = registro.histograma(
+    "julia_trabajos_duracion_segundos", "Duración de los trabajos en segundo plano", ("tipo",))
+
+
+def tarea(tipo, max_intentos=None):
+    """Registrar funcion(db_path, **datos) como la tarea `tipo`"""
+    def registrar(funcion):
+        TAREAS[tipo] = (funcion, max_intentos)
+        return funcion
+    return registrar
+
+
+def _clave(db_path):
+    return db_path if es_postgres(db_path) else os.path.abspath(db_path)
+
+
+def _aviso(db_path):
+    with _lock_avisos:
+        return _avisos.setdefault(_clave(db_path), threading.Event())
+
+
+def avisar(db_path):
+    """Despertar a los trabajadores de este proceso (tras encolar en una transacción propia)"""
+    _aviso(db_path).set()
+
+
+def encolar(cursor, tipo, datos=None, prioridad=0, clave_unica=None, retraso=0,
+            max_intentos=None):
+    """Encolar un trabajo en la transacción de `cursor` y devolver su id
+
+    Si clave_unica ya tiene una copia pendiente o en proceso no se agrega
+    otra y se devuelve el id de esa copia.
+    """
+    if max_intentos is None:
+        max_intentos = TAREAS.get(tipo, (None, None))[1] or MAX_INTENTOS
+    ahora = time.time()
+    cursor.execute('''
+        INSERT OR IGNORE INTO cola_trabajos
+        (tipo, datos, prioridad, max_intentos, clave_unica, visible_desde, fecha_creacion)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (tipo, json.dumps(datos or {}, default=str), prioridad, max_intentos, clave_unica,
+          ahora + retraso, ahora))
+    if cursor.rowcount == 1:
+        return cursor.lastrowid
+    cursor.execute('''
+        SELECT id_trabajo FROM cola_trabajos
+        WHERE clave_unica = ? AND estado IN ('pendiente', 'en_proceso')
+    ''', (clave_unica,))
+    fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+def encolar_trabajo(db_path, tipo, datos=None, prioridad=0, clave_unica=None, retraso=0,
+                    max_intentos=None):
+    """Encolar un trabajo en su propia escritura y avisar a los trabajadores"""
+    id_trabajo = escribir(db_path, lambda cursor: encolar(
+        cursor, tipo, datos, prioridad, clave_unica, retraso, max_intentos))
+    avisar(db_path)
+    return id_trabajo
+
+
+def obtener_trabajo(db_path, id_trabajo):
+    """Estado, intentos y resultado de un trabajo"""
+    conn = conectar(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT tipo, estado, prioridad, intentos, max_intentos, resultado, ultimo_error,
+               fecha_creacion, fecha_actualizacion
+        FROM cola_trabajos WHERE id_trabajo = ?
+    ''', (id_trabajo,))
+    fila = cursor.fetchone()
+    conn.close()
+
+    if not fila:
+        return {"success": False, "error": "Trabajo no encontrado"}
+
+    return {
+        "success": True,
+        "id_trabajo": id_trabajo,
+        "tipo": fila[0],
+        "estado": fila[1],
+        "prioridad": fila[2],
+        "intentos": fila[3],
+        "max_intentos": fila[4],
+        "resultado": json.loads(fila[5]) if fila[5] else None,
+        "ultimo_error": fila[6],
+        "fecha_creacion": fila[7],
+        "fecha_actualizacion": fila[8]
+    }
+
+
+class ColaTrabajos:
+    """Pool de trabajadores que consume cola_trabajos de una base"""
+
+    def __init__(self, db_path, trabajadores=TRABAJADORES, modo="hilos", intervalo=INTERVALO_S,
+                 timeout_visibilidad=TIMEOUT_VISIBILIDAD_S, modulos=MODULOS_TAREAS):
+        if modo not in ("hilos", "procesos"):
+            raise ValueError(f"Modo de trabajadores desconocido: {modo}")
+
+        self.db_path = db_path
+        self.trabajadores = trabajadores
+        self.modo = modo
+        self.intervalo = intervalo
+        self.timeout_visibilidad = timeout_visibilidad
+        self.modulos = tuple(modulos)
+
+        self._aviso = _aviso(db_path)
+        self._detener = threading.Event()
+        self._evento_procesos = None
+        self._hilos = []
+        self._procesos = []
+        self._lock = threading.Lock()
+
+        self.metricas = {
+            "tomados": 0,
+            "completados": 0,
+            "reintentos": 0,
+            "fallidos": 0,
+            "en_ejecucion": 0,
+            "ultimo_error": None
+        }
+
+        registro.registrar_colector(f"cola_trabajos:{os.path.basename(str(db_path))}",
+                                    self._colector_metricas)
+
+    def tomar(self, limite=1):
+        """Reservar hasta `limite` trabajos visibles; devuelve [(id, tipo, datos, intento)]"""
+        def operacion(cursor):
+            ahora = time.time()
+            cursor.execute('''
+                SELECT id_trabajo, tipo, datos, intentos, max_intentos FROM cola_trabajos
+                WHERE estado IN ('pendiente', 'en_proceso') AND visible_desde <= ?
+                ORDER BY prioridad DESC, visible_desde, id_trabajo
+                LIMIT ?
+            ''', (ahora, limite))
+
+            tomados = []
+            for id_trabajo, tipo, datos, intentos, max_intentos in cursor.fetchall():
+                if intentos >= max_intentos:
+                    # Solo llega aquí un trabajo 'en_proceso' cuyo trabajador no respondió
+                    cursor.execute('''
+                        UPDATE cola_trabajos
+                        SET estado = 'fallido', fecha_actualizacion = ?,
+                            ultimo_error = 'Tiempo de visibilidad agotado'
+                        WHERE id_trabajo = ? AND intentos = ?
+                    ''', (ahora, id_trabajo, intentos))
+                    continue
+                # `intentos` funciona como turno: otro trabajador que haya tomado la
+                # misma fila ya lo incrementó y este UPDATE no la encuentra
+                cursor.execute('''
+                    UPDATE cola_trabajos
+                    SET estado = 'en_proceso', intentos = intentos + 1,
+                        visible_desde = ?, fecha_actualizacion = ?
+                    WHERE id_trabajo = ? AND intentos = ?
+                ''', (ahora + self.timeout_visibilidad, ahora, id_trabajo, intentos))
+                if cursor.rowcount == 1:
+                    tomados.append((id_trabajo, tipo, json.loads(datos or "{}"), intentos + 1))
+            return tomados
+
+        tomados = escribir(self.db_path, operacion)
+        with self._lock:
+            self.metricas["tomados"] += len(tomados)
+        return tomados
+
+    def _completar(self, id_trabajo, intento, resultado):
+        escribir(self.db_path, lambda cursor: cursor.execute('''
+            UPDATE cola_trabajos
+            SET estado = 'completado', resultado = ?, fecha_actualizacion = ?
+            WHERE id_trabajo = ? AND intentos = ?
+        ''', (json.dumps(a_json(resultado), default=str), time.time(), id_trabajo, intento)))
+
+    def _registrar_completado(self, id_trabajo, tipo, intento, resultado):
+        """Marcar completado un trabajo que ya terminó bien, reintentando la escritura
+
+        Nunca lo devuelve a la cola: si no se logra registrar, queda
+        'en_proceso' y solo se repite si vence su tiempo de visibilidad.
+        """
+        for reintento in range(REINTENTOS_COMPLETAR):
+            if reintento:
+                time.sleep(0.1 * 2 ** reintento * random.uniform(0.5, 1.0))
+            try:
+                self._completar(id_trabajo, intento, resultado)
+                return True
+            except Exception as e:
+                error = e
+        logger.error("Trabajo %d (%s) intento %d terminó bien pero no se pudo registrar: %s",
+                     id_trabajo, tipo, intento, error)
+        with self._lock:
+            self.metricas["ultimo_error"] = f"{type(error).__name__}: {error}"
+        return False
+
+    def _fallar(self, id_trabajo, intento, error):
+        def operacion(cursor):
+            ahora = time.time()
+            # Exponencial con medio jitter: nunca reintenta de inmediato
+            espera = min(ESPERA_MAXIMA_S, ESPERA_BASE_S * 2 ** (intento - 1))
+            espera *= random.uniform(0.5, 1.0)
+            cursor.execute('''
+                UPDATE cola_trabajos
+                SET estado = CASE WHEN intentos >= max_intentos THEN 'fallido' ELSE 'pendiente' END,
+                    visible_desde = ?, fecha_actualizacion = ?, ultimo_error = ?
+                WHERE id_trabajo = ? AND intentos = ?
+            ''', (ahora + espera, ahora, error, id_trabajo, intento))
+            cursor.execute('SELECT estado FROM cola_trabajos WHERE id_trabajo = ?', (id_trabajo,))
+            return cursor.fetchone()[0]
+
+        return escribir(self.db_path, operacion)
+
+    def ejecutar(self, id_trabajo, tipo, datos, intento):
+        """Ejecutar un trabajo ya tomado y registrar su resultado"""
+        funcion = TAREAS.get(tipo, (None, None))[0]
+        inicio = time.perf_counter()
+        with self._lock:
+            self.metricas["en_ejecucion"] += 1
+        try:
+            with tracing.span(f"trabajo {tipo}", {"trabajo.id": id_trabajo, "trabajo.intento": intento}):
+                if funcion is None:
+                    raise LookupError(f"No hay tarea registrada para '{tipo}'")
+                resultado = funcion(self.db_path, **datos)
+
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            estado = self._fallar(id_trabajo, intento, error)
+            with self._lock:
+                self.metricas["fallidos" if estado == "fallido" else "reintentos"] += 1
+                self.metricas["ultimo_error"] = error
+            logger.warning("Trabajo %d (%s) intento %d falló%s: %s", id_trabajo, tipo, intento,
+                           " definitivamente" if estado == "fallido" else "", error)
+            return False
+
+        else:
+            # Fuera del try de la tarea: si falla el registro, la tarea no se reprograma
+            self._registrar_completado(id_trabajo, tipo, intento, resultado)
+            with self._lock:
+                self.metricas["completados"] += 1
+            return True
+
+        finally:
+            _duracion.observar(time.perf_counter() - inicio, tipo=tipo)
+            with self._lock:
+                self.metricas["en_ejecucion"] -= 1
+
+    def procesar_pendientes(self, limite=None):
+        """Ejecutar en este hilo los trabajos visibles; devuelve cuántos procesó"""
+        procesados = 0
+        while limite is None or procesados < limite:
+            tomados = self.tomar(1)
+            if not tomados:
+                return procesados
+            self.ejecutar(*tomados[0])
+            procesados += 1
+        return procesados
+
+    def _trabajador(self):
+        while not self._detener.is_set():
+            try:
+                if self.procesar_pendientes(limite=100):
+                    continue
+            except Exception as e:
+                with self._lock:
+                    self.metricas["ultimo_error"] = str(e)
+                logger.error("Error en trabajador de la cola: %s", e)
+
+            self._aviso.wait(self.intervalo)
+            self._aviso.clear()
+
+    def iniciar(self):
+        """Iniciar los trabajadores en segundo plano"""
+        if self._hilos or self._procesos:
+            return
+        self._detener.clear()
+
+        if self.modo == "procesos":
+            # spawn: un fork heredaría el escritor único y sus conexiones abiertas
+            contexto = multiprocessing.get_context("spawn")
+            self._evento_procesos = contexto.Event()
+            for i in range(self.trabajadores):
+                proceso = contexto.Process(
+                    target=_proceso_trabajador, name=f"cola-trabajos-{i}", daemon=True,
+                    args=(self.db_path, self.modulos, self.intervalo, self.timeout_visibilidad,
+                          self._evento_procesos))
+                proceso.start()
+                self._procesos.append(proceso)
+            return
+
+        for i in range(self.trabajadores):
+            contexto = contextvars.copy_context()
+            hilo = threading.Thread(target=contexto.run, args=(self._trabajador,),
+                                    daemon=True, name=f"cola-trabajos-{i}")
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def detener(self, timeout=10.0):
+        """Detener los trabajadores; un trabajo en curso termina antes de salir"""
+        self._detener.set()
+        self._aviso.set()
+        if self._evento_procesos is not None:
+            self._evento_procesos.set()
+        for trabajador in self._hilos + self._procesos:
+            trabajador.join(timeout)
+        self._hilos = []
+        self._procesos = []
+
+    def obtener_estado(self):
+        """Trabajos por estado, atrasados visibles y métricas de este pool"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT estado, COUNT(*) FROM cola_trabajos GROUP BY estado')
+        por_estado = dict(cursor.fetchall())
+        cursor.execute('''
+            SELECT MIN(visible_desde) FROM cola_trabajos
+            WHERE estado IN ('pendiente', 'en_proceso') AND visible_desde <= ?
+        ''', (time.time(),))
+        mas_antiguo = cursor.fetchone()[0]
+        conn.close()
+
+        with self._lock:
+            estado = dict(self.metricas)
+        estado["por_estado"] = por_estado
+        estado["retraso_segundos"] = round(time.time() - mas_antiguo, 3) if mas_antiguo else 0.0
+        estado["trabajadores"] = self.trabajadores
+        estado["modo"] = self.modo
+        estado["activo"] = any(t.is_alive() for t in self._hilos + self._procesos)
+        return estado
+
+    def _colector_metricas(self):
+        with self._lock:
+            metricas = dict(self.metricas)
+        return [
+            ("julia_trabajos_tomados_total", "counter", "Trabajos tomados por este pool",
+             [({}, metricas["tomados"])]),
+            ("julia_trabajos_completados_total", "counter", "Trabajos terminados con éxito",
+             [({}, metricas["completados"])]),
+            ("julia_trabajos_reintentos_total", "counter", "Trabajos devueltos a la cola tras un error",
+             [({}, metricas["reintentos"])]),
+            ("julia_trabajos_fallidos_total", "counter", "Trabajos que agotaron sus intentos",
+             [({}, metricas["fallidos"])]),
+            ("julia_trabajos_en_ejecucion", "gauge", "Trabajos ejecutándose en este momento",
+             [({}, metricas["en_ejecucion"])]),
+        ]
+
+
+def importar_tareas(modulos=MODULOS_TAREAS):
+    """Importar los módulos que registran tareas; omite los que no se pueden cargar"""
+    for modulo in modulos:
+        try:
+            importlib.import_module(modulo)
+        except ImportError as e:
+            logger.warning("No se cargaron las tareas de %s: %s", modulo, e)
+
+
+def iniciar_en_proceso(db_path):
+    """Iniciar un pool de hilos en este proceso (salvo JULIA_COLA_EN_PROCESO=0)
+
+    Para el portal y el programador de barridos; devuelve la cola iniciada o
+    None si está desactivado.
+    """
+    if not EN_PROCESO:
+        logger.warning("Sin trabajadores de la cola en este proceso (JULIA_COLA_EN_PROCESO=0): "
+                       "los trabajos de %s requieren `python job_queue.py`", db_path)
+        return None
+    importar_tareas()
+    cola = ColaTrabajos(db_path)
+    cola.iniciar()
+    logger.info("Cola de trabajos en proceso para %s: %d trabajadores", db_path, cola.trabajadores)
+    return cola
+
+
+def _proceso_trabajador(db_path, modulos, intervalo, timeout_visibilidad, detener):
+    importar_tareas(modulos)
+    cola = ColaTrabajos(db_path, trabajadores=1, intervalo=intervalo,
+                        timeout_visibilidad=timeout_visibilidad, modulos=modulos)
+    cola.iniciar()
+    detener.wait()
+    cola.detener()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trabajadores de la cola de trabajos")
+    parser.add_argument("--db", default=os.getenv("JULIA_DB", "julia_confecciones.db"))
+    parser.add_argument("--trabajadores", type=int, default=TRABAJADORES)
+    parser.add_argument("--procesos", action="store_true", help="Un proceso por trabajador")
+    parser.add_argument("--estado", action="store_true", help="Mostrar el estado y salir")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from schema import asegurar_esquema
+    asegurar_esquema(args.db)
+    importar_tareas()
+
+    cola = ColaTrabajos(args.db, args.trabajadores, "procesos" if args.procesos else "hilos")
+    if args.estado:
+        print(json.dumps(cola.obtener_estado(), indent=2))
+    else:
+        cola.iniciar()
+        print(f"Cola de trabajos en {args.db}: {args.trabajadores} trabajadores ({cola.modo})")
+        try:
+            while True:
+                time.sleep(60)
+                print(json.dumps(cola.obtener_estado()))
+        except KeyboardInterrupt:
+            cola.detener()
@@ -0,0 +1,186 @@
+# Registro de Métricas en Proceso (formato Prometheus) - Julia Confecciones
+#
+# Los sistemas escriben contadores, medidores e histogramas en `registro`;
+# también pueden registrar colectores que calculan valores al momento de la
+# consulta. El portal expone todo en /metrics con exportar_texto().
+
+import bisect
+import threading
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in etiquetas) + "}"
+
+
+def _formatear_valor(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas):
+        return tuple((k, etiquetas.get(k, "")) for k in self.etiquetas)
+
+    def muestras(self):
+        with self._lock:
+            return [(self.nombre, clave, valor) for clave, valor in self._valores.items()]
+
+
+class Contador(_Metrica):
+    """Valor que solo aumenta"""
+
+    tipo = "counter"
+
+    def inc(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def total(self):
+        """Suma de todas las series del contador"""
+        with self._lock:
+            return sum(self._valores.values())
+
+
+class Medidor(_Metrica):
+    """Valor que sube y baja"""
+
+    tipo = "gauge"
+
+    def set(self, valor, **etiquetas):
+        with self._lock:
+            self._valores[self._clave(etiquetas)] = valor
+
+    def inc(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def dec(self, valor=1, **etiquetas):
+        self.inc(-valor, **etiquetas)
+
+
+class Histograma(_Metrica):
+    """Distribución de observaciones en buckets acumulativos"""
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            datos = self._valores.get(clave)
+            if datos is None:
+                datos = self._valores[clave] = {"buckets": [0] * len(self.buckets), "suma": 0.0, "cuenta": 0}
+            indice = bisect.bisect_left(self.buckets, valor)
+            if indice < len(self.buckets):
+                datos["buckets"][indice] += 1
+            datos["suma"] += valor
+            datos["cuenta"] += 1
+
+    def muestras(self):
+        resultado = []
+        with self._lock:
+            for clave, datos in self._valores.items():
+                acumulado = 0
+                for limite, cantidad in zip(self.buckets, datos["buckets"]):
+                    acumulado += cantidad
+                    resultado.append((f"{self.nombre}_bucket", clave + (("le", _formatear_valor(float(limite))),), acumulado))
+                resultado.append((f"{self.nombre}_bucket", clave + (("le", "+Inf"),), datos["cuenta"]))
+                resultado.append((f"{self.nombre}_sum", clave, datos["suma"]))
+                resultado.append((f"{self.nombre}_count", clave, datos["cuenta"]))
+        return resultado
+
+
+class Registro:
+    """Registro de métricas y colectores del proceso"""
+
+    def __init__(self):
+        self._metricas = {}
+        self._colectores = {}
+        self._lock = threading.Lock()
+
+    def _obtener(self, clase, nombre, ayuda, etiquetas, **kwargs):
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, ayuda, etiquetas, **kwargs)
+            return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._obtener(Contador, nombre, ayuda, etiquetas)
+
+    def medidor(self, nombre, ayuda, etiquetas=()):
+        return self._obtener(Medidor, nombre, ayuda, etiquetas)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        return self._obtener(Histograma, nombre, ayuda, etiquetas, buckets=buckets)
+
+    def registrar_colector(self, clave, funcion):
+        """Registrar (o reemplazar) un colector
+
+        `funcion()` devuelve una lista de (nombre, tipo, ayuda, muestras) donde
+        muestras es una lista de (dict_etiquetas, valor).
+        """
+        with self._lock:
+            self._colectores[clave] = funcion
+
+    def eliminar_colector(self, clave):
+        with self._lock:
+            self._colectores.pop(clave, None)
+
+    def exportar_texto(self):
+        """Exportar todas las métricas en el formato de texto de Prometheus"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+            colectores = list(self._colectores.items())
+
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            for nombre, etiquetas, valor in metrica.muestras():
+                lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {_formatear_valor(valor)}")
+
+        for clave, colector in colectores:
+            try:
+                familias = colector()
+            except Exception as e:
+                lineas.append(f"# colector {clave} falló: {_escapar(e)}")
+                continue
+            for nombre, tipo, ayuda, muestras in familias:
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                for etiquetas, valor in muestras:
+                    if valor is None:
+                        continue
+                    lineas.append(f"{nombre}{_formatear_etiquetas(sorted(etiquetas.items()))} "
+                                  f"{_formatear_valor(valor)}")
+
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
@@ -0,0 +1,420 @@
+# Replicación por Outbox hacia Supabase - Julia Confecciones
+#
+# Triggers en las tablas del taller anotan cada cambio en outbox_cambios, en
+# la misma transacción que el cambio. Un replicador lee el outbox desde su
+# checkpoint, toma el estado actual de las filas cambiadas y lo envía por
+# lotes al destino como upserts/deletes por clave primaria: repetir un lote ya
+# enviado deja el destino igual, así que ante cualquier error se reintenta el
+# mismo lote (espera exponencial con jitter) sin riesgo de duplicar.
+#
+# Destinos:
+#   - PostgREST de Supabase:  JULIA_REPLICA_DESTINO=https://<proyecto>.supabase.co
+#                             (clave en SUPABASE_SERVICE_ROLE_KEY)
+#   - Postgres directo o un archivo SQLite local de prueba:
+#                             JULIA_REPLICA_DESTINO=postgresql://...  |  replica.db
+#
+# Las tablas de destino llevan el prefijo JULIA_REPLICA_PREFIJO ("replica_")
+# para no chocar con las tablas migradas desde Access; `--ddl` imprime su DDL.
+#
+# Uso:
+#   python outbox_replicator.py --ddl
+#   python outbox_replicator.py --destino replica_local.db --una-vez
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from database import conectar, es_postgres
+from job_queue import encolar_trabajo, tarea
+from metrics import registro
+from schema import asegurar_esquema
+from sqlite_writer import escribir
+
+logger = logging.getLogger("julia.replicacion")
+
+TAMANO_LOTE = int(os.getenv("JULIA_REPLICA_LOTE", "500"))
+INTERVALO_S = float(os.getenv("JULIA_REPLICA_INTERVALO", "2.0"))
+ESPERA_MAXIMA_S = float(os.getenv("JULIA_REPLICA_ESPERA_MAXIMA", "60"))
+PREFIJO = os.getenv("JULIA_REPLICA_PREFIJO", "replica_")
+
+# Tablas replicadas y su clave primaria
+TABLAS_REPLICADAS = {
+    "produccion": "id_produccion",
+    "pagos_empleados": "id_pago",
+    "compras_cliente": "id_compra",
+    "reservas": "id_reserva",
+}
+
+# Tablas particionadas: se leen por su vista, así una fila que pasa a la
+# partición histórica sigue existiendo para el destino y no se borra allá
+VISTAS_LECTURA = {
+    "produccion": "produccion_completa",
+}
+
+
+class ErrorReplicacion(Exception):
+    """El destino rechazó o no recibió un lote"""
+
+
+def instalar_outbox(db_path, tablas=None):
+    """Crear el outbox, los checkpoints y los triggers de captura (idempotente)"""
+    tablas = TABLAS_REPLICADAS if tablas is None else tablas
+    if es_postgres(db_path):
+        raise ValueError("El outbox captura cambios de la base SQLite local")
+
+    # Las tablas del outbox son parte del esquema versionado (migración 3)
+    asegurar_esquema(db_path)
+
+    conn = conectar(db_path)
+    cursor = conn.cursor()
+
+    instaladas = []
+    for tabla, clave in tablas.items():
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,))
+        if cursor.fetchone() is None:
+            logger.warning("Tabla %s no existe: se omite su captura de cambios", tabla)
+            continue
+        for evento, operacion, fila in (("INSERT", "upsert", "NEW"), ("UPDATE", "upsert", "NEW"),
+                                        ("DELETE", "delete", "OLD")):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS outbox_{tabla}_{evento.lower()}
+                AFTER {evento} ON {tabla}
+                BEGIN
+                    INSERT INTO outbox_cambios (tabla, operacion, id_fila)
+                    VALUES ('{tabla}', '{operacion}', {fila}.{clave});
+                END
+            ''')
+        instaladas.append(tabla)
+
+    conn.commit()
+    conn.close()
+    return instaladas
+
+
+def ddl_destino(db_path, tabla, prefijo=PREFIJO):
+    """CREATE TABLE de la réplica de `tabla`, con las columnas de la tabla local"""
+    conn = conectar(db_path)
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    columnas = cursor.fetchall()
+    conn.close()
+
+    definiciones = [f"{c[1]} {c[2] or 'TEXT'}" for c in columnas]
+    definiciones.append(f"PRIMARY KEY ({TABLAS_REPLICADAS[tabla]})")
+    return f"CREATE TABLE IF NOT EXISTS {prefijo}{tabla} (\n    " + ",\n    ".join(definiciones) + "\n)"
+
+
+class DestinoPostgREST:
+    """Upserts/deletes por lote contra la API REST de Supabase"""
+
+    def __init__(self, url, clave=None, timeout=30):
+        self.url = url.rstrip("/")
+        self.clave = clave or os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+        self.timeout = timeout
+        self.nombre = self.url
+
+    def _peticion(self, metodo, ruta, cuerpo=None, prefer=None):
+        cabeceras = {"apikey": self.clave, "Authorization": f"Bearer {self.clave}",
+                     "Content-Type": "application/json"}
+        if prefer:
+            cabeceras["Prefer"] = prefer
+        datos = json.dumps(cuerpo, default=str).encode("utf-8") if cuerpo is not None else None
+        req = urllib.request.Request(f"{self.url}/rest/v1/{ruta}", data=datos,
+                                     headers=cabeceras, method=metodo)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as respuesta:
+                respuesta.read()
+        except urllib.error.HTTPError as e:
+            detalle = e.read().decode("utf-8", "replace")[:300]
+            raise ErrorReplicacion(f"{metodo} {ruta}: HTTP {e.code} {detalle}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise ErrorReplicacion(f"{metodo} {ruta}: {e}") from e
+
+    def aplicar(self, tabla, clave, filas, ids_borrados):
+        if filas:
+            self._peticion("POST", f"{tabla}?on_conflict={clave}", filas,
+                           prefer="resolution=merge-duplicates,return=minimal")
+        if ids_borrados:
+            lista = ",".join(str(i) for i in ids_borrados)
+            self._peticion("DELETE", f"{tabla}?{clave}=in.({lista})", prefer="return=minimal")
+
+
+class DestinoSQL:
+    """Upserts/deletes por lote en Postgres (URL) o en un archivo SQLite de prueba"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.nombre = db_path.rsplit("@", 1)[-1]
+
+    def preparar(self, ddls):
+        """Crear las tablas de réplica si no existen"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        for ddl in ddls:
+            cursor.execute(ddl)
+        conn.commit()
+        conn.close()
+
+    def aplicar(self, tabla, clave, filas, ids_borrados):
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        try:
+            if filas:
+                columnas = list(filas[0])
+                # En Postgres, postgres_backend lo traduce a ON CONFLICT (clave) DO UPDATE
+                cursor.executemany(f'''
+                    INSERT OR REPLACE INTO {tabla} ({", ".join(columnas)})
+                    VALUES ({", ".join("?" for _ in columnas)})
+                ''', [tuple(f[c] for c in columnas) for f in filas])
+            if ids_borrados:
+                cursor.execute(f'''
+                    DELETE FROM {tabla} WHERE {clave} IN ({", ".join("?" for _ in ids_borrados)})
+                ''', list(ids_borrados))
+            conn.commit()
+        except Exception as e:
+            raise ErrorReplicacion(f"{tabla}: {e}") from e
+        finally:
+            conn.close()
+
+
+def crear_destino(destino):
+    """Destino según su forma: URL http(s) -> PostgREST; URL postgresql:// o archivo -> SQL"""
+    if destino.startswith(("http://", "https://")):
+        return DestinoPostgREST(destino)
+    return DestinoSQL(destino)
+
+
+class OutboxReplicator:
+    """Envía los cambios del outbox a un destino, por lotes y desde un checkpoint"""
+
+    def __init__(self, db_path, destino, tamano_lote=TAMANO_LOTE, intervalo=INTERVALO_S,
+                 prefijo=PREFIJO, espera_maxima=ESPERA_MAXIMA_S):
+        self.db_path = db_path
+        self.destino = crear_destino(destino) if isinstance(destino, str) else destino
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.prefijo = prefijo
+        self.espera_maxima = espera_maxima
+
+        self._detener = threading.Event()
+        self._hilo = None
+        self._fallos_seguidos = 0
+
+        self.metricas = {
+            "cambios_enviados": 0,
+            "filas_enviadas": 0,
+            "lotes_enviados": 0,
+            "errores": 0,
+            "ultimo_error": None,
+            "ultima_replicacion": None
+        }
+
+        instalar_outbox(db_path)
+        registro.registrar_colector(f"replicacion:{self.destino.nombre}", self._colector_metricas)
+
+    def checkpoint(self):
+        """Último id_cambio confirmado por el destino"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT ultimo_id FROM replicacion_checkpoint WHERE destino = ?",
+                       (self.destino.nombre,))
+        fila = cursor.fetchone()
+        conn.close()
+        return fila[0] if fila else 0
+
+    def _leer_lote(self, desde):
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id_cambio, tabla, operacion, id_fila FROM outbox_cambios
+            WHERE id_cambio > ?
+            ORDER BY id_cambio
+            LIMIT ?
+        ''', (desde, self.tamano_lote))
+        cambios = cursor.fetchall()
+
+        # Solo importa el último cambio de cada fila; las filas se leen en su estado actual
+        ultimos = {}
+        for _, tabla, operacion, id_fila in cambios:
+            ultimos.setdefault(tabla, {})[id_fila] = operacion
+
+        por_tabla = {}
+        for tabla, filas in ultimos.items():
+            clave = TABLAS_REPLICADAS[tabla]
+            origen = VISTAS_LECTURA.get(tabla)
+            # En una tabla particionada un borrado puede ser un traslado: se consulta igual
+            ids = [i for i, operacion in filas.items() if operacion == "upsert" or origen]
+            actuales = []
+            if ids:
+                cursor.execute(f'''
+                    SELECT * FROM {origen or tabla} WHERE {clave} IN ({", ".join("?" for _ in ids)})
+                ''', ids)
+                columnas = [d[0] for d in cursor.description]
+                actuales = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+            presentes = {f[clave] for f in actuales}
+            # Una fila que ya no existe se replica como borrado
+            borrados = sorted(i for i in filas if i not in presentes)
+            por_tabla[tabla] = (clave, actuales, borrados)
+
+        conn.close()
+        return (cambios[-1][0] if cambios else desde), len(cambios), por_tabla
+
+    def _guardar_checkpoint(self, ultimo_id):
+        nombre = self.destino.nombre
+
+        def operacion(cursor):
+            cursor.execute('''
+                INSERT OR REPLACE INTO replicacion_checkpoint (destino, ultimo_id, fecha_actualizacion)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (nombre, ultimo_id))
+            # El outbox se vacía hasta donde llegaron todos los destinos registrados
+            cursor.execute('''
+                DELETE FROM outbox_cambios
+                WHERE id_cambio <= (SELECT MIN(ultimo_id) FROM replicacion_checkpoint)
+            ''')
+
+        escribir(self.db_path, operacion)
+
+    def replicar_lote(self):
+        """Enviar un lote desde el checkpoint; devuelve cuántos cambios consumió"""
+        desde = self.checkpoint()
+        hasta, cantidad, por_tabla = self._leer_lote(desde)
+        if not cantidad:
+            return 0
+
+        for tabla, (clave, filas, borrados) in por_tabla.items():
+            self.destino.aplicar(f"{self.prefijo}{tabla}", clave, filas, borrados)
+            self.metricas["filas_enviadas"] += len(filas) + len(borrados)
+
+        # Si esto falla, el lote se reenvía: el destino queda igual
+        self._guardar_checkpoint(hasta)
+        self.metricas["cambios_enviados"] += cantidad
+        self.metricas["lotes_enviados"] += 1
+        self.metricas["ultima_replicacion"] = time.time()
+        return cantidad
+
+    def replicar_pendientes(self):
+        """Enviar lotes hasta vaciar el outbox; devuelve el total de cambios"""
+        total = 0
+        while True:
+            cantidad = self.replicar_lote()
+            total += cantidad
+            if cantidad < self.tamano_lote:
+                return total
+
+    def obtener_estado(self):
+        """Cambios pendientes y retraso del cambio más antiguo sin replicar"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*), MIN(fecha_epoch) FROM outbox_cambios
+            WHERE id_cambio > COALESCE(
+                (SELECT ultimo_id FROM replicacion_checkpoint WHERE destino = ?), 0)
+        ''', (self.destino.nombre,))
+        pendientes, mas_antiguo = cursor.fetchone()
+        conn.close()
+
+        estado = dict(self.metricas)
+        estado["destino"] = self.destino.nombre
+        estado["pendientes"] = pendientes
+        estado["retraso_segundos"] = round(max(0.0, time.time() - mas_antiguo), 3) if mas_antiguo else 0.0
+        estado["activo"] = bool(self._hilo and self._hilo.is_alive())
+        return estado
+
+    def _espera(self):
+        if not self._fallos_seguidos:
+            return self.intervalo
+        return random.uniform(0, min(self.espera_maxima, self.intervalo * 2 ** self._fallos_seguidos))
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            try:
+                self.replicar_pendientes()
+                self._fallos_seguidos = 0
+            except Exception as e:
+                self._fallos_seguidos += 1
+                self.metricas["errores"] += 1
+                self.metricas["ultimo_error"] = str(e)
+                logger.warning("Error replicando hacia %s (fallo %d seguido): %s",
+                               self.destino.nombre, self._fallos_seguidos, e)
+            self._detener.wait(self._espera())
+
+    def iniciar(self):
+        """Iniciar el hilo replicador en segundo plano"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, daemon=True, name="replicador-outbox")
+        self._hilo.start()
+
+    def detener(self, timeout=5.0):
+        """Detener el hilo replicador"""
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def _colector_metricas(self):
+        estado = self.obtener_estado()
+        etiquetas = {"destino": self.destino.nombre}
+        return [
+            ("julia_replicacion_pendientes", "gauge",
+             "Cambios del outbox aún no confirmados por el destino", [(etiquetas, estado["pendientes"])]),
+            ("julia_replicacion_retraso_segundos", "gauge",
+             "Antigüedad del cambio más viejo sin replicar", [(etiquetas, estado["retraso_segundos"])]),
+            ("julia_replicacion_cambios_enviados_total", "counter",
+             "Cambios del outbox replicados", [(etiquetas, estado["cambios_enviados"])]),
+            ("julia_replicacion_errores_total", "counter",
+             "Lotes que fallaron y se reintentarán", [(etiquetas, estado["errores"])]),
+        ]
+
+
+def encolar_replicacion(db_path, destino):
+    """Pedir a la cola de trabajos un envío del outbox (uno pendiente por destino)"""
+    return encolar_trabajo(db_path, "replicar_outbox", {"destino": destino},
+                           clave_unica=f"replicar_outbox:{destino}")
+
+
+@tarea("replicar_outbox")
+def _tarea_replicar_outbox(db_path, destino):
+    """Trabajo de la cola: vaciar el outbox hacia `destino`; un fallo se reintenta"""
+    return {"cambios": OutboxReplicator(db_path, destino).replicar_pendientes()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replicar el outbox local hacia Supabase")
+    parser.add_argument("--db", default=os.getenv("JULIA_DB", "julia_confecciones.db"))
+    parser.add_argument("--destino", default=os.getenv("JULIA_REPLICA_DESTINO"))
+    parser.add_argument("--ddl", action="store_true", help="Imprimir el DDL de las tablas de réplica")
+    parser.add_argument("--una-vez", action="store_true", help="Vaciar el outbox y terminar")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.ddl:
+        from postgres_backend import traducir
+
+        for tabla in TABLAS_REPLICADAS:
+            print(traducir(ddl_destino(args.db, tabla))[0] + ";\n")
+    elif not args.destino:
+        parser.error("Falta --destino (o JULIA_REPLICA_DESTINO)")
+    else:
+        replicador = OutboxReplicator(args.db, args.destino)
+        if isinstance(replicador.destino, DestinoSQL):
+            replicador.destino.preparar([ddl_destino(args.db, t) for t in TABLAS_REPLICADAS])
+        if args.una_vez:
+            print("Cambios replicados:", replicador.replicar_pendientes())
+            print(json.dumps(replicador.obtener_estado(), indent=2))
+        else:
+            replicador.iniciar()
+            try:
+                while True:
+                    time.sleep(10)
+                    print(json.dumps(replicador.obtener_estado()))
+            except KeyboardInterrupt:
+                replicador.detener()
@@ -0,0 +1,85 @@
+# Paginación por Keyset para Listados - Julia Confecciones
+
+import base64
+import json
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+
+
+def codificar_cursor(valores):
+    """Codificar los valores de la última fila en un cursor opaco"""
+    texto = json.dumps(list(valores), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor_pagina, columnas=None):
+    """Decodificar un cursor generado por codificar_cursor
+
+    El cursor llega del cliente: solo se aceptan `columnas` valores escalares,
+    que son los que se enlazan en la consulta.
+    """
+    try:
+        texto = base64.urlsafe_b64decode(cursor_pagina.encode('ascii')).decode('utf-8')
+        valores = json.loads(texto)
+    except (ValueError, UnicodeError):
+        raise ValueError("Cursor de página inválido")
+
+    if (not isinstance(valores, list)
+            or (columnas is not None and len(valores) != columnas)
+            or not all(v is None or isinstance(v, (str, int, float)) for v in valores)):
+        raise ValueError("Cursor de página inválido")
+    return valores
+
+
+def normalizar_limite(limite):
+    """Acotar el tamaño de página a un rango razonable"""
+    try:
+        limite = int(limite or LIMITE_POR_DEFECTO)
+    except (TypeError, ValueError):
+        limite = LIMITE_POR_DEFECTO
+    return max(1, min(limite, LIMITE_MAXIMO))
+
+
+def consultar_pagina(cursor, select_sql, condiciones, params, columnas_orden,
+                     claves_orden, cursor_pagina=None, limite=LIMITE_POR_DEFECTO,
+                     descendente=True, tipo=None):
+    """Ejecutar una consulta paginada por keyset
+
+    `select_sql` es el SELECT ... FROM ... con columnas explícitas (sin WHERE),
+    `columnas_orden` las expresiones SQL de la clave de orden (la última debe
+    ser única, normalmente el id) y `claves_orden` los nombres de esas mismas
+    columnas en el resultado, usados para construir el siguiente cursor.
+    Con `tipo` (ver records) las filas son registros de ese tipo en vez de dicts.
+    """
+    condiciones = list(condiciones)
+    params = list(params)
+    limite = normalizar_limite(limite)
+
+    if cursor_pagina:
+        valores = decodificar_cursor(cursor_pagina, len(columnas_orden))
+        operador = '<' if descendente else '>'
+        condiciones.append(
+            f"({', '.join(columnas_orden)}) {operador} ({', '.join('?' for _ in valores)})")
+        params.extend(valores)
+
+    where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    direccion = 'DESC' if descendente else 'ASC'
+    orden = ', '.join(f"{c} {direccion}" for c in columnas_orden)
+
+    cursor.execute(f"{select_sql}{where} ORDER BY {orden} LIMIT ?", (*params, limite + 1))
+
+    if tipo is not None:
+        filas = tipo.de_filas(cursor.fetchall())
+    else:
+        nombres = [d[0] for d in cursor.description]
+        filas = [dict(zip(nombres, f)) for f in cursor.fetchall()]
+
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    return {
+        "items": filas,
+        "siguiente_cursor": codificar_cursor([filas[-1][c] for c in claves_orden]) if hay_mas else None,
+        "limite": limite
+    }
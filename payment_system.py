@@ -1,9 +1,40 @@
 # Sistema de Pagos a Proveedores y Empleados - Julia Confecciones
+#
+# El reporte de pagos y el resumen diario de cuentas por pagar se generan en
+# la cola de trabajos: los ejecutan los trabajadores que inician el portal y el
+# programador de barridos, o `python job_queue.py` si se apagaron
+# (JULIA_COLA_EN_PROCESO=0).
 
 import sqlite3
 from datetime import datetime, timedelta
 import json
 
+from pagination import consultar_pagina
+from backup_service import conectar_instantanea
+from database import conectar
+from job_queue import encolar_trabajo, tarea
+from records import tipo_registro
+import schema
+from schema import asegurar_esquema
+from sqlite_writer import escribir
+from sql_instrumentation import instrumentar_clase
+
+EmpleadoSueldo = tipo_registro("EmpleadoSueldo", "nombre sueldo_fijo precio_prenda")
+CuentaPorPagar = tipo_registro("CuentaPorPagar", "id_cuenta tipo_cuenta proveedor rut_proveedor monto "
+                                                 "fecha_vencimiento prioridad")
+Pago = tipo_registro("Pago", "tipo nombre monto tipo_pago fecha_pago metodo_pago")
+PagoPaginado = tipo_registro("PagoPaginado", "id tipo nombre monto tipo_pago fecha_pago metodo_pago")
+CuentaAntiguedad = tipo_registro("CuentaAntiguedad", "id_cuenta proveedor monto fecha_vencimiento")
+
+
+def rango_periodo(periodo_pago):
+    """Primer y último instante del mes 'AAAA-MM' de un período de pago"""
+    inicio = datetime.strptime(periodo_pago, "%Y-%m")
+    siguiente = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio, siguiente - timedelta(microseconds=1)
+
+
+@instrumentar_clase
 class PaymentSystem:
     def __init__(self, db_path):
         self.db_path = db_path
@@ -11,151 +42,40 @@ class PaymentSystem:
 
     def init_database(self):
         """Inicializar base de datos para sistema de pagos"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Tabla de Empleados
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS empleados (
-                id_empleado INTEGER PRIMARY KEY AUTOINCREMENT,
-                rut TEXT UNIQUE,
-                nombre TEXT,
-                email TEXT,
-                celular TEXT,
-                tipo_empleado TEXT,
-                sueldo_fijo REAL,
-                precio_prenda REAL,
-                fecha_contratacion DATE,
-                estado TEXT DEFAULT 'activo',
-                codigo_acceso TEXT UNIQUE
-            )
-        ''')
-
-        # Tabla de Pagos a Empleados
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS pagos_empleados (
-                id_pago INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_empleado INTEGER,
-                tipo_pago TEXT,
-                monto REAL,
-                cantidad_prendas INTEGER DEFAULT 0,
-                periodo_pago TEXT,
-                fecha_pago DATETIME DEFAULT CURRENT_TIMESTAMP,
-                metodo_pago TEXT,
-                estado TEXT DEFAULT 'pagado',
-                comprobante TEXT,
-                FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado)
-            )
-        ''')
-
-        # Tabla de Proveedores de Materiales
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS proveedores_materiales (
-                id_proveedor INTEGER PRIMARY KEY AUTOINCREMENT,
-                rut TEXT UNIQUE,
-                nombre TEXT,
-                email TEXT,
-                celular TEXT,
-                direccion TEXT,
-                tipo_material TEXT,
-                forma_pago TEXT,
-                credito_dias INTEGER DEFAULT 0,
-                estado TEXT DEFAULT 'activo'
-            )
-        ''')
-
-        # Tabla de Compras a Proveedores
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS compras_proveedores (
-                id_compra INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_proveedor INTEGER,
-                id_material INTEGER,
-                cantidad REAL,
-                precio_unitario REAL,
-                total REAL,
-                fecha_compra DATETIME DEFAULT CURRENT_TIMESTAMP,
-                fecha_pago DATETIME,
-                fecha_vencimiento DATETIME,
-                estado_pago TEXT DEFAULT 'pendiente',
-                metodo_pago TEXT,
-                comprobante TEXT,
-                notas TEXT,
-                FOREIGN KEY (id_proveedor) REFERENCES proveedores_materiales (id_proveedor)
-            )
-        ''')
-
-        # Tabla de Cuentas por Pagar
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cuentas_por_pagar (
-                id_cuenta INTEGER PRIMARY KEY AUTOINCREMENT,
-                tipo_cuenta TEXT, -- 'empleado', 'proveedor'
-                id_referencia INTEGER,
-                monto REAL,
-                fecha_vencimiento DATETIME,
-                fecha_pago DATETIME,
-                estado TEXT DEFAULT 'pendiente',
-                prioridad TEXT DEFAULT 'normal',
-                FOREIGN KEY (id_referencia) REFERENCES proveedores_materiales (id_proveedor)
-            )
-        ''')
-
-        # Tabla de Configuración de Pagos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS configuracion_pagos (
-                id_config INTEGER PRIMARY KEY AUTOINCREMENT,
-                concepto TEXT,
-                tipo_empleado TEXT,
-                tipo_pago TEXT, -- 'fijo', 'variable', 'mixto'
-                valor REAL,
-                periodicidad TEXT, -- 'mensual', 'quincenal', 'semanal', 'por_prenda'
-                condiciones TEXT,
-                estado TEXT DEFAULT 'activo'
-            )
-        ''')
-
-        conn.commit()
-        conn.close()
+        asegurar_esquema(self.db_path)
 
     def registrar_proveedor_material(self, rut, nombre, email, celular, direccion,
                                    tipo_material, forma_pago, credito_dias=0):
         """Registrar proveedor de materiales"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             cursor.execute('''
                 INSERT INTO proveedores_materiales
                 (rut, nombre, email, celular, direccion, tipo_material, forma_pago, credito_dias)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (rut, nombre, email, celular, direccion, tipo_material, forma_pago, credito_dias))
+            return cursor.lastrowid
 
-            proveedor_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-
+        try:
+            proveedor_id = escribir(self.db_path, operacion)
             return {"success": True, "proveedor_id": proveedor_id}
 
         except sqlite3.IntegrityError:
-            conn.close()
             return {"success": False, "error": "RUT ya existe"}
 
     def registrar_compra_proveedor(self, id_proveedor, id_material, cantidad,
                                   precio_unitario, metodo_pago, comprobante="",
                                   credito_dias=0, notas=""):
         """Registrar compra a proveedor"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
-            total = cantidad * precio_unitario
-            fecha_vencimiento = None
+        total = cantidad * precio_unitario
+        fecha_vencimiento = None
 
-            if credito_dias > 0:
-                fecha_vencimiento = datetime.now() + timedelta(days=credito_dias)
-                estado_pago = 'pendiente'
-            else:
-                estado_pago = 'pagado'
+        if credito_dias > 0:
+            fecha_vencimiento = datetime.now() + timedelta(days=credito_dias)
+            estado_pago = 'pendiente'
+        else:
+            estado_pago = 'pagado'
 
+        def operacion(cursor):
             cursor.execute('''
                 INSERT INTO compras_proveedores
                 (id_proveedor, id_material, cantidad, precio_unitario, total,
@@ -174,23 +94,140 @@ class PaymentSystem:
                     VALUES ('proveedor', ?, ?, ?, 'normal')
                 ''', (id_proveedor, total, fecha_vencimiento))
 
-            conn.commit()
-            conn.close()
+                id_cuenta = cursor.lastrowid
+                cursor.execute('UPDATE compras_proveedores SET id_cuenta = ? WHERE id_compra = ?',
+                               (id_cuenta, compra_id))
+                self._registrar_antiguedad(cursor, id_cuenta, id_proveedor,
+                                           total, fecha_vencimiento)
+
+            return compra_id
 
+        try:
+            compra_id = escribir(self.db_path, operacion)
             return {"success": True, "compra_id": compra_id}
 
         except Exception as e:
-            conn.close()
+            return {"success": False, "error": str(e)}
+
+    def registrar_compras_proveedor_lote(self, lineas):
+        """Registrar una recepción completa de compras a proveedores
+
+        Cada línea es un dict con id_proveedor, id_material, cantidad,
+        precio_unitario y opcionalmente metodo_pago, comprobante (número de
+        factura), credito_dias y notas. Todo ocurre en una sola operación del
+        escritor: las compras, el aumento de stock de materiales (una sola
+        sentencia) y una cuenta por pagar consolidada por proveedor y factura
+        a crédito.
+        """
+        if not lineas:
+            return {"success": False, "error": "No hay líneas para registrar"}
+
+        def operacion(cursor):
+            ahora = datetime.now()
+            compras_ids = []
+            facturas = {}
+
+            for linea in lineas:
+                cantidad = linea['cantidad']
+                precio_unitario = linea['precio_unitario']
+                credito_dias = linea.get('credito_dias', 0)
+                total = cantidad * precio_unitario
+
+                if credito_dias > 0:
+                    fecha_vencimiento = ahora + timedelta(days=credito_dias)
+                    estado_pago = 'pendiente'
+                else:
+                    fecha_vencimiento = None
+                    estado_pago = 'pagado'
+
+                cursor.execute('''
+                    INSERT INTO compras_proveedores
+                    (id_proveedor, id_material, cantidad, precio_unitario, total,
+                     metodo_pago, comprobante, fecha_vencimiento, estado_pago, notas)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (linea['id_proveedor'], linea['id_material'], cantidad, precio_unitario,
+                      total, linea.get('metodo_pago', 'credito'), linea.get('comprobante', ''),
+                      fecha_vencimiento, estado_pago, linea.get('notas', '')))
+
+                compras_ids.append(cursor.lastrowid)
+
+                # Agrupar por proveedor y factura las líneas a crédito
+                if estado_pago == 'pendiente':
+                    clave = (linea['id_proveedor'], linea.get('comprobante', ''))
+                    factura = facturas.setdefault(clave, {"monto": 0, "fecha_vencimiento": fecha_vencimiento,
+                                                          "compras": []})
+                    factura["monto"] += total
+                    factura["compras"].append(cursor.lastrowid)
+                    factura["fecha_vencimiento"] = max(factura["fecha_vencimiento"], fecha_vencimiento)
+
+            # Actualizar stock de todos los materiales recibidos en una sola sentencia
+            cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS recepcion_materiales (
+                    id_material INTEGER,
+                    cantidad REAL
+                )
+            ''')
+            cursor.execute('DELETE FROM temp.recepcion_materiales')
+            cursor.executemany('''
+                INSERT INTO temp.recepcion_materiales (id_material, cantidad) VALUES (?, ?)
+            ''', [(linea['id_material'], linea['cantidad']) for linea in lineas])
+
+            cursor.execute('''
+                UPDATE materiales
+                SET stock_actual = stock_actual + (
+                        SELECT SUM(r.cantidad) FROM temp.recepcion_materiales r
+                        WHERE r.id_material = materiales.id_material
+                    ),
+                    fecha_ultimo_ingreso = datetime('now')
+                WHERE id_material IN (SELECT id_material FROM temp.recepcion_materiales)
+            ''')
+            materiales_actualizados = cursor.rowcount
+
+            # Cuentas por pagar consolidadas por factura
+            cuentas = []
+            for (id_proveedor, comprobante), factura in facturas.items():
+                cursor.execute('''
+                    INSERT INTO cuentas_por_pagar
+                    (tipo_cuenta, id_referencia, monto, fecha_vencimiento, prioridad)
+                    VALUES ('proveedor', ?, ?, ?, 'normal')
+                ''', (id_proveedor, factura["monto"], factura["fecha_vencimiento"]))
+
+                id_cuenta = cursor.lastrowid
+                cursor.executemany('UPDATE compras_proveedores SET id_cuenta = ? WHERE id_compra = ?',
+                                   [(id_cuenta, id_compra) for id_compra in factura["compras"]])
+                self._registrar_antiguedad(cursor, id_cuenta, id_proveedor,
+                                           factura["monto"], factura["fecha_vencimiento"])
+                cuentas.append({
+                    "id_cuenta": id_cuenta,
+                    "id_proveedor": id_proveedor,
+                    "comprobante": comprobante,
+                    "monto": factura["monto"]
+                })
+
+            cursor.execute('DELETE FROM temp.recepcion_materiales')
+
+            return {
+                "success": True,
+                "compras_ids": compras_ids,
+                "materiales_actualizados": materiales_actualizados,
+                "cuentas_por_pagar": cuentas
+            }
+
+        try:
+            return escribir(self.db_path, operacion)
+
+        except Exception as e:
             return {"success": False, "error": str(e)}
 
     def calcular_sueldo_empleado(self, id_empleado, periodo_inicio, periodo_fin):
         """Calcular sueldo de empleado incluyendo pago por prendas"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         # Obtener información del empleado
-        cursor.execute('SELECT * FROM empleados WHERE id_empleado = ?', (id_empleado,))
-        empleado = cursor.fetchone()
+        cursor.execute(f'SELECT {EmpleadoSueldo.proyeccion()} FROM empleados WHERE id_empleado = ?',
+                       (id_empleado,))
+        empleado = EmpleadoSueldo.de_fila(cursor.fetchone())
 
         if not empleado:
             conn.close()
@@ -211,8 +248,8 @@ class PaymentSystem:
         total_prendas = prendas_result[0] if prendas_result else 0
 
         # Calcular montos
-        sueldo_fijo = empleado[5] or 0
-        precio_prenda = empleado[6] or 0
+        sueldo_fijo = empleado.sueldo_fijo or 0
+        precio_prenda = empleado.precio_prenda or 0
         pago_prendas = total_prendas * precio_prenda
         total_sueldo = sueldo_fijo + pago_prendas
 
@@ -220,7 +257,7 @@ class PaymentSystem:
 
         return {
             "success": True,
-            "empleado": empleado[2],
+            "empleado": empleado.nombre,
             "sueldo_fijo": sueldo_fijo,
             "total_prendas": total_prendas,
             "precio_prenda": precio_prenda,
@@ -228,14 +265,24 @@ class PaymentSystem:
             "total_sueldo": total_sueldo
         }
 
-    def generar_planilla_pagos(self, periodo_pago):
-        """Generar planilla de pagos para empleados"""
-        conn = sqlite3.connect(self.db_path)
+    def generar_planilla_pagos(self, periodo_pago, periodo_inicio=None, periodo_fin=None):
+        """Generar planilla de pagos para empleados
+
+        periodo_pago es el mes liquidado ('AAAA-MM'); sin periodo_inicio y
+        periodo_fin explícitos, las prendas se cuentan en ese mes completo.
+        """
+        if periodo_inicio is None or periodo_fin is None:
+            inicio_mes, fin_mes = rango_periodo(periodo_pago)
+            periodo_inicio = periodo_inicio or inicio_mes
+            periodo_fin = periodo_fin or fin_mes
+
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         # Obtener todos los empleados activos
-        cursor.execute('SELECT id_empleado FROM empleados WHERE estado = "activo"')
+        cursor.execute("SELECT id_empleado FROM empleados WHERE estado = 'activo'")
         empleados = cursor.fetchall()
+        conn.close()
 
         planilla = []
 
@@ -254,16 +301,12 @@ class PaymentSystem:
                     "periodo_pago": periodo_pago
                 })
 
-        conn.close()
         return planilla
 
     def procesar_pago_empleado(self, id_empleado, monto, tipo_pago, periodo_pago,
                              metodo_pago="transferencia", comprobante=""):
         """Procesar pago a empleado"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             # Registrar pago
             cursor.execute('''
                 INSERT INTO pagos_empleados
@@ -287,21 +330,29 @@ class PaymentSystem:
                     AND estado_pago_costura = 'pendiente'
                 ''', (id_empleado,))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Pago procesado exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def procesar_pago_proveedor(self, id_compra, metodo_pago, comprobante=""):
-        """Procesar pago a proveedor"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Procesar pago a proveedor
+
+        Cierra solo la cuenta por pagar de la compra; si la cuenta es una
+        factura consolidada con otras compras aún pendientes, se le descuenta
+        el total de esta compra.
+        """
+        def operacion(cursor):
+            cursor.execute('''
+                SELECT id_cuenta, total, estado_pago FROM compras_proveedores WHERE id_compra = ?
+            ''', (id_compra,))
+            compra = cursor.fetchone()
+            if not compra:
+                raise ValueError("Compra no encontrada")
+            id_cuenta, total, estado_pago = compra
 
-        try:
             # Actualizar estado de compra
             cursor.execute('''
                 UPDATE compras_proveedores
@@ -310,32 +361,51 @@ class PaymentSystem:
                 WHERE id_compra = ?
             ''', (metodo_pago, comprobante, id_compra))
 
-            # Eliminar de cuentas por pagar
-            cursor.execute('''
-                DELETE FROM cuentas_por_pagar
-                WHERE tipo_cuenta = 'proveedor' AND id_referencia IN (
-                    SELECT id_proveedor FROM compras_proveedores WHERE id_compra = ?
-                )
-            ''', (id_compra,))
+            if estado_pago != 'pendiente' or id_cuenta is None:
+                return
 
-            conn.commit()
-            conn.close()
+            cursor.execute('SELECT fecha_vencimiento, monto FROM antiguedad_cxp WHERE id_cuenta = ?',
+                           (id_cuenta,))
+            antiguedad = cursor.fetchone()
 
+            cursor.execute('''
+                SELECT COUNT(*) FROM compras_proveedores
+                WHERE id_cuenta = ? AND estado_pago = 'pendiente'
+            ''', (id_cuenta,))
+
+            if cursor.fetchone()[0] == 0:
+                # Era la última compra de la cuenta: sale de la antigüedad y de cuentas por pagar
+                # (las compras pagadas dejan de apuntarle, id_cuenta es clave foránea)
+                cursor.execute('DELETE FROM antiguedad_cxp WHERE id_cuenta = ?', (id_cuenta,))
+                if antiguedad:
+                    self._sumar_totales_antiguedad(cursor, antiguedad[0], -1, -antiguedad[1])
+                cursor.execute('UPDATE compras_proveedores SET id_cuenta = NULL WHERE id_cuenta = ?',
+                               (id_cuenta,))
+                cursor.execute('DELETE FROM cuentas_por_pagar WHERE id_cuenta = ?', (id_cuenta,))
+            else:
+                cursor.execute('UPDATE cuentas_por_pagar SET monto = monto - ? WHERE id_cuenta = ?',
+                               (total, id_cuenta))
+                cursor.execute('UPDATE antiguedad_cxp SET monto = monto - ? WHERE id_cuenta = ?',
+                               (total, id_cuenta))
+                if antiguedad:
+                    self._sumar_totales_antiguedad(cursor, antiguedad[0], 0, -total)
+
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Pago a proveedor procesado exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def obtener_cuentas_por_pagar(self, dias=7):
         """Obtener cuentas por pagar próximas a vencer"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         fecha_limite = datetime.now() + timedelta(days=dias)
 
-        cursor.execute('''
-            SELECT cpp.*, pm.nombre, pm.rut
+        cursor.execute(f'''
+            SELECT {CuentaPorPagar.proyeccion("cpp", proveedor="pm.nombre", rut_proveedor="pm.rut")}
             FROM cuentas_por_pagar cpp
             JOIN proveedores_materiales pm ON cpp.id_referencia = pm.id_proveedor
             WHERE cpp.estado = 'pendiente'
@@ -343,149 +413,311 @@ class PaymentSystem:
             ORDER BY cpp.fecha_vencimiento ASC
         ''', (fecha_limite,))
 
-        cuentas = cursor.fetchall()
+        cuentas = CuentaPorPagar.de_filas(cursor.fetchall())
         conn.close()
+        return cuentas
 
-        return [
-            {
-                "id_cuenta": c[0],
-                "tipo_cuenta": c[1],
-                "proveedor": c[8],
-                "rut_proveedor": c[9],
-                "monto": c[3],
-                "fecha_vencimiento": c[4],
-                "prioridad": c[6]
-            } for c in cuentas
-        ]
-
-    def generar_reporte_pagos(self, fecha_inicio, fecha_fin):
-        """Generar reporte de pagos realizados"""
-        conn = sqlite3.connect(self.db_path)
+    def generar_reporte_pagos(self, fecha_inicio, fecha_fin, desde_instantanea=False):
+        """Generar reporte de pagos realizados (desde_instantanea: sobre la copia de solo lectura)"""
+        conn = conectar_instantanea(self.db_path) if desde_instantanea else conectar(self.db_path)
         cursor = conn.cursor()
 
         # Pagos a empleados
-        cursor.execute('''
-            SELECT 'empleado' as tipo, e.nombre, pe.monto, pe.tipo_pago,
-                   pe.fecha_pago, pe.metodo_pago
+        cursor.execute(f'''
+            SELECT {Pago.proyeccion("pe", tipo="'empleado'", nombre="e.nombre")}
             FROM pagos_empleados pe
             JOIN empleados e ON pe.id_empleado = e.id_empleado
             WHERE pe.fecha_pago BETWEEN ? AND ?
         ''', (fecha_inicio, fecha_fin))
 
-        pagos_empleados = cursor.fetchall()
+        pagos_empleados = Pago.de_filas(cursor.fetchall())
 
         # Pagos a proveedores
-        cursor.execute('''
-            SELECT 'proveedor' as tipo, pm.nombre, cp.total, 'compra' as tipo_pago,
-                   cp.fecha_pago, cp.metodo_pago
+        cursor.execute(f'''
+            SELECT {Pago.proyeccion("cp", tipo="'proveedor'", nombre="pm.nombre", monto="cp.total",
+                                    tipo_pago="'compra'")}
             FROM compras_proveedores cp
             JOIN proveedores_materiales pm ON cp.id_proveedor = pm.id_proveedor
             WHERE cp.fecha_pago BETWEEN ? AND ?
             AND cp.estado_pago = 'pagado'
         ''', (fecha_inicio, fecha_fin))
 
-        pagos_proveedores = cursor.fetchall()
+        pagos_proveedores = Pago.de_filas(cursor.fetchall())
 
         conn.close()
 
         return {
-            "pagos_empleados": [
-                {
-                    "tipo": p[0],
-                    "nombre": p[1],
-                    "monto": p[2],
-                    "tipo_pago": p[3],
-                    "fecha_pago": p[4],
-                    "metodo_pago": p[5]
-                } for p in pagos_empleados
-            ],
-            "pagos_proveedores": [
-                {
-                    "tipo": p[0],
-                    "nombre": p[1],
-                    "monto": p[2],
-                    "tipo_pago": p[3],
-                    "fecha_pago": p[4],
-                    "metodo_pago": p[5]
-                } for p in pagos_proveedores
-            ]
+            "pagos_empleados": pagos_empleados,
+            "pagos_proveedores": pagos_proveedores
         }
 
-    def configurar_pago_automatico(self, concepto, tipo_empleado, tipo_pago,
-                                  valor, periodicidad, condiciones=""):
-        """Configurar pago automático"""
-        conn = sqlite3.connect(self.db_path)
+    def solicitar_reporte_pagos(self, fecha_inicio, fecha_fin, prioridad=0):
+        """Encolar el reporte de pagos; el resultado queda en job_queue.obtener_trabajo"""
+        try:
+            id_trabajo = encolar_trabajo(
+                self.db_path, 'reporte_pagos',
+                {"fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin},
+                prioridad=prioridad, clave_unica=f"reporte_pagos:{fecha_inicio}:{fecha_fin}")
+            return {"success": True, "id_trabajo": id_trabajo}
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def generar_reporte_pagos_paginado(self, tipo, fecha_inicio, fecha_fin,
+                                       cursor_pagina=None, limite=50):
+        """Generar reporte de pagos por páginas ('empleado' o 'proveedor')"""
+        if tipo == 'empleado':
+            select_sql = f'''
+                SELECT {PagoPaginado.proyeccion("pe", id="pe.id_pago", tipo="'empleado'", nombre="e.nombre")}
+                FROM pagos_empleados pe
+                JOIN empleados e ON pe.id_empleado = e.id_empleado
+            '''
+            condiciones = ["pe.fecha_pago BETWEEN ? AND ?"]
+            columnas_orden = ("pe.fecha_pago", "pe.id_pago")
+        elif tipo == 'proveedor':
+            select_sql = f'''
+                SELECT {PagoPaginado.proyeccion("cp", id="cp.id_compra", tipo="'proveedor'", nombre="pm.nombre",
+                                                monto="cp.total", tipo_pago="'compra'")}
+                FROM compras_proveedores cp
+                JOIN proveedores_materiales pm ON cp.id_proveedor = pm.id_proveedor
+            '''
+            condiciones = ["cp.fecha_pago BETWEEN ? AND ?", "cp.estado_pago = 'pagado'"]
+            columnas_orden = ("cp.fecha_pago", "cp.id_compra")
+        else:
+            return {"success": False, "error": "Tipo de reporte inválido"}
+
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         try:
+            pagina = consultar_pagina(
+                cursor, select_sql, condiciones, [fecha_inicio, fecha_fin],
+                columnas_orden, ("fecha_pago", "id"),
+                cursor_pagina=cursor_pagina, limite=limite, tipo=PagoPaginado
+            )
+        except ValueError as e:
+            conn.close()
+            return {"success": False, "error": str(e)}
+
+        conn.close()
+        return {"success": True, **pagina}
+
+    def configurar_pago_automatico(self, concepto, tipo_empleado, tipo_pago,
+                                  valor, periodicidad, condiciones=""):
+        """Configurar pago automático"""
+        def operacion(cursor):
             cursor.execute('''
                 INSERT INTO configuracion_pagos
                 (concepto, tipo_empleado, tipo_pago, valor, periodicidad, condiciones)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (concepto, tipo_empleado, tipo_pago, valor, periodicidad, condiciones))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Configuración guardada exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
-    def verificar_pagos_pendientes(self):
-        """Verificar pagos pendientes y generar alertas"""
-        conn = sqlite3.connect(self.db_path)
+    def _registrar_antiguedad(self, cursor, id_cuenta, id_proveedor, monto, fecha_vencimiento):
+        """Agregar una cuenta abierta al estado de antigüedad"""
+        cursor.execute('SELECT fecha_vencimiento, monto FROM antiguedad_cxp WHERE id_cuenta = ?',
+                       (id_cuenta,))
+        anterior = cursor.fetchone()
+
+        vencimiento = fecha_vencimiento.date().isoformat()
+        cursor.execute('''
+            INSERT OR REPLACE INTO antiguedad_cxp
+            (id_cuenta, id_proveedor, proveedor, monto, fecha_vencimiento)
+            SELECT ?, ?, nombre, ?, ? FROM proveedores_materiales WHERE id_proveedor = ?
+        ''', (id_cuenta, id_proveedor, monto, vencimiento, id_proveedor))
+
+        if cursor.rowcount == 1:
+            if anterior:
+                self._sumar_totales_antiguedad(cursor, anterior[0], -1, -anterior[1])
+            self._sumar_totales_antiguedad(cursor, vencimiento, 1, monto)
+
+    def _sumar_totales_antiguedad(self, cursor, fecha_vencimiento, cantidad, monto):
+        """Ajustar el total de antigüedad de un día de vencimiento"""
+        cursor.execute('''
+            INSERT INTO antiguedad_cxp_totales (fecha_vencimiento, cantidad, monto)
+            VALUES (?, ?, ?)
+            ON CONFLICT (fecha_vencimiento) DO UPDATE
+            SET cantidad = antiguedad_cxp_totales.cantidad + excluded.cantidad,
+                monto = antiguedad_cxp_totales.monto + excluded.monto
+        ''', (fecha_vencimiento, cantidad, monto))
+        if cantidad < 0:
+            cursor.execute('''
+                DELETE FROM antiguedad_cxp_totales WHERE fecha_vencimiento = ? AND cantidad <= 0
+            ''', (fecha_vencimiento,))
+
+    def reconstruir_antiguedad_cxp(self, cursor=None):
+        """Reconstruir el estado de antigüedad desde cuentas_por_pagar"""
+        if cursor is None:
+            return escribir(self.db_path, self.reconstruir_antiguedad_cxp)
+
+        filas = schema.reconstruir_antiguedad_cxp(cursor)
+        schema.reconstruir_totales_antiguedad(cursor)
+        return filas
+
+    def obtener_antiguedad_cxp(self, fecha=None):
+        """Obtener cuentas por pagar agrupadas por tramo de antigüedad
+
+        Agrupa los totales por día de vencimiento (antiguedad_cxp_totales,
+        mantenidos al registrar y pagar compras), no cada cuenta abierta.
+        """
+        hoy = fecha or datetime.now().date()
+
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT
+                CASE
+                    WHEN fecha_vencimiento < ? THEN 'vencidas'
+                    WHEN fecha_vencimiento <= ? THEN '0_7_dias'
+                    WHEN fecha_vencimiento <= ? THEN '8_30_dias'
+                    ELSE 'mas_30_dias'
+                END as tramo,
+                SUM(cantidad), SUM(monto)
+            FROM antiguedad_cxp_totales
+            GROUP BY tramo
+        ''', (hoy.isoformat(), (hoy + timedelta(days=7)).isoformat(),
+              (hoy + timedelta(days=30)).isoformat()))
+
+        filas = cursor.fetchall()
+        conn.close()
+
+        tramos = {tramo: {"cantidad": 0, "monto": 0} for tramo in
+                  ('vencidas', '0_7_dias', '8_30_dias', 'mas_30_dias')}
+        for tramo, cantidad, monto in filas:
+            tramos[tramo] = {"cantidad": cantidad, "monto": monto or 0}
+
+        return tramos
+
+    def verificar_pagos_pendientes(self, fecha=None, desde_fecha=None, desde_cuenta=None):
+        """Verificar pagos pendientes y generar alertas
+
+        Con desde_fecha/desde_cuenta (día e id_cuenta máximo de la revisión
+        anterior) solo devuelve las alertas nuevas: cuentas registradas después,
+        las que vencieron desde entonces y las que entraron en la ventana de 7 días.
+        """
+        hoy = fecha or datetime.now().date()
+        limite = (hoy + timedelta(days=7)).isoformat()
+
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         alertas = []
 
-        # Verificar cuentas por pagar vencidas
-        cursor.execute('''
-            SELECT cpp.id_cuenta, pm.nombre, cpp.monto, cpp.fecha_vencimiento,
-                   JULIANDAY('now') - JULIANDAY(cpp.fecha_vencimiento) as dias_vencido
-            FROM cuentas_por_pagar cpp
-            JOIN proveedores_materiales pm ON cpp.id_referencia = pm.id_proveedor
-            WHERE cpp.estado = 'pendiente'
-            AND cpp.fecha_vencimiento < datetime('now')
-            ORDER BY dias_vencido DESC
-        ''')
-
-        vencidas = cursor.fetchall()
-        for v in vencidas:
-            alertas.append({
-                "tipo": "cuenta_vencida",
-                "id": v[0],
-                "proveedor": v[1],
-                "monto": v[2],
-                "dias_vencido": int(v[4]),
-                "prioridad": "alta"
-            })
-
-        # Verificar cuentas próximas a vencer
-        cursor.execute('''
-            SELECT cpp.id_cuenta, pm.nombre, cpp.monto, cpp.fecha_vencimiento,
-                   JULIANDAY(cpp.fecha_vencimiento) - JULIANDAY('now') as dias_para_vencer
-            FROM cuentas_por_pagar cpp
-            JOIN proveedores_materiales pm ON cpp.id_referencia = pm.id_proveedor
-            WHERE cpp.estado = 'pendiente'
-            AND cpp.fecha_vencimiento BETWEEN datetime('now') AND datetime('now', '+7 days')
-            ORDER BY dias_para_vencer ASC
-        ''')
-
-        proximas = cursor.fetchall()
-        for p in proximas:
-            alertas.append({
-                "tipo": "cuenta_proxima_vencer",
-                "id": p[0],
-                "proveedor": p[1],
-                "monto": p[2],
-                "dias_para_vencer": int(p[4]),
-                "prioridad": "media"
-            })
+        # Cuentas vencidas y próximas a vencer (7 días) desde el estado precalculado
+        if desde_fecha is None:
+            cursor.execute(f'''
+                SELECT {CuentaAntiguedad.proyeccion()}
+                FROM antiguedad_cxp
+                WHERE fecha_vencimiento <= ?
+                ORDER BY fecha_vencimiento ASC
+            ''', (limite,))
+        else:
+            anterior = datetime.strptime(desde_fecha, '%Y-%m-%d').date()
+            cursor.execute(f'''
+                SELECT {CuentaAntiguedad.proyeccion()}
+                FROM antiguedad_cxp
+                WHERE fecha_vencimiento <= ?
+                AND (id_cuenta > ?
+                     OR fecha_vencimiento > ?
+                     OR (fecha_vencimiento >= ? AND fecha_vencimiento < ?))
+                ORDER BY fecha_vencimiento ASC
+            ''', (limite, desde_cuenta or 0, (anterior + timedelta(days=7)).isoformat(),
+                  anterior.isoformat(), hoy.isoformat()))
+
+        cuentas = CuentaAntiguedad.de_filas(cursor.fetchall())
+        conn.close()
+
+        proximas = []
+        for c in cuentas:
+            dias = (datetime.strptime(c.fecha_vencimiento, '%Y-%m-%d').date() - hoy).days
+            if dias < 0:
+                alertas.append({
+                    "tipo": "cuenta_vencida",
+                    "id": c.id_cuenta,
+                    "proveedor": c.proveedor,
+                    "monto": c.monto,
+                    "dias_vencido": -dias,
+                    "prioridad": "alta"
+                })
+            else:
+                proximas.append({
+                    "tipo": "cuenta_proxima_vencer",
+                    "id": c.id_cuenta,
+                    "proveedor": c.proveedor,
+                    "monto": c.monto,
+                    "dias_para_vencer": dias,
+                    "prioridad": "media"
+                })
+
+        return alertas + proximas
 
+    def emitir_resumen_diario(self, fecha=None):
+        """Emitir (una vez por día) el resumen de antigüedad de cuentas por pagar"""
+        hoy = fecha or datetime.now().date()
+
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT contenido FROM resumenes_cxp WHERE fecha = ?', (hoy.isoformat(),))
+        existente = cursor.fetchone()
         conn.close()
-        return alertas
+
+        if existente:
+            return {"success": True, "emitido": False, "resumen": json.loads(existente[0])}
+
+        alertas = self.verificar_pagos_pendientes(hoy)
+        resumen = {
+            "fecha": hoy.isoformat(),
+            "tramos": self.obtener_antiguedad_cxp(hoy),
+            "cuentas_vencidas": [a for a in alertas if a["tipo"] == "cuenta_vencida"][:10],
+            "cuentas_proximas_vencer": [a for a in alertas if a["tipo"] == "cuenta_proxima_vencer"][:10]
+        }
+
+        def operacion(cursor):
+            cursor.execute('''
+                INSERT OR IGNORE INTO resumenes_cxp (fecha, contenido) VALUES (?, ?)
+            ''', (hoy.isoformat(), json.dumps(resumen, default=str)))
+            return cursor.rowcount == 1
+
+        emitido = escribir(self.db_path, operacion)
+
+        if emitido:
+            # Aquí se integraría con un sistema real de email/SMS
+            tramos = resumen["tramos"]
+            print(f"Resumen de cuentas por pagar {resumen['fecha']}:")
+            for tramo, datos in tramos.items():
+                print(f"  {tramo}: {datos['cantidad']} cuentas - ${datos['monto']:.2f}")
+
+        return {"success": True, "emitido": emitido, "resumen": resumen}
+
+    def solicitar_resumen_diario(self, fecha=None):
+        """Encolar la emisión del resumen diario de cuentas por pagar"""
+        hoy = fecha or datetime.now().date()
+        try:
+            id_trabajo = encolar_trabajo(self.db_path, 'resumen_diario_cxp',
+                                         {"fecha": hoy.isoformat()},
+                                         clave_unica=f"resumen_diario_cxp:{hoy.isoformat()}")
+            return {"success": True, "id_trabajo": id_trabajo}
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+@tarea("reporte_pagos")
+def _tarea_reporte_pagos(db_path, fecha_inicio, fecha_fin):
+    """Trabajo de la cola: generar el reporte de pagos del período"""
+    return PaymentSystem(db_path).generar_reporte_pagos(fecha_inicio, fecha_fin)
+
+@tarea("resumen_diario_cxp")
+def _tarea_resumen_diario(db_path, fecha):
+    """Trabajo de la cola: emitir el resumen diario (idempotente por fecha)"""
+    return PaymentSystem(db_path).emitir_resumen_diario(datetime.fromisoformat(fecha).date())
 
 # Ejemplo de uso
 if __name__ == "__main__":
@@ -514,6 +746,16 @@ if __name__ == "__main__":
     )
     print("Compra registrada:", compra)
 
+    # Registrar recepción completa (varias líneas de una misma factura)
+    print("Registrando recepción de tela...")
+    recepcion = sistema.registrar_compras_proveedor_lote([
+        {"id_proveedor": proveedor["proveedor_id"], "id_material": 1, "cantidad": 50,
+         "precio_unitario": 4500, "comprobante": "F-1001", "credito_dias": 30},
+        {"id_proveedor": proveedor["proveedor_id"], "id_material": 2, "cantidad": 20,
+         "precio_unitario": 500, "comprobante": "F-1001", "credito_dias": 30}
+    ])
+    print("Recepción registrada:", recepcion)
+
     # Calcular sueldo de empleado
     print("Calculando sueldo de empleado...")
     sueldo = sistema.calcular_sueldo_empleado(1, "2024-01-01", "2024-01-31")
@@ -529,4 +771,9 @@ if __name__ == "__main__":
     print("Alertas de pagos:")
     alertas = sistema.verificar_pagos_pendientes()
     for alerta in alertas:
-        print(f"{alerta['tipo']}: {alerta.get('proveedor', '')} - ${alerta['monto']:.2f}")
\ No newline at end of file
+        print(f"{alerta['tipo']}: {alerta.get('proveedor', '')} - ${alerta['monto']:.2f}")
+
+    # Resumen diario de antigüedad, emitido por la cola de trabajos
+    from job_queue import ColaTrabajos
+    sistema.solicitar_resumen_diario()
+    ColaTrabajos("julia_confecciones.db").procesar_pendientes()
\ No newline at end of file
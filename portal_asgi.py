@@ -0,0 +1,435 @@
+# Portal de Empleados como Aplicación ASGI - Julia Confecciones
+#
+# Las mismas rutas JSON que la app Flask de employee_tracking_portal, más
+# /api/notificaciones/espera (long-poll) y /api/notificaciones/stream (SSE),
+# sobre PortalAsincrono. No agrega dependencias (la app ASGI está escrita
+# sobre el protocolo directamente); se sirve con cualquier servidor ASGI:
+#
+#   JULIA_DB=julia_confecciones.db uvicorn portal_asgi:app --workers 2
+#
+# Cada proceso inicia además un pool de trabajadores de la cola (ver
+# job_queue); con JULIA_COLA_EN_PROCESO=0 no, y hace falta correr
+# `python job_queue.py` aparte para que salgan las notificaciones.
+
+import asyncio
+import json
+import os
+import re
+import time
+from urllib.parse import parse_qs
+
+import tracing
+from employee_tracking_portal import activos, duracion_peticiones, peticiones_total
+from job_queue import iniciar_en_proceso
+from http_responses import CACHE_PRIVADO_REVALIDAR, a_json_bytes, coincide_etag, comprimir, etag_empleado
+from metrics import registro
+from portal_async import DifusorNotificaciones, PortalAsincrono
+from sql_instrumentation import CABECERAS as CABECERAS_SQL, cerrar_ambito, iniciar_ambito
+
+ESPERA_MAXIMA_S = float(os.getenv("JULIA_LONG_POLL_MAXIMO", "30"))
+LATIDO_SSE_S = float(os.getenv("JULIA_SSE_LATIDO", "15"))
+
+portal = PortalAsincrono(os.getenv("JULIA_DB", "julia_confecciones.db"))
+difusor = DifusorNotificaciones(portal)
+cola_trabajos = None
+_cola_revisada = False
+
+
+def _iniciar_cola():
+    """Iniciar (una vez por proceso) los trabajadores de la cola, ver job_queue"""
+    global cola_trabajos, _cola_revisada
+    if not _cola_revisada:
+        _cola_revisada = True
+        cola_trabajos = iniciar_en_proceso(portal.db_path)
+
+_conexiones_abiertas = registro.medidor(
+    "julia_portal_conexiones_espera", "Clientes esperando notificaciones (long-poll y SSE)",
+    ("tipo",))
+
+
+class Peticion:
+    """Datos de una petición HTTP ASGI"""
+
+    __slots__ = ("scope", "receive", "metodo", "ruta", "args", "encabezados", "parametros", "_cuerpo")
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.metodo = scope["method"]
+        self.ruta = scope["path"]
+        self.args = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+        self.encabezados = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
+        self.parametros = {}
+        self._cuerpo = None
+
+    async def cuerpo(self):
+        if self._cuerpo is None:
+            partes = []
+            while True:
+                mensaje = await self.receive()
+                partes.append(mensaje.get("body", b""))
+                if not mensaje.get("more_body"):
+                    break
+            self._cuerpo = b"".join(partes)
+        return self._cuerpo
+
+    async def json(self):
+        cuerpo = await self.cuerpo()
+        return json.loads(cuerpo) if cuerpo else {}
+
+    @property
+    def token(self):
+        return self.encabezados.get("authorization", "").replace("Bearer ", "")
+
+    @property
+    def ip(self):
+        cliente = self.scope.get("client")
+        return cliente[0] if cliente else ""
+
+
+class Respuesta:
+    __slots__ = ("cuerpo", "estado", "tipo", "encabezados")
+
+    def __init__(self, cuerpo, estado=200, tipo="application/json", encabezados=None):
+        self.cuerpo = cuerpo
+        self.estado = estado
+        self.tipo = tipo
+        self.encabezados = encabezados or {}
+
+
+def respuesta_json(datos, estado=200, columnas=False, etag=None):
+    encabezados = None
+    if etag:
+        encabezados = {"ETag": etag, "Cache-Control": CACHE_PRIVADO_REVALIDAR, "Vary": "Authorization"}
+    return Respuesta(a_json_bytes(datos, columnas), estado, encabezados=encabezados)
+
+
+def respuesta_activo(peticion, activo):
+    cuerpo, codificacion = activo.variante(peticion.encabezados.get("accept-encoding"))
+    return Respuesta(cuerpo, tipo=activo.tipo, encabezados=activo.encabezados(codificacion))
+
+
+def _comprimir(peticion, respuesta):
+    """Comprimir el cuerpo según Accept-Encoding si no viene ya comprimido"""
+    if "Content-Encoding" in respuesta.encabezados:
+        return respuesta
+    cuerpo, codificacion = comprimir(respuesta.cuerpo, peticion.encabezados.get("accept-encoding"),
+                                     respuesta.tipo)
+    if codificacion:
+        respuesta.cuerpo = cuerpo
+        respuesta.encabezados["Content-Encoding"] = codificacion
+        vary = respuesta.encabezados.get("Vary")
+        respuesta.encabezados["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+    return respuesta
+
+
+async def _enviar(send, respuesta, extra=()):
+    # Un 304 no lleva cuerpo ni describe uno
+    contenido = [] if respuesta.estado == 304 else [
+        (b"content-type", respuesta.tipo.encode()),
+        (b"content-length", str(len(respuesta.cuerpo)).encode())]
+    await send({
+        "type": "http.response.start",
+        "status": respuesta.estado,
+        "headers": [*contenido,
+                    *((k.lower().encode(), v.encode()) for k, v in respuesta.encabezados.items()),
+                    *extra]
+    })
+    await send({"type": "http.response.body", "body": respuesta.cuerpo})
+
+
+async def _sesion(peticion):
+    sesion = await portal.validar_sesion(peticion.token)
+    return sesion if sesion["success"] else None
+
+
+SESION_INVALIDA = ({"success": False, "error": "Sesión inválida"}, 401)
+
+
+async def _etag(peticion, id_empleado):
+    """ETag de la petición del empleado; (etag, respuesta 304 o None)"""
+    version = await portal.obtener_version_empleado(id_empleado)
+    etag = etag_empleado(id_empleado, version,
+                         f"{peticion.ruta}?{peticion.scope.get('query_string', b'').decode()}")
+    if etag and coincide_etag(peticion.encabezados.get("if-none-match"), etag):
+        return etag, Respuesta(b"", 304, encabezados={"ETag": etag, "Cache-Control": CACHE_PRIVADO_REVALIDAR,
+                                                      "Vary": "Authorization"})
+    return etag, None
+
+
+# Rutas
+
+async def index(peticion):
+    return respuesta_activo(peticion, activos.pagina)
+
+
+async def activo_estatico(peticion):
+    activo = activos.activo(peticion.parametros["nombre"])
+    if activo is None:
+        return respuesta_json({"success": False, "error": "No encontrado"}, 404)
+    return respuesta_activo(peticion, activo)
+
+
+async def login(peticion):
+    data = await peticion.json()
+    result = await portal.validar_acceso_empleado(data.get("codigo_acceso"))
+
+    if result["success"]:
+        session_result = await portal.crear_sesion(
+            result["id_empleado"], peticion.ip, peticion.encabezados.get("user-agent", ""))
+
+        if session_result["success"]:
+            return respuesta_json({
+                "success": True,
+                "token_sesion": session_result["token_sesion"],
+                "nombre": result["nombre"],
+                "tipo_empleado": result["tipo_empleado"]
+            })
+
+    return respuesta_json({"success": False, "error": "Código de acceso inválido"})
+
+
+async def dashboard(peticion):
+    sesion = await _sesion(peticion)
+    if not sesion:
+        return respuesta_json(*SESION_INVALIDA)
+
+    id_empleado = sesion["id_empleado"]
+    tipo_empleado = sesion["tipo_empleado"]
+
+    # Sin cambios desde la versión que tiene el cliente: 304 sin las cuatro consultas
+    etag, no_modificado = await _etag(peticion, id_empleado)
+    if no_modificado:
+        return no_modificado
+
+    # Las cuatro consultas son independientes: en paralelo en el pool
+    tareas_pendientes, tareas_completadas, resumen, notificaciones = await asyncio.gather(
+        portal.obtener_tareas_pendientes(id_empleado, tipo_empleado),
+        portal.obtener_tareas_completadas(id_empleado, tipo_empleado),
+        portal.obtener_resumen_pagos(id_empleado, tipo_empleado),
+        portal.obtener_notificaciones(id_empleado, no_leidas=True))
+
+    return respuesta_json({
+        "success": True,
+        "tareas_pendientes": tareas_pendientes,
+        "tareas_completadas": tareas_completadas,
+        "resumen": resumen,
+        "notificaciones": notificaciones,
+        "empleado": sesion
+    }, columnas=peticion.args.get("formato") == "columnas", etag=etag)
+
+
+async def actualizar_tarea(peticion):
+    sesion = await _sesion(peticion)
+    if not sesion:
+        return respuesta_json(*SESION_INVALIDA)
+
+    data = await peticion.json()
+    result = await portal.actualizar_estado_tarea(
+        data.get("id_produccion"), sesion["id_empleado"], sesion["tipo_empleado"],
+        data.get("nuevo_estado"))
+    return respuesta_json(result)
+
+
+async def listar_notificaciones(peticion):
+    sesion = await _sesion(peticion)
+    if not sesion:
+        return respuesta_json(*SESION_INVALIDA)
+
+    etag, no_modificado = await _etag(peticion, sesion["id_empleado"])
+    if no_modificado:
+        return no_modificado
+
+    result = await portal.obtener_notificaciones_paginadas(
+        sesion["id_empleado"],
+        no_leidas=peticion.args.get("no_leidas") == "1",
+        cursor_pagina=peticion.args.get("cursor"),
+        limite=peticion.args.get("limite", 20))
+    return respuesta_json(result, 200 if result["success"] else 400,
+                          columnas=peticion.args.get("formato") == "columnas",
+                          etag=etag if result["success"] else None)
+
+
+async def marcar_notificacion_leida(peticion):
+    sesion = await _sesion(peticion)
+    if not sesion:
+        return respuesta_json(*SESION_INVALIDA)
+
+    await portal.marcar_notificacion_leida(int(peticion.parametros["id_notificacion"]),
+                                           sesion["id_empleado"])
+    return respuesta_json({"success": True})
+
+
+async def esperar_notificaciones(peticion):
+    """Long-poll: responde con la primera notificación nueva o vacío al vencer el plazo"""
+    sesion = await _sesion(peticion)
+    if not sesion:
+        return respuesta_json(*SESION_INVALIDA)
+
+    try:
+        plazo = min(float(peticion.args.get("timeout", ESPERA_MAXIMA_S)), ESPERA_MAXIMA_S)
+    except ValueError:
+        plazo = ESPERA_MAXIMA_S
+
+    cola = difusor.suscribir(sesion["id_empleado"])
+    _conexiones_abiertas.inc(tipo="long_poll")
+    try:
+        notificaciones = [await asyncio.wait_for(cola.get(), plazo)]
+        while not cola.empty():
+            notificaciones.append(cola.get_nowait())
+    except asyncio.TimeoutError:
+        notificaciones = []
+    finally:
+        difusor.desuscribir(sesion["id_empleado"], cola)
+        _conexiones_abiertas.dec(tipo="long_poll")
+
+    return respuesta_json({"success": True, "notificaciones": notificaciones})
+
+
+async def stream_notificaciones(peticion, send):
+    """SSE: mantiene la conexión y envía cada notificación nueva como evento"""
+    sesion = await _sesion(peticion)
+    if not sesion:
+        await _enviar(send, respuesta_json(*SESION_INVALIDA))
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]
+    })
+
+    cola = difusor.suscribir(sesion["id_empleado"])
+    _conexiones_abiertas.inc(tipo="sse")
+    desconexion = asyncio.ensure_future(_esperar_desconexion(peticion.receive))
+    siguiente = None
+    try:
+        while True:
+            siguiente = asyncio.ensure_future(cola.get())
+            hechas, _ = await asyncio.wait({siguiente, desconexion}, timeout=LATIDO_SSE_S,
+                                           return_when=asyncio.FIRST_COMPLETED)
+            if desconexion.done():
+                siguiente.cancel()
+                break
+            if siguiente in hechas:
+                datos = a_json_bytes(siguiente.result()).decode()
+                evento = f"event: notificacion\ndata: {datos}\n\n"
+            else:
+                siguiente.cancel()
+                evento = ": latido\n\n"
+            await send({"type": "http.response.body", "body": evento.encode(), "more_body": True})
+    finally:
+        desconexion.cancel()
+        if siguiente is not None:
+            siguiente.cancel()
+        difusor.desuscribir(sesion["id_empleado"], cola)
+        _conexiones_abiertas.dec(tipo="sse")
+
+
+async def _esperar_desconexion(receive):
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "http.disconnect":
+            return
+
+
+async def metrics(peticion):
+    return Respuesta(registro.exportar_texto().encode(), tipo="text/plain; version=0.0.4")
+
+
+RUTAS = [
+    ("GET", "/", index),
+    ("GET", "/activos/<nombre>", activo_estatico),
+    ("POST", "/api/login", login),
+    ("GET", "/api/dashboard", dashboard),
+    ("POST", "/api/tarea/actualizar", actualizar_tarea),
+    ("GET", "/api/notificaciones", listar_notificaciones),
+    ("GET", "/api/notificaciones/espera", esperar_notificaciones),
+    ("POST", "/api/notificaciones/<int:id_notificacion>/leida", marcar_notificacion_leida),
+    ("GET", "/metrics", metrics),
+]
+RUTAS_STREAM = {"/api/notificaciones/stream": stream_notificaciones}
+
+def _compilar(patron):
+    """<int:nombre> captura dígitos y <nombre> un segmento de la ruta"""
+    return re.compile("^" + re.sub(
+        r"<(int:)?(\w+)>",
+        lambda m: f"(?P<{m.group(2)}>" + (r"\d+" if m.group(1) else r"[^/]+") + ")",
+        patron) + "$")
+
+
+_RUTAS_COMPILADAS = [(metodo, patron, _compilar(patron), vista) for metodo, patron, vista in RUTAS]
+
+
+def resolver(metodo, ruta):
+    """Devolver (patrón, vista, parámetros) o (None, None, estado_http)"""
+    metodo_incorrecto = False
+    for metodo_ruta, patron, regex, vista in _RUTAS_COMPILADAS:
+        coincidencia = regex.match(ruta)
+        if coincidencia:
+            if metodo_ruta == metodo:
+                return patron, vista, coincidencia.groupdict()
+            metodo_incorrecto = True
+    return None, None, 405 if metodo_incorrecto else 404
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "lifespan.startup":
+            difusor.iniciar()
+            _iniciar_cola()
+            await send({"type": "lifespan.startup.complete"})
+        elif mensaje["type"] == "lifespan.shutdown":
+            await difusor.detener()
+            if cola_trabajos is not None:
+                # Espera a que termine el trabajo en curso sin bloquear el loop
+                await asyncio.to_thread(cola_trabajos.detener)
+            portal.cerrar()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """Punto de entrada ASGI"""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    # Servidores sin lifespan: iniciar el difusor y la cola con la primera petición
+    difusor.iniciar()
+    _iniciar_cola()
+    peticion = Peticion(scope, receive)
+
+    if peticion.ruta in RUTAS_STREAM and peticion.metodo == "GET":
+        await RUTAS_STREAM[peticion.ruta](peticion, send)
+        return
+
+    patron, vista, parametros = resolver(peticion.metodo, peticion.ruta)
+    if vista is None:
+        await _enviar(send, respuesta_json({"success": False, "error": "No encontrado"}, parametros))
+        return
+    peticion.parametros = parametros
+
+    nombre = f"{peticion.metodo} {patron}"
+    inicio = time.perf_counter()
+    ambito, token = iniciar_ambito(nombre)
+    with tracing.span(nombre, {"http.method": peticion.metodo, "http.route": patron},
+                      tracing.SERVIDOR) as span:
+        try:
+            respuesta = await vista(peticion)
+        except Exception as e:
+            respuesta = respuesta_json({"success": False, "error": str(e)}, 500)
+        finally:
+            conteo = cerrar_ambito(ambito, token)
+        if span is not None:
+            span.atributos["http.status_code"] = respuesta.estado
+
+    duracion_peticiones.observar(time.perf_counter() - inicio, metodo=peticion.metodo, ruta=patron)
+    peticiones_total.inc(metodo=peticion.metodo, ruta=patron, codigo=str(respuesta.estado))
+    # Conteos por petición solo al depurar (JULIA_SQL_CABECERAS=1)
+    extra = [(b"x-sql-sentencias", str(conteo["sentencias"]).encode()),
+             (b"x-sql-conexiones", str(conteo["conexiones"]).encode())] if CABECERAS_SQL else []
+    await _enviar(send, _comprimir(peticion, respuesta), extra)
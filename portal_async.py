@@ -0,0 +1,122 @@
+# Acceso Asíncrono a Datos del Portal - Julia Confecciones
+#
+# Variante asyncio de EmployeeTrackingPortal para el despliegue ASGI del
+# portal (ver portal_asgi). Las llamadas bloqueantes a sqlite3 corren en un
+# pool de hilos dedicado y acotado (JULIA_DB_HILOS): una petición que espera a
+# la base no ocupa un hilo del servidor, y las conexiones inactivas de
+# long-poll / SSE esperan en colas asyncio alimentadas por un único sondeo de
+# notificaciones compartido.
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from employee_tracking_portal import EmployeeTrackingPortal
+
+logger = logging.getLogger("julia.portal")
+
+HILOS_DB = int(os.getenv("JULIA_DB_HILOS", "8"))
+INTERVALO_SONDEO_S = float(os.getenv("JULIA_NOTIFICACIONES_SONDEO", "1.0"))
+
+
+def _asincrono(nombre):
+    metodo = getattr(EmployeeTrackingPortal, nombre)
+
+    @functools.wraps(metodo)
+    async def envoltura(self, *args, **kwargs):
+        return await self._en_pool(getattr(self.portal, nombre), *args, **kwargs)
+    return envoltura
+
+
+class PortalAsincrono:
+    """Mismos métodos que EmployeeTrackingPortal, como corrutinas"""
+
+    def __init__(self, db_path=None, hilos=HILOS_DB, portal=None):
+        self.portal = portal or EmployeeTrackingPortal(db_path)
+        self.db_path = self.portal.db_path
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="portal-db")
+
+    async def _en_pool(self, funcion, *args, **kwargs):
+        # El contexto viaja al hilo: ámbitos SQL y spans quedan en la petición
+        contexto = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._pool, functools.partial(contexto.run, funcion, *args, **kwargs))
+
+    def cerrar(self):
+        """Liberar el pool de hilos de la base"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+for _nombre, _atributo in list(vars(EmployeeTrackingPortal).items()):
+    if not _nombre.startswith("_") and callable(_atributo) and _nombre != "init_database":
+        setattr(PortalAsincrono, _nombre, _asincrono(_nombre))
+
+
+class DifusorNotificaciones:
+    """Reparte notificaciones nuevas a los clientes en espera (long-poll / SSE)
+
+    Un solo bucle consulta la base cada `intervalo` segundos, y solo mientras
+    haya suscriptores, sin importar cuántas conexiones estén abiertas.
+    """
+
+    def __init__(self, portal_async, intervalo=INTERVALO_SONDEO_S):
+        self.portal = portal_async
+        self.intervalo = intervalo
+        self._suscriptores = {}
+        self._ultimo_id = None
+        self._hay_suscriptores = asyncio.Event()
+        self._tarea = None
+
+    @property
+    def total_suscriptores(self):
+        return sum(len(colas) for colas in self._suscriptores.values())
+
+    def suscribir(self, id_empleado):
+        """Registrar un cliente; devuelve la cola donde llegarán sus notificaciones"""
+        cola = asyncio.Queue(maxsize=100)
+        self._suscriptores.setdefault(id_empleado, set()).add(cola)
+        self._hay_suscriptores.set()
+        return cola
+
+    def desuscribir(self, id_empleado, cola):
+        colas = self._suscriptores.get(id_empleado)
+        if colas:
+            colas.discard(cola)
+            if not colas:
+                del self._suscriptores[id_empleado]
+        if not self._suscriptores:
+            self._hay_suscriptores.clear()
+
+    async def _sondear(self):
+        while True:
+            await self._hay_suscriptores.wait()
+            try:
+                if self._ultimo_id is None:
+                    self._ultimo_id = await self.portal.ultimo_id_notificacion()
+                nuevas = await self.portal.obtener_notificaciones_desde(self._ultimo_id)
+                for notificacion in nuevas:
+                    self._ultimo_id = notificacion["id_notificacion"]
+                    for cola in self._suscriptores.get(notificacion["id_empleado"], ()):
+                        if not cola.full():
+                            cola.put_nowait(notificacion)
+            except Exception as e:
+                logger.warning("Error sondeando notificaciones: %s", e)
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self):
+        """Iniciar el sondeo en el loop actual"""
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.get_running_loop().create_task(self._sondear())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
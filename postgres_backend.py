@@ -0,0 +1,454 @@
+# Backend PostgreSQL para los Sistemas - Julia Confecciones
+#
+# database.conectar() entrega una conexión de este módulo cuando db_path es
+# una URL postgresql://. La conexión imita la interfaz de sqlite3 que usan los
+# sistemas (cursor/execute/fetch*/lastrowid/commit/close) sobre psycopg 3:
+#
+#   - Conexiones tomadas de un pool por URL (psycopg_pool); close() la devuelve.
+#   - Sentencias preparadas en el servidor desde la ejecución número
+#     JULIA_PG_PREPARAR de cada una (0 = desde la primera, negativo = nunca,
+#     necesario detrás de un pgbouncer en modo transacción).
+#   - El SQL escrito para SQLite se traduce una vez y queda en caché:
+#     marcadores ?, datetime('now'), julianday('now'), strftime, GROUP_CONCAT,
+#     INSERT OR IGNORE/REPLACE, tipos de CREATE TABLE, tablas temp. y
+#     sqlite_master.
+#     strftime admite %Y %m %d %H %M %S %j y %W (semana con lunes como primer
+#     día, 00-53, igual que SQLite; no la semana ISO). tests/test_postgres_backend
+#     pasa el SQL de los sistemas por traducir().
+#   - Los INSERT llevan RETURNING <clave primaria>; su valor es lastrowid.
+#   - Los errores de psycopg se relanzan como sus equivalentes de sqlite3, de
+#     modo que los except y la política de reintentos no cambian.
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import tracing
+from metrics import registro
+from sql_instrumentation import HABILITADA, _registrar_conexion, _registrar_sentencia, _span_sentencia
+
+try:
+    import psycopg
+    from psycopg.pq import TransactionStatus
+    from psycopg.types.numeric import FloatLoader
+    from psycopg.types.string import TextLoader
+    from psycopg_pool import ConnectionPool, PoolTimeout
+except ImportError:
+    psycopg = None
+
+logger = logging.getLogger("julia.db")
+
+POOL_MIN = int(os.getenv("JULIA_PG_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("JULIA_PG_POOL_MAX", "10"))
+POOL_ESPERA_S = float(os.getenv("JULIA_PG_POOL_ESPERA", "30"))
+PREPARAR_DESDE = int(os.getenv("JULIA_PG_PREPARAR", "0"))
+
+# datetime('now') de SQLite: UTC, sin microsegundos
+AHORA_UTC = "(CURRENT_TIMESTAMP AT TIME ZONE 'UTC')::timestamp(0)"
+# julianday('now'): días julianos (la época Unix es el día 2440587.5)
+AHORA_JULIANO = "(extract(epoch from CURRENT_TIMESTAMP)::double precision / 86400.0 + 2440587.5)"
+
+_FORMATOS_STRFTIME = {"%Y": "YYYY", "%m": "MM", "%d": "DD", "%H": "HH24", "%M": "MI",
+                      "%S": "SS", "%j": "DDD"}
+# %W de SQLite no tiene patrón en to_char ('IW' es la semana ISO, 01-53): los
+# días antes del primer lunes del año son la semana 00
+_SEMANA_LUNES = "lpad(((extract(doy from {0})::int + 7 - extract(isodow from {0})::int) / 7)::text, 2, '0')"
+
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_PRAGMA = re.compile(r"^\s*PRAGMA\b", re.IGNORECASE)
+_BEGIN = re.compile(r"^\s*BEGIN\s+(IMMEDIATE|DEFERRED|EXCLUSIVE)\b", re.IGNORECASE)
+_DATETIME_AHORA = re.compile(
+    r"datetime\(\s*'now'\s*(?:,\s*'([+-]?\d+) (\w+?)s?'\s*)?\)", re.IGNORECASE)
+_JULIANDAY_AHORA = re.compile(r"julianday\(\s*'now'\s*\)", re.IGNORECASE)
+_STRFTIME = re.compile(r"strftime\(\s*'([^']*)'\s*,\s*([^()]+?)\s*\)", re.IGNORECASE)
+_SQLITE_MASTER = re.compile(
+    r"sqlite_master\s+WHERE\s+type\s*=\s*'table'\s+AND\s+name\s*=", re.IGNORECASE)
+_INSERT = re.compile(
+    r"^\s*INSERT\s+(?:OR\s+(IGNORE|REPLACE)\s+)?INTO\s+(\w+)\s*(?:\(([^)]*)\))?", re.IGNORECASE)
+_CREATE_TABLE = re.compile(r"^\s*CREATE\s+(?:TEMP\s+|TEMPORARY\s+)?TABLE\b", re.IGNORECASE)
+_TEMP = re.compile(r"\btemp\.", re.IGNORECASE)
+_TIPOS_DDL = [
+    (re.compile(r"INTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT", re.IGNORECASE),
+     "INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY"),
+    (re.compile(r"\bDATETIME\b", re.IGNORECASE), "TIMESTAMP"),
+    (re.compile(r"\bREAL\b", re.IGNORECASE), "DOUBLE PRECISION"),
+    (re.compile(r"DEFAULT\s+CURRENT_TIMESTAMP", re.IGNORECASE), f"DEFAULT {AHORA_UTC}"),
+]
+
+_bases = {}
+_lock_bases = threading.Lock()
+
+
+def _reemplazar_fuera_de_literales(sql, funcion):
+    partes = _LITERAL.split(sql)
+    return "".join(p if i % 2 else funcion(p) for i, p in enumerate(partes))
+
+
+def _traducir_group_concat(sql):
+    # GROUP_CONCAT(expr[, sep]) -> string_agg((expr)::text, sep); expr puede tener paréntesis
+    salida = []
+    posicion = 0
+    patron = re.compile(r"GROUP_CONCAT\s*\(", re.IGNORECASE)
+    while True:
+        coincidencia = patron.search(sql, posicion)
+        if not coincidencia:
+            salida.append(sql[posicion:])
+            return "".join(salida)
+        salida.append(sql[posicion:coincidencia.start()])
+        nivel, inicio, argumentos = 1, coincidencia.end(), []
+        i = inicio
+        while nivel:
+            caracter = sql[i]
+            if caracter == "'":
+                i = sql.index("'", i + 1)
+            elif caracter == "(":
+                nivel += 1
+            elif caracter == ")":
+                nivel -= 1
+            elif caracter == "," and nivel == 1:
+                argumentos.append(sql[inicio:i])
+                inicio = i + 1
+            i += 1
+        argumentos.append(sql[inicio:i - 1])
+        separador = argumentos[1].strip() if len(argumentos) > 1 else "','"
+        salida.append(f"string_agg(({argumentos[0].strip()})::text, {separador})")
+        posicion = i
+
+
+def _traducir_fechas(fragmento):
+    def ahora(coincidencia):
+        cantidad, unidad = coincidencia.groups()
+        if cantidad is None:
+            return AHORA_UTC
+        return f"({AHORA_UTC} + INTERVAL '{cantidad} {unidad}')"
+
+    def strftime(coincidencia):
+        formato, expresion = coincidencia.groups()
+        partes = []
+        for i, trozo in enumerate(formato.split("%W")):
+            if i:
+                partes.append(_SEMANA_LUNES.format(expresion))
+            if trozo:
+                for origen, destino in _FORMATOS_STRFTIME.items():
+                    trozo = trozo.replace(origen, destino)
+                partes.append(f"to_char({expresion}, '{trozo}')")
+        return partes[0] if len(partes) == 1 else f"({' || '.join(partes)})"
+
+    fragmento = _DATETIME_AHORA.sub(ahora, fragmento)
+    fragmento = _JULIANDAY_AHORA.sub(AHORA_JULIANO, fragmento)
+    return _STRFTIME.sub(strftime, fragmento)
+
+
+@lru_cache(maxsize=2048)
+def traducir(sql):
+    """Traducir una sentencia escrita para SQLite al dialecto de PostgreSQL
+
+    Devuelve (sql_postgres, insercion) donde insercion es (tabla, columnas,
+    conflicto) para los INSERT y None para el resto. sql_postgres es None si
+    la sentencia no aplica en PostgreSQL (PRAGMA).
+    """
+    if _PRAGMA.match(sql):
+        return None, None
+    sql = _BEGIN.sub("BEGIN", sql.strip().rstrip(";"))
+
+    # Las funciones de fecha llevan literales propios: se traducen antes de separar literales
+    sql = _traducir_fechas(sql)
+    sql = _traducir_group_concat(sql)
+    sql = _SQLITE_MASTER.sub(
+        "information_schema.tables WHERE table_schema = current_schema() AND table_name =", sql)
+    sql = _reemplazar_fuera_de_literales(sql, lambda p: _TEMP.sub("pg_temp.", p))
+
+    if _CREATE_TABLE.match(sql):
+        for patron, reemplazo in _TIPOS_DDL:
+            sql = _reemplazar_fuera_de_literales(sql, lambda p: patron.sub(reemplazo, p))
+
+    insercion = None
+    coincidencia = _INSERT.match(sql)
+    if coincidencia:
+        conflicto, tabla, columnas = coincidencia.groups()
+        columnas = tuple(c.strip() for c in columnas.split(",")) if columnas else ()
+        insercion = (tabla, columnas, conflicto.lower() if conflicto else None)
+        if conflicto:
+            sql = re.sub(r"\s+OR\s+(IGNORE|REPLACE)\s+", " ", sql, count=1, flags=re.IGNORECASE)
+
+    # psycopg usa %s como marcador y %% para un % literal
+    sql = sql.replace("%", "%%")
+    sql = _reemplazar_fuera_de_literales(sql, lambda p: p.replace("?", "%s"))
+    return sql, insercion
+
+
+@contextmanager
+def _errores_como_sqlite():
+    try:
+        yield
+    except (psycopg.errors.SerializationFailure, psycopg.errors.DeadlockDetected,
+            psycopg.errors.LockNotAvailable) as e:
+        # Transitorios: database.con_reintentos los reintenta como un SQLITE_BUSY
+        raise sqlite3.OperationalError(f"database is busy: {e}") from e
+    except psycopg.IntegrityError as e:
+        raise sqlite3.IntegrityError(str(e)) from e
+    except psycopg.OperationalError as e:
+        raise sqlite3.OperationalError(str(e)) from e
+    except psycopg.Error as e:
+        raise sqlite3.DatabaseError(str(e)) from e
+
+
+def _configurar_conexion(conn):
+    # Mismos tipos que devuelve sqlite3: fechas como texto ISO y sumas/promedios como float
+    for tipo in ("timestamp", "timestamptz", "date"):
+        conn.adapters.register_loader(tipo, TextLoader)
+    conn.adapters.register_loader("numeric", FloatLoader)
+
+
+class _Sentencia:
+    __slots__ = ("texto", "devuelve_id")
+
+    def __init__(self, texto, devuelve_id=False):
+        self.texto = texto
+        self.devuelve_id = devuelve_id
+
+
+class BasePostgres:
+    """Pool de conexiones y caché de sentencias traducidas de una URL"""
+
+    def __init__(self, url):
+        if psycopg is None:
+            raise ImportError("El backend PostgreSQL requiere psycopg y psycopg_pool "
+                              "(pip install 'psycopg[binary]' psycopg_pool)")
+        partes = urlsplit(url)
+        self.nombre = f"{partes.hostname or 'local'}{partes.path}"
+        self.pool = ConnectionPool(
+            url, min_size=POOL_MIN, max_size=POOL_MAX, name=self.nombre,
+            kwargs={"prepare_threshold": PREPARAR_DESDE if PREPARAR_DESDE >= 0 else None},
+            configure=_configurar_conexion, open=True)
+        self._claves = {}
+        self._sentencias = {}
+
+    def clave_primaria(self, tabla, conn):
+        """Columna de clave primaria simple de la tabla (None si no tiene o es compuesta)"""
+        if tabla not in self._claves:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    SELECT a.attname FROM pg_index i
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                    WHERE i.indrelid = to_regclass(%s) AND i.indisprimary
+                ''', (tabla,))
+                columnas = [fila[0] for fila in cursor.fetchall()]
+            if not columnas:
+                # La tabla puede no existir aún: no se guarda en caché
+                return None
+            self._claves[tabla] = columnas[0] if len(columnas) == 1 else None
+        return self._claves[tabla]
+
+    def sentencia(self, sql, conn):
+        """Sentencia lista para psycopg (None si no aplica en PostgreSQL)"""
+        sentencia = self._sentencias.get(sql)
+        if sentencia is not None:
+            return sentencia
+
+        texto, insercion = traducir(sql)
+        if texto is None:
+            return None
+        devuelve_id = False
+        if insercion:
+            tabla, columnas, conflicto = insercion
+            clave = self.clave_primaria(tabla, conn)
+            if conflicto == "ignore":
+                texto += " ON CONFLICT DO NOTHING"
+            elif conflicto == "replace" and clave:
+                asignaciones = ", ".join(f"{c} = EXCLUDED.{c}" for c in columnas if c != clave)
+                texto += f" ON CONFLICT ({clave}) DO " + (
+                    f"UPDATE SET {asignaciones}" if asignaciones else "NOTHING")
+            if clave and "RETURNING" not in texto.upper():
+                texto += f" RETURNING {clave}"
+                devuelve_id = True
+
+        sentencia = self._sentencias[sql] = _Sentencia(texto, devuelve_id)
+        return sentencia
+
+    def conectar(self, autocommit=False):
+        try:
+            conn = self.pool.getconn(timeout=POOL_ESPERA_S)
+        except PoolTimeout as e:
+            raise sqlite3.OperationalError(f"database is busy: pool agotado ({e})") from e
+        conn.autocommit = autocommit
+        return ConexionPostgres(self, conn)
+
+    def estadisticas(self):
+        return self.pool.get_stats()
+
+
+class CursorPostgres:
+    """Cursor con la interfaz de sqlite3.Cursor sobre un cursor de psycopg"""
+
+    def __init__(self, conexion):
+        self.connection = conexion
+        self._cursor = conexion._conn.cursor()
+        self._con_resultado = False
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description if self._con_resultado else None
+
+    def _ejecutar(self, sql, parametros, muchas):
+        sentencia = self.connection._base.sentencia(sql, self.connection._conn)
+        if sentencia is None:
+            self._con_resultado = False
+            return self
+
+        primera = (parametros[0] if parametros else None) if muchas else parametros
+        span = (_span_sentencia(self.connection, sql, primera, len(parametros) if muchas else None)
+                if HABILITADA and tracing.HABILITADO else None)
+        error = None
+        inicio = time.perf_counter()
+        try:
+            with _errores_como_sqlite():
+                if muchas:
+                    self._cursor.executemany(sentencia.texto, parametros)
+                else:
+                    self._cursor.execute(sentencia.texto, parametros)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if HABILITADA:
+                _registrar_sentencia(sql, primera, (time.perf_counter() - inicio) * 1000,
+                                     len(parametros) if muchas else None)
+            tracing.terminar_span(span, error=error)
+
+        self._con_resultado = self._cursor.description is not None
+        if sentencia.devuelve_id and not muchas:
+            fila = self._cursor.fetchone()
+            self.lastrowid = fila[0] if fila else None
+            self._con_resultado = False
+        return self
+
+    def execute(self, sql, parametros=()):
+        return self._ejecutar(sql, tuple(parametros), muchas=False)
+
+    def executemany(self, sql, secuencia):
+        return self._ejecutar(sql, [tuple(p) for p in secuencia], muchas=True)
+
+    def fetchone(self):
+        return self._cursor.fetchone() if self._con_resultado else None
+
+    def fetchall(self):
+        return self._cursor.fetchall() if self._con_resultado else []
+
+    def fetchmany(self, tamano=1):
+        return self._cursor.fetchmany(tamano) if self._con_resultado else []
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionPostgres:
+    """Conexión del pool con la interfaz de sqlite3.Connection que usan los sistemas"""
+
+    sistema = "postgresql"
+
+    def __init__(self, base, conn):
+        self._base = base
+        self._conn = conn
+        self.span = None
+        if HABILITADA:
+            _registrar_conexion()
+            if tracing.HABILITADO:
+                self.span = tracing.iniciar_span_hijo(
+                    "postgresql.conexion", {"db.system": "postgresql", "db.name": base.nombre})
+
+    @property
+    def in_transaction(self):
+        return self._conn.info.transaction_status != TransactionStatus.IDLE
+
+    def cursor(self):
+        return CursorPostgres(self)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def commit(self):
+        span = tracing.iniciar_span_hijo("postgresql.commit", {"db.system": "postgresql"},
+                                         self.span) if self.span else None
+        try:
+            with _errores_como_sqlite():
+                self._conn.commit()
+        finally:
+            tracing.terminar_span(span)
+
+    def rollback(self):
+        with _errores_como_sqlite():
+            self._conn.rollback()
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            # Como en sqlite3, lo no confirmado se descarta al cerrar
+            if conn.info.transaction_status != TransactionStatus.IDLE:
+                conn.rollback()
+            conn.autocommit = False
+        except psycopg.Error as e:
+            logger.warning("Conexión PostgreSQL descartada al cerrar: %s", e)
+        finally:
+            self._base.pool.putconn(conn)
+            span, self.span = self.span, None
+            tracing.terminar_span(span)
+
+
+def obtener_base(url):
+    """Pool y caché de sentencias de la URL (uno por proceso y URL)"""
+    with _lock_bases:
+        base = _bases.get(url)
+        if base is None:
+            base = _bases[url] = BasePostgres(url)
+        return base
+
+
+def conectar(url, isolation_level="", **kwargs):
+    """Tomar una conexión del pool de `url`
+
+    isolation_level=None (autocommit con BEGIN/COMMIT explícitos) se respeta
+    como en sqlite3; el resto de opciones propias de sqlite3 no aplica.
+    """
+    return obtener_base(url).conectar(autocommit=isolation_level is None)
+
+
+def cerrar_pools():
+    """Cerrar los pools abiertos por este proceso"""
+    with _lock_bases:
+        bases = list(_bases.values())
+        _bases.clear()
+    for base in bases:
+        base.pool.close()
+
+
+def _colector_metricas():
+    with _lock_bases:
+        bases = list(_bases.values())
+    estadisticas = [(base.nombre, base.estadisticas()) for base in bases]
+    return [
+        ("julia_pg_pool_conexiones", "gauge", "Conexiones abiertas por el pool de PostgreSQL",
+         [({"base": nombre, "estado": "abiertas"}, e.get("pool_size", 0)) for nombre, e in estadisticas]
+         + [({"base": nombre, "estado": "libres"}, e.get("pool_available", 0)) for nombre, e in estadisticas]),
+        ("julia_pg_pool_esperando", "gauge", "Peticiones esperando una conexión del pool",
+         [({"base": nombre}, e.get("requests_waiting", 0)) for nombre, e in estadisticas]),
+    ]
+
+
+registro.registrar_colector("postgres_pool", _colector_metricas)
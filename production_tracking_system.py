@@ -5,6 +5,27 @@ from datetime import datetime, timedelta
 import json
 import uuid
 
+from backup_service import conectar_instantanea
+from database import conectar, es_postgres
+from records import a_json, tipo_registro
+from schema import asegurar_esquema
+from sqlite_writer import escribir
+from sql_instrumentation import instrumentar_clase
+
+# Orden terminada y pagada a cortador y costurero: ya no cambia y pasa a
+# produccion_historica. En produccion queda solo el trabajo abierto o impago.
+ORDEN_LIQUIDADA = '''
+    estado_corte = 'completado' AND estado_costura = 'completado'
+    AND estado_pago_corte = 'pagado' AND estado_pago_costura = 'pagado'
+'''
+
+TareaEmpleado = tipo_registro("TareaEmpleado", "id_produccion id_orden tipo_orden fecha_asignacion pago_corte "
+                                               "pago_costura estado_pago_corte estado_pago_costura notas estado_descripcion")
+FilaReporteProduccion = tipo_registro("FilaReporteProduccion", "estado_corte estado_costura total_ordenes "
+                                                               "total_pago_corte total_pago_costura cortador costurero")
+MaterialBajo = tipo_registro("MaterialBajo", "id_material nombre stock_actual stock_minimo unidad_medida diferencia")
+
+@instrumentar_clase
 class ProductionTrackingSystem:
     def __init__(self, db_path):
         self.db_path = db_path
@@ -12,126 +33,7 @@ class ProductionTrackingSystem:
 
     def init_database(self):
         """Inicializar base de datos para seguimiento de producción"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Tabla de Empleados
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS empleados (
-                id_empleado INTEGER PRIMARY KEY AUTOINCREMENT,
-                rut TEXT UNIQUE,
-                nombre TEXT,
-                email TEXT,
-                celular TEXT,
-                tipo_empleado TEXT,
-                sueldo_fijo REAL,
-                precio_prenda REAL,
-                fecha_contratacion DATE,
-                estado TEXT DEFAULT 'activo',
-                codigo_acceso TEXT UNIQUE
-            )
-        ''')
-
-        # Tabla de Materiales
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS materiales (
-                id_material INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT,
-                tipo TEXT,
-                unidad_medida TEXT,
-                stock_actual REAL DEFAULT 0,
-                stock_minimo REAL DEFAULT 0,
-                costo_unitario REAL DEFAULT 0,
-                proveedor TEXT,
-                fecha_ultimo_ingreso DATETIME,
-                estado TEXT DEFAULT 'activo'
-            )
-        ''')
-
-        # Tabla de Producción
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS produccion (
-                id_produccion INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_orden INTEGER,
-                tipo_orden TEXT,
-                id_cortador INTEGER,
-                id_costurero INTEGER,
-                fecha_asignacion DATETIME DEFAULT CURRENT_TIMESTAMP,
-                fecha_entrega_corte DATETIME,
-                fecha_entrega_costura DATETIME,
-                estado_corte TEXT DEFAULT 'pendiente',
-                estado_costura TEXT DEFAULT 'pendiente',
-                pago_corte REAL DEFAULT 0,
-                pago_costura REAL DEFAULT 0,
-                estado_pago_corte TEXT DEFAULT 'pendiente',
-                estado_pago_costura TEXT DEFAULT 'pendiente',
-                notas TEXT,
-                FOREIGN KEY (id_cortador) REFERENCES empleados (id_empleado),
-                FOREIGN KEY (id_costurero) REFERENCES empleados (id_empleado)
-            )
-        ''')
-
-        # Tabla de Detalle de Materiales por Producción
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS detalle_produccion_materiales (
-                id_detalle INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_produccion INTEGER,
-                id_material INTEGER,
-                cantidad_utilizada REAL,
-                fecha_uso DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion),
-                FOREIGN KEY (id_material) REFERENCES materiales (id_material)
-            )
-        ''')
-
-        # Tabla de Seguimiento de Producción
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS seguimiento_produccion (
-                id_seguimiento INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_produccion INTEGER,
-                id_empleado INTEGER,
-                fecha_acceso DATETIME DEFAULT CURRENT_TIMESTAMP,
-                accion TEXT,
-                notas TEXT,
-                FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion),
-                FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado)
-            )
-        ''')
-
-        # Tabla de Compras de Materiales
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS compras_materiales (
-                id_compra INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_material INTEGER,
-                cantidad_comprada REAL,
-                costo_total REAL,
-                proveedor TEXT,
-                fecha_compra DATETIME DEFAULT CURRENT_TIMESTAMP,
-                fecha_recepcion DATETIME,
-                estado TEXT DEFAULT 'pendiente',
-                comprobante TEXT
-            )
-        ''')
-
-        # Tabla de Envíos a Proveedores
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS envios_proveedores (
-                id_envio INTEGER PRIMARY KEY AUTOINCREMENT,
-                tipo_proveedor TEXT, -- 'cortador', 'costurero'
-                id_proveedor INTEGER,
-                id_produccion INTEGER,
-                fecha_envio DATETIME DEFAULT CURRENT_TIMESTAMP,
-                fecha_recepcion DATETIME,
-                estado_envio TEXT DEFAULT 'enviado',
-                estado_recepcion TEXT DEFAULT 'pendiente',
-                notas TEXT,
-                FOREIGN KEY (id_proveedor) REFERENCES empleados (id_empleado),
-                FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion)
-            )
-        ''')
-
-        conn.commit()
-        conn.close()
+        asegurar_esquema(self.db_path)
 
     def generar_codigo_acceso(self):
         """Generar código de acceso único para empleados"""
@@ -140,22 +42,18 @@ class ProductionTrackingSystem:
     def registrar_empleado(self, rut, nombre, email, celular, tipo_empleado,
                           sueldo_fijo=0, precio_prenda=0):
         """Registrar nuevo empleado"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
-            codigo_acceso = self.generar_codigo_acceso()
+        codigo_acceso = self.generar_codigo_acceso()
 
+        def operacion(cursor):
             cursor.execute('''
                 INSERT INTO empleados
                 (rut, nombre, email, celular, tipo_empleado, sueldo_fijo, precio_prenda, codigo_acceso)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (rut, nombre, email, celular, tipo_empleado, sueldo_fijo, precio_prenda, codigo_acceso))
+            return cursor.lastrowid
 
-            empleado_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-
+        try:
+            empleado_id = escribir(self.db_path, operacion)
             return {
                 "success": True,
                 "empleado_id": empleado_id,
@@ -163,39 +61,34 @@ class ProductionTrackingSystem:
             }
 
         except sqlite3.IntegrityError:
-            conn.close()
             return {"success": False, "error": "RUT ya existe"}
 
     def registrar_material(self, nombre, tipo, unidad_medida, stock_actual=0,
                           stock_minimo=0, costo_unitario=0, proveedor=""):
         """Registrar nuevo material"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             cursor.execute('''
                 INSERT INTO materiales
                 (nombre, tipo, unidad_medida, stock_actual, stock_minimo, costo_unitario, proveedor)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (nombre, tipo, unidad_medida, stock_actual, stock_minimo, costo_unitario, proveedor))
+            return cursor.lastrowid
 
-            material_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-
+        try:
+            material_id = escribir(self.db_path, operacion)
             return {"success": True, "material_id": material_id}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def crear_orden_produccion(self, id_orden, tipo_orden, detalles_productos,
                                id_cortador=None, id_costurero=None):
-        """Crear orden de producción"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Crear orden de producción
 
-        try:
+        La verificación y el descuento de stock corren en la misma transacción
+        de escritura, así dos órdenes simultáneas no pueden gastar el mismo stock.
+        """
+        def operacion(cursor):
             # Crear orden principal
             cursor.execute('''
                 INSERT INTO produccion
@@ -231,25 +124,21 @@ class ProductionTrackingSystem:
                         VALUES (?, ?, ?)
                     ''', (id_produccion, id_material, cantidad))
                 else:
-                    conn.rollback()
-                    conn.close()
-                    return {"success": False, "error": f"Stock insuficiente para material {id_material}"}
+                    # Deshace toda la orden (el escritor revierte su savepoint)
+                    raise ValueError(f"Stock insuficiente para material {id_material}")
 
-            conn.commit()
-            conn.close()
+            return id_produccion
 
+        try:
+            id_produccion = escribir(self.db_path, operacion)
             return {"success": True, "id_produccion": id_produccion}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def enviar_a_corte(self, id_produccion, id_cortador):
         """Enviar orden a corte"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             # Actualizar producción
             cursor.execute('''
                 UPDATE produccion
@@ -271,21 +160,16 @@ class ProductionTrackingSystem:
                 VALUES (?, ?, 'enviado_a_corte')
             ''', (id_produccion, id_cortador))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Enviado a corte exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def confirmar_recepcion_corte(self, id_produccion, id_cortador, notas=""):
         """Confirmar recepción de corte por parte del cortador"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             # Actualizar producción
             cursor.execute('''
                 UPDATE produccion
@@ -307,21 +191,16 @@ class ProductionTrackingSystem:
                 VALUES (?, ?, 'corte_completado', ?)
             ''', (id_produccion, id_cortador, notas))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Corte completado exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def enviar_a_costura(self, id_produccion, id_costurero):
         """Enviar orden a costura"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             # Actualizar producción
             cursor.execute('''
                 UPDATE produccion
@@ -343,21 +222,16 @@ class ProductionTrackingSystem:
                 VALUES (?, ?, 'enviado_a_costura')
             ''', (id_produccion, id_costurero))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Enviado a costura exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def confirmar_recepcion_costura(self, id_produccion, id_costurero, notas=""):
         """Confirmar recepción de costura por parte del costurero"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             # Actualizar producción
             cursor.execute('''
                 UPDATE produccion
@@ -379,40 +253,33 @@ class ProductionTrackingSystem:
                 VALUES (?, ?, 'costura_completada', ?)
             ''', (id_produccion, id_costurero, notas))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Costura completada exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def registrar_pago_empleado(self, id_empleado, tipo_pago, monto, cantidad_prendas=0,
                                metodo_pago="efectivo", periodo_pago=""):
         """Registrar pago a empleado"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             cursor.execute('''
                 INSERT INTO pagos_empleados
                 (id_empleado, tipo_pago, monto, cantidad_prendas, periodo_pago, metodo_pago)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (id_empleado, tipo_pago, monto, cantidad_prendas, periodo_pago, metodo_pago))
 
-            conn.commit()
-            conn.close()
-
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True, "mensaje": "Pago registrado exitosamente"}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def obtener_tareas_pendientes_empleado(self, codigo_acceso):
         """Obtener tareas pendientes para un empleado"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         # Verificar empleado
@@ -424,62 +291,36 @@ class ProductionTrackingSystem:
             return {"success": False, "error": "Código de acceso inválido"}
 
         id_empleado, tipo_empleado = empleado
+        if tipo_empleado not in ('cortador', 'costurero'):
+            conn.close()
+            return {"success": True, "empleado_tipo": tipo_empleado, "tareas": []}
+
+        estado = 'estado_corte' if tipo_empleado == 'cortador' else 'estado_costura'
+        descripcion = f'''
+                CASE WHEN p.{estado} = 'pendiente' THEN 'Pendiente de recepción'
+                     WHEN p.{estado} = 'en_proceso' THEN 'En proceso'
+                     ELSE 'Completado'
+                END'''
+        cursor.execute(f'''
+            SELECT {TareaEmpleado.proyeccion("p", estado_descripcion=descripcion)}
+            FROM produccion p
+            WHERE p.id_{tipo_empleado} = ?
+            AND p.{estado} IN ('pendiente', 'en_proceso')
+            ORDER BY p.fecha_asignacion
+        ''', (id_empleado,))
 
-        if tipo_empleado == 'cortador':
-            # Tareas de corte pendientes
-            cursor.execute('''
-                SELECT p.*, e.nombre as nombre_orden,
-                       CASE WHEN p.estado_corte = 'pendiente' THEN 'Pendiente de recepción'
-                            WHEN p.estado_corte = 'en_proceso' THEN 'En proceso'
-                            ELSE 'Completado'
-                       END as estado_descripcion
-                FROM produccion p
-                LEFT JOIN envios_proveedores ep ON p.id_produccion = ep.id_produccion
-                WHERE p.id_cortador = ?
-                AND p.estado_corte IN ('pendiente', 'en_proceso')
-                ORDER BY p.fecha_asignacion
-            ''', (id_empleado,))
-
-        elif tipo_empleado == 'costurero':
-            # Tareas de costura pendientes
-            cursor.execute('''
-                SELECT p.*, e.nombre as nombre_orden,
-                       CASE WHEN p.estado_costura = 'pendiente' THEN 'Pendiente de recepción'
-                            WHEN p.estado_costura = 'en_proceso' THEN 'En proceso'
-                            ELSE 'Completado'
-                       END as estado_descripcion
-                FROM produccion p
-                LEFT JOIN envios_proveedores ep ON p.id_produccion = ep.id_produccion
-                WHERE p.id_costurero = ?
-                AND p.estado_costura IN ('pendiente', 'en_proceso')
-                ORDER BY p.fecha_asignacion
-            ''', (id_empleado,))
-
-        tareas = cursor.fetchall()
+        tareas = TareaEmpleado.de_filas(cursor.fetchall())
         conn.close()
 
         return {
             "success": True,
             "empleado_tipo": tipo_empleado,
-            "tareas": [
-                {
-                    "id_produccion": t[0],
-                    "id_orden": t[1],
-                    "tipo_orden": t[2],
-                    "fecha_asignacion": t[4],
-                    "pago_corte": t[8],
-                    "pago_costura": t[9],
-                    "estado_pago_corte": t[10],
-                    "estado_pago_costura": t[11],
-                    "notas": t[12],
-                    "estado_descripcion": t[13]
-                } for t in tareas
-            ]
+            "tareas": tareas
         }
 
-    def generar_reporte_produccion(self, fecha_inicio=None, fecha_fin=None):
-        """Generar reporte de producción"""
-        conn = sqlite3.connect(self.db_path)
+    def generar_reporte_produccion(self, fecha_inicio=None, fecha_fin=None, desde_instantanea=False):
+        """Generar reporte de producción (desde_instantanea: sobre la copia de solo lectura)"""
+        conn = conectar_instantanea(self.db_path) if desde_instantanea else conectar(self.db_path)
         cursor = conn.cursor()
 
         where_clause = ""
@@ -490,15 +331,10 @@ class ProductionTrackingSystem:
             params = [fecha_inicio, fecha_fin]
 
         cursor.execute(f'''
-            SELECT
-                p.estado_corte,
-                p.estado_costura,
-                COUNT(*) as total_ordenes,
-                SUM(p.pago_corte) as total_pago_corte,
-                SUM(p.pago_costura) as total_pago_costura,
-                ec.nombre as nombre_cortador,
-                es.nombre as nombre_costurero
-            FROM produccion p
+            SELECT {FilaReporteProduccion.proyeccion(
+                "p", total_ordenes="COUNT(*)", total_pago_corte="SUM(p.pago_corte)",
+                total_pago_costura="SUM(p.pago_costura)", cortador="ec.nombre", costurero="es.nombre")}
+            FROM produccion_completa p
             LEFT JOIN empleados ec ON p.id_cortador = ec.id_empleado
             LEFT JOIN empleados es ON p.id_costurero = es.id_empleado
             {where_clause}
@@ -506,47 +342,113 @@ class ProductionTrackingSystem:
             ORDER BY p.estado_corte, p.estado_costura
         ''', params)
 
-        reporte = cursor.fetchall()
+        reporte = FilaReporteProduccion.de_filas(cursor.fetchall())
+        conn.close()
+        return reporte
+
+    def verificar_materiales_bajos(self, desde_detalle=None, desde_material=None):
+        """Verificar materiales con stock bajo
+
+        Con desde_detalle/desde_material solo revisa los materiales nuevos y los
+        consumidos en producción después de esos ids (el stock solo baja ahí).
+        """
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+
+        columnas = MaterialBajo.proyeccion(diferencia="stock_minimo - stock_actual")
+        if desde_detalle is None:
+            cursor.execute(f'''
+                SELECT {columnas}
+                FROM materiales
+                WHERE stock_actual <= stock_minimo
+                AND estado = 'activo'
+                ORDER BY (stock_actual - stock_minimo) ASC
+            ''')
+        else:
+            cursor.execute(f'''
+                SELECT {columnas}
+                FROM materiales
+                WHERE stock_actual <= stock_minimo
+                AND estado = 'activo'
+                AND (id_material > ? OR id_material IN (
+                    SELECT id_material FROM detalle_produccion_materiales WHERE id_detalle > ?))
+                ORDER BY (stock_actual - stock_minimo) ASC
+            ''', (desde_material or 0, desde_detalle))
+
+        materiales = MaterialBajo.de_filas(cursor.fetchall())
         conn.close()
+        return materiales
+
+    def mover_ordenes_liquidadas(self, tamano_lote=500, max_lotes=100):
+        """Pasar las órdenes liquidadas de produccion a produccion_historica por lotes"""
+        if es_postgres(self.db_path):
+            # Las claves foráneas se validan en PostgreSQL: ahí se usa particionado declarativo
+            return {"success": False, "error": "El particionado por lotes es solo para SQLite"}
+
+        def operacion(cursor):
+            cursor.execute(f'''
+                SELECT id_produccion FROM produccion
+                WHERE {ORDEN_LIQUIDADA}
+                ORDER BY id_produccion
+                LIMIT ?
+            ''', (tamano_lote,))
+            ids = [f[0] for f in cursor.fetchall()]
+            if not ids:
+                return 0
+            marcadores = ", ".join("?" for _ in ids)
+
+            for rol, pago in (('cortador', 'pago_corte'), ('costurero', 'pago_costura')):
+                cursor.execute(f'''
+                    INSERT INTO resumen_produccion_historica (id_empleado, rol, prendas, monto)
+                    SELECT id_{rol}, '{rol}', COUNT(*), COALESCE(SUM({pago}), 0)
+                    FROM produccion
+                    WHERE id_produccion IN ({marcadores}) AND id_{rol} IS NOT NULL
+                    GROUP BY id_{rol}
+                    ON CONFLICT (id_empleado, rol) DO UPDATE SET
+                        prendas = prendas + excluded.prendas,
+                        monto = monto + excluded.monto
+                ''', ids)
+
+            # Los ids vienen de AUTOINCREMENT: nunca se reutilizan en la tabla caliente
+            cursor.execute(f'''
+                INSERT INTO produccion_historica
+                SELECT * FROM produccion WHERE id_produccion IN ({marcadores})
+            ''', ids)
+            cursor.execute(f'DELETE FROM produccion WHERE id_produccion IN ({marcadores})', ids)
+            return len(ids)
+
+        movidas = 0
+        try:
+            for _ in range(max_lotes):
+                cantidad = escribir(self.db_path, operacion)
+                movidas += cantidad
+                if cantidad < tamano_lote:
+                    break
+            return {"success": True, "movidas": movidas}
 
-        return [
-            {
-                "estado_corte": r[0],
-                "estado_costura": r[1],
-                "total_ordenes": r[2],
-                "total_pago_corte": r[3],
-                "total_pago_costura": r[4],
-                "cortador": r[5],
-                "costurero": r[6]
-            } for r in reporte
-        ]
-
-    def verificar_materiales_bajos(self):
-        """Verificar materiales con stock bajo"""
-        conn = sqlite3.connect(self.db_path)
+        except Exception as e:
+            return {"success": False, "error": str(e), "movidas": movidas}
+
+    def obtener_estado_particion(self):
+        """Órdenes en la tabla caliente (abiertas y por mover) y en la histórica"""
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT id_material, nombre, stock_actual, stock_minimo, unidad_medida
-            FROM materiales
-            WHERE stock_actual <= stock_minimo
-            AND estado = 'activo'
-            ORDER BY (stock_actual - stock_minimo) ASC
+        cursor.execute(f'''
+            SELECT COUNT(*), COALESCE(SUM(CASE WHEN {ORDEN_LIQUIDADA} THEN 1 ELSE 0 END), 0)
+            FROM produccion
         ''')
-
-        materiales = cursor.fetchall()
+        calientes, por_mover = cursor.fetchone()
+        cursor.execute('SELECT COUNT(*) FROM produccion_historica')
+        historicas = cursor.fetchone()[0]
         conn.close()
 
-        return [
-            {
-                "id_material": m[0],
-                "nombre": m[1],
-                "stock_actual": m[2],
-                "stock_minimo": m[3],
-                "unidad_medida": m[4],
-                "diferencia": m[3] - m[2]
-            } for m in materiales
-        ]
+        return {
+            "calientes": calientes,
+            "abiertas": calientes - por_mover,
+            "liquidadas_por_mover": por_mover,
+            "historicas": historicas
+        }
 
 # Ejemplo de uso
 if __name__ == "__main__":
@@ -604,7 +506,7 @@ if __name__ == "__main__":
     # Verificar tareas pendientes
     print("Tareas pendientes del cortador:")
     tareas = sistema.obtener_tareas_pendientes_empleado(cortador["codigo_acceso"])
-    print(json.dumps(tareas, indent=2, default=str))
+    print(json.dumps(a_json(tareas), indent=2, default=str))
 
     # Verificar materiales bajos
     print("Materiales con stock bajo:")
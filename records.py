@@ -0,0 +1,112 @@
+# Registros Tipados de las Consultas - Julia Confecciones
+#
+# Las lecturas devuelven registros de un tipo por entidad en vez de tuplas
+# leídas por posición (t[0]..t[13]) o dicts armados a mano por fila. Un
+# registro es una namedtuple sin __dict__ (__slots__ = ()): una tupla por
+# fila, y sus campos definen también la proyección del SELECT, así consulta
+# y registro no pueden desalinearse cuando cambian las columnas.
+#
+#   Cliente = tipo_registro("Cliente", "id_cliente rut nombre nivel_cliente")
+#   cursor.execute(f"SELECT {Cliente.proyeccion('c')} FROM clientes c WHERE ...")
+#   clientes = Cliente.de_filas(cursor.fetchall())
+#
+# Para los llamadores que leían dicts, un registro acepta también
+# registro["campo"], .get() y .keys() (dict(registro) funciona).
+#
+# JSON: una namedtuple se serializa como lista, así que las respuestas pasan
+# por a_json(), que la convierte en objeto. Con columnas=True los listados
+# van como {"columnas": [...], "filas": [[...], ...]}: las filas se
+# serializan tal cual, sin armar un dict por fila.
+
+from collections import namedtuple
+import sys
+
+
+def _getitem(self, clave):
+    if clave.__class__ is str:
+        try:
+            return getattr(self, clave)
+        except AttributeError:
+            raise KeyError(clave) from None
+    return tuple.__getitem__(self, clave)
+
+
+def _get(self, clave, defecto=None):
+    return getattr(self, clave, defecto) if clave in self._fields else defecto
+
+
+def _keys(self):
+    return self._fields
+
+
+def _contains(self, clave):
+    # Como en un dict: `"campo" in registro` pregunta por el campo
+    return clave in self._fields if clave.__class__ is str else tuple.__contains__(self, clave)
+
+
+@classmethod
+def _de_filas(cls, filas):
+    return list(map(cls._make, filas))
+
+
+@classmethod
+def _de_fila(cls, fila):
+    return cls._make(fila) if fila is not None else None
+
+
+@classmethod
+def _fabrica(cls, cursor, fila):
+    return cls._make(fila)
+
+
+@classmethod
+def _proyeccion(cls, alias=None, **expresiones):
+    """Columnas del SELECT en el orden de los campos
+
+    Cada campo sale de `alias.campo` salvo los dados en `expresiones`
+    (campo="expresión SQL"), que se proyectan como `expresión AS campo`.
+    """
+    desconocidos = set(expresiones) - set(cls._fields)
+    if desconocidos:
+        raise ValueError(f"{cls.__name__} no tiene los campos {sorted(desconocidos)}")
+    prefijo = f"{alias}." if alias else ""
+    return ", ".join(f"{expresiones[c]} AS {c}" if c in expresiones else f"{prefijo}{c}"
+                     for c in cls._fields)
+
+
+def tipo_registro(nombre, campos):
+    """Crear el tipo de registro `nombre` con los `campos` dados (como namedtuple)"""
+    modulo = sys._getframe(1).f_globals.get("__name__", __name__)
+    base = namedtuple(nombre, campos, module=modulo)
+    return type(nombre, (base,), {
+        "__slots__": (),
+        "__module__": modulo,
+        "__getitem__": _getitem,
+        "__contains__": _contains,
+        "get": _get,
+        "keys": _keys,
+        "a_dict": base._asdict,
+        "de_filas": _de_filas,
+        "de_fila": _de_fila,
+        "fabrica": _fabrica,
+        "proyeccion": _proyeccion,
+    })
+
+
+def es_registro(valor):
+    return isinstance(valor, tuple) and hasattr(valor, "proyeccion")
+
+
+def a_json(valor, columnas=False):
+    """Valor listo para json.dumps: registros como objetos (o columnas + filas)"""
+    if isinstance(valor, dict):
+        return {clave: a_json(v, columnas) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        if valor and es_registro(valor[0]):
+            if columnas and all(type(v) is type(valor[0]) for v in valor):
+                return {"columnas": valor[0]._fields, "filas": valor}
+            return [dict(zip(v._fields, v)) for v in valor]
+        return [a_json(v, columnas) for v in valor]
+    if es_registro(valor):
+        return dict(zip(valor._fields, valor))
+    return valor
@@ -0,0 +1,233 @@
+# Programador de Vencimiento de Reservas - Julia Confecciones
+
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime
+
+from database import conectar
+from metrics import registro
+from reservation_system_implementation import ReservationSystem
+
+logger = logging.getLogger("julia.reservas")
+
+
+def parsear_fecha(valor):
+    """Convertir fecha_vencimiento (texto SQLite o datetime) a datetime"""
+    if isinstance(valor, datetime):
+        return valor
+    if not valor:
+        return None
+    try:
+        return datetime.fromisoformat(str(valor))
+    except ValueError:
+        return None
+
+
+class ReservationExpiryScheduler:
+    """Expira reservas pendientes cerca de su vencimiento usando una cola por fecha
+
+    Mantiene un min-heap (fecha_vencimiento, id_reserva) con las reservas
+    pendientes. Las reservas nuevas entran por `programar` (crear_reserva lo
+    llama automáticamente) o por un sondeo incremental por id_reserva, de modo
+    que nunca se recorre la tabla completa después de la carga inicial. La
+    marca del sondeo solo avanza con lo que leyó el sondeo: una reserva
+    programada en este proceso no salta las de otros procesos con id menor.
+    """
+
+    def __init__(self, sistema_reservas, tamano_lote=50, intervalo_maximo=5.0,
+                 intervalo_sondeo=30.0):
+        if isinstance(sistema_reservas, str):
+            sistema_reservas = ReservationSystem(sistema_reservas)
+
+        self.sistema = sistema_reservas
+        self.db_path = sistema_reservas.db_path
+        self.tamano_lote = tamano_lote
+        self.intervalo_maximo = intervalo_maximo
+        self.intervalo_sondeo = intervalo_sondeo
+
+        self._cola = []
+        self._programadas = set()
+        self._ultimo_id = 0
+        self._ultimo_sondeo = 0.0
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+
+        self.metricas = {
+            "reservas_en_cola": 0,
+            "reservas_expiradas": 0,
+            "cupones_liberados": 0,
+            "lotes_ejecutados": 0,
+            "errores": 0,
+            "ultimo_retraso_segundos": 0.0,
+            "retraso_maximo_segundos": 0.0,
+            "ultima_ejecucion": None
+        }
+
+        sistema_reservas.programador_vencimientos = self
+        registro.registrar_colector("vencimiento_reservas", self._colector_metricas)
+
+    def cargar_pendientes(self):
+        """Cargar en la cola las reservas pendientes nuevas desde el último id visto"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id_reserva, fecha_vencimiento FROM reservas
+            WHERE id_reserva > ? AND estado = 'pendiente'
+            ORDER BY id_reserva
+        ''', (self._ultimo_id,))
+
+        pendientes = cursor.fetchall()
+        conn.close()
+
+        for id_reserva, fecha_vencimiento in pendientes:
+            self.programar(id_reserva, fecha_vencimiento)
+        if pendientes:
+            with self._lock:
+                self._ultimo_id = max(self._ultimo_id, pendientes[-1][0])
+
+        self._ultimo_sondeo = time.monotonic()
+        return len(pendientes)
+
+    def programar(self, id_reserva, fecha_vencimiento):
+        """Agregar una reserva a la cola de vencimientos"""
+        vencimiento = parsear_fecha(fecha_vencimiento)
+        if vencimiento is None:
+            return False
+
+        with self._lock:
+            if id_reserva in self._programadas:
+                return False
+            heapq.heappush(self._cola, (vencimiento, id_reserva))
+            self._programadas.add(id_reserva)
+            self.metricas["reservas_en_cola"] = len(self._cola)
+
+        self._despertar.set()
+        return True
+
+    def procesar_vencidas(self, ahora=None):
+        """Expirar en lotes las reservas cuyo vencimiento ya pasó"""
+        ahora = ahora or datetime.now()
+        total_canceladas = 0
+
+        while True:
+            with self._lock:
+                lote = []
+                while self._cola and self._cola[0][0] <= ahora and len(lote) < self.tamano_lote:
+                    lote.append(heapq.heappop(self._cola))
+                for _, id_reserva in lote:
+                    self._programadas.discard(id_reserva)
+                self.metricas["reservas_en_cola"] = len(self._cola)
+
+            if not lote:
+                break
+
+            resultado = self.sistema.expirar_reservas([r[1] for r in lote], ahora)
+
+            if not resultado["success"]:
+                # Reintentar en la próxima vuelta
+                with self._lock:
+                    for vencimiento, id_reserva in lote:
+                        heapq.heappush(self._cola, (vencimiento, id_reserva))
+                        self._programadas.add(id_reserva)
+                    self.metricas["reservas_en_cola"] = len(self._cola)
+                self.metricas["errores"] += 1
+                break
+
+            retraso = (datetime.now() - lote[0][0]).total_seconds()
+            total_canceladas += resultado["reservas_canceladas"]
+            self.metricas["reservas_expiradas"] += resultado["reservas_canceladas"]
+            self.metricas["cupones_liberados"] += resultado["cupones_liberados"]
+            self.metricas["lotes_ejecutados"] += 1
+            self.metricas["ultimo_retraso_segundos"] = retraso
+            self.metricas["retraso_maximo_segundos"] = max(
+                self.metricas["retraso_maximo_segundos"], retraso)
+
+        self.metricas["ultima_ejecucion"] = datetime.now().isoformat()
+        return {"reservas_canceladas": total_canceladas}
+
+    def segundos_hasta_proximo(self):
+        """Segundos hasta el próximo vencimiento (acotado por intervalo_maximo)"""
+        with self._lock:
+            if not self._cola:
+                return self.intervalo_maximo
+            espera = (self._cola[0][0] - datetime.now()).total_seconds()
+        return max(0.0, min(espera, self.intervalo_maximo))
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            try:
+                if time.monotonic() - self._ultimo_sondeo >= self.intervalo_sondeo:
+                    self.cargar_pendientes()
+                self.procesar_vencidas()
+            except Exception as e:
+                self.metricas["errores"] += 1
+                logger.error("Error en programador de vencimientos: %s", e)
+
+            self._despertar.wait(self.segundos_hasta_proximo())
+            self._despertar.clear()
+
+    def iniciar(self):
+        """Iniciar el hilo de vencimientos en segundo plano"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self.cargar_pendientes()
+        self._hilo = threading.Thread(target=self._ejecutar, daemon=True,
+                                      name="vencimiento-reservas")
+        self._hilo.start()
+
+    def detener(self, timeout=5.0):
+        """Detener el hilo de vencimientos"""
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def obtener_metricas(self):
+        """Obtener métricas del programador"""
+        with self._lock:
+            metricas = dict(self.metricas)
+            metricas["reservas_en_cola"] = len(self._cola)
+            metricas["proximo_vencimiento"] = (
+                self._cola[0][0].isoformat() if self._cola else None)
+        metricas["activo"] = bool(self._hilo and self._hilo.is_alive())
+        return metricas
+
+    def _colector_metricas(self):
+        """Métricas del programador para metrics.registro"""
+        metricas = self.obtener_metricas()
+        return [
+            ("julia_reservas_vencimiento_en_cola", "gauge",
+             "Reservas pendientes en la cola de vencimiento",
+             [({}, metricas["reservas_en_cola"])]),
+            ("julia_reservas_expiradas_total", "counter",
+             "Reservas canceladas por vencimiento",
+             [({}, metricas["reservas_expiradas"])]),
+            ("julia_reservas_cupones_liberados_total", "counter",
+             "Usos de cupón devueltos por reservas vencidas",
+             [({}, metricas["cupones_liberados"])]),
+            ("julia_reservas_vencimiento_retraso_segundos", "gauge",
+             "Retraso del último lote respecto del vencimiento",
+             [({"tipo": "ultimo"}, metricas["ultimo_retraso_segundos"]),
+              ({"tipo": "maximo"}, metricas["retraso_maximo_segundos"])]),
+            ("julia_reservas_vencimiento_activo", "gauge",
+             "1 si el hilo de vencimientos está corriendo",
+             [({}, int(metricas["activo"]))]),
+        ]
+
+
+# Ejemplo de uso
+if __name__ == "__main__":
+    sistema = ReservationSystem("julia_confecciones.db")
+    programador = ReservationExpiryScheduler(sistema)
+    programador.iniciar()
+
+    print("Métricas del programador:", programador.obtener_metricas())
+    time.sleep(1)
+    programador.detener()
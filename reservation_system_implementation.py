@@ -6,85 +6,32 @@ import hashlib
 import random
 import string
 
+from pagination import consultar_pagina
+from records import tipo_registro
+from database import conectar
+from schema import asegurar_esquema
+from sqlite_writer import escribir
+from sql_instrumentation import instrumentar_clase
+
+Cupon = tipo_registro("Cupon", "tipo_descuento valor_descuento tipo_cupon")
+Cliente = tipo_registro("Cliente", "id_cliente rut nombre email celular tipo_cliente total_compras "
+                                   "descuento_frecuente")
+ReservaActiva = tipo_registro("ReservaActiva", "id_reserva cliente monto_total monto_reserva monto_pendiente "
+                                               "estado fecha_vencimiento")
+Reserva = tipo_registro("Reserva", "id_reserva id_cliente cliente id_producto fecha_reserva fecha_vencimiento "
+                                   "monto_total monto_reserva monto_pendiente estado")
+
+@instrumentar_clase
 class ReservationSystem:
     def __init__(self, db_path):
         self.db_path = db_path
+        # Programador de vencimientos opcional (ver reservation_expiry_scheduler)
+        self.programador_vencimientos = None
         self.init_database()
 
     def init_database(self):
         """Inicializar la base de datos con el esquema de reservas"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Tabla de Clientes
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clientes (
-                id_cliente INTEGER PRIMARY KEY AUTOINCREMENT,
-                rut TEXT UNIQUE,
-                nombre TEXT,
-                email TEXT,
-                celular TEXT,
-                direccion TEXT,
-                tipo_cliente TEXT DEFAULT 'regular',
-                fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP,
-                ultima_compra DATETIME,
-                total_compras REAL DEFAULT 0,
-                descuento_frecuente REAL DEFAULT 0,
-                estado TEXT DEFAULT 'activo'
-            )
-        ''')
-
-        # Tabla de Reservas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reservas (
-                id_reserva INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_cliente INTEGER,
-                id_producto INTEGER,
-                fecha_reserva DATETIME DEFAULT CURRENT_TIMESTAMP,
-                fecha_vencimiento DATETIME,
-                monto_total REAL,
-                monto_reserva REAL,
-                monto_pendiente REAL,
-                estado TEXT DEFAULT 'pendiente',
-                codigo_cupon TEXT,
-                descuento_aplicado REAL,
-                notas TEXT,
-                FOREIGN KEY (id_cliente) REFERENCES clientes (id_cliente)
-            )
-        ''')
-
-        # Tabla de Pagos de Reservas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS pagos_reservas (
-                id_pago INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_reserva INTEGER,
-                monto REAL,
-                metodo_pago TEXT,
-                fecha_pago DATETIME DEFAULT CURRENT_TIMESTAMP,
-                comprobante TEXT,
-                estado TEXT DEFAULT 'confirmado',
-                FOREIGN KEY (id_reserva) REFERENCES reservas (id_reserva)
-            )
-        ''')
-
-        # Tabla de Cupones
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cupones (
-                id_cupon INTEGER PRIMARY KEY AUTOINCREMENT,
-                codigo TEXT UNIQUE,
-                tipo_descuento TEXT,
-                valor_descuento REAL,
-                tipo_cupon TEXT,
-                fecha_inicio DATETIME,
-                fecha_vencimiento DATETIME,
-                usos_maximos INTEGER,
-                usos_actuales INTEGER DEFAULT 0,
-                estado TEXT DEFAULT 'activo'
-            )
-        ''')
-
-        conn.commit()
-        conn.close()
+        asegurar_esquema(self.db_path)
 
     def generar_codigo_cupon(self, longitud=8):
         """Generar código de cupón aleatorio"""
@@ -93,56 +40,59 @@ class ReservationSystem:
 
     def crear_cliente(self, rut, nombre, email, celular, direccion=""):
         """Crear nuevo cliente"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             cursor.execute('''
                 INSERT INTO clientes (rut, nombre, email, celular, direccion)
                 VALUES (?, ?, ?, ?, ?)
             ''', (rut, nombre, email, celular, direccion))
+            return cursor.lastrowid
 
-            conn.commit()
-            cliente_id = cursor.lastrowid
-            conn.close()
+        try:
+            cliente_id = escribir(self.db_path, operacion)
             return {"success": True, "cliente_id": cliente_id}
         except sqlite3.IntegrityError:
-            conn.close()
             return {"success": False, "error": "RUT ya existe"}
 
     def crear_reserva(self, id_cliente, id_producto, monto_total,
                      porcentaje_reserva=50, codigo_cupon=None, notas=""):
-        """Crear nueva reserva con pago parcial"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Calcular montos
-        monto_reserva = monto_total * (porcentaje_reserva / 100)
-        descuento = 0
+        """Crear nueva reserva con pago parcial
+
+        Todo el flujo (descuento del cliente, validación y canje del cupón e
+        inserción de la reserva) ocurre en una sola operación del escritor
+        único, dentro de su transacción.
+        """
+        def operacion(cursor):
+            descuento = 0
+            cupon_aplicado = False
+
+            # Aplicar cupón si existe: se canjea dentro de la misma transacción
+            # y solo descuenta (y queda en la reserva) si el canje tomó un uso
+            if codigo_cupon:
+                cupon_info = self._consultar_cupon(cursor, codigo_cupon)
+                if cupon_info["valid"]:
+                    cursor.execute('''
+                        UPDATE cupones SET usos_actuales = usos_actuales + 1
+                        WHERE codigo = ? AND usos_actuales < usos_maximos
+                    ''', (codigo_cupon,))
+                    cupon_aplicado = cursor.rowcount == 1
+                if cupon_aplicado:
+                    if cupon_info["tipo"] == "porcentaje":
+                        descuento = monto_total * (cupon_info["valor"] / 100)
+                    else:
+                        descuento = cupon_info["valor"]
+
+            # Aplicar descuento de cliente frecuente
+            descuento_cliente = self._consultar_descuento_cliente(cursor, id_cliente)
+            if descuento_cliente > 0:
+                descuento += monto_total * (descuento_cliente / 100)
+
+            monto_final = max(0, monto_total - descuento)
+            monto_reserva_final = monto_final * (porcentaje_reserva / 100)
+            monto_pendiente = monto_final - monto_reserva_final
+
+            # Fecha de vencimiento (7 días)
+            fecha_vencimiento = datetime.now() + timedelta(days=7)
 
-        # Aplicar cupón si existe
-        if codigo_cupon:
-            cupon_info = self.validar_cupon(codigo_cupon)
-            if cupon_info["valid"]:
-                if cupon_info["tipo"] == "porcentaje":
-                    descuento = monto_total * (cupon_info["valor"] / 100)
-                else:
-                    descuento = cupon_info["valor"]
-
-        # Aplicar descuento de cliente frecuente
-        cliente_info = self.obtener_cliente(id_cliente)
-        if cliente_info and cliente_info["descuento_frecuente"] > 0:
-            descuento_frecuente = monto_total * (cliente_info["descuento_frecuente"] / 100)
-            descuento += descuento_frecuente
-
-        monto_final = max(0, monto_total - descuento)
-        monto_reserva_final = monto_final * (porcentaje_reserva / 100)
-        monto_pendiente = monto_final - monto_reserva_final
-
-        # Fecha de vencimiento (7 días)
-        fecha_vencimiento = datetime.now() + timedelta(days=7)
-
-        try:
             cursor.execute('''
                 INSERT INTO reservas
                 (id_cliente, id_producto, fecha_vencimiento, monto_total,
@@ -151,39 +101,32 @@ class ReservationSystem:
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (id_cliente, id_producto, fecha_vencimiento, monto_total,
                   monto_reserva_final, monto_pendiente, 'pendiente',
-                  codigo_cupon, descuento, notas))
-
-            reserva_id = cursor.lastrowid
-
-            # Si se usó cupón, actualizar usos
-            if codigo_cupon and cupon_info["valid"]:
-                cursor.execute('''
-                    UPDATE cupones SET usos_actuales = usos_actuales + 1
-                    WHERE codigo = ?
-                ''', (codigo_cupon,))
-
-            conn.commit()
-            conn.close()
+                  codigo_cupon if cupon_aplicado else None, descuento, notas))
 
             return {
                 "success": True,
-                "reserva_id": reserva_id,
+                "reserva_id": cursor.lastrowid,
                 "monto_reserva": monto_reserva_final,
                 "monto_pendiente": monto_pendiente,
                 "descuento_total": descuento,
+                "cupon_aplicado": cupon_aplicado,
                 "fecha_vencimiento": fecha_vencimiento
             }
 
+        try:
+            resultado = escribir(self.db_path, operacion)
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
+        if self.programador_vencimientos:
+            self.programador_vencimientos.programar(resultado["reserva_id"],
+                                                    resultado["fecha_vencimiento"])
+
+        return resultado
+
     def registrar_pago_reserva(self, id_reserva, monto, metodo_pago, comprobante=""):
         """Registrar pago de reserva"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        def operacion(cursor):
             # Registrar pago
             cursor.execute('''
                 INSERT INTO pagos_reservas (id_reserva, monto, metodo_pago, comprobante)
@@ -201,152 +144,244 @@ class ReservationSystem:
                 WHERE id_reserva = ?
             ''', (monto, monto, id_reserva))
 
-            conn.commit()
-            conn.close()
+        try:
+            escribir(self.db_path, operacion)
             return {"success": True}
 
         except Exception as e:
-            conn.close()
             return {"success": False, "error": str(e)}
 
     def validar_cupon(self, codigo):
         """Validar cupón de descuento"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
-        cursor.execute('''
-            SELECT * FROM cupones
+        cupon_info = self._consultar_cupon(cursor, codigo)
+        conn.close()
+
+        return cupon_info
+
+    def _consultar_cupon(self, cursor, codigo):
+        """Consultar un cupón vigente usando un cursor existente"""
+        cursor.execute(f'''
+            SELECT {Cupon.proyeccion()} FROM cupones
             WHERE codigo = ? AND estado = 'activo'
             AND fecha_inicio <= datetime('now')
             AND fecha_vencimiento >= datetime('now')
             AND usos_actuales < usos_maximos
         ''', (codigo,))
 
-        cupon = cursor.fetchone()
-        conn.close()
+        cupon = Cupon.de_fila(cursor.fetchone())
 
         if cupon:
             return {
                 "valid": True,
-                "tipo": cupon[2],  # tipo_descuento
-                "valor": cupon[3],  # valor_descuento
-                "tipo_cupon": cupon[4]  # tipo_cupon
+                "tipo": cupon.tipo_descuento,
+                "valor": cupon.valor_descuento,
+                "tipo_cupon": cupon.tipo_cupon
             }
         return {"valid": False}
 
+    def _consultar_descuento_cliente(self, cursor, id_cliente):
+        """Obtener el descuento de cliente frecuente usando un cursor existente"""
+        cursor.execute('''
+            SELECT descuento_frecuente FROM clientes WHERE id_cliente = ?
+        ''', (id_cliente,))
+        result = cursor.fetchone()
+
+        return (result[0] or 0) if result else 0
+
     def obtener_cliente(self, id_cliente):
         """Obtener información del cliente"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
-        cursor.execute('SELECT * FROM clientes WHERE id_cliente = ?', (id_cliente,))
-        cliente = cursor.fetchone()
+        cursor.execute(f'SELECT {Cliente.proyeccion()} FROM clientes WHERE id_cliente = ?', (id_cliente,))
+        cliente = Cliente.de_fila(cursor.fetchone())
         conn.close()
-
-        if cliente:
-            return {
-                "id_cliente": cliente[0],
-                "rut": cliente[1],
-                "nombre": cliente[2],
-                "email": cliente[3],
-                "celular": cliente[4],
-                "tipo_cliente": cliente[5],
-                "total_compras": cliente[8],
-                "descuento_frecuente": cliente[9]
-            }
-        return None
+        return cliente
 
     def actualizar_cliente_frecuente(self, id_cliente):
         """Actualizar a cliente frecuente basado en compras"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Obtener total de compras
-        cursor.execute('SELECT total_compras FROM clientes WHERE id_cliente = ?', (id_cliente,))
-        result = cursor.fetchone()
-
-        if result:
-            total_compras = result[0]
-
-            # Determinar tipo de cliente y descuento
-            if total_compras >= 200000:  # VIP
-                tipo_cliente = 'vip'
-                descuento = 15.0
-            elif total_compras >= 100000:  # Frecuente
-                tipo_cliente = 'frecuente'
-                descuento = 10.0
-            elif total_compras >= 50000:   # Regular con descuento
-                tipo_cliente = 'regular'
-                descuento = 5.0
-            else:
-                tipo_cliente = 'regular'
-                descuento = 0.0
-
-            # Actualizar cliente
-            cursor.execute('''
-                UPDATE clientes
-                SET tipo_cliente = ?, descuento_frecuente = ?
-                WHERE id_cliente = ?
-            ''', (tipo_cliente, descuento, id_cliente))
+        def operacion(cursor):
+            # Obtener total de compras (lectura y escritura en la misma transacción)
+            cursor.execute('SELECT total_compras FROM clientes WHERE id_cliente = ?', (id_cliente,))
+            result = cursor.fetchone()
+
+            if result:
+                total_compras = result[0]
+
+                # Determinar tipo de cliente y descuento
+                if total_compras >= 200000:  # VIP
+                    tipo_cliente = 'vip'
+                    descuento = 15.0
+                elif total_compras >= 100000:  # Frecuente
+                    tipo_cliente = 'frecuente'
+                    descuento = 10.0
+                elif total_compras >= 50000:   # Regular con descuento
+                    tipo_cliente = 'regular'
+                    descuento = 5.0
+                else:
+                    tipo_cliente = 'regular'
+                    descuento = 0.0
 
-            conn.commit()
+                # Actualizar cliente
+                cursor.execute('''
+                    UPDATE clientes
+                    SET tipo_cliente = ?, descuento_frecuente = ?
+                    WHERE id_cliente = ?
+                ''', (tipo_cliente, descuento, id_cliente))
 
-        conn.close()
+        escribir(self.db_path, operacion)
 
     def listar_reservas_activas(self, id_cliente=None):
         """Listar reservas activas"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
+        condiciones = ["r.estado IN ('pendiente', 'confirmada')"]
+        params = []
+
         if id_cliente:
-            cursor.execute('''
-                SELECT r.*, c.nombre
-                FROM reservas r
-                JOIN clientes c ON r.id_cliente = c.id_cliente
-                WHERE r.id_cliente = ? AND r.estado IN ('pendiente', 'confirmada')
-                ORDER BY r.fecha_reserva DESC
-            ''', (id_cliente,))
-        else:
-            cursor.execute('''
-                SELECT r.*, c.nombre
+            condiciones.append("r.id_cliente = ?")
+            params.append(id_cliente)
+
+        cursor.execute(f'''
+            SELECT {ReservaActiva.proyeccion("r", cliente="c.nombre")}
+            FROM reservas r
+            JOIN clientes c ON r.id_cliente = c.id_cliente
+            WHERE {' AND '.join(condiciones)}
+            ORDER BY r.fecha_reserva DESC
+        ''', params)
+
+        reservas = ReservaActiva.de_filas(cursor.fetchall())
+        conn.close()
+        return reservas
+
+    def listar_reservas_paginadas(self, id_cliente=None, estados=('pendiente', 'confirmada'),
+                                  fecha_desde=None, fecha_hasta=None,
+                                  cursor_pagina=None, limite=50):
+        """Listar reservas por páginas (keyset sobre fecha_reserva, id_reserva)"""
+        condiciones = []
+        params = []
+
+        if id_cliente:
+            condiciones.append("r.id_cliente = ?")
+            params.append(id_cliente)
+        if estados:
+            condiciones.append(f"r.estado IN ({', '.join('?' for _ in estados)})")
+            params.extend(estados)
+        if fecha_desde:
+            condiciones.append("r.fecha_reserva >= ?")
+            params.append(fecha_desde)
+        if fecha_hasta:
+            condiciones.append("r.fecha_reserva <= ?")
+            params.append(fecha_hasta)
+
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+
+        try:
+            pagina = consultar_pagina(
+                cursor,
+                f'''
+                SELECT {Reserva.proyeccion("r", cliente="c.nombre")}
                 FROM reservas r
                 JOIN clientes c ON r.id_cliente = c.id_cliente
-                WHERE r.estado IN ('pendiente', 'confirmada')
-                ORDER BY r.fecha_reserva DESC
-            ''')
+                ''',
+                condiciones, params,
+                ("r.fecha_reserva", "r.id_reserva"), ("fecha_reserva", "id_reserva"),
+                cursor_pagina=cursor_pagina, limite=limite, tipo=Reserva
+            )
+        except ValueError as e:
+            conn.close()
+            return {"success": False, "error": str(e)}
 
-        reservas = cursor.fetchall()
         conn.close()
+        return {"success": True, **pagina}
 
-        return [
-            {
-                "id_reserva": r[0],
-                "cliente": r[11],
-                "monto_total": r[4],
-                "monto_reserva": r[5],
-                "monto_pendiente": r[6],
-                "estado": r[7],
-                "fecha_vencimiento": r[3]
-            } for r in reservas
-        ]
-
-    def verificar_reservas_vencidas(self):
-        """Verificar y actualizar reservas vencidas"""
-        conn = sqlite3.connect(self.db_path)
+    def verificar_reservas_vencidas(self, desde=None):
+        """Verificar y actualizar reservas vencidas
+
+        Con `desde` (el "hasta" de la corrida anterior) solo revisa las que
+        vencieron después, sobre idx_reservas_estado_vencimiento.
+        """
+        ahora = datetime.now()
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
-        cursor.execute('''
-            UPDATE reservas
-            SET estado = 'cancelada'
-            WHERE estado = 'pendiente'
-            AND fecha_vencimiento < datetime('now')
-        ''')
-
-        count = cursor.rowcount
-        conn.commit()
+        # fecha_vencimiento se guarda desde un datetime local de Python, por lo
+        # que se compara contra un datetime del mismo formato y no contra
+        # datetime('now') (UTC, sin microsegundos)
+        if desde is None:
+            cursor.execute('''
+                SELECT id_reserva FROM reservas
+                WHERE estado = 'pendiente'
+                AND fecha_vencimiento < ?
+            ''', (ahora,))
+        else:
+            cursor.execute('''
+                SELECT id_reserva FROM reservas
+                WHERE estado = 'pendiente'
+                AND fecha_vencimiento >= ? AND fecha_vencimiento < ?
+            ''', (desde, ahora))
+
+        ids_reservas = [r[0] for r in cursor.fetchall()]
         conn.close()
 
-        return {"reservas_canceladas": count}
+        resultado = self.expirar_reservas(ids_reservas, ahora)
+        return {"success": resultado["success"], "error": resultado.get("error"),
+                "reservas_canceladas": resultado["reservas_canceladas"], "hasta": ahora}
+
+    def expirar_reservas(self, ids_reservas, fecha_corte=None):
+        """Cancelar un lote de reservas vencidas y liberar sus cupones"""
+        if not ids_reservas:
+            return {"success": True, "reservas_canceladas": 0, "cupones_liberados": 0}
+
+        fecha_corte = fecha_corte or datetime.now()
+        marcadores = ', '.join('?' for _ in ids_reservas)
+
+        def operacion(cursor):
+            # Solo las que siguen pendientes: una reserva pagada no se cancela
+            cursor.execute(f'''
+                SELECT id_reserva, codigo_cupon FROM reservas
+                WHERE id_reserva IN ({marcadores})
+                AND estado = 'pendiente'
+                AND fecha_vencimiento <= ?
+            ''', (*ids_reservas, fecha_corte))
+
+            vencidas = cursor.fetchall()
+            ids_vencidas = [v[0] for v in vencidas]
+
+            if ids_vencidas:
+                cursor.execute(f'''
+                    UPDATE reservas SET estado = 'cancelada'
+                    WHERE id_reserva IN ({', '.join('?' for _ in ids_vencidas)})
+                ''', ids_vencidas)
+
+            # Devolver los usos de cupón consumidos por las reservas canceladas
+            # (codigo_cupon solo queda en las reservas que canjearon un uso)
+            cupones = [(v[1],) for v in vencidas if v[1]]
+            cupones_liberados = 0
+            if cupones:
+                cursor.executemany('''
+                    UPDATE cupones SET usos_actuales = usos_actuales - 1
+                    WHERE codigo = ? AND usos_actuales > 0
+                ''', cupones)
+                cupones_liberados = cursor.rowcount
+
+            return {
+                "success": True,
+                "reservas_canceladas": len(ids_vencidas),
+                "cupones_liberados": cupones_liberados
+            }
+
+        try:
+            return escribir(self.db_path, operacion)
+
+        except Exception as e:
+            return {"success": False, "error": str(e),
+                    "reservas_canceladas": 0, "cupones_liberados": 0}
 
 # Ejemplo de uso
 if __name__ == "__main__":
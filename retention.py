@@ -0,0 +1,287 @@
+# Retención y Archivo de Tablas de Registro - Julia Confecciones
+#
+# Las tablas de registro (actividad, notificaciones, seguimiento) crecen sin
+# límite. Según la política de cada tabla, las filas más antiguas pasan a una
+# base de archivo adjunta (ATTACH) en lotes acotados:
+#
+#   1. INSERT OR IGNORE del lote en archivo.<tabla> (transacción propia)
+#   2. DELETE del mismo lote en la base principal (BEGIN IMMEDIATE corto)
+#
+# Con WAL, SQLite no garantiza atomicidad entre bases adjuntas; por eso son
+# dos pasos idempotentes: si el proceso cae entre ambos, el lote queda en las
+# dos bases y la próxima corrida solo completa el borrado.
+#
+# Las sesiones del portal expiran tras SESION_INACTIVIDAD_HORAS sin uso; las
+# expiradas o cerradas se eliminan (no se archivan).
+#
+# `historial()` consulta una tabla uniendo las filas vigentes y las archivadas.
+#
+# Uso:
+#   python retention.py --db julia_confecciones.db [--estado]
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from database import conectar, con_reintentos, es_postgres
+from metrics import registro
+from schema import asegurar_esquema
+
+logger = logging.getLogger("julia.retencion")
+
+TAMANO_LOTE = int(os.getenv("JULIA_RETENCION_LOTE", "1000"))
+MAX_LOTES = int(os.getenv("JULIA_RETENCION_MAX_LOTES", "200"))
+PAUSA_S = float(os.getenv("JULIA_RETENCION_PAUSA_MS", "20")) / 1000
+SESION_INACTIVIDAD_HORAS = int(os.getenv("JULIA_SESION_INACTIVIDAD_HORAS", "12"))
+
+# tabla: (clave primaria, columna de fecha, días que se conservan en caliente)
+POLITICAS = {
+    "registro_actividad": ("id_registro", "fecha_actividad",
+                           int(os.getenv("JULIA_RETENCION_ACTIVIDAD_DIAS", "90"))),
+    "notificaciones_produccion": ("id_notificacion", "fecha_envio",
+                                  int(os.getenv("JULIA_RETENCION_NOTIFICACIONES_DIAS", "90"))),
+    "seguimiento_produccion": ("id_seguimiento", "fecha_acceso",
+                               int(os.getenv("JULIA_RETENCION_SEGUIMIENTO_DIAS", "365"))),
+}
+
+_filas = registro.contador(
+    "julia_retencion_filas_total", "Filas archivadas o purgadas por la retención", ("tabla", "accion"))
+
+
+def ruta_archivo(db_path):
+    """Base de archivo de db_path (JULIA_ARCHIVO_DB o <base>_archivo.db)"""
+    return os.getenv("JULIA_ARCHIVO_DB") or os.path.splitext(db_path)[0] + "_archivo.db"
+
+
+def _corte(dias=0, horas=0):
+    # Las columnas de fecha se llenan con CURRENT_TIMESTAMP / datetime('now'): UTC
+    momento = datetime.now(timezone.utc) - timedelta(days=dias, hours=horas)
+    return momento.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _columnas(cursor, esquema, tabla):
+    cursor.execute(f"PRAGMA {esquema}.table_info({tabla})")
+    return [(c[1], c[2] or "TEXT") for c in cursor.fetchall()]
+
+
+def _transaccion(conn, funcion, inmediata=False):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE" if inmediata else "BEGIN")
+        resultado = funcion(cursor)
+        cursor.execute("COMMIT")
+        return resultado
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+class MotorRetencion:
+    """Archiva por lotes las filas antiguas y purga las sesiones expiradas"""
+
+    def __init__(self, db_path, archivo=None, politicas=None, tamano_lote=TAMANO_LOTE,
+                 max_lotes=MAX_LOTES):
+        if es_postgres(db_path):
+            raise ValueError("El archivo usa ATTACH de SQLite; en PostgreSQL particione las tablas")
+        asegurar_esquema(db_path)
+        self.db_path = db_path
+        self.archivo = archivo or ruta_archivo(db_path)
+        self.politicas = POLITICAS if politicas is None else politicas
+        self.tamano_lote = tamano_lote
+        self.max_lotes = max_lotes
+
+    def _conectar(self):
+        conn = conectar(self.db_path, isolation_level=None)
+        conn.execute("ATTACH DATABASE ? AS archivo", (self.archivo,))
+        return conn
+
+    def _preparar_archivo(self, cursor, tabla, clave, fecha):
+        """Crear archivo.<tabla> con las columnas actuales de la tabla principal"""
+        columnas = _columnas(cursor, "main", tabla)
+        archivadas = dict(_columnas(cursor, "archivo", tabla))
+        if not archivadas:
+            definiciones = [f"{nombre} {tipo}" for nombre, tipo in columnas]
+            definiciones.append(f"PRIMARY KEY ({clave})")
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS archivo.{tabla} ({', '.join(definiciones)})")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS archivo.idx_{tabla}_fecha ON {tabla} ({fecha})")
+        else:
+            # Columnas agregadas por migraciones posteriores al primer archivado
+            for nombre, tipo in columnas:
+                if nombre not in archivadas:
+                    cursor.execute(f"ALTER TABLE archivo.{tabla} ADD COLUMN {nombre} {tipo}")
+        return [nombre for nombre, _ in columnas]
+
+    def archivar_tabla(self, tabla):
+        """Mover a la base de archivo las filas de `tabla` más antiguas que su política"""
+        clave, fecha, dias = self.politicas[tabla]
+        corte = _corte(dias=dias)
+        conn = self._conectar()
+        movidas = 0
+        try:
+            columnas = _transaccion(conn, lambda c: self._preparar_archivo(c, tabla, clave, fecha))
+            lista = ", ".join(columnas)
+            cursor = conn.cursor()
+
+            for _ in range(self.max_lotes):
+                cursor.execute(f'''
+                    SELECT {clave} FROM main.{tabla}
+                    WHERE {fecha} < ?
+                    ORDER BY {fecha}, {clave}
+                    LIMIT ?
+                ''', (corte, self.tamano_lote))
+                ids = [f[0] for f in cursor.fetchall()]
+                if not ids:
+                    break
+                marcadores = ", ".join("?" for _ in ids)
+
+                con_reintentos(lambda: _transaccion(conn, lambda c: c.execute(f'''
+                    INSERT OR IGNORE INTO archivo.{tabla} ({lista})
+                    SELECT {lista} FROM main.{tabla} WHERE {clave} IN ({marcadores})
+                ''', ids)), "retencion")
+                con_reintentos(lambda: _transaccion(conn, lambda c: c.execute(f'''
+                    DELETE FROM main.{tabla} WHERE {clave} IN ({marcadores})
+                ''', ids), inmediata=True), "retencion")
+
+                movidas += len(ids)
+                _filas.inc(len(ids), tabla=tabla, accion="archivada")
+                if len(ids) < self.tamano_lote:
+                    break
+                # Deja pasar al escritor único entre lotes
+                time.sleep(PAUSA_S)
+        finally:
+            conn.close()
+
+        if movidas:
+            logger.info("Retención: %d filas de %s archivadas (anteriores a %s)", movidas, tabla, corte)
+        return movidas
+
+    def purgar_sesiones(self):
+        """Eliminar las sesiones cerradas o sin uso por más de SESION_INACTIVIDAD_HORAS"""
+        corte = _corte(horas=SESION_INACTIVIDAD_HORAS)
+        conn = conectar(self.db_path, isolation_level=None)
+        purgadas = 0
+        try:
+            for _ in range(self.max_lotes):
+                cantidad = con_reintentos(lambda: _transaccion(conn, lambda c: c.execute('''
+                    DELETE FROM sesiones_empleados WHERE id_sesion IN (
+                        SELECT id_sesion FROM sesiones_empleados
+                        WHERE estado != 'activa'
+                        OR COALESCE(fecha_ultimo_acceso, fecha_inicio) < ?
+                        LIMIT ?)
+                ''', (corte, self.tamano_lote)).rowcount, inmediata=True), "retencion")
+                purgadas += cantidad
+                if cantidad < self.tamano_lote:
+                    break
+                time.sleep(PAUSA_S)
+        finally:
+            conn.close()
+
+        _filas.inc(purgadas, tabla="sesiones_empleados", accion="purgada")
+        return purgadas
+
+    def ejecutar(self):
+        """Purgar sesiones y archivar todas las tablas con política"""
+        try:
+            resultado = {"success": True, "sesiones_purgadas": self.purgar_sesiones(), "archivadas": {}}
+            for tabla in self.politicas:
+                resultado["archivadas"][tabla] = self.archivar_tabla(tabla)
+            return resultado
+
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def obtener_estado(self):
+        """Filas en caliente y archivadas por tabla"""
+        conn = self._conectar()
+        cursor = conn.cursor()
+        estado = {}
+        for tabla, (clave, fecha, dias) in self.politicas.items():
+            cursor.execute(f"SELECT COUNT(*), MIN({fecha}) FROM main.{tabla}")
+            vigentes, mas_antigua = cursor.fetchone()
+            archivadas = 0
+            if _columnas(cursor, "archivo", tabla):
+                cursor.execute(f"SELECT COUNT(*) FROM archivo.{tabla}")
+                archivadas = cursor.fetchone()[0]
+            estado[tabla] = {"dias_en_caliente": dias, "vigentes": vigentes,
+                             "archivadas": archivadas, "mas_antigua_vigente": mas_antigua}
+        cursor.execute("SELECT COUNT(*) FROM sesiones_empleados")
+        estado["sesiones_empleados"] = {"vigentes": cursor.fetchone()[0],
+                                        "horas_inactividad": SESION_INACTIVIDAD_HORAS}
+        conn.close()
+        return estado
+
+
+def historial(db_path, tabla, filtros=None, desde=None, hasta=None, limite=100,
+              incluir_archivo=True, archivo=None):
+    """Filas de `tabla` vigentes y archivadas, de la más reciente a la más antigua
+
+    Cada fila trae "archivada": True si viene de la base de archivo.
+    """
+    clave, fecha, _ = POLITICAS[tabla]
+    filtros = filtros or {}
+    archivo = archivo or ruta_archivo(db_path)
+
+    conn = conectar(db_path)
+    cursor = conn.cursor()
+    columnas = [nombre for nombre, _ in _columnas(cursor, "main", tabla)]
+    desconocidas = set(filtros) - set(columnas)
+    if desconocidas:
+        conn.close()
+        raise ValueError(f"Columnas desconocidas en {tabla}: {', '.join(sorted(desconocidas))}")
+
+    condiciones = [f"{columna} = ?" for columna in filtros]
+    params = list(filtros.values())
+    if desde:
+        condiciones.append(f"{fecha} >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append(f"{fecha} < ?")
+        params.append(hasta)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    lista = ", ".join(columnas)
+
+    partes = [f"SELECT {lista}, 0 AS archivada FROM main.{tabla} {where}"]
+    consulta_params = list(params)
+    if incluir_archivo and os.path.exists(archivo):
+        cursor.execute("ATTACH DATABASE ? AS archivo", (archivo,))
+        if _columnas(cursor, "archivo", tabla):
+            columnas_archivo = {nombre for nombre, _ in _columnas(cursor, "archivo", tabla)}
+            seleccion = ", ".join(c if c in columnas_archivo else f"NULL AS {c}" for c in columnas)
+            partes.append(f"SELECT {seleccion}, 1 AS archivada FROM archivo.{tabla} {where}")
+            consulta_params += params
+
+    cursor.execute(f'''
+        SELECT * FROM ({" UNION ALL ".join(partes)})
+        ORDER BY {fecha} DESC, {clave} DESC
+        LIMIT ?
+    ''', (*consulta_params, limite))
+    filas = cursor.fetchall()
+    conn.close()
+
+    return [dict(zip(columnas + ["archivada"], f), archivada=bool(f[-1])) for f in filas]
+
+
+def barrer_retencion(db_path, marca):
+    """Barrido para sweep_scheduler: purga y archivado con las políticas vigentes"""
+    resultado = MotorRetencion(db_path).ejecutar()
+    if not resultado["success"]:
+        raise RuntimeError(resultado["error"])
+    filas = resultado["sesiones_purgadas"] + sum(resultado["archivadas"].values())
+    return filas, {"corte": _corte()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retención y archivo de tablas de registro")
+    parser.add_argument("--db", default=os.getenv("JULIA_DB", "julia_confecciones.db"))
+    parser.add_argument("--estado", action="store_true", help="Solo mostrar el estado")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    motor = MotorRetencion(args.db)
+    if not args.estado:
+        print(json.dumps(motor.ejecutar(), indent=2))
+    print(json.dumps(motor.obtener_estado(), indent=2, default=str))
@@ -0,0 +1,921 @@
+# Esquema y Migraciones de la Base de Datos - Julia Confecciones
+#
+# Única definición de las tablas de los cinco sistemas. Cada cambio de esquema
+# es una migración numerada; la última aplicada se guarda en PRAGMA
+# user_version (en PostgreSQL, en la tabla esquema_version). Al arrancar, si
+# la versión de la base coincide con VERSION_ACTUAL no se ejecuta ningún DDL:
+# basta una lectura de user_version por proceso y archivo.
+#
+# Para cambiar el esquema se agrega una migración al final; nunca se edita
+# una ya publicada.
+
+import logging
+import os
+import sqlite3
+import threading
+
+from database import conectar, con_reintentos, es_postgres
+
+logger = logging.getLogger("julia.db")
+
+MIGRACIONES = []
+
+_al_dia = set()
+_lock = threading.Lock()
+
+
+def migracion(version, descripcion):
+    """Registrar funcion(cursor) como la migración `version`"""
+    def registrar(funcion):
+        assert version == len(MIGRACIONES) + 1, "Las migraciones se numeran en orden"
+        MIGRACIONES.append((version, descripcion, funcion))
+        return funcion
+    return registrar
+
+
+def reconstruir_antiguedad_cxp(cursor):
+    """Reconstruir antiguedad_cxp desde cuentas_por_pagar; devuelve las filas"""
+    cursor.execute('DELETE FROM antiguedad_cxp')
+    cursor.execute('''
+        INSERT INTO antiguedad_cxp
+        (id_cuenta, id_proveedor, proveedor, monto, fecha_vencimiento)
+        SELECT cpp.id_cuenta, cpp.id_referencia, pm.nombre, cpp.monto,
+               date(cpp.fecha_vencimiento)
+        FROM cuentas_por_pagar cpp
+        JOIN proveedores_materiales pm ON cpp.id_referencia = pm.id_proveedor
+        WHERE cpp.tipo_cuenta = 'proveedor' AND cpp.estado = 'pendiente'
+        AND cpp.fecha_vencimiento IS NOT NULL
+    ''')
+    return cursor.rowcount
+
+
+def reconstruir_totales_antiguedad(cursor):
+    """Reconstruir antiguedad_cxp_totales desde antiguedad_cxp"""
+    cursor.execute('DELETE FROM antiguedad_cxp_totales')
+    cursor.execute('''
+        INSERT INTO antiguedad_cxp_totales (fecha_vencimiento, cantidad, monto)
+        SELECT fecha_vencimiento, COUNT(*), SUM(monto)
+        FROM antiguedad_cxp
+        WHERE fecha_vencimiento IS NOT NULL
+        GROUP BY fecha_vencimiento
+    ''')
+
+
+def _compras_sin_cuenta(cursor):
+    cursor.execute('''
+        SELECT COUNT(*) FROM compras_proveedores
+        WHERE estado_pago = 'pendiente' AND id_cuenta IS NULL
+    ''')
+    return cursor.fetchone()[0]
+
+
+def vincular_compras_cuentas(cursor):
+    """Enlazar las compras pendientes sin id_cuenta con su cuenta por pagar; devuelve cuántas"""
+    sin_cuenta = _compras_sin_cuenta(cursor)
+    # Compra suelta: su cuenta tiene el mismo proveedor, monto y vencimiento
+    cursor.execute('''
+        UPDATE compras_proveedores
+        SET id_cuenta = (
+            SELECT MIN(cpp.id_cuenta) FROM cuentas_por_pagar cpp
+            WHERE cpp.tipo_cuenta = 'proveedor' AND cpp.estado = 'pendiente'
+            AND cpp.id_referencia = compras_proveedores.id_proveedor
+            AND cpp.monto = compras_proveedores.total
+            AND cpp.fecha_vencimiento = compras_proveedores.fecha_vencimiento
+        )
+        WHERE estado_pago = 'pendiente' AND id_cuenta IS NULL
+    ''')
+    # Factura consolidada (registrar_compras_proveedor_lote): el monto de la
+    # cuenta es la suma de las líneas pendientes del mismo comprobante. SQLite
+    # ve las líneas que este mismo UPDATE ya enlazó y PostgreSQL no, así que se
+    # suman las sin cuenta más las ya enlazadas a la cuenta candidata
+    cursor.execute('''
+        UPDATE compras_proveedores
+        SET id_cuenta = (
+            SELECT MIN(cpp.id_cuenta) FROM cuentas_por_pagar cpp
+            WHERE cpp.tipo_cuenta = 'proveedor' AND cpp.estado = 'pendiente'
+            AND cpp.id_referencia = compras_proveedores.id_proveedor
+            AND cpp.monto = (
+                SELECT SUM(c.total) FROM compras_proveedores c
+                WHERE c.id_proveedor = compras_proveedores.id_proveedor
+                AND c.comprobante = compras_proveedores.comprobante
+                AND c.estado_pago = 'pendiente'
+                AND (c.id_cuenta IS NULL OR c.id_cuenta = cpp.id_cuenta)
+            )
+        )
+        WHERE estado_pago = 'pendiente' AND id_cuenta IS NULL
+    ''')
+    return sin_cuenta - _compras_sin_cuenta(cursor)
+
+
+BENEFICIOS_PREDETERMINADOS = [
+    ('regular', 'descuento', 5.0, '5% de descuento en compras', 'Mínimo $50.000 en compras'),
+    ('frecuente', 'descuento', 10.0, '10% de descuento en compras', 'Mínimo $100.000 en compras'),
+    ('frecuente', 'prioridad', 0, 'Prioridad en producción', 'Mínimo $100.000 en compras'),
+    ('vip', 'descuento', 15.0, '15% de descuento en compras', 'Mínimo $200.000 en compras'),
+    ('vip', 'prioridad', 0, 'Entrega prioritaria', 'Mínimo $200.000 en compras'),
+    ('vip', 'cupon_exclusivo', 20.0, 'Cupón exclusivo 20%', 'Mínimo $200.000 en compras')
+]
+
+
+@migracion(1, "Esquema inicial de los cinco sistemas")
+def _esquema_inicial(cursor):
+    # --- Producción y pagos -------------------------------------------------
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS empleados (
+            id_empleado INTEGER PRIMARY KEY AUTOINCREMENT,
+            rut TEXT UNIQUE,
+            nombre TEXT,
+            email TEXT,
+            celular TEXT,
+            tipo_empleado TEXT,
+            sueldo_fijo REAL,
+            precio_prenda REAL,
+            fecha_contratacion DATE,
+            estado TEXT DEFAULT 'activo',
+            codigo_acceso TEXT UNIQUE
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS materiales (
+            id_material INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT,
+            tipo TEXT,
+            unidad_medida TEXT,
+            stock_actual REAL DEFAULT 0,
+            stock_minimo REAL DEFAULT 0,
+            costo_unitario REAL DEFAULT 0,
+            proveedor TEXT,
+            fecha_ultimo_ingreso DATETIME,
+            estado TEXT DEFAULT 'activo'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS produccion (
+            id_produccion INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_orden INTEGER,
+            tipo_orden TEXT,
+            id_cortador INTEGER,
+            id_costurero INTEGER,
+            fecha_asignacion DATETIME DEFAULT CURRENT_TIMESTAMP,
+            fecha_entrega_corte DATETIME,
+            fecha_entrega_costura DATETIME,
+            estado_corte TEXT DEFAULT 'pendiente',
+            estado_costura TEXT DEFAULT 'pendiente',
+            pago_corte REAL DEFAULT 0,
+            pago_costura REAL DEFAULT 0,
+            estado_pago_corte TEXT DEFAULT 'pendiente',
+            estado_pago_costura TEXT DEFAULT 'pendiente',
+            notas TEXT,
+            FOREIGN KEY (id_cortador) REFERENCES empleados (id_empleado),
+            FOREIGN KEY (id_costurero) REFERENCES empleados (id_empleado)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS detalle_produccion_materiales (
+            id_detalle INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_produccion INTEGER,
+            id_material INTEGER,
+            cantidad_utilizada REAL,
+            fecha_uso DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion),
+            FOREIGN KEY (id_material) REFERENCES materiales (id_material)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS seguimiento_produccion (
+            id_seguimiento INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_produccion INTEGER,
+            id_empleado INTEGER,
+            fecha_acceso DATETIME DEFAULT CURRENT_TIMESTAMP,
+            accion TEXT,
+            notas TEXT,
+            FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion),
+            FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS compras_materiales (
+            id_compra INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_material INTEGER,
+            cantidad_comprada REAL,
+            costo_total REAL,
+            proveedor TEXT,
+            fecha_compra DATETIME DEFAULT CURRENT_TIMESTAMP,
+            fecha_recepcion DATETIME,
+            estado TEXT DEFAULT 'pendiente',
+            comprobante TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS envios_proveedores (
+            id_envio INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo_proveedor TEXT, -- 'cortador', 'costurero'
+            id_proveedor INTEGER,
+            id_produccion INTEGER,
+            fecha_envio DATETIME DEFAULT CURRENT_TIMESTAMP,
+            fecha_recepcion DATETIME,
+            estado_envio TEXT DEFAULT 'enviado',
+            estado_recepcion TEXT DEFAULT 'pendiente',
+            notas TEXT,
+            FOREIGN KEY (id_proveedor) REFERENCES empleados (id_empleado),
+            FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pagos_empleados (
+            id_pago INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_empleado INTEGER,
+            tipo_pago TEXT,
+            monto REAL,
+            cantidad_prendas INTEGER DEFAULT 0,
+            periodo_pago TEXT,
+            fecha_pago DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metodo_pago TEXT,
+            estado TEXT DEFAULT 'pagado',
+            comprobante TEXT,
+            FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS proveedores_materiales (
+            id_proveedor INTEGER PRIMARY KEY AUTOINCREMENT,
+            rut TEXT UNIQUE,
+            nombre TEXT,
+            email TEXT,
+            celular TEXT,
+            direccion TEXT,
+            tipo_material TEXT,
+            forma_pago TEXT,
+            credito_dias INTEGER DEFAULT 0,
+            estado TEXT DEFAULT 'activo'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS compras_proveedores (
+            id_compra INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_proveedor INTEGER,
+            id_material INTEGER,
+            cantidad REAL,
+            precio_unitario REAL,
+            total REAL,
+            fecha_compra DATETIME DEFAULT CURRENT_TIMESTAMP,
+            fecha_pago DATETIME,
+            fecha_vencimiento DATETIME,
+            estado_pago TEXT DEFAULT 'pendiente',
+            metodo_pago TEXT,
+            comprobante TEXT,
+            notas TEXT,
+            FOREIGN KEY (id_proveedor) REFERENCES proveedores_materiales (id_proveedor)
+        )
+    ''')
+
+    # Índices para paginar el reporte de pagos por (fecha_pago, id)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_pagos_empleados_fecha
+        ON pagos_empleados (fecha_pago, id_pago)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_compras_proveedores_fecha_pago
+        ON compras_proveedores (fecha_pago, id_compra)
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cuentas_por_pagar (
+            id_cuenta INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo_cuenta TEXT, -- 'empleado', 'proveedor'
+            id_referencia INTEGER,
+            monto REAL,
+            fecha_vencimiento DATETIME,
+            fecha_pago DATETIME,
+            estado TEXT DEFAULT 'pendiente',
+            prioridad TEXT DEFAULT 'normal',
+            FOREIGN KEY (id_referencia) REFERENCES proveedores_materiales (id_proveedor)
+        )
+    ''')
+
+    # Antigüedad de cuentas por pagar: estado precalculado de las cuentas
+    # abiertas, mantenido al registrar compras y al pagarlas
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'antiguedad_cxp'")
+    antiguedad_existia = cursor.fetchone() is not None
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS antiguedad_cxp (
+            id_cuenta INTEGER PRIMARY KEY,
+            id_proveedor INTEGER,
+            proveedor TEXT,
+            monto REAL,
+            fecha_vencimiento DATE,
+            FOREIGN KEY (id_cuenta) REFERENCES cuentas_por_pagar (id_cuenta)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_antiguedad_cxp_vencimiento
+        ON antiguedad_cxp (fecha_vencimiento)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_antiguedad_cxp_proveedor
+        ON antiguedad_cxp (id_proveedor)
+    ''')
+    if not antiguedad_existia:
+        reconstruir_antiguedad_cxp(cursor)
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resumenes_cxp (
+            fecha DATE PRIMARY KEY,
+            contenido TEXT,
+            fecha_emision DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS configuracion_pagos (
+            id_config INTEGER PRIMARY KEY AUTOINCREMENT,
+            concepto TEXT,
+            tipo_empleado TEXT,
+            tipo_pago TEXT, -- 'fijo', 'variable', 'mixto'
+            valor REAL,
+            periodicidad TEXT, -- 'mensual', 'quincenal', 'semanal', 'por_prenda'
+            condiciones TEXT,
+            estado TEXT DEFAULT 'activo'
+        )
+    ''')
+
+    # --- Clientes, reservas y clientes frecuentes ---------------------------
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clientes (
+            id_cliente INTEGER PRIMARY KEY AUTOINCREMENT,
+            rut TEXT UNIQUE,
+            nombre TEXT,
+            email TEXT,
+            celular TEXT,
+            direccion TEXT,
+            tipo_cliente TEXT DEFAULT 'regular',
+            fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP,
+            ultima_compra DATETIME,
+            total_compras REAL DEFAULT 0,
+            descuento_frecuente REAL DEFAULT 0,
+            estado TEXT DEFAULT 'activo'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reservas (
+            id_reserva INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_cliente INTEGER,
+            id_producto INTEGER,
+            fecha_reserva DATETIME DEFAULT CURRENT_TIMESTAMP,
+            fecha_vencimiento DATETIME,
+            monto_total REAL,
+            monto_reserva REAL,
+            monto_pendiente REAL,
+            estado TEXT DEFAULT 'pendiente',
+            codigo_cupon TEXT,
+            descuento_aplicado REAL,
+            notas TEXT,
+            FOREIGN KEY (id_cliente) REFERENCES clientes (id_cliente)
+        )
+    ''')
+
+    # Reservas pendientes por vencimiento sin recorrer la tabla
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reservas_estado_vencimiento
+        ON reservas (estado, fecha_vencimiento)
+    ''')
+    # Listado paginado por (fecha_reserva, id_reserva)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reservas_fecha
+        ON reservas (fecha_reserva, id_reserva)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reservas_cliente_fecha
+        ON reservas (id_cliente, fecha_reserva, id_reserva)
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pagos_reservas (
+            id_pago INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_reserva INTEGER,
+            monto REAL,
+            metodo_pago TEXT,
+            fecha_pago DATETIME DEFAULT CURRENT_TIMESTAMP,
+            comprobante TEXT,
+            estado TEXT DEFAULT 'confirmado',
+            FOREIGN KEY (id_reserva) REFERENCES reservas (id_reserva)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cupones (
+            id_cupon INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo TEXT UNIQUE,
+            tipo_descuento TEXT,
+            valor_descuento REAL,
+            tipo_cupon TEXT,
+            fecha_inicio DATETIME,
+            fecha_vencimiento DATETIME,
+            usos_maximos INTEGER,
+            usos_actuales INTEGER DEFAULT 0,
+            estado TEXT DEFAULT 'activo'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS compras_cliente (
+            id_compra INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_cliente INTEGER,
+            monto_compra REAL,
+            fecha_compra DATETIME DEFAULT CURRENT_TIMESTAMP,
+            tipo_compra TEXT, -- 'directa', 'reserva'
+            id_venta INTEGER, -- Referencia a venta original
+            FOREIGN KEY (id_cliente) REFERENCES clientes (id_cliente)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS beneficios_frecuentes (
+            id_beneficio INTEGER PRIMARY KEY AUTOINCREMENT,
+            nivel_cliente TEXT,
+            tipo_beneficio TEXT, -- 'descuento', 'cupon_exclusivo', 'prioridad'
+            valor_beneficio REAL,
+            descripcion TEXT,
+            condiciones TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS canjeo_beneficios (
+            id_canjeo INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_cliente INTEGER,
+            id_beneficio INTEGER,
+            fecha_canjeo DATETIME DEFAULT CURRENT_TIMESTAMP,
+            estado TEXT DEFAULT 'activo',
+            FOREIGN KEY (id_cliente) REFERENCES clientes (id_cliente),
+            FOREIGN KEY (id_beneficio) REFERENCES beneficios_frecuentes (id_beneficio)
+        )
+    ''')
+
+    # --- Portal de empleados -------------------------------------------------
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sesiones_empleados (
+            id_sesion INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_empleado INTEGER,
+            token_sesion TEXT UNIQUE,
+            fecha_inicio DATETIME DEFAULT CURRENT_TIMESTAMP,
+            fecha_ultimo_acceso DATETIME,
+            estado TEXT DEFAULT 'activa',
+            ip_address TEXT,
+            user_agent TEXT,
+            FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notificaciones_produccion (
+            id_notificacion INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_empleado INTEGER,
+            id_produccion INTEGER,
+            tipo_notificacion TEXT, -- 'nueva_tarea', 'recordatorio', 'actualizacion'
+            mensaje TEXT,
+            fecha_envio DATETIME DEFAULT CURRENT_TIMESTAMP,
+            fecha_leida DATETIME,
+            estado TEXT DEFAULT 'no_leida',
+            FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado),
+            FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion)
+        )
+    ''')
+
+    # Paginar notificaciones por (fecha_envio, id_notificacion)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notificaciones_empleado_fecha
+        ON notificaciones_produccion (id_empleado, fecha_envio, id_notificacion)
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS registro_actividad (
+            id_registro INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_empleado INTEGER,
+            id_produccion INTEGER,
+            tipo_actividad TEXT,
+            descripcion TEXT,
+            fecha_actividad DATETIME DEFAULT CURRENT_TIMESTAMP,
+            ip_address TEXT,
+            FOREIGN KEY (id_empleado) REFERENCES empleados (id_empleado),
+            FOREIGN KEY (id_produccion) REFERENCES produccion (id_produccion)
+        )
+    ''')
+
+
+@migracion(2, "Beneficios predeterminados únicos por nivel y tipo")
+def _beneficios_unicos(cursor):
+    # Antes se insertaban en cada arranque sin clave única: quedaron duplicados
+    cursor.execute('''
+        UPDATE canjeo_beneficios SET id_beneficio = (
+            SELECT MIN(b2.id_beneficio) FROM beneficios_frecuentes b1
+            JOIN beneficios_frecuentes b2
+              ON b2.nivel_cliente = b1.nivel_cliente AND b2.tipo_beneficio = b1.tipo_beneficio
+            WHERE b1.id_beneficio = canjeo_beneficios.id_beneficio
+        )
+        WHERE id_beneficio IN (SELECT id_beneficio FROM beneficios_frecuentes)
+    ''')
+    cursor.execute('''
+        DELETE FROM beneficios_frecuentes WHERE id_beneficio NOT IN (
+            SELECT MIN(id_beneficio) FROM beneficios_frecuentes
+            GROUP BY nivel_cliente, tipo_beneficio
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_beneficios_nivel_tipo
+        ON beneficios_frecuentes (nivel_cliente, tipo_beneficio)
+    ''')
+    cursor.executemany('''
+        INSERT OR IGNORE INTO beneficios_frecuentes
+        (nivel_cliente, tipo_beneficio, valor_beneficio, descripcion, condiciones)
+        VALUES (?, ?, ?, ?, ?)
+    ''', BENEFICIOS_PREDETERMINADOS)
+
+
+@migracion(3, "Outbox de cambios para la replicación")
+def _outbox(cursor):
+    # Los triggers que lo llenan son opcionales: los instala outbox_replicator
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox_cambios (
+            id_cambio INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            operacion TEXT NOT NULL, -- 'upsert', 'delete'
+            id_fila INTEGER NOT NULL,
+            fecha_epoch REAL DEFAULT ((julianday('now') - 2440587.5) * 86400.0)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS replicacion_checkpoint (
+            destino TEXT PRIMARY KEY,
+            ultimo_id INTEGER DEFAULT 0,
+            fecha_actualizacion DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+@migracion(4, "Cola de trabajos en segundo plano")
+def _cola_trabajos(cursor):
+    # Tiempos en segundos epoch: los compara el trabajador sin depender de zonas horarias
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cola_trabajos (
+            id_trabajo INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            datos TEXT,
+            prioridad INTEGER DEFAULT 0,
+            estado TEXT DEFAULT 'pendiente', -- 'pendiente', 'en_proceso', 'completado', 'fallido'
+            intentos INTEGER DEFAULT 0,
+            max_intentos INTEGER DEFAULT 5,
+            clave_unica TEXT,
+            visible_desde REAL NOT NULL,
+            fecha_creacion REAL NOT NULL,
+            fecha_actualizacion REAL,
+            resultado TEXT,
+            ultimo_error TEXT
+        )
+    ''')
+    # Solo los trabajos vivos: los terminados no ocupan el índice que recorre el trabajador
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_cola_trabajos_visibles
+        ON cola_trabajos (visible_desde)
+        WHERE estado IN ('pendiente', 'en_proceso')
+    ''')
+    # Deduplicación: una sola copia viva por clave_unica
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_cola_trabajos_clave
+        ON cola_trabajos (clave_unica)
+        WHERE estado IN ('pendiente', 'en_proceso')
+    ''')
+
+
+@migracion(5, "Programación, marcas de agua y ejecuciones de barridos")
+def _barridos(cursor):
+    # Una fila por barrido: próxima ejecución, marca de agua y quién lo tiene tomado
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS barridos (
+            nombre TEXT PRIMARY KEY,
+            marca_agua TEXT,
+            proxima_ejecucion REAL NOT NULL,
+            ultima_ejecucion REAL,
+            bloqueado_por TEXT,
+            bloqueado_hasta REAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ejecuciones_barridos (
+            id_ejecucion INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            inicio REAL NOT NULL,
+            duracion_segundos REAL,
+            filas_afectadas INTEGER DEFAULT 0,
+            estado TEXT, -- 'ok', 'error'
+            error TEXT,
+            marca_agua TEXT,
+            ejecutado_por TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ejecuciones_barridos_nombre
+        ON ejecuciones_barridos (nombre, inicio)
+    ''')
+
+
+@migracion(6, "Índices por fecha para la retención de tablas de registro")
+def _indices_retencion(cursor):
+    # retention.py elige los lotes a archivar por estas columnas
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_registro_actividad_fecha
+        ON registro_actividad (fecha_actividad)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notificaciones_fecha
+        ON notificaciones_produccion (fecha_envio)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_seguimiento_produccion_fecha
+        ON seguimiento_produccion (fecha_acceso)
+    ''')
+
+
+@migracion(7, "Partición fría de producción liquidada y vista unificada")
+def _particion_produccion(cursor):
+    # Mismas columnas y orden que produccion: las órdenes liquidadas se mueven
+    # con INSERT ... SELECT *. Una columna nueva de produccion va en las dos
+    # tablas y obliga a recrear la vista.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS produccion_historica (
+            id_produccion INTEGER PRIMARY KEY,
+            id_orden INTEGER,
+            tipo_orden TEXT,
+            id_cortador INTEGER,
+            id_costurero INTEGER,
+            fecha_asignacion DATETIME,
+            fecha_entrega_corte DATETIME,
+            fecha_entrega_costura DATETIME,
+            estado_corte TEXT,
+            estado_costura TEXT,
+            pago_corte REAL DEFAULT 0,
+            pago_costura REAL DEFAULT 0,
+            estado_pago_corte TEXT,
+            estado_pago_costura TEXT,
+            notas TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_produccion_historica_cortador
+        ON produccion_historica (id_cortador, fecha_entrega_corte)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_produccion_historica_costurero
+        ON produccion_historica (id_costurero, fecha_entrega_costura)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_produccion_historica_asignacion
+        ON produccion_historica (fecha_asignacion)
+    ''')
+    # Totales por empleado de lo ya movido: el resumen de pagos no recorre la historia
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resumen_produccion_historica (
+            id_empleado INTEGER NOT NULL,
+            rol TEXT NOT NULL, -- 'cortador', 'costurero'
+            prendas INTEGER DEFAULT 0,
+            monto REAL DEFAULT 0,
+            PRIMARY KEY (id_empleado, rol)
+        )
+    ''')
+    # La tabla caliente queda con el trabajo abierto: índices por empleado y estado
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_produccion_cortador_estado
+        ON produccion (id_cortador, estado_corte)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_produccion_costurero_estado
+        ON produccion (id_costurero, estado_costura)
+    ''')
+    cursor.execute("DROP VIEW IF EXISTS produccion_completa")
+    cursor.execute('''
+        CREATE VIEW produccion_completa AS
+        SELECT * FROM produccion
+        UNION ALL
+        SELECT * FROM produccion_historica
+    ''')
+
+
+@migracion(8, "Historial de tamaño, páginas libres e integridad de la base")
+def _mantencion(cursor):
+    # Una fila por medición de db_maintenance; fecha en segundos epoch
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mantencion_metricas (
+            id_medicion INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha REAL NOT NULL,
+            operacion TEXT, -- 'medicion', 'estadisticas', 'vacio', 'integridad'
+            tamano_bytes INTEGER,
+            wal_bytes INTEGER,
+            paginas INTEGER,
+            paginas_libres INTEGER,
+            tamano_pagina INTEGER,
+            auto_vacuum INTEGER,
+            integridad TEXT,
+            duracion_segundos REAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_mantencion_metricas_fecha
+        ON mantencion_metricas (fecha)
+    ''')
+
+
+# Milisegundos epoch: una base restaurada desde un respaldo no repite una
+# versión ya entregada con otro contenido
+VERSION_AHORA = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+# Tablas que alimentan el dashboard del empleado y, por cada una, los
+# id_empleado que toca una fila ({fila} = NEW u OLD)
+EMPLEADOS_POR_FILA = {
+    "produccion": "SELECT {fila}.id_cortador AS id_empleado UNION SELECT {fila}.id_costurero",
+    "envios_proveedores": """
+        SELECT id_cortador AS id_empleado FROM produccion WHERE id_produccion = {fila}.id_produccion
+        UNION SELECT id_costurero FROM produccion WHERE id_produccion = {fila}.id_produccion""",
+    "notificaciones_produccion": "SELECT {fila}.id_empleado AS id_empleado",
+    "pagos_empleados": "SELECT {fila}.id_empleado AS id_empleado",
+    "resumen_produccion_historica": "SELECT {fila}.id_empleado AS id_empleado",
+    "empleados": "SELECT {fila}.id_empleado AS id_empleado",
+}
+
+
+@migracion(9, "Versión por empleado de los datos de su dashboard")
+def _version_empleados(cursor):
+    # La sube cada escritura que toca sus tareas, pagos o notificaciones; el
+    # portal la usa como ETag y responde 304 sin consultar nada más
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS version_empleados (
+            id_empleado INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO version_empleados (id_empleado, version)
+        SELECT id_empleado, {VERSION_AHORA} FROM empleados
+    ''')
+    if not isinstance(cursor, sqlite3.Cursor):
+        # Sin triggers en PostgreSQL: el portal no emite ETag (ver obtener_version_empleado)
+        return
+
+    for tabla, ids in EMPLEADOS_POR_FILA.items():
+        for evento, filas in (("INSERT", ("NEW",)), ("UPDATE", ("NEW", "OLD")), ("DELETE", ("OLD",))):
+            afectados = " UNION ".join(ids.format(fila=fila) for fila in filas)
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS version_empleados_{tabla}_{evento.lower()}
+                AFTER {evento} ON {tabla}
+                BEGIN
+                    INSERT INTO version_empleados (id_empleado, version)
+                    SELECT id_empleado, {VERSION_AHORA} FROM ({afectados})
+                    WHERE id_empleado IS NOT NULL
+                    ON CONFLICT (id_empleado) DO UPDATE SET version = MAX(version + 1, excluded.version);
+                END
+            ''')
+
+
+@migracion(10, "Cuenta por pagar de cada compra a proveedor")
+def _cuenta_compra(cursor):
+    # Pagar una compra cierra solo su cuenta (o descuenta su parte de la
+    # factura consolidada), no todas las cuentas abiertas del proveedor.
+    # Las compras antiguas que no se puedan enlazar quedan con id_cuenta NULL
+    # y su pago no toca cuentas_por_pagar.
+    cursor.execute('''
+        ALTER TABLE compras_proveedores
+        ADD COLUMN id_cuenta INTEGER REFERENCES cuentas_por_pagar (id_cuenta)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_compras_proveedores_cuenta
+        ON compras_proveedores (id_cuenta)
+    ''')
+    vincular_compras_cuentas(cursor)
+
+
+@migracion(11, "Totales de antigüedad de cuentas por pagar por día de vencimiento")
+def _totales_antiguedad(cursor):
+    # Los tramos (vencidas, 0-7, 8-30, más de 30 días) dependen del día en que
+    # se consultan; los totales por día de vencimiento no, y se mantienen al
+    # escribir antiguedad_cxp. obtener_antiguedad_cxp agrupa en tramos estas
+    # pocas filas en vez de recorrer cada cuenta abierta
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS antiguedad_cxp_totales (
+            fecha_vencimiento DATE PRIMARY KEY,
+            cantidad INTEGER NOT NULL,
+            monto REAL NOT NULL
+        )
+    ''')
+    reconstruir_totales_antiguedad(cursor)
+
+
+VERSION_ACTUAL = len(MIGRACIONES)
+
+
+def _leer_version(cursor, postgres):
+    if not postgres:
+        cursor.execute("PRAGMA user_version")
+        return cursor.fetchone()[0]
+    cursor.execute("CREATE TABLE IF NOT EXISTS esquema_version (version INTEGER NOT NULL)")
+    cursor.execute("SELECT MAX(version) FROM esquema_version")
+    return cursor.fetchone()[0] or 0
+
+
+def _guardar_version(cursor, postgres, version):
+    if not postgres:
+        cursor.execute(f"PRAGMA user_version = {int(version)}")
+    else:
+        cursor.execute("DELETE FROM esquema_version")
+        cursor.execute("INSERT INTO esquema_version (version) VALUES (?)", (version,))
+
+
+def version_esquema(db_path):
+    """Versión de esquema registrada en la base (0 si nunca se migró)"""
+    conn = conectar(db_path)
+    cursor = conn.cursor()
+    try:
+        return _leer_version(cursor, es_postgres(db_path))
+    finally:
+        conn.close()
+
+
+def _transaccion_migracion(db_path, postgres):
+    conn = conectar(db_path, isolation_level=None)
+    cursor = conn.cursor()
+    try:
+        if not postgres:
+            # Solo surte efecto en una base aún sin tablas: las nuevas nacen con
+            # vacío incremental (ver db_maintenance); en las demás no cambia nada
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("BEGIN IMMEDIATE")
+        # Se relee dentro de la transacción: otro proceso pudo migrar primero
+        version = _leer_version(cursor, postgres)
+        for numero, descripcion, funcion in MIGRACIONES[version:]:
+            funcion(cursor)
+            logger.info("Migración %d aplicada en %s: %s", numero, db_path, descripcion)
+        _guardar_version(cursor, postgres, max(version, VERSION_ACTUAL))
+        cursor.execute("COMMIT")
+        return version
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def migrar(db_path):
+    """Aplicar las migraciones pendientes en una sola transacción"""
+    # Fuera del escritor único: corre una vez al arrancar y no deja su hilo
+    # ni su conexión abiertos (p. ej. para la carga masiva del generador)
+    postgres = es_postgres(db_path)
+    anterior = con_reintentos(lambda: _transaccion_migracion(db_path, postgres), "migracion")
+    return {"version_anterior": anterior, "version": max(anterior, VERSION_ACTUAL)}
+
+
+def _clave_cache(db_path):
+    if es_postgres(db_path):
+        return db_path
+    # Con el inodo, un archivo borrado y recreado en el mismo proceso se vuelve a revisar
+    ruta = os.path.abspath(db_path)
+    try:
+        return (ruta, os.stat(ruta).st_ino)
+    except OSError:
+        return (ruta, None)
+
+
+def asegurar_esquema(db_path):
+    """Dejar la base en VERSION_ACTUAL; sin DDL si ya lo está"""
+    clave = _clave_cache(db_path)
+    if clave in _al_dia:
+        return VERSION_ACTUAL
+
+    with _lock:
+        if clave in _al_dia:
+            return VERSION_ACTUAL
+        version = version_esquema(db_path)
+        if version < VERSION_ACTUAL:
+            version = migrar(db_path)["version"]
+        elif version > VERSION_ACTUAL:
+            logger.warning("La base %s tiene esquema v%d, más nuevo que el del código (v%d)",
+                           db_path, version, VERSION_ACTUAL)
+        _al_dia.add(_clave_cache(db_path))
+        return version
+
+
+if __name__ == "__main__":
+    import sys
+
+    ruta = sys.argv[1] if len(sys.argv) > 1 else "julia_confecciones.db"
+    print(f"Versión antes: {version_esquema(ruta)} (código: v{VERSION_ACTUAL})")
+    print("Resultado:", migrar(ruta))
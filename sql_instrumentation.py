@@ -0,0 +1,327 @@
+# Instrumentación de Consultas SQL - Julia Confecciones
+#
+# Cuenta sentencias y conexiones por petición Flask y por llamada a método de
+# los sistemas, registra las sentencias lentas (con la forma de sus
+# parámetros, nunca los valores) y acumula totales consultables.
+
+import contextvars
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import tracing
+from metrics import registro
+
+logger = logging.getLogger("julia.sql")
+
+# Umbrales configurables por variables de entorno. Los de sentencias y
+# conexiones por ámbito están medidos sobre el portal: /api/dashboard junta
+# cuatro métodos de los sistemas, cada uno con su conexión, y queda en 8
+# sentencias y 6 conexiones; los demás endpoints no pasan de 3 conexiones.
+UMBRAL_LENTA_MS = float(os.getenv("JULIA_SQL_LENTA_MS", "100"))
+UMBRAL_SENTENCIAS = int(os.getenv("JULIA_SQL_MAX_SENTENCIAS", "25"))
+UMBRAL_CONEXIONES = int(os.getenv("JULIA_SQL_MAX_CONEXIONES", "6"))
+HABILITADA = os.getenv("JULIA_SQL_INSTRUMENTACION", "1") != "0"
+# Cabeceras X-SQL-Sentencias / X-SQL-Conexiones en las respuestas: solo para depurar
+CABECERAS = os.getenv("JULIA_SQL_CABECERAS", "0") == "1"
+
+_ambitos = contextvars.ContextVar("julia_sql_ambitos", default=())
+_lock = threading.Lock()
+
+_totales = {
+    "sentencias": 0,
+    "conexiones": 0,
+    "tiempo_ms": 0.0,
+    "sentencias_lentas": 0,
+    "ambitos_excedidos": 0
+}
+_por_ambito = {}
+_lentas = []
+MAX_LENTAS = 200
+
+_duracion_metodos = registro.histograma(
+    "julia_metodo_duracion_segundos",
+    "Duración de las llamadas a métodos públicos de los sistemas",
+    ("metodo",))
+
+
+class Ambito:
+    """Contador de sentencias de una petición o llamada a método"""
+
+    __slots__ = ("nombre", "sentencias", "conexiones", "tiempo_ms", "inicio")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.sentencias = 0
+        self.conexiones = 0
+        self.tiempo_ms = 0.0
+        self.inicio = time.perf_counter()
+
+    def como_dict(self):
+        return {
+            "nombre": self.nombre,
+            "sentencias": self.sentencias,
+            "conexiones": self.conexiones,
+            "tiempo_sql_ms": round(self.tiempo_ms, 3),
+            "duracion_ms": round((time.perf_counter() - self.inicio) * 1000, 3)
+        }
+
+
+def forma_parametros(parametros):
+    """Describir los parámetros por tipo, sin exponer sus valores"""
+    if parametros is None:
+        return "()"
+    if isinstance(parametros, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parametros.items()) + "}"
+    try:
+        return "(" + ", ".join(type(p).__name__ for p in parametros) + ")"
+    except TypeError:
+        return type(parametros).__name__
+
+
+def _registrar_sentencia(sql, parametros, duracion_ms, filas=None):
+    ambitos = _ambitos.get()
+    for ambito in ambitos:
+        ambito.sentencias += 1
+        ambito.tiempo_ms += duracion_ms
+
+    lenta = duracion_ms >= UMBRAL_LENTA_MS
+
+    with _lock:
+        _totales["sentencias"] += 1
+        _totales["tiempo_ms"] += duracion_ms
+        if lenta:
+            _totales["sentencias_lentas"] += 1
+            _lentas.append({
+                "sql": " ".join(sql.split())[:500],
+                "parametros": forma_parametros(parametros),
+                "filas": filas,
+                "duracion_ms": round(duracion_ms, 3),
+                "ambito": ambitos[-1].nombre if ambitos else None,
+                "fecha": time.time()
+            })
+            del _lentas[:-MAX_LENTAS]
+
+    if lenta:
+        logger.warning("Consulta lenta (%.1f ms) parametros=%s en %s: %s",
+                       duracion_ms, forma_parametros(parametros),
+                       ambitos[-1].nombre if ambitos else "-", " ".join(sql.split())[:200])
+
+
+def _registrar_conexion():
+    for ambito in _ambitos.get():
+        ambito.conexiones += 1
+    with _lock:
+        _totales["conexiones"] += 1
+
+
+def _span_sentencia(conexion, sql, parametros, filas=None):
+    """Span de una sentencia, hijo de la conexión que la ejecuta"""
+    sistema = getattr(conexion, "sistema", "sqlite")
+    atributos = {"db.system": sistema, "db.statement": " ".join(sql.split())[:500],
+                 "db.parametros": forma_parametros(parametros)}
+    if filas is not None:
+        atributos["db.filas"] = filas
+    return tracing.iniciar_span_hijo(f"{sistema}.sentencia", atributos,
+                                     getattr(conexion, "span", None) or tracing.span_actual())
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que mide cada execute/executemany"""
+
+    def execute(self, sql, parametros=()):
+        if not HABILITADA:
+            return super().execute(sql, parametros)
+        span = _span_sentencia(self.connection, sql, parametros) if tracing.HABILITADO else None
+        error = None
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _registrar_sentencia(sql, parametros, (time.perf_counter() - inicio) * 1000)
+            tracing.terminar_span(span, error=error)
+
+    def executemany(self, sql, secuencia):
+        if not HABILITADA:
+            return super().executemany(sql, secuencia)
+        secuencia = list(secuencia)
+        primera = secuencia[0] if secuencia else None
+        span = (_span_sentencia(self.connection, sql, primera, len(secuencia))
+                if tracing.HABILITADO else None)
+        error = None
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, secuencia)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _registrar_sentencia(sql, primera, (time.perf_counter() - inicio) * 1000, len(secuencia))
+            tracing.terminar_span(span, error=error)
+
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """Conexión SQLite cuyos cursores quedan instrumentados
+
+    Con las trazas activas, la conexión abre un span que dura hasta close() y
+    del que cuelgan sus sentencias y commits.
+    """
+
+    sistema = "sqlite"
+
+    def __init__(self, *args, **kwargs):
+        inicio = time.time_ns()
+        super().__init__(*args, **kwargs)
+        self.span = None
+        if HABILITADA:
+            _registrar_conexion()
+            if tracing.HABILITADO:
+                base = args[0] if args else kwargs.get("database", "")
+                self.span = tracing.iniciar_span_hijo(
+                    "sqlite.conexion", {"db.system": "sqlite", "db.name": os.fspath(base),
+                                        "julia.apertura_ms": (time.time_ns() - inicio) / 1e6},
+                    inicio=inicio)
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def commit(self):
+        span = tracing.iniciar_span_hijo("sqlite.commit", {"db.system": "sqlite"},
+                                         self.span) if self.span else None
+        try:
+            super().commit()
+        finally:
+            tracing.terminar_span(span)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            span, self.span = self.span, None
+            tracing.terminar_span(span)
+
+
+def _cerrar_ambito(ambito):
+    with _lock:
+        agregado = _por_ambito.setdefault(ambito.nombre, {
+            "llamadas": 0, "sentencias": 0, "conexiones": 0, "tiempo_sql_ms": 0.0,
+            "max_sentencias": 0, "max_conexiones": 0
+        })
+        agregado["llamadas"] += 1
+        agregado["sentencias"] += ambito.sentencias
+        agregado["conexiones"] += ambito.conexiones
+        agregado["tiempo_sql_ms"] += ambito.tiempo_ms
+        agregado["max_sentencias"] = max(agregado["max_sentencias"], ambito.sentencias)
+        agregado["max_conexiones"] = max(agregado["max_conexiones"], ambito.conexiones)
+
+        excedido = ambito.sentencias > UMBRAL_SENTENCIAS or ambito.conexiones > UMBRAL_CONEXIONES
+        if excedido:
+            _totales["ambitos_excedidos"] += 1
+
+    if excedido:
+        # Típico de un N+1 o de abrir una conexión por consulta
+        logger.warning("%s ejecutó %d sentencias en %d conexiones",
+                       ambito.nombre, ambito.sentencias, ambito.conexiones)
+
+
+def iniciar_ambito(nombre):
+    """Abrir un ámbito de conteo; devuelve un token para cerrar_ambito"""
+    ambito = Ambito(nombre)
+    token = _ambitos.set(_ambitos.get() + (ambito,))
+    return ambito, token
+
+
+def cerrar_ambito(ambito, token):
+    """Cerrar un ámbito abierto con iniciar_ambito"""
+    _ambitos.reset(token)
+    _cerrar_ambito(ambito)
+    return ambito.como_dict()
+
+
+@contextmanager
+def ambito_sql(nombre):
+    """Contexto que cuenta las sentencias ejecutadas dentro de él"""
+    ambito, token = iniciar_ambito(nombre)
+    try:
+        yield ambito
+    finally:
+        cerrar_ambito(ambito, token)
+
+
+def instrumentar_clase(cls):
+    """Decorador de clase: cuenta sentencias y abre un span por llamada a cada método público"""
+    for nombre, atributo in list(vars(cls).items()):
+        if nombre.startswith("_") or not callable(atributo):
+            continue
+
+        def envolver(metodo, nombre_ambito):
+            @functools.wraps(metodo)
+            def envoltura(*args, **kwargs):
+                if not HABILITADA:
+                    return metodo(*args, **kwargs)
+                with ambito_sql(nombre_ambito) as ambito, tracing.span(nombre_ambito) as span:
+                    try:
+                        resultado = metodo(*args, **kwargs)
+                        if span is not None and isinstance(resultado, dict) \
+                                and resultado.get("success") is False:
+                            span.marcar_error(resultado.get("error", "success=False"))
+                        return resultado
+                    finally:
+                        _duracion_metodos.observar(time.perf_counter() - ambito.inicio,
+                                                   metodo=nombre_ambito)
+            return envoltura
+
+        setattr(cls, nombre, envolver(atributo, f"{cls.__name__}.{nombre}"))
+    return cls
+
+
+def obtener_totales():
+    """Totales globales, por ámbito y últimas consultas lentas"""
+    with _lock:
+        return {
+            "totales": {**_totales, "tiempo_ms": round(_totales["tiempo_ms"], 3)},
+            "por_ambito": {
+                nombre: {**datos, "tiempo_sql_ms": round(datos["tiempo_sql_ms"], 3),
+                         "promedio_sentencias": round(datos["sentencias"] / datos["llamadas"], 2)}
+                for nombre, datos in _por_ambito.items()
+            },
+            "consultas_lentas": list(_lentas)
+        }
+
+
+def reiniciar_totales():
+    """Reiniciar todos los contadores"""
+    with _lock:
+        for clave in _totales:
+            _totales[clave] = 0
+        _por_ambito.clear()
+        _lentas.clear()
+
+
+def _colector_metricas():
+    """Totales de SQL en formato de colector para metrics.registro"""
+    with _lock:
+        totales = dict(_totales)
+    return [
+        ("julia_sql_sentencias_total", "counter", "Sentencias SQL ejecutadas",
+         [({}, totales["sentencias"])]),
+        ("julia_sql_conexiones_total", "counter", "Conexiones SQLite abiertas",
+         [({}, totales["conexiones"])]),
+        ("julia_sql_tiempo_segundos_total", "counter", "Tiempo acumulado en sentencias SQL",
+         [({}, totales["tiempo_ms"] / 1000)]),
+        ("julia_sql_sentencias_lentas_total", "counter", "Sentencias sobre el umbral de lentitud",
+         [({}, totales["sentencias_lentas"])]),
+        ("julia_sql_ambitos_excedidos_total", "counter",
+         "Peticiones o métodos sobre el umbral de sentencias o conexiones",
+         [({}, totales["ambitos_excedidos"])]),
+    ]
+
+
+registro.registrar_colector("sql", _colector_metricas)
@@ -0,0 +1,329 @@
+# Escritor Único con Commit Agrupado - Julia Confecciones
+#
+# Todas las escrituras de un archivo SQLite pasan por un único hilo escritor.
+# Las operaciones que llegan mientras se confirma un lote se agrupan en la
+# siguiente transacción (group commit): un solo BEGIN IMMEDIATE / COMMIT para
+# muchas operaciones, cada una aislada en su SAVEPOINT para que el fallo de
+# una no arrastre a las demás. Cada llamador recibe su propio resultado
+# recién cuando el lote quedó confirmado.
+#
+# Si el hilo escritor muere (no pudo abrir la base, un ROLLBACK falló...) las
+# operaciones de su lote y las que quedaban en la cola reciben el error, y el
+# próximo envío arranca un hilo nuevo. Además escribir() no espera más de
+# JULIA_ESCRITOR_TIMEOUT segundos: pasado ese plazo lanza TimeoutError,
+# aunque la operación todavía puede confirmarse después.
+#
+# JULIA_ESCRITOR_UNICO=0 desactiva el hilo y ejecuta cada operación en su
+# propia transacción BEGIN IMMEDIATE. En ambos casos los bloqueos transitorios
+# se reintentan según la política de database.con_reintentos.
+#
+# Con PostgreSQL (db_path postgresql://) no hay escritor único: el servidor ya
+# admite escrituras concurrentes y cada operación va en su propia transacción.
+
+import contextvars
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from database import conectar, con_reintentos, es_postgres
+from metrics import registro
+
+logger = logging.getLogger("julia.db")
+
+HABILITADO = os.getenv("JULIA_ESCRITOR_UNICO", "1") != "0"
+MAX_LOTE = int(os.getenv("JULIA_ESCRITOR_MAX_LOTE", "64"))
+ESPERA_LOTE_MS = float(os.getenv("JULIA_ESCRITOR_ESPERA_MS", "0"))
+TIMEOUT_ESCRITURA_S = float(os.getenv("JULIA_ESCRITOR_TIMEOUT", "120"))
+
+_tamano_lotes = registro.histograma(
+    "julia_escritor_lote_operaciones", "Operaciones confirmadas por commit del escritor único",
+    ("base",), buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+_duracion_lotes = registro.histograma(
+    "julia_escritor_lote_duracion_segundos", "Duración de cada lote del escritor único",
+    ("base",))
+
+_escritores = {}
+_lock_escritores = threading.Lock()
+
+
+class _Operacion:
+    __slots__ = ("funcion", "contexto", "futuro")
+
+    def __init__(self, funcion):
+        self.funcion = funcion
+        # El contexto del llamador: ámbitos SQL y spans siguen contando para él
+        self.contexto = contextvars.copy_context()
+        self.futuro = Future()
+
+
+class EscritorSQLite:
+    """Hilo dueño de la única conexión que escribe en una base SQLite"""
+
+    def __init__(self, db_path, max_lote=MAX_LOTE, espera_lote_ms=ESPERA_LOTE_MS):
+        self.db_path = db_path
+        self.max_lote = max_lote
+        self.espera_lote = espera_lote_ms / 1000
+        self._cola = queue.Queue()
+        self._local = threading.local()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+        self.metricas = {
+            "operaciones": 0,
+            "operaciones_fallidas": 0,
+            "lotes": 0,
+            "lotes_fallidos": 0,
+            "max_lote": 0
+        }
+
+    def iniciar(self):
+        """Iniciar el hilo escritor (se llama solo al primer envío)"""
+        with self._lock:
+            self._iniciar()
+
+    def _iniciar(self):
+        # Con self._lock tomado
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._hilo = threading.Thread(target=self._ejecutar, daemon=True,
+                                      name=f"escritor-{os.path.basename(self.db_path)}")
+        self._hilo.start()
+
+    def detener(self, timeout=5.0):
+        """Confirmar lo pendiente y detener el hilo escritor"""
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+        if hilo:
+            self._cola.put(None)
+            hilo.join(timeout)
+
+    def enviar(self, funcion):
+        """Encolar funcion(cursor); devuelve un Future con su resultado
+
+        Desde el propio hilo escritor (una operación que escribe otra) se
+        ejecuta en línea dentro del mismo lote.
+        """
+        cursor_actual = getattr(self._local, "cursor", None)
+        if cursor_actual is not None:
+            futuro = Future()
+            try:
+                futuro.set_result(funcion(cursor_actual))
+            except Exception as e:
+                futuro.set_exception(e)
+            return futuro
+
+        operacion = _Operacion(funcion)
+        # Bajo el lock: un hilo que está muriendo no vacía la cola en medio
+        # de un envío, y lo que se encole después lo toma el hilo nuevo
+        with self._lock:
+            self._iniciar()
+            self._cola.put(operacion)
+        return operacion.futuro
+
+    def ejecutar(self, funcion, timeout=TIMEOUT_ESCRITURA_S):
+        """Encolar funcion(cursor) y esperar a que su lote quede confirmado"""
+        return self.enviar(funcion).result(timeout)
+
+    def _tomar_lote(self):
+        primera = self._cola.get()
+        if primera is None:
+            return None
+        lote = [primera]
+        limite = time.monotonic() + self.espera_lote
+        while len(lote) < self.max_lote:
+            try:
+                restante = limite - time.monotonic()
+                operacion = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if operacion is None:
+                self._cola.put(None)
+                break
+            lote.append(operacion)
+        return lote
+
+    def _conectar(self):
+        conn = conectar(self.db_path, isolation_level=None, check_same_thread=False)
+        # WAL: los lectores de los demás hilos no esperan al escritor
+        try:
+            con_reintentos(lambda: conn.execute("PRAGMA journal_mode=WAL"), "escritor.wal")
+        except sqlite3.OperationalError as e:
+            logger.warning("No se pudo activar WAL en %s: %s", self.db_path, e)
+        return conn
+
+    def _ejecutar(self):
+        base = os.path.basename(self.db_path)
+        lote = []
+        try:
+            conn = self._conectar()
+            try:
+                while True:
+                    lote = self._tomar_lote()
+                    if lote is None:
+                        break
+                    inicio = time.perf_counter()
+                    self._confirmar_lote(conn.cursor(), lote)
+                    _duracion_lotes.observar(time.perf_counter() - inicio, base=base)
+                    _tamano_lotes.observar(len(lote), base=base)
+                    if conn.in_transaction:
+                        # El ROLLBACK del lote falló: la conexión no sirve para el siguiente
+                        conn.close()
+                        conn = self._conectar()
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.exception("El escritor de %s se detuvo por un error", self.db_path)
+            self._abandonar(lote or [], e)
+
+    def _abandonar(self, lote, error):
+        """Resolver con `error` el lote en curso y lo que quedaba en la cola"""
+        for operacion in lote:
+            if not operacion.futuro.done():
+                operacion.futuro.set_exception(error)
+        with self._lock:
+            if self._hilo is not threading.current_thread():
+                # detener() ya lo reemplazó: la cola es del hilo nuevo
+                return
+            self._hilo = None
+            while True:
+                try:
+                    operacion = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if operacion is not None:
+                    operacion.futuro.set_exception(error)
+
+    def _confirmar_lote(self, cursor, lote):
+        resultados = []
+        self._local.cursor = cursor
+        try:
+            # Otro proceso puede tener el bloqueo de escritura: esperar y reintentar
+            con_reintentos(lambda: cursor.execute("BEGIN IMMEDIATE"), "escritor.begin")
+            for operacion in lote:
+                cursor.execute("SAVEPOINT operacion")
+                try:
+                    resultado = operacion.contexto.run(operacion.funcion, cursor)
+                    cursor.execute("RELEASE operacion")
+                    resultados.append((operacion, resultado, None))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO operacion")
+                    cursor.execute("RELEASE operacion")
+                    resultados.append((operacion, None, e))
+            # Un COMMIT que recibe SQLITE_BUSY deja la transacción abierta y se puede repetir
+            con_reintentos(lambda: cursor.execute("COMMIT"), "escritor.commit")
+        except Exception as e:
+            # Falló el BEGIN o el COMMIT: ninguna operación del lote quedó escrita
+            if cursor.connection.in_transaction:
+                try:
+                    cursor.execute("ROLLBACK")
+                except sqlite3.Error as error_rollback:
+                    logger.error("No se pudo deshacer el lote en %s: %s", self.db_path, error_rollback)
+            self.metricas["lotes_fallidos"] += 1
+            resultados = [(operacion, None, e) for operacion in lote]
+        finally:
+            self._local.cursor = None
+
+        self.metricas["lotes"] += 1
+        self.metricas["max_lote"] = max(self.metricas["max_lote"], len(lote))
+        for operacion, resultado, error in resultados:
+            self.metricas["operaciones"] += 1
+            if error is not None:
+                self.metricas["operaciones_fallidas"] += 1
+                operacion.futuro.set_exception(error)
+            else:
+                operacion.futuro.set_result(resultado)
+
+    def obtener_metricas(self):
+        """Obtener métricas del escritor"""
+        metricas = dict(self.metricas)
+        metricas["en_cola"] = self._cola.qsize()
+        metricas["promedio_lote"] = round(metricas["operaciones"] / metricas["lotes"], 2) \
+            if metricas["lotes"] else 0
+        metricas["activo"] = bool(self._hilo and self._hilo.is_alive())
+        return metricas
+
+
+def obtener_escritor(db_path):
+    """Escritor único del archivo db_path (uno por proceso y archivo)"""
+    clave = os.path.abspath(db_path)
+    with _lock_escritores:
+        escritor = _escritores.get(clave)
+        if escritor is None:
+            escritor = _escritores[clave] = EscritorSQLite(db_path)
+        return escritor
+
+
+def _transaccion_directa(db_path, funcion):
+    conn = conectar(db_path, isolation_level=None)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        resultado = funcion(cursor)
+        cursor.execute("COMMIT")
+        return resultado
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _ejecutar_directo(db_path, funcion):
+    # La transacción se deshace entera ante un bloqueo, así que repetirla es seguro
+    return con_reintentos(lambda: _transaccion_directa(db_path, funcion), "directo")
+
+
+def escribir(db_path, funcion):
+    """Ejecutar funcion(cursor) como escritura confirmada y devolver su resultado
+
+    Las excepciones de `funcion` se propagan al llamador; sus cambios se
+    deshacen sin afectar al resto del lote.
+    """
+    if not HABILITADO or es_postgres(db_path):
+        return _ejecutar_directo(db_path, funcion)
+    return obtener_escritor(db_path).ejecutar(funcion)
+
+
+def escribir_sin_esperar(db_path, funcion):
+    """Encolar una escritura cuyo resultado no hace falta esperar (p. ej. un 'touch')"""
+    if not HABILITADO or es_postgres(db_path):
+        futuro = Future()
+        try:
+            futuro.set_result(_ejecutar_directo(db_path, funcion))
+        except Exception as e:
+            futuro.set_exception(e)
+    else:
+        futuro = obtener_escritor(db_path).enviar(funcion)
+    # Nadie lee el resultado: sin esto el error se perdería en silencio
+    futuro.add_done_callback(_avisar_error)
+    return futuro
+
+
+def _avisar_error(futuro):
+    error = futuro.exception()
+    if error is not None:
+        logger.warning("Falló una escritura sin esperar: %s", error)
+
+
+def _colector_metricas():
+    with _lock_escritores:
+        escritores = list(_escritores.values())
+    familias = {
+        "operaciones": ("julia_escritor_operaciones_total", "counter", "Operaciones procesadas por el escritor único"),
+        "operaciones_fallidas": ("julia_escritor_operaciones_fallidas_total", "counter", "Operaciones que terminaron en error"),
+        "lotes": ("julia_escritor_lotes_total", "counter", "Transacciones confirmadas por el escritor único"),
+        "en_cola": ("julia_escritor_en_cola", "gauge", "Operaciones esperando al escritor único"),
+    }
+    return [
+        (nombre, tipo, ayuda,
+         [({"base": os.path.basename(e.db_path)}, e.obtener_metricas()[clave]) for e in escritores])
+        for clave, (nombre, tipo, ayuda) in familias.items()
+    ]
+
+
+registro.registrar_colector("escritor_sqlite", _colector_metricas)
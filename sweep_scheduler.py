@@ -0,0 +1,467 @@
+# Programador de Barridos Periódicos - Julia Confecciones
+#
+# Ejecuta dentro del proceso los barridos de mantenimiento (reservas vencidas,
+# alertas de pago, materiales bajos, clientes próximos a subir de nivel).
+#
+#   - Programa: segundos ("60") o expresión cron de 5 campos ("0 7 * * 1-5"),
+#     más un jitter aleatorio para que varias instancias no coincidan.
+#   - Un solo ejecutor: la fila del barrido en la tabla `barridos` hace de
+#     candado con vencimiento (bloqueado_hasta). Varios procesos pueden correr
+#     el programador; cada ejecución la toma solo uno.
+#   - Incremental: cada barrido recibe la marca de agua de la corrida anterior
+#     y devuelve (filas_afectadas, nueva_marca). La marca solo avanza si la
+#     corrida termina bien.
+#   - Cada corrida queda en ejecuciones_barridos con su duración y filas.
+#
+# Uso:
+#   python sweep_scheduler.py --db julia_confecciones.db [--una-vez]
+#
+# Programas por variable de entorno: JULIA_BARRIDO_<NOMBRE> (p. ej.
+# JULIA_BARRIDO_RESERVAS_VENCIDAS="*/5 * * * *"). El proceso inicia también
+# trabajadores de la cola, salvo con JULIA_COLA_EN_PROCESO=0 (ver job_queue).
+
+import argparse
+import contextvars
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from backup_service import barrer_instantanea, barrer_respaldo
+from database import conectar
+from db_maintenance import barrer_estadisticas, barrer_mantencion_nocturna, barrer_mediciones
+from frequent_customer_system import FrequentCustomerSystem
+from job_queue import iniciar_en_proceso
+from metrics import registro
+from payment_system import PaymentSystem
+from production_tracking_system import ProductionTrackingSystem
+from reservation_system_implementation import ReservationSystem
+from retention import barrer_retencion
+from schema import asegurar_esquema
+from sqlite_writer import escribir
+import tracing
+
+logger = logging.getLogger("julia.barridos")
+
+INTERVALO_SONDEO_S = float(os.getenv("JULIA_BARRIDOS_SONDEO", "30"))
+TIEMPO_MAXIMO_S = float(os.getenv("JULIA_BARRIDOS_TIEMPO_MAXIMO", "600"))
+JITTER_S = float(os.getenv("JULIA_BARRIDOS_JITTER", "10"))
+
+
+class Cron:
+    """Expresión cron de 5 campos: minuto hora día-del-mes mes día-de-semana"""
+
+    _RANGOS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expresion):
+        campos = expresion.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expresión cron inválida (se esperan 5 campos): {expresion}")
+        self.expresion = expresion
+        self.minutos, self.horas, self.dias, self.meses, self.dias_semana = (
+            self._parsear(campo, minimo, maximo)
+            for campo, (minimo, maximo) in zip(campos, self._RANGOS))
+        # Como en cron: si se restringen día del mes y de la semana, basta con uno
+        self._dia_o_semana = campos[2] != "*" and campos[4] != "*"
+
+    @staticmethod
+    def _parsear(campo, minimo, maximo):
+        valores = set()
+        for parte in campo.split(","):
+            rango, _, paso = parte.partition("/")
+            if rango == "*":
+                inicio, fin = minimo, maximo
+            elif "-" in rango:
+                inicio, fin = (int(v) for v in rango.split("-"))
+            else:
+                inicio = fin = int(rango)
+                if paso:
+                    # Como en cron: "N/paso" va desde N hasta el máximo del campo
+                    fin = maximo
+            if not minimo <= inicio <= fin <= maximo:
+                raise ValueError(f"Valor fuera de rango en '{campo}'")
+            valores.update(range(inicio, fin + 1, int(paso) if paso else 1))
+        return valores
+
+    def _dia_valido(self, momento):
+        en_mes = momento.day in self.dias
+        # cron cuenta el domingo como 0; weekday() lo cuenta como 6
+        en_semana = (momento.weekday() + 1) % 7 in self.dias_semana
+        return (en_mes or en_semana) if self._dia_o_semana else (en_mes and en_semana)
+
+    def siguiente(self, desde):
+        """Primer minuto que cumple la expresión, estrictamente después de `desde`"""
+        momento = desde.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = momento + timedelta(days=366 * 4)
+        while momento < limite:
+            if momento.month not in self.meses:
+                momento = (momento.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._dia_valido(momento):
+                momento = momento.replace(hour=0, minute=0) + timedelta(days=1)
+            elif momento.hour not in self.horas:
+                momento = momento.replace(minute=0) + timedelta(hours=1)
+            elif momento.minute not in self.minutos:
+                momento += timedelta(minutes=1)
+            else:
+                return momento
+        raise ValueError(f"La expresión cron nunca se cumple: {self.expresion}")
+
+
+class Barrido:
+    """Un barrido registrado: funcion(db_path, marca_agua) -> (filas, nueva_marca)"""
+
+    def __init__(self, nombre, funcion, programa, jitter=JITTER_S, tiempo_maximo=TIEMPO_MAXIMO_S):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.programa = str(programa)
+        self.jitter = jitter
+        self.tiempo_maximo = tiempo_maximo
+        try:
+            self.intervalo = float(programa)
+            self.cron = None
+        except ValueError:
+            self.intervalo = None
+            self.cron = Cron(self.programa)
+
+    def proxima(self, desde):
+        """Epoch de la próxima ejecución a partir del epoch `desde`"""
+        if self.cron is not None:
+            base = self.cron.siguiente(datetime.fromtimestamp(desde)).timestamp()
+        else:
+            base = desde + self.intervalo
+        return base + random.uniform(0, self.jitter)
+
+
+class ProgramadorBarridos:
+    """Corre los barridos registrados cuando les toca, uno a la vez por base"""
+
+    def __init__(self, db_path, intervalo_sondeo=INTERVALO_SONDEO_S):
+        self.db_path = db_path
+        self.intervalo_sondeo = intervalo_sondeo
+        self.identidad = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+
+        self.barridos = {}
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+
+        self.metricas = {}
+        asegurar_esquema(db_path)
+        registro.registrar_colector(f"barridos:{os.path.basename(str(db_path))}",
+                                    self._colector_metricas)
+
+    def registrar(self, nombre, funcion, programa, jitter=JITTER_S, tiempo_maximo=TIEMPO_MAXIMO_S):
+        """Registrar un barrido; su fila se crea con la primera ejecución programada"""
+        barrido = Barrido(nombre, funcion, programa, jitter, tiempo_maximo)
+        escribir(self.db_path, lambda cursor: cursor.execute('''
+            INSERT OR IGNORE INTO barridos (nombre, proxima_ejecucion) VALUES (?, ?)
+        ''', (nombre, barrido.proxima(time.time()))))
+
+        with self._lock:
+            self.barridos[nombre] = barrido
+            self.metricas.setdefault(nombre, {
+                "ejecuciones": 0,
+                "errores": 0,
+                "filas_afectadas": 0,
+                "omitidas": 0,
+                "ultima_duracion_segundos": 0.0
+            })
+        self._despertar.set()
+        return barrido
+
+    def _tomar(self, nombre, forzar):
+        """Tomar el candado del barrido; devuelve (True, marca) o (False, None)"""
+        tiempo_maximo = self.barridos[nombre].tiempo_maximo
+
+        def operacion(cursor):
+            ahora = time.time()
+            cursor.execute(f'''
+                UPDATE barridos SET bloqueado_por = ?, bloqueado_hasta = ?
+                WHERE nombre = ?
+                AND (bloqueado_hasta IS NULL OR bloqueado_hasta < ?)
+                {"" if forzar else "AND proxima_ejecucion <= ?"}
+            ''', (self.identidad, ahora + tiempo_maximo, nombre, ahora,
+                  *(() if forzar else (ahora,))))
+            if cursor.rowcount != 1:
+                return False, None
+            cursor.execute('SELECT marca_agua FROM barridos WHERE nombre = ?', (nombre,))
+            marca = cursor.fetchone()[0]
+            return True, json.loads(marca) if marca else None
+
+        return escribir(self.db_path, operacion)
+
+    def _liberar(self, nombre, inicio, duracion, filas, error, marca):
+        barrido = self.barridos[nombre]
+        marca_texto = json.dumps(marca, default=str) if error is None else None
+
+        def operacion(cursor):
+            cursor.execute('''
+                INSERT INTO ejecuciones_barridos
+                (nombre, inicio, duracion_segundos, filas_afectadas, estado, error,
+                 marca_agua, ejecutado_por)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (nombre, inicio, duracion, filas, "ok" if error is None else "error", error,
+                  marca_texto, self.identidad))
+            cursor.execute('''
+                UPDATE barridos
+                SET marca_agua = COALESCE(?, marca_agua), proxima_ejecucion = ?,
+                    ultima_ejecucion = ?, bloqueado_por = NULL, bloqueado_hasta = NULL
+                WHERE nombre = ? AND bloqueado_por = ?
+            ''', (marca_texto, barrido.proxima(time.time()), inicio, nombre, self.identidad))
+
+        escribir(self.db_path, operacion)
+
+    def ejecutar(self, nombre, forzar=False):
+        """Correr el barrido si le toca (o ya, con forzar) y nadie más lo tiene tomado
+
+        Devuelve None si no se ejecutó.
+        """
+        tomado, marca = self._tomar(nombre, forzar)
+        if not tomado:
+            with self._lock:
+                self.metricas[nombre]["omitidas"] += 1
+            return None
+
+        inicio = time.time()
+        filas, nueva_marca, error = 0, marca, None
+        try:
+            with tracing.span(f"barrido {nombre}", {"barrido.incremental": marca is not None}):
+                filas, nueva_marca = self.barridos[nombre].funcion(self.db_path, marca)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.error("Barrido %s falló: %s", nombre, error)
+        duracion = time.time() - inicio
+
+        self._liberar(nombre, inicio, duracion, filas, error, nueva_marca)
+
+        with self._lock:
+            metricas = self.metricas[nombre]
+            metricas["ejecuciones"] += 1
+            metricas["errores"] += error is not None
+            metricas["filas_afectadas"] += filas
+            metricas["ultima_duracion_segundos"] = duracion
+
+        return {"barrido": nombre, "success": error is None, "error": error,
+                "filas_afectadas": filas, "duracion_segundos": round(duracion, 4),
+                "marca_agua": nueva_marca}
+
+    def _proximas(self):
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT nombre, proxima_ejecucion FROM barridos')
+        proximas = {n: p for n, p in cursor.fetchall() if n in self.barridos}
+        conn.close()
+        return proximas
+
+    def ejecutar_pendientes(self):
+        """Correr los barridos a los que ya les toca; devuelve sus resultados"""
+        ahora = time.time()
+        resultados = []
+        for nombre, proxima in sorted(self._proximas().items(), key=lambda p: p[1]):
+            if proxima <= ahora:
+                resultado = self.ejecutar(nombre)
+                if resultado is not None:
+                    resultados.append(resultado)
+        return resultados
+
+    def _segundos_hasta_proximo(self):
+        proximas = self._proximas().values()
+        if not proximas:
+            return self.intervalo_sondeo
+        # El sondeo acota la espera: otro proceso puede haber reprogramado
+        return max(0.0, min(min(proximas) - time.time(), self.intervalo_sondeo))
+
+    def _ejecutar(self):
+        while not self._detener.is_set():
+            espera = self.intervalo_sondeo
+            try:
+                self.ejecutar_pendientes()
+                espera = self._segundos_hasta_proximo()
+            except Exception as e:
+                logger.error("Error en programador de barridos: %s", e)
+
+            self._despertar.wait(espera)
+            self._despertar.clear()
+
+    def iniciar(self):
+        """Iniciar el hilo del programador"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        contexto = contextvars.copy_context()
+        self._hilo = threading.Thread(target=contexto.run, args=(self._ejecutar,),
+                                      daemon=True, name="barridos")
+        self._hilo.start()
+
+    def detener(self, timeout=10.0):
+        """Detener el hilo (un barrido en curso termina antes)"""
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+            self._hilo = None
+
+    def obtener_estado(self):
+        """Programa, marca de agua y última corrida de cada barrido"""
+        conn = conectar(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT b.nombre, b.marca_agua, b.proxima_ejecucion, b.bloqueado_por,
+                   e.inicio, e.duracion_segundos, e.filas_afectadas, e.estado, e.error
+            FROM barridos b
+            LEFT JOIN ejecuciones_barridos e ON e.id_ejecucion = (
+                SELECT MAX(id_ejecucion) FROM ejecuciones_barridos WHERE nombre = b.nombre)
+            ORDER BY b.nombre
+        ''')
+        filas = cursor.fetchall()
+        conn.close()
+
+        estado = {}
+        for f in filas:
+            barrido = self.barridos.get(f[0])
+            estado[f[0]] = {
+                "programa": barrido.programa if barrido else None,
+                "marca_agua": json.loads(f[1]) if f[1] else None,
+                "proxima_ejecucion": datetime.fromtimestamp(f[2]).isoformat(timespec="seconds"),
+                "tomado_por": f[3],
+                "ultima_ejecucion": {
+                    "inicio": datetime.fromtimestamp(f[4]).isoformat(timespec="seconds"),
+                    "duracion_segundos": f[5],
+                    "filas_afectadas": f[6],
+                    "estado": f[7],
+                    "error": f[8]
+                } if f[4] else None
+            }
+        return estado
+
+    def _colector_metricas(self):
+        with self._lock:
+            metricas = {n: dict(m) for n, m in self.metricas.items()}
+        familias = (
+            ("ejecuciones", "julia_barridos_ejecuciones_total", "counter", "Corridas de cada barrido en este proceso"),
+            ("errores", "julia_barridos_errores_total", "counter", "Corridas terminadas en error"),
+            ("filas_afectadas", "julia_barridos_filas_total", "counter", "Filas afectadas por los barridos"),
+            ("omitidas", "julia_barridos_omitidas_total", "counter", "Corridas omitidas porque otro proceso tenía el barrido"),
+            ("ultima_duracion_segundos", "julia_barridos_duracion_segundos", "gauge", "Duración de la última corrida"),
+        )
+        return [
+            (nombre, tipo, ayuda, [({"barrido": b}, m[clave]) for b, m in metricas.items()])
+            for clave, nombre, tipo, ayuda in familias
+        ]
+
+
+def _maximo(db_path, consulta):
+    conn = conectar(db_path)
+    cursor = conn.cursor()
+    cursor.execute(consulta)
+    valor = cursor.fetchone()[0]
+    conn.close()
+    return valor or 0
+
+
+def barrer_reservas_vencidas(db_path, marca):
+    """Cancelar las reservas vencidas desde la corrida anterior"""
+    resultado = ReservationSystem(db_path).verificar_reservas_vencidas(desde=marca)
+    if not resultado["success"]:
+        raise RuntimeError(resultado["error"])
+    return resultado["reservas_canceladas"], str(resultado["hasta"])
+
+
+def barrer_pagos_pendientes(db_path, marca):
+    """Alertas de pago nuevas desde la corrida anterior"""
+    # Los topes se leen antes: lo que entre durante la corrida se revisa en la próxima
+    tope = _maximo(db_path, 'SELECT MAX(id_cuenta) FROM cuentas_por_pagar')
+    hoy = datetime.now().date()
+    marca = marca or {}
+    alertas = PaymentSystem(db_path).verificar_pagos_pendientes(
+        hoy, desde_fecha=marca.get("fecha"), desde_cuenta=marca.get("id_cuenta"))
+    for alerta in alertas:
+        logger.info("Alerta de pago %s: %s $%.2f", alerta["tipo"], alerta["proveedor"], alerta["monto"])
+    return len(alertas), {"fecha": hoy.isoformat(), "id_cuenta": tope}
+
+
+def barrer_materiales_bajos(db_path, marca):
+    """Materiales que quedaron bajo el mínimo desde la corrida anterior"""
+    tope_detalle = _maximo(db_path, 'SELECT MAX(id_detalle) FROM detalle_produccion_materiales')
+    tope_material = _maximo(db_path, 'SELECT MAX(id_material) FROM materiales')
+    marca = marca or {}
+    materiales = ProductionTrackingSystem(db_path).verificar_materiales_bajos(
+        desde_detalle=marca.get("id_detalle"), desde_material=marca.get("id_material"))
+    for material in materiales:
+        logger.info("Stock bajo: %s (%s de mínimo %s %s)", material["nombre"],
+                    material["stock_actual"], material["stock_minimo"], material["unidad_medida"])
+    return len(materiales), {"id_detalle": tope_detalle, "id_material": tope_material}
+
+
+def barrer_clientes_upgrade(db_path, marca):
+    """Clientes con compras nuevas que quedaron cerca del siguiente nivel"""
+    tope = _maximo(db_path, 'SELECT MAX(id_compra) FROM compras_cliente')
+    clientes = FrequentCustomerSystem(db_path).proximos_clientes_upgrade(
+        desde_compra=(marca or {}).get("id_compra"), limite=1000)
+    for cliente in clientes:
+        logger.info("Cliente %s a $%.0f del siguiente nivel", cliente["nombre"],
+                    cliente["monto_para_siguiente_nivel"])
+    return len(clientes), {"id_compra": tope}
+
+
+def barrer_particion_produccion(db_path, marca):
+    """Órdenes liquidadas que pasan de produccion a produccion_historica"""
+    resultado = ProductionTrackingSystem(db_path).mover_ordenes_liquidadas()
+    if not resultado["success"]:
+        raise RuntimeError(resultado["error"])
+    if resultado["movidas"]:
+        logger.info("Particionado: %d órdenes liquidadas a produccion_historica", resultado["movidas"])
+    return resultado["movidas"], marca
+
+
+BARRIDOS_PREDETERMINADOS = {
+    "reservas_vencidas": (barrer_reservas_vencidas, "60"),
+    "pagos_pendientes": (barrer_pagos_pendientes, "0 7 * * *"),
+    "materiales_bajos": (barrer_materiales_bajos, "900"),
+    "clientes_upgrade": (barrer_clientes_upgrade, "30 7 * * *"),
+    "retencion": (barrer_retencion, "15 3 * * *"),
+    "particion_produccion": (barrer_particion_produccion, "45 3 * * *"),
+    "instantanea": (barrer_instantanea, "3600"),
+    "respaldo": (barrer_respaldo, "0 2 * * *"),
+    "mediciones_base": (barrer_mediciones, "900"),
+    "estadisticas_base": (barrer_estadisticas, "0 */6 * * *"),
+    "mantencion_nocturna": (barrer_mantencion_nocturna, "30 4 * * *"),
+}
+
+
+def crear_programador(db_path, **kwargs):
+    """Programador con los barridos de mantenimiento registrados"""
+    programador = ProgramadorBarridos(db_path, **kwargs)
+    for nombre, (funcion, programa) in BARRIDOS_PREDETERMINADOS.items():
+        programa = os.getenv(f"JULIA_BARRIDO_{nombre.upper()}", programa)
+        programador.registrar(nombre, funcion, programa)
+    return programador
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Barridos periódicos de mantenimiento")
+    parser.add_argument("--db", default=os.getenv("JULIA_DB", "julia_confecciones.db"))
+    parser.add_argument("--una-vez", action="store_true", help="Correr todos los barridos ahora y salir")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    programador = crear_programador(args.db)
+    if args.una_vez:
+        for nombre in programador.barridos:
+            print(json.dumps(programador.ejecutar(nombre, forzar=True), default=str))
+    else:
+        programador.iniciar()
+        cola = iniciar_en_proceso(args.db)
+        try:
+            while True:
+                time.sleep(60)
+                print(json.dumps(programador.obtener_estado(), default=str))
+        except KeyboardInterrupt:
+            programador.detener()
+            if cola is not None:
+                cola.detener()
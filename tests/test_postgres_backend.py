@@ -0,0 +1,190 @@
+# Pruebas de la Traducción SQLite -> PostgreSQL - Julia Confecciones
+#
+# Corre los sistemas sobre una base SQLite de prueba, junta cada sentencia
+# que ejecutan y la pasa por postgres_backend.traducir(); además revisa los
+# casos puntuales (INSERT OR REPLACE ... SELECT, strftime, GROUP_CONCAT, %
+# dentro de literales). No necesita psycopg ni un servidor PostgreSQL; la
+# ejecución real está en test_postgres_integracion (con JULIA_PG_URL).
+#
+# Uso: python -m pytest tests
+
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import postgres_backend
+import schema
+import sql_instrumentation
+from postgres_backend import BasePostgres, _LITERAL, traducir
+
+# Lo que no existe en PostgreSQL y debió traducirse (fuera de literales)
+SOLO_SQLITE = re.compile(
+    r"\?|\bdatetime\s*\(|\bstrftime\s*\(|\bjulianday\s*\(|GROUP_CONCAT|INSERT\s+OR\b|"
+    r"AUTOINCREMENT|sqlite_master|\btemp\.", re.IGNORECASE)
+
+
+def fuera_de_literales(sql):
+    return "".join(parte for i, parte in enumerate(_LITERAL.split(sql)) if i % 2 == 0)
+
+
+def base_sin_servidor(claves):
+    """BasePostgres sin pool: las claves primarias vienen dadas por tabla"""
+    base = object.__new__(BasePostgres)
+    base._claves = dict(claves)
+    base._sentencias = {}
+    return base
+
+
+@pytest.fixture(scope="module")
+def sentencias(tmp_path_factory):
+    """Todas las sentencias que ejecutan los sistemas en un recorrido típico"""
+    from benchmarks.generador import generar_base
+    from frequent_customer_system import FrequentCustomerSystem
+    from job_queue import ColaTrabajos
+    from payment_system import PaymentSystem
+    from reservation_system_implementation import ReservationSystem
+
+    db_path = str(tmp_path_factory.mktemp("traduccion") / "julia.db")
+    generar_base(db_path, "pequena")
+
+    capturadas = set()
+    registrar = sql_instrumentation._registrar_sentencia
+
+    def capturar(sql, *args, **kwargs):
+        capturadas.add(sql)
+        return registrar(sql, *args, **kwargs)
+
+    with pytest.MonkeyPatch.context() as parche:
+        parche.setattr(sql_instrumentation, "_registrar_sentencia", capturar)
+
+        fin = datetime.now()
+        pagos = PaymentSystem(db_path)
+        pagos.generar_planilla_pagos(fin.strftime("%Y-%m"))
+        pagos.verificar_pagos_pendientes()
+        pagos.obtener_cuentas_por_pagar()
+        pagos.obtener_antiguedad_cxp()
+        compra = pagos.registrar_compra_proveedor(1, 1, 10, 1500, "credito", credito_dias=30)
+        pagos.procesar_pago_proveedor(compra["compra_id"], "transferencia")
+        recepcion = pagos.registrar_compras_proveedor_lote([
+            {"id_proveedor": 1, "id_material": 1, "cantidad": 5, "precio_unitario": 1000,
+             "comprobante": "F-1", "credito_dias": 30}])
+        pagos.procesar_pago_proveedor(recepcion["compras_ids"][0], "transferencia")
+        pagos.procesar_pago_empleado(1, 10000, "prendas", fin.strftime("%Y-%m"))
+
+        clientes = FrequentCustomerSystem(db_path)
+        clientes.registrar_compra(1, 250000)
+        clientes.obtener_beneficios_cliente(1)
+        clientes.obtener_estadisticas_cliente(1)
+        clientes.generar_reporte_clientes_frecuentes()
+        clientes.proximos_clientes_upgrade()
+
+        reservas = ReservationSystem(db_path)
+        reservas.crear_reserva(1, 10, 40000)
+        reservas.verificar_reservas_vencidas()
+
+        try:
+            from employee_tracking_portal import EmployeeTrackingPortal
+        except ImportError:
+            # Sin flask no se recorre el portal (ver test_group_concat_de_los_sistemas)
+            EmployeeTrackingPortal = None
+        if EmployeeTrackingPortal is not None:
+            portal = EmployeeTrackingPortal(db_path)
+            portal.obtener_tareas_pendientes(1, "costurero")
+            portal.obtener_tareas_completadas(1, "costurero")
+            portal.obtener_resumen_pagos(1, "costurero")
+            portal.obtener_notificaciones(1)
+            portal.obtener_detalle_tarea(1, 1, "cortador")
+
+        ColaTrabajos(db_path).procesar_pendientes()
+
+    return capturadas
+
+
+def test_sentencias_de_los_sistemas_quedan_en_dialecto_postgres(sentencias):
+    assert len(sentencias) > 30
+    for sql in sentencias:
+        texto, _ = traducir(sql)
+        if texto is None:
+            continue
+        restos = SOLO_SQLITE.findall(fuera_de_literales(texto))
+        assert not restos, f"{restos} en: {texto}"
+        # psycopg usa la sintaxis de % de Python: solo %s y %% deben quedar
+        texto % tuple("x" for _ in range(texto.count("%s")))
+
+
+def test_insert_or_replace_select_usa_on_conflict(sentencias):
+    sql = next(s for s in sentencias if "INSERT OR REPLACE INTO antiguedad_cxp" in s)
+    base = base_sin_servidor({"antiguedad_cxp": "id_cuenta"})
+
+    texto = " ".join(base.sentencia(sql, None).texto.split())
+
+    assert "OR REPLACE" not in texto
+    assert texto.startswith("INSERT INTO antiguedad_cxp (id_cuenta, id_proveedor, proveedor, monto, "
+                            "fecha_vencimiento) SELECT %s, %s, nombre, %s, %s FROM proveedores_materiales")
+    assert texto.endswith("ON CONFLICT (id_cuenta) DO UPDATE SET id_proveedor = EXCLUDED.id_proveedor, "
+                          "proveedor = EXCLUDED.proveedor, monto = EXCLUDED.monto, "
+                          "fecha_vencimiento = EXCLUDED.fecha_vencimiento RETURNING id_cuenta")
+
+
+def test_insert_or_ignore_usa_on_conflict_do_nothing():
+    base = base_sin_servidor({"clientes": "id_cliente"})
+    sentencia = base.sentencia("INSERT OR IGNORE INTO clientes (rut, nombre) VALUES (?, ?)", None)
+    assert sentencia.texto == ("INSERT INTO clientes (rut, nombre) VALUES (%s, %s) "
+                               "ON CONFLICT DO NOTHING RETURNING id_cliente")
+    assert sentencia.devuelve_id
+
+
+def test_strftime_de_los_sistemas(sentencias):
+    sql = next(s for s in sentencias if "strftime('%Y-%m', fecha_compra)" in s)
+    texto, _ = traducir(sql)
+    assert texto.count("to_char(fecha_compra, 'YYYY-MM')") == 2
+
+
+def test_group_concat_de_los_sistemas(sentencias):
+    sql = next((s for s in sentencias if "GROUP_CONCAT" in s), None)
+    if sql is None:
+        pytest.skip("dependencia no instalada (flask)")
+    texto, _ = traducir(sql)
+    assert ("COALESCE(string_agg((m.nombre || ':' || dpm.cantidad_utilizada || ' ' || "
+            "m.unidad_medida)::text, ', '), '')") in texto
+
+
+def test_porcentaje_y_signo_de_pregunta_en_literales():
+    texto, insercion = traducir("SELECT nombre FROM clientes WHERE nombre LIKE '%ana?%' AND id_cliente = ?")
+    assert texto == "SELECT nombre FROM clientes WHERE nombre LIKE '%%ana?%%' AND id_cliente = %s"
+    assert insercion is None
+    # Lo que recibe el servidor tras el formateo de psycopg
+    assert texto % ("$1",) == "SELECT nombre FROM clientes WHERE nombre LIKE '%ana?%' AND id_cliente = $1"
+
+
+def test_semana_w_como_sqlite():
+    texto, _ = traducir("SELECT strftime('%Y-%W', fecha_compra) FROM compras_clientes")
+    assert "IW" not in texto
+    assert texto == ("SELECT (to_char(fecha_compra, 'YYYY-') || "
+                     + postgres_backend._SEMANA_LUNES.format("fecha_compra") + ") FROM compras_clientes")
+
+    # La fórmula de _SEMANA_LUNES, (día del año + 7 - día ISO) / 7, contra SQLite
+    conn = sqlite3.connect(":memory:")
+    dia = date(2020, 1, 1)
+    while dia < date(2031, 1, 1):
+        esperado = conn.execute("SELECT strftime('%W', ?)", (dia.isoformat(),)).fetchone()[0]
+        calculado = (dia.timetuple().tm_yday + 7 - dia.isoweekday()) // 7
+        assert f"{calculado:02d}" == esperado, dia
+        dia += timedelta(days=1)
+    conn.close()
+
+
+def test_temp_y_pragma():
+    assert traducir("PRAGMA journal_mode=WAL") == (None, None)
+    texto, _ = traducir("CREATE TEMP TABLE IF NOT EXISTS recepcion_materiales (id_material INTEGER, cantidad REAL)")
+    assert texto == ("CREATE TEMP TABLE IF NOT EXISTS recepcion_materiales "
+                     "(id_material INTEGER, cantidad DOUBLE PRECISION)")
+    assert traducir("DELETE FROM temp.recepcion_materiales")[0] == "DELETE FROM pg_temp.recepcion_materiales"
+
+
+def test_julianday_now_de_las_migraciones():
+    texto, _ = traducir(f"SELECT {schema.VERSION_AHORA}")
+    assert "julianday" not in texto
+    assert postgres_backend.AHORA_JULIANO in texto
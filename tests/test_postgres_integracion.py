@@ -0,0 +1,212 @@
+# Pruebas de los Sistemas sobre PostgreSQL - Julia Confecciones
+#
+# Corre los sistemas contra un servidor PostgreSQL real: lo que
+# test_postgres_backend solo revisa como texto (RETURNING como lastrowid,
+# INSERT OR REPLACE -> ON CONFLICT, la tabla temporal de la recepción en lote
+# y el ALTER TABLE de la migración 10) se ejecuta aquí de verdad. Necesita
+# JULIA_PG_URL y psycopg; sin ellos se salta. Cada prueba trabaja en un
+# esquema propio que se borra al terminar.
+#
+# Uso: JULIA_PG_URL=postgresql://postgres@localhost/julia_pruebas python -m pytest tests
+
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import postgres_backend
+import schema
+from database import conectar
+from sqlite_writer import escribir
+
+PG_URL = os.getenv("JULIA_PG_URL")
+
+pytestmark = pytest.mark.skipif(
+    not PG_URL or postgres_backend.psycopg is None,
+    reason="sin JULIA_PG_URL o sin psycopg")
+
+
+def consultar(url, sql, parametros=()):
+    conn = conectar(url)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def nueva_base():
+    """Fábrica de URLs con search_path en un esquema vacío y desechable"""
+    esquemas = []
+
+    def crear():
+        esquema = f"julia_pruebas_{uuid.uuid4().hex[:12]}"
+        with postgres_backend.psycopg.connect(PG_URL, autocommit=True) as conn:
+            conn.execute(f"CREATE SCHEMA {esquema}")
+        esquemas.append(esquema)
+        separador = "&" if "?" in PG_URL else "?"
+        return f"{PG_URL}{separador}options=-csearch_path%3D{esquema}"
+
+    yield crear
+
+    postgres_backend.cerrar_pools()
+    with postgres_backend.psycopg.connect(PG_URL, autocommit=True) as conn:
+        for esquema in esquemas:
+            conn.execute(f"DROP SCHEMA {esquema} CASCADE")
+
+
+@pytest.fixture
+def base(nueva_base):
+    """Base migrada a VERSION_ACTUAL con un proveedor y dos materiales"""
+    from payment_system import PaymentSystem
+
+    url = nueva_base()
+    pagos = PaymentSystem(url)
+    pagos.registrar_proveedor_material("76.000.001-1", "Telas del Sur", "ventas@telas.cl",
+                                       "912345678", "Temuco", "tela", "credito", 30)
+
+    def materiales(cursor):
+        cursor.executemany('''
+            INSERT INTO materiales (nombre, tipo, unidad_medida, stock_actual, stock_minimo, costo_unitario)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [("Popelina", "tela", "metros", 100, 10, 2500),
+              ("Hilo blanco", "hilo", "unidades", 50, 5, 800)])
+
+    escribir(url, materiales)
+    return url
+
+
+def test_migraciones_y_columna_de_la_migracion_10(base):
+    assert schema.version_esquema(base) == schema.VERSION_ACTUAL
+    columnas = consultar(base, '''
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'compras_proveedores'
+    ''')
+    assert ("id_cuenta",) in columnas
+
+
+def test_migracion_10_sobre_compras_existentes(nueva_base):
+    # Base en v9 con una compra suelta y una factura consolidada a crédito,
+    # aún sin id_cuenta: el ALTER TABLE y el enlace corren sobre filas reales
+    url = nueva_base()
+    conn = conectar(url, isolation_level=None)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    for _, _, funcion in schema.MIGRACIONES[:9]:
+        funcion(cursor)
+    cursor.execute("CREATE TABLE esquema_version (version INTEGER NOT NULL)")
+    cursor.execute("INSERT INTO esquema_version (version) VALUES (9)")
+
+    vencimiento = (datetime.now() + timedelta(days=30)).replace(microsecond=0)
+    cursor.execute('''
+        INSERT INTO proveedores_materiales (rut, nombre, forma_pago, credito_dias)
+        VALUES ('76.000.002-2', 'Botones Ltda', 'credito', 30)
+    ''')
+    id_proveedor = cursor.lastrowid
+    compras = []
+    for cantidad, comprobante in ((10, "F-10"), (5, "F-20"), (7, "F-20")):
+        cursor.execute('''
+            INSERT INTO compras_proveedores
+            (id_proveedor, cantidad, precio_unitario, total, comprobante, fecha_vencimiento, estado_pago)
+            VALUES (?, ?, 100, ?, ?, ?, 'pendiente')
+        ''', (id_proveedor, cantidad, cantidad * 100, comprobante, vencimiento))
+        compras.append(cursor.lastrowid)
+    cuentas = []
+    for monto in (1000, 1200):
+        cursor.execute('''
+            INSERT INTO cuentas_por_pagar (tipo_cuenta, id_referencia, monto, fecha_vencimiento)
+            VALUES ('proveedor', ?, ?, ?)
+        ''', (id_proveedor, monto, vencimiento))
+        cuentas.append(cursor.lastrowid)
+    cursor.execute("COMMIT")
+    conn.close()
+
+    assert schema.asegurar_esquema(url) == schema.VERSION_ACTUAL
+    enlazadas = dict(consultar(url, "SELECT id_compra, id_cuenta FROM compras_proveedores"))
+    # La suelta toma la cuenta de su monto; las dos líneas de F-20, la de su suma
+    assert enlazadas == {compras[0]: cuentas[0], compras[1]: cuentas[1], compras[2]: cuentas[1]}
+
+
+def test_insert_devuelve_id_como_lastrowid(base):
+    from payment_system import PaymentSystem
+    from reservation_system_implementation import ReservationSystem
+
+    pagos = PaymentSystem(base)
+    segundo = pagos.registrar_proveedor_material("76.000.003-3", "Cierres SpA", "", "", "",
+                                                 "cierre", "contado")
+    assert segundo == {"success": True, "proveedor_id": 2}
+
+    compra = pagos.registrar_compra_proveedor(1, 1, 10, 1500, "credito", credito_dias=30)
+    assert compra["success"], compra
+    fila = consultar(base, '''
+        SELECT c.total, c.id_cuenta, cpp.monto FROM compras_proveedores c
+        JOIN cuentas_por_pagar cpp ON cpp.id_cuenta = c.id_cuenta
+        WHERE c.id_compra = ?
+    ''', (compra["compra_id"],))
+    assert fila == [(15000, fila[0][1], 15000)]
+
+    reservas = ReservationSystem(base)
+    cliente = reservas.crear_cliente("12.345.678-9", "Ana Pérez", "ana@email.com", "987654321")
+    reserva = reservas.crear_reserva(cliente["cliente_id"], 1, 40000)
+    assert reserva["success"], reserva
+    assert consultar(base, "SELECT id_cliente, monto_total FROM reservas WHERE id_reserva = ?",
+                     (reserva["reserva_id"],)) == [(cliente["cliente_id"], 40000)]
+
+
+def test_insert_or_replace_de_antiguedad_usa_on_conflict(base):
+    from payment_system import PaymentSystem
+
+    pagos = PaymentSystem(base)
+    compra = pagos.registrar_compra_proveedor(1, 1, 10, 1500, "credito", credito_dias=3)
+    id_cuenta = consultar(base, "SELECT id_cuenta FROM compras_proveedores WHERE id_compra = ?",
+                          (compra["compra_id"],))[0][0]
+
+    # Reemplazar la misma cuenta actualiza la fila en vez de chocar con la clave primaria
+    nuevo_vencimiento = datetime.now() + timedelta(days=20)
+    escribir(base, lambda cursor: pagos._registrar_antiguedad(cursor, id_cuenta, 1, 9000, nuevo_vencimiento))
+    assert consultar(base, "SELECT proveedor, monto, fecha_vencimiento FROM antiguedad_cxp") == [
+        ("Telas del Sur", 9000, nuevo_vencimiento.date().isoformat())]
+
+    tramos = pagos.obtener_antiguedad_cxp()
+    assert tramos["8_30_dias"] == {"cantidad": 1, "monto": 9000}
+    assert tramos["0_7_dias"] == {"cantidad": 0, "monto": 0}
+
+    assert pagos.reconstruir_antiguedad_cxp() == 1
+    assert pagos.obtener_antiguedad_cxp()["0_7_dias"] == {"cantidad": 1, "monto": 15000}
+
+
+def test_recepcion_en_lote_con_tabla_temporal(base):
+    from payment_system import PaymentSystem
+
+    pagos = PaymentSystem(base)
+    lineas = [
+        {"id_proveedor": 1, "id_material": 1, "cantidad": 5, "precio_unitario": 1000,
+         "comprobante": "F-1", "credito_dias": 30},
+        {"id_proveedor": 1, "id_material": 1, "cantidad": 3, "precio_unitario": 1000,
+         "comprobante": "F-1", "credito_dias": 30},
+        {"id_proveedor": 1, "id_material": 2, "cantidad": 20, "precio_unitario": 50},
+    ]
+
+    # Dos recepciones seguidas: la tabla temporal se reutiliza en la conexión del pool
+    for _ in range(2):
+        recepcion = pagos.registrar_compras_proveedor_lote(lineas)
+        assert recepcion["success"], recepcion
+        assert recepcion["materiales_actualizados"] == 2
+        assert [c["monto"] for c in recepcion["cuentas_por_pagar"]] == [8000]
+
+    assert consultar(base, "SELECT id_material, stock_actual FROM materiales ORDER BY id_material") == [
+        (1, 116), (2, 90)]
+
+    # Pagar una línea de la factura consolidada descuenta su parte de la cuenta
+    id_cuenta = recepcion["cuentas_por_pagar"][0]["id_cuenta"]
+    assert pagos.procesar_pago_proveedor(recepcion["compras_ids"][0], "transferencia")["success"]
+    assert consultar(base, "SELECT monto FROM cuentas_por_pagar WHERE id_cuenta = ?", (id_cuenta,)) == [(3000,)]
+    assert consultar(base, "SELECT monto FROM antiguedad_cxp WHERE id_cuenta = ?", (id_cuenta,)) == [(3000,)]
+
+    assert pagos.procesar_pago_proveedor(recepcion["compras_ids"][1], "transferencia")["success"]
+    assert consultar(base, "SELECT COUNT(*) FROM cuentas_por_pagar WHERE id_cuenta = ?", (id_cuenta,)) == [(0,)]
+    # Los totales por día de vencimiento siguieron a los dos pagos
+    assert pagos.obtener_antiguedad_cxp()["8_30_dias"] == {"cantidad": 1, "monto": 8000}
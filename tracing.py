@@ -0,0 +1,252 @@
+# Trazas Locales de Operaciones - Julia Confecciones
+#
+# Spans anidados (método -> conexión -> sentencia / commit) exportados a un
+# archivo local en el formato JSON de OTLP, una traza por línea. Se activa con
+# JULIA_TRAZAS_ARCHIVO; JULIA_TRAZAS_UMBRAL_MS descarta las trazas más rápidas.
+#
+# Para ver las trazas más lentas:  python tracing.py trazas.jsonl [cantidad]
+
+import contextvars
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+
+ARCHIVO = os.getenv("JULIA_TRAZAS_ARCHIVO", "")
+UMBRAL_MS = float(os.getenv("JULIA_TRAZAS_UMBRAL_MS", "0"))
+HABILITADO = bool(ARCHIVO)
+SERVICIO = os.getenv("JULIA_TRAZAS_SERVICIO", "julia-confecciones")
+
+# Valores de SpanKind y StatusCode de OTLP
+INTERNO, SERVIDOR, CLIENTE = 1, 2, 3
+ESTADO_OK, ESTADO_ERROR = 1, 2
+
+_actual = contextvars.ContextVar("julia_span_actual", default=None)
+_lock_archivo = threading.Lock()
+_ACTUAL = object()
+
+
+class Traza:
+    """Spans de una misma operación raíz"""
+
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+
+
+class Span:
+    """Intervalo de tiempo con atributos dentro de una traza"""
+
+    __slots__ = ("traza", "span_id", "padre_id", "nombre", "tipo", "inicio", "fin",
+                 "atributos", "estado", "mensaje")
+
+    def __init__(self, traza, padre_id, nombre, tipo, inicio, atributos):
+        self.traza = traza
+        self.span_id = secrets.token_hex(8)
+        self.padre_id = padre_id
+        self.nombre = nombre
+        self.tipo = tipo
+        self.inicio = inicio
+        self.fin = None
+        self.atributos = atributos or {}
+        self.estado = 0
+        self.mensaje = ""
+
+    def marcar_error(self, mensaje):
+        self.estado = ESTADO_ERROR
+        self.mensaje = str(mensaje)[:500]
+
+    def como_otlp(self):
+        span = {
+            "traceId": self.traza.trace_id,
+            "spanId": self.span_id,
+            "name": self.nombre,
+            "kind": self.tipo,
+            "startTimeUnixNano": str(self.inicio),
+            "endTimeUnixNano": str(self.fin),
+            "attributes": [{"key": k, "value": _valor_otlp(v)} for k, v in self.atributos.items()],
+            "status": {"code": self.estado, "message": self.mensaje} if self.estado else {}
+        }
+        if self.padre_id:
+            span["parentSpanId"] = self.padre_id
+        return span
+
+
+def _valor_otlp(valor):
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+def configurar(archivo, umbral_ms=0):
+    """Activar (o desactivar con archivo vacío) la exportación de trazas"""
+    global ARCHIVO, UMBRAL_MS, HABILITADO
+    ARCHIVO = archivo or ""
+    UMBRAL_MS = float(umbral_ms)
+    HABILITADO = bool(ARCHIVO)
+
+
+def span_actual():
+    """Span activo en el contexto actual (o None)"""
+    return _actual.get()
+
+
+def iniciar_span(nombre, atributos=None, tipo=INTERNO, padre=_ACTUAL, inicio=None):
+    """Abrir un span hijo del activo; sin span activo abre una traza nueva
+
+    No activa el span: usar activar() para que los spans siguientes cuelguen de él.
+    """
+    if not HABILITADO:
+        return None
+    if padre is _ACTUAL:
+        padre = _actual.get()
+    traza = padre.traza if padre is not None else Traza()
+    span = Span(traza, padre.span_id if padre is not None else None, nombre, tipo,
+                inicio or time.time_ns(), atributos)
+    traza.spans.append(span)
+    return span
+
+
+def iniciar_span_hijo(nombre, atributos=None, padre=_ACTUAL, inicio=None):
+    """Como iniciar_span, pero solo dentro de una traza ya abierta"""
+    if not HABILITADO:
+        return None
+    if padre is _ACTUAL:
+        padre = _actual.get()
+    if padre is None:
+        return None
+    return iniciar_span(nombre, atributos, CLIENTE, padre, inicio)
+
+
+def activar(span):
+    """Hacer de `span` el padre de los spans siguientes; devuelve un token"""
+    return _actual.set(span)
+
+
+def terminar_span(span, token=None, error=None):
+    """Cerrar un span; al cerrar la raíz se exporta la traza completa"""
+    if span is None:
+        return
+    span.fin = time.time_ns()
+    if error is not None:
+        span.marcar_error(error)
+    if token is not None:
+        _actual.reset(token)
+    if span.padre_id is None:
+        _exportar(span)
+
+
+def _exportar(raiz):
+    if (raiz.fin - raiz.inicio) / 1e6 < UMBRAL_MS or not ARCHIVO:
+        return
+
+    spans = []
+    for span in raiz.traza.spans:
+        if span.fin is None:
+            # Conexiones que el método nunca cerró
+            span.fin = raiz.fin
+            span.atributos["julia.sin_cerrar"] = True
+        spans.append(span.como_otlp())
+
+    linea = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICIO}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}}
+            ]},
+            "scopeSpans": [{"scope": {"name": "julia.tracing"}, "spans": spans}]
+        }]
+    }, ensure_ascii=False)
+
+    with _lock_archivo:
+        with open(ARCHIVO, "a", encoding="utf-8") as archivo:
+            archivo.write(linea + "\n")
+
+
+class _ContextoSpan:
+    """Contexto devuelto por span()"""
+
+    __slots__ = ("nombre", "atributos", "tipo", "_span", "_token")
+
+    def __init__(self, nombre, atributos=None, tipo=INTERNO):
+        self.nombre = nombre
+        self.atributos = atributos
+        self.tipo = tipo
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        if HABILITADO:
+            self._span = iniciar_span(self.nombre, self.atributos, self.tipo)
+            self._token = activar(self._span)
+        return self._span
+
+    def __exit__(self, tipo_exc, exc, tb):
+        if self._span is not None:
+            terminar_span(self._span, self._token, exc)
+        return False
+
+
+def span(nombre, atributos=None, tipo=INTERNO):
+    """Contexto que abre, activa y cierra un span; el `with` entrega el span (o None)"""
+    return _ContextoSpan(nombre, atributos, tipo)
+
+
+def leer_trazas(archivo):
+    """Leer un archivo de trazas; devuelve una lista de listas de spans OTLP"""
+    trazas = []
+    with open(archivo, encoding="utf-8") as f:
+        for linea in f:
+            if not linea.strip():
+                continue
+            datos = json.loads(linea)
+            spans = [s for recurso in datos["resourceSpans"]
+                     for alcance in recurso["scopeSpans"] for s in alcance["spans"]]
+            trazas.append(spans)
+    return trazas
+
+
+def formatear_traza(spans):
+    """Árbol de texto con la duración de cada span"""
+    hijos = {}
+    for s in spans:
+        hijos.setdefault(s.get("parentSpanId"), []).append(s)
+
+    lineas = []
+
+    def recorrer(padre_id, nivel):
+        for s in sorted(hijos.get(padre_id, []), key=lambda s: int(s["startTimeUnixNano"])):
+            duracion = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+            atributos = {a["key"]: next(iter(a["value"].values())) for a in s["attributes"]}
+            detalle = atributos.get("db.statement", "")
+            error = " [ERROR]" if s.get("status", {}).get("code") == ESTADO_ERROR else ""
+            lineas.append(f"{'  ' * nivel}{s['name']} {duracion:.2f} ms{error} {detalle[:80]}".rstrip())
+            recorrer(s["spanId"], nivel + 1)
+
+    recorrer(None, 0)
+    return "\n".join(lineas)
+
+
+# Ejemplo de uso: mostrar las trazas más lentas de un archivo
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python tracing.py <archivo_trazas> [cantidad]")
+        sys.exit(1)
+
+    cantidad = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    def duracion_raiz(spans):
+        raiz = next(s for s in spans if not s.get("parentSpanId"))
+        return int(raiz["endTimeUnixNano"]) - int(raiz["startTimeUnixNano"])
+
+    for spans in sorted(leer_trazas(sys.argv[1]), key=duracion_raiz, reverse=True)[:cantidad]:
+        print(formatear_traza(spans))
+        print()